@@ -2,21 +2,26 @@
 Rutas y endpoints de la API REST.
 """
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from typing import Any, Dict, List, Optional
 from pathlib import Path
+import asyncio
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 import json
 from loguru import logger
 
 from app.models import (
+    FichaData,
     FichaGenerateRequest,
     FichaGenerateResponse,
     HealthCheckResponse,
 )
-from app.core import PDFExtractor, LLMProcessor, RAGSystem, WordGenerator
+from app.core import PDFExtractor, RAGSystem, WordGenerator, ModelPool, DuplicateIndex
+from app.core.near_duplicates import restamp_ficha, text_diff, touched_fields
+from app.core.usage_ledger import UsageLedger, to_csv, usage_entries
+from app.core.rate_scheduler import llm_priority, scheduler_stats
 from app.config import settings
 from app import __version__
 
@@ -27,7 +32,10 @@ router = APIRouter(prefix="/api/v1", tags=["fichas"])
 pdf_extractor = PDFExtractor()
 rag_system = None  # Se inicializa en startup
 llm_processor = None  # Se inicializa en startup
+model_pool = None  # Se inicializa en startup
+duplicate_index = None  # Se inicializa en startup
 word_generator = WordGenerator()
+usage_ledger = UsageLedger(settings.USAGE_LEDGER_DIR)
 
 
 @router.get("/health", response_model=HealthCheckResponse)
@@ -83,6 +91,7 @@ async def generate_ficha(
     """
     start_time = datetime.now()
     ficha_id = str(uuid.uuid4())
+    request_config = FichaGenerateRequest()
 
     try:
         # Parsear configuración
@@ -92,8 +101,6 @@ async def generate_ficha(
                 request_config = FichaGenerateRequest(**config_dict)
             except json.JSONDecodeError:
                 raise HTTPException(status_code=400, detail="Config JSON inválido")
-        else:
-            request_config = FichaGenerateRequest()
 
         logger.info(f"[{ficha_id}] Procesando PDF: {file.filename}")
 
@@ -110,7 +117,7 @@ async def generate_ficha(
         temp_pdf_path.write_bytes(content)
 
         logger.info(f"[{ficha_id}] Extrayendo texto del PDF...")
-        pdf_text = pdf_extractor.extract_text(temp_pdf_path)
+        pdf_text = await asyncio.to_thread(pdf_extractor.extract_text, temp_pdf_path)
 
         if not pdf_text or len(pdf_text) < 100:
             raise HTTPException(
@@ -120,17 +127,61 @@ async def generate_ficha(
 
         logger.info(f"[{ficha_id}] Texto extraído: {len(pdf_text)} caracteres")
 
-        # Generar ficha con LLM
-        logger.info(f"[{ficha_id}] Generando ficha con LLM...")
-        result = llm_processor.generate_ficha(
-            pdf_text=pdf_text,
-            use_rag=request_config.include_rag,
-            usuario=request_config.usuario,
-        )
+        processor = None
+        if request_config.model != "cascade":
+            try:
+                processor = model_pool.get(request_config.model)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        # Buscar una versión anterior casi idéntica del documento
+        duplicate = None
+        if duplicate_index is not None:
+            duplicate = await asyncio.to_thread(duplicate_index.find, pdf_text, settings.DUPLICATE_THRESHOLD)
+
+        # Generar ficha con el modelo solicitado (o en cascada)
+        with llm_priority(request_config.priority):
+            if duplicate:
+                logger.info(
+                    f"[{ficha_id}] Documento casi idéntico a {duplicate['doc_id']} "
+                    f"(similitud {duplicate['similarity']:.2f})"
+                )
+                result = await _from_duplicate(
+                    duplicate, pdf_text, processor or llm_processor, request_config.usuario
+                )
+            elif processor is None:
+                logger.info(f"[{ficha_id}] Generando ficha con LLM (cascada)...")
+                result = await model_pool.agenerate_cascade(
+                    pdf_text=pdf_text,
+                    use_rag=request_config.include_rag,
+                    usuario=request_config.usuario,
+                )
+            else:
+                logger.info(f"[{ficha_id}] Generando ficha con LLM ({request_config.model or 'por defecto'})...")
+                result = await processor.agenerate_ficha(
+                    pdf_text=pdf_text,
+                    use_rag=request_config.include_rag,
+                    usuario=request_config.usuario,
+                )
 
         ficha_data = result["ficha"]
         metadata = result["metadata"]
 
+        # Contabilizar tokens, coste y latencia (incluidos los niveles descartados de la cascada)
+        entries = usage_entries(ficha_id, request_config.usuario, metadata)
+        await asyncio.to_thread(_record_usage, entries)
+        usage = entries[-1]
+
+        # Indexar las fichas nuevas o actualizadas para futuras versiones
+        if duplicate_index is not None and not metadata.get("duplicate", {}).get("reused"):
+            await asyncio.to_thread(
+                duplicate_index.add,
+                ficha_id,
+                pdf_text,
+                ficha_data,
+                {"model": metadata["model"], "provider": metadata["provider"]},
+            )
+
         # Validar si se solicitó
         validation_passed = True
         if request_config.validate_output:
@@ -144,7 +195,7 @@ async def generate_ficha(
         # Generar documento Word
         logger.info(f"[{ficha_id}] Generando documento Word...")
         output_path = Path(settings.OUTPUT_DIR) / f"{ficha_id}.docx"
-        word_generator.generate(ficha_data, output_path)
+        await asyncio.to_thread(word_generator.generate, ficha_data, output_path)
 
         # Limpiar archivo temporal
         temp_pdf_path.unlink(missing_ok=True)
@@ -165,6 +216,17 @@ async def generate_ficha(
                 "rag_enabled": metadata["rag_enabled"],
                 "rag_examples_used": metadata["rag_examples_count"],
                 "validation_passed": validation_passed,
+                "entity_warnings": metadata.get("entity_warnings", []),
+                "input_tokens": usage["input_tokens"],
+                "output_tokens": usage["output_tokens"],
+                "cache_read_tokens": usage["cache_read_tokens"],
+                "cache_creation_tokens": usage["cache_creation_tokens"],
+                "cost_usd": usage["cost_usd"],
+                "ttft": usage["ttft"],
+                "llm_time": usage["llm_time"],
+                "repaired_fields": metadata.get("repaired_fields", []),
+                "cascade": metadata.get("cascade"),
+                "duplicate": metadata.get("duplicate"),
                 "pdf_size_kb": len(content) / 1024,
                 "pdf_text_length": len(pdf_text),
             },
@@ -175,6 +237,9 @@ async def generate_ficha(
     except Exception as e:
         logger.error(f"[{ficha_id}] Error generando ficha: {e}", exc_info=True)
 
+        # Lo gastado en una generación fallida también se factura
+        await asyncio.to_thread(_record_usage, usage_entries(ficha_id, request_config.usuario, error=e))
+
         # Limpiar archivos temporales
         Path(settings.TEMP_DIR).joinpath(f"{ficha_id}.pdf").unlink(missing_ok=True)
 
@@ -185,6 +250,61 @@ async def generate_ficha(
         )
 
 
+def _record_usage(entries: List[Dict[str, Any]]) -> None:
+    """Guarda registros de uso sin que un fallo del registro tumbe la petición."""
+    for entry in entries:
+        try:
+            usage_ledger.record(entry)
+        except Exception as e:
+            logger.error(f"Error registrando uso de {entry['ficha_id']}: {e}")
+
+
+async def _from_duplicate(duplicate: Dict[str, Any], pdf_text: str, processor, usuario: str) -> Dict[str, Any]:
+    """
+    Resultado para un documento casi idéntico a otro ya procesado.
+
+    Con DUPLICATE_MODE=regenerate solo se regeneran los campos afectados por
+    el diff; si no hay campos afectados (o en modo reuse) se devuelve la
+    ficha anterior sin llamar al LLM. En ambos casos USUARIO y FECHA son los
+    de la petición actual.
+
+    Args:
+        duplicate: Coincidencia devuelta por DuplicateIndex.find
+        pdf_text: Texto del documento nuevo
+        processor: LLMProcessor para la actualización
+        usuario: Usuario de la petición
+
+    Returns:
+        Dict con la ficha y metadata (incluye "duplicate")
+    """
+    diff_lines = text_diff(duplicate["text"], pdf_text)
+    fields = touched_fields(diff_lines, duplicate["ficha"])
+
+    if fields and settings.DUPLICATE_MODE == "regenerate":
+        result = await processor.aupdate_ficha(pdf_text, duplicate["ficha"], fields, diff_lines)
+    else:
+        fields = []
+        result = {
+            "ficha": FichaData(**duplicate["ficha"]),
+            "metadata": {
+                "model": duplicate["metadata"].get("model", ""),
+                "provider": duplicate["metadata"].get("provider", ""),
+                "rag_enabled": False,
+                "rag_examples_count": 0,
+            },
+        }
+
+    result["ficha"] = restamp_ficha(result["ficha"], usuario)
+    result["metadata"]["duplicate"] = {
+        "ficha_id": duplicate["doc_id"],
+        "similarity": duplicate["similarity"],
+        "reused": not fields,
+        "updated_fields": fields,
+        "diff": diff_lines[:50],
+    }
+    return result
+
+
 @router.get("/download/{ficha_id}")
 async def download_ficha(ficha_id: str):
     """
@@ -234,6 +354,65 @@ async def get_status(ficha_id: str):
         }
 
 
+@router.get("/models")
+async def get_models():
+    """
+    Modelos disponibles y estadísticas de escalado de la cascada.
+
+    Returns:
+        Alias disponibles, orden de la cascada y tasas de escalado por tipo de documento
+    """
+    if not model_pool:
+        raise HTTPException(status_code=503, detail="Pool de modelos no inicializado")
+
+    return {
+        "default": model_pool.default.model_name,
+        "available": model_pool.available(),
+        "cascade": model_pool.cascade,
+        "escalation_stats": model_pool.stats.snapshot(),
+    }
+
+
+@router.get("/usage")
+async def get_usage(
+    group_by: str = Query("day,model,usuario", description="Dimensiones: day, model, provider, usuario"),
+    since: Optional[date] = Query(None, description="Fecha inicial (AAAA-MM-DD)"),
+    until: Optional[date] = Query(None, description="Fecha final (AAAA-MM-DD)"),
+    format: str = Query("json", pattern="^(json|csv)$", description="json o csv"),
+):
+    """
+    Uso agregado de LLM: tokens, coste estimado, TTFT y tiempo de LLM.
+    """
+    try:
+        rows = await asyncio.to_thread(
+            usage_ledger.summary,
+            [name.strip() for name in group_by.split(",") if name.strip()],
+            since,
+            until,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "csv":
+        return PlainTextResponse(to_csv(rows), media_type="text/csv")
+    return {
+        "rows": rows,
+        "total_cost_usd": round(sum(row["cost_usd"] for row in rows), 6),
+        "total_requests": sum(row["requests"] for row in rows),
+    }
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    """
+    Métricas del planificador de llamadas por proveedor y modelo.
+
+    Returns:
+        Concurrencia actual, profundidad de cola y tiempo de espera por límites
+    """
+    return {"enabled": settings.ENABLE_LLM_SCHEDULER, "schedulers": scheduler_stats()}
+
+
 @router.get("/rag/info")
 async def get_rag_info():
     """
@@ -260,7 +439,7 @@ def initialize_services():
     """
     Inicializa servicios globales (llamar en startup).
     """
-    global rag_system, llm_processor
+    global rag_system, llm_processor, model_pool, duplicate_index
 
     logger.info("Inicializando servicios...")
 
@@ -269,8 +448,14 @@ def initialize_services():
         rag_system = RAGSystem()
         logger.info(f"RAG System inicializado: {rag_system.count()} fichas indexadas")
 
-    # Inicializar LLM Processor
-    llm_processor = LLMProcessor(rag_system=rag_system)
+    # Inicializar pool de modelos (el procesador por defecto es el global)
+    model_pool = ModelPool(rag_system=rag_system)
+    llm_processor = model_pool.default
     logger.info("LLM Processor inicializado")
 
+    # Índice de documentos ya procesados (versiones republicadas)
+    if settings.ENABLE_DUPLICATE_DETECTION:
+        duplicate_index = DuplicateIndex(settings.DUPLICATE_INDEX_DIR)
+        logger.info(f"Índice de duplicados: {len(duplicate_index)} documentos")
+
     logger.info("✓ Servicios listos")
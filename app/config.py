@@ -4,7 +4,7 @@ Carga variables de entorno y configuraciones centralizadas.
 """
 
 from pydantic_settings import BaseSettings
-from typing import Literal, Optional
+from typing import Dict, Literal, Optional
 from pathlib import Path
 
 
@@ -16,14 +16,86 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = "gpt-4o"
     OPENAI_MAX_TOKENS: int = 4096
     OPENAI_TEMPERATURE: float = 0.3
+    OPENAI_BASE_URL: Optional[str] = None
 
     ANTHROPIC_API_KEY: Optional[str] = None
     ANTHROPIC_MODEL: str = "claude-3-5-sonnet-20241022"
     ANTHROPIC_MAX_TOKENS: int = 4096
     ANTHROPIC_TEMPERATURE: float = 0.3
+    ANTHROPIC_BASE_URL: Optional[str] = None
 
     DEFAULT_LLM_PROVIDER: Literal["openai", "anthropic"] = "anthropic"
 
+    # === LLM Resilience ===
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY: float = 1.0
+    LLM_RETRY_MAX_DELAY: float = 20.0
+    LLM_FALLBACK_PROVIDER: Optional[Literal["openai", "anthropic"]] = None
+    ENABLE_LLM_HEDGING: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.9
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_HEDGE_DEFAULT_DELAY: float = 20.0
+    LLM_STREAM_MAX_REPROMPTS: int = 2  # Reintentos tras abortar el streaming por una violación
+    LLM_REPAIR_MAX_ROUNDS: int = 2  # Rondas de reparación por campos (0 = desactivada)
+
+    # === Planificador de llamadas (RPM/TPM) ===
+    ENABLE_LLM_SCHEDULER: bool = True
+    LLM_RATE_LIMIT_RPM: int = 0  # Peticiones por minuto por modelo (0 = sin límite; ajustar al tier de la cuenta)
+    LLM_RATE_LIMIT_TPM: int = 0  # Tokens por minuto por modelo (0 = sin límite)
+    # Por modelo (nombre o prefijo), p. ej. {"claude-3-5-sonnet": {"rpm": 50, "tpm": 40000}}
+    LLM_RATE_LIMITS: Dict[str, Dict[str, int]] = {}
+    LLM_SCHEDULER_MAX_CONCURRENCY: int = 32
+    LLM_SCHEDULER_LATENCY_TOLERANCE: float = 2.0  # Latencia > N x mediana reduce la concurrencia
+    LLM_SCHEDULER_OUTPUT_TOKENS: int = 1500  # Salida esperada al estimar el TPM de una llamada
+
+    # === Cascada de modelos ===
+    LLM_CASCADE_MODELS: str = "claude-3.5-haiku,claude-3.5-sonnet"  # Alias de más barato a más caro
+
+    # === Map-Reduce (documentos largos) ===
+    MAP_REDUCE_THRESHOLD_CHARS: int = 60000  # 0 = desactivado
+    MAP_REDUCE_CHUNK_CHARS: int = 12000
+    MAP_REDUCE_HEAD_CHARS: int = 4000
+    MAP_REDUCE_CONCURRENCY: int = 8
+    MAP_REDUCE_OPENAI_MODEL: str = "gpt-4o-mini"
+    MAP_REDUCE_ANTHROPIC_MODEL: str = "claude-3-5-haiku-20241022"
+    MAP_REDUCE_CACHE_DIR: str = "./data/cache/map_reduce"
+
+    # === LLM HTTP Pool ===
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE: int = 20
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_HTTP2: bool = True
+
+    # === Formato de salida ===
+    # prompt: schema como instrucciones de texto; native: tool use (Anthropic) / json_schema strict (OpenAI)
+    LLM_OUTPUT_MODE: Literal["prompt", "native"] = "prompt"
+
+    # === LLM simulado (record/replay) ===
+    LLM_REPLAY_MODE: Literal["off", "record", "replay"] = "off"
+    LLM_REPLAY_DIR: str = "./data/cache/llm_replay"
+    LLM_REPLAY_LATENCY: Optional[float] = None  # Segundos hasta el primer token (None = la grabada)
+    LLM_REPLAY_TOKENS_PER_SECOND: float = 0.0  # Ritmo del streaming (0 = sin espera)
+    LLM_REPLAY_ERROR_RATE: float = 0.0  # Fracción de errores 500/529 simulados
+    LLM_REPLAY_RATE_LIMIT_RATE: float = 0.0  # Fracción de 429 simulados
+    LLM_REPLAY_SEED: Optional[int] = None
+
+    # === Costes y uso ===
+    USAGE_LEDGER_DIR: str = "./data/usage"
+    # USD por millón de tokens, p. ej. {"gpt-4o": {"input": 2.5, "output": 10}}
+    LLM_PRICE_OVERRIDES: Dict[str, Dict[str, float]] = {}
+
+    # === Procesamiento por lotes (APIs batch) ===
+    BATCH_STATE_DIR: str = "./data/batches"
+    BATCH_MAX_REQUESTS: int = 10000  # Peticiones por batch (límite de ambos proveedores)
+    BATCH_POLL_INTERVAL: float = 60.0  # Segundos entre consultas de estado
+
+    # === Prompt Caching ===
+    ENABLE_PROMPT_CACHING: bool = True
+    PROMPT_CACHE_FEW_SHOT: bool = False
+
+    # === Almacén vectorial ===
+    VECTOR_STORE_BACKEND: Literal["chroma", "numpy"] = "chroma"  # numpy: matriz en memoria mapeada (corpus pequeños)
+
     # === ChromaDB ===
     CHROMA_PERSIST_DIRECTORY: str = "./data/vector_db"
     CHROMA_HOST: str = "localhost"
@@ -48,6 +120,44 @@ class Settings(BaseSettings):
     USE_RAG: bool = True
     RAG_TOP_K: int = 3
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: Literal["torch", "onnx"] = "torch"  # onnx: onnxruntime sin torch (nodos solo CPU)
+    EMBEDDING_ONNX_DIR: str = "./data/models/onnx"  # Modelos exportados con scripts/export_onnx_embeddings.py
+    EMBEDDING_ONNX_QUANTIZED: bool = True  # Usar la versión int8 si existe
+    EMBEDDING_ONNX_THREADS: int = 0  # Hilos de onnxruntime (0 = por defecto)
+    EMBEDDING_BATCH_SIZE: int = 32  # Textos por pasada del modelo de embeddings
+    # La query (PDF completo) se trocea en ventanas que caben en el modelo (256 word pieces)
+    RAG_QUERY_CHUNK_WORDS: int = 160
+    RAG_QUERY_CHUNK_OVERLAP: int = 20
+    RAG_QUERY_MAX_CHUNKS: int = 8  # Máximo de ventanas por query (latencia)
+    RAG_QUERY_POOLING: Literal["maxsim", "mean", "first"] = "maxsim"  # first = solo el inicio del texto
+    RAG_HYBRID: bool = True  # Fusionar la búsqueda densa con BM25 (Reciprocal Rank Fusion)
+    RAG_HYBRID_CANDIDATES: int = 20  # Candidatas de cada ranking antes de fusionar
+    RAG_RRF_K: int = 60
+    RAG_BM25_MAX_QUERY_TERMS: int = 64  # Términos de la query (PDF completo) con más tf·idf
+    # Ejemplos por campo: secciones CAMPO / CONCEPTO de las fichas indexadas aparte
+    RAG_FIELD_EXAMPLES: bool = True
+    RAG_FIELD_EXAMPLE_FIELDS: str = "cuantia,importe_maximo,requisitos_acceso,documentos_presentar"
+    RAG_FIELD_EXAMPLE_TOKENS: int = 600  # Presupuesto de todos los fragmentos (~4 caracteres por token)
+    RAG_EXAMPLE_HEAD_CHARS: int = 300  # Inicio de cada ficha de ejemplo cuando hay ejemplos por campo
+
+    # === Caché de embeddings ===
+    ENABLE_EMBEDDING_CACHE: bool = True
+    EMBEDDING_CACHE_DIR: Optional[str] = "./data/cache/embeddings"  # None = solo memoria
+    EMBEDDING_CACHE_MEMORY_ITEMS: int = 10000  # Vectores en el LRU en memoria
+
+    # === Indexación masiva ===
+    RAG_INDEX_BATCH_SIZE: int = 128  # Fichas leídas, codificadas y confirmadas en el manifiesto juntas
+    RAG_INDEX_WORKERS: int = 4  # Procesos que leen los .docx en paralelo (1 = sin pool)
+
+    # === Pre-extracción ===
+    USE_ENTITY_HINTS: bool = True
+    ENTITY_HINTS_MAX_PER_TYPE: int = 8
+
+    # === Documentos casi duplicados ===
+    ENABLE_DUPLICATE_DETECTION: bool = True
+    DUPLICATE_THRESHOLD: float = 0.9  # Jaccard mínimo de shingles
+    DUPLICATE_MODE: Literal["reuse", "regenerate"] = "regenerate"  # reuse: ficha anterior sin llamar al LLM
+    DUPLICATE_INDEX_DIR: str = "./data/cache/duplicates"
 
     # === Rate Limiting ===
     RATE_LIMIT_PER_MINUTE: int = 10
@@ -71,7 +181,9 @@ class Settings(BaseSettings):
     ENABLE_BATCH_PROCESSING: bool = True
     ENABLE_DOWNLOAD: bool = True
     ENABLE_QUALITY_CHECK: bool = True
+    QUALITY_MIN_SCORE: int = 70  # Puntuación mínima (0-100) para aprobar el control de calidad
     ENABLE_STREAMING: bool = False
+    ENABLE_PARALLEL_GROUPS: bool = False  # Generar grupos de campos en llamadas concurrentes
 
     class Config:
         env_file = ".env"
@@ -107,6 +219,13 @@ class Settings(BaseSettings):
                 "temperature": self.ANTHROPIC_TEMPERATURE,
             }
 
+    def get_llm_api_key(self, provider: str) -> Optional[str]:
+        """Retorna la API key configurada para un proveedor."""
+        return {
+            "openai": self.OPENAI_API_KEY,
+            "anthropic": self.ANTHROPIC_API_KEY,
+        }.get(provider)
+
     def ensure_directories(self) -> None:
         """Crea directorios necesarios si no existen."""
         directories = [
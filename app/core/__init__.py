@@ -1,15 +1,28 @@
 """
 Módulos core del sistema de generación de fichas.
+
+Las clases se importan bajo demanda: cargar PDFExtractor no debe arrastrar
+LangChain, ChromaDB ni PyTorch (relevante en procesos worker y scripts).
 """
 
-from .pdf_extractor import PDFExtractor
-from .llm_processor import LLMProcessor
-from .rag_system import RAGSystem
-from .word_generator import WordGenerator
-
-__all__ = [
-    "PDFExtractor",
-    "LLMProcessor",
-    "RAGSystem",
-    "WordGenerator",
-]
+from importlib import import_module
+
+_EXPORTS = {
+    "PDFExtractor": ".pdf_extractor",
+    "LLMProcessor": ".llm_processor",
+    "RAGSystem": ".rag_system",
+    "WordGenerator": ".word_generator",
+    "EntityScanner": ".entity_scanner",
+    "ModelPool": ".model_pool",
+    "DuplicateIndex": ".near_duplicates",
+    "BulkJob": ".batch_jobs",
+    "QualityChecker": ".quality_checker",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
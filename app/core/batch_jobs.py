@@ -0,0 +1,523 @@
+"""
+Generación masiva con las APIs batch de los proveedores.
+Construye las peticiones de muchos PDFs, las envía a Anthropic Message Batches
+u OpenAI Batch API (50% más baratas y fuera de los límites de rate), espera a
+que terminen y parsea, valida y genera los .docx. El estado se guarda en disco
+tras cada paso para reanudar el trabajo tras un reinicio.
+"""
+
+import io
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+
+from langchain_core.messages import AIMessage
+
+from app.config import settings
+from app.core.llm_processor import LLMProcessor
+from app.core.pdf_extractor import PDFExtractor
+from app.core.rate_scheduler import BULK, llm_priority
+from app.core.usage_ledger import UsageLedger, usage_entries
+from app.core.word_generator import WordGenerator
+
+
+# Estados de un documento dentro del trabajo
+PENDING, SUBMITTED, RENDERED, FAILED = "pending", "submitted", "rendered", "failed"
+
+# Margen (segundos) entre la marca de envío y el created_at del proveedor
+SUBMISSION_CLOCK_SKEW = 300
+
+
+class AnthropicBatchBackend:
+    """
+    Anthropic Message Batches (/v1/messages/batches).
+    """
+
+    def __init__(self, client=None):
+        """
+        Args:
+            client: anthropic.Anthropic (por defecto, con la configuración de settings)
+        """
+        if client is None:
+            import anthropic
+
+            client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY, base_url=settings.ANTHROPIC_BASE_URL)
+        self.client = client
+
+    def submit(self, requests: List[Tuple[str, Dict[str, Any]]], submission: Optional[str] = None) -> str:
+        """Envía las peticiones (custom_id, params) y devuelve el ID del batch."""
+        batch = self.client.messages.batches.create(
+            requests=[{"custom_id": custom_id, "params": params} for custom_id, params in requests]
+        )
+        return batch.id
+
+    def find(self, submission: Dict[str, Any]) -> Optional[str]:
+        """
+        Busca el batch de un envío interrumpido.
+
+        Message Batches no admite metadatos: se elige el batch creado desde la
+        marca con el mismo número de peticiones y, si ya ha terminado, con
+        los mismos custom_id.
+
+        Args:
+            submission: Marca de envío (documents, started_at)
+
+        Returns:
+            ID del batch o None si el envío no llegó al proveedor
+        """
+        documents = set(submission["documents"])
+        for batch in self.client.messages.batches.list(limit=100):
+            if batch.created_at.timestamp() < submission["started_at"] - SUBMISSION_CLOCK_SKEW:
+                break  # La lista va de más reciente a más antiguo
+            if sum(vars(batch.request_counts).values()) != len(documents):
+                continue
+            if batch.processing_status == "ended" and documents != {
+                item.custom_id for item in self.client.messages.batches.results(batch.id)
+            }:
+                continue
+            return batch.id
+        return None
+
+    def is_done(self, batch_id: str) -> bool:
+        """Indica si el batch ha terminado."""
+        return self.client.messages.batches.retrieve(batch_id).processing_status == "ended"
+
+    def results(self, batch_id: str) -> Iterator[Tuple[str, Optional[AIMessage], Optional[str]]]:
+        """
+        Resultados del batch.
+
+        Yields:
+            Tuplas (custom_id, respuesta o None, error o None)
+        """
+        for item in self.client.messages.batches.results(batch_id):
+            if item.result.type != "succeeded":
+                error = getattr(item.result, "error", None)
+                yield item.custom_id, None, f"{item.result.type}: {error}"
+                continue
+
+            message = item.result.message
+            parts = []
+            for block in message.content:
+                if block.type == "text":
+                    parts.append(block.text)
+                elif block.type == "tool_use":
+                    parts.append(json.dumps(block.input, ensure_ascii=False))
+
+            usage = message.usage
+            cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+            cache_creation = getattr(usage, "cache_creation_input_tokens", None) or 0
+            input_tokens = usage.input_tokens + cache_read + cache_creation
+            yield item.custom_id, AIMessage(
+                content="".join(parts),
+                usage_metadata={
+                    "input_tokens": input_tokens,
+                    "output_tokens": usage.output_tokens,
+                    "total_tokens": input_tokens + usage.output_tokens,
+                    "input_token_details": {"cache_read": cache_read, "cache_creation": cache_creation},
+                },
+            ), None
+
+
+class OpenAIBatchBackend:
+    """
+    OpenAI Batch API (fichero JSONL + /v1/batches sobre /v1/chat/completions).
+    """
+
+    def __init__(self, client=None):
+        """
+        Args:
+            client: openai.OpenAI (por defecto, con la configuración de settings)
+        """
+        if client is None:
+            import openai
+
+            client = openai.OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+        self.client = client
+
+    def submit(self, requests: List[Tuple[str, Dict[str, Any]]], submission: Optional[str] = None) -> str:
+        """
+        Sube el JSONL de peticiones, crea el batch y devuelve su ID.
+
+        El identificador del envío viaja en los metadatos del batch para
+        encontrarlo si el proceso se interrumpe antes de guardar el ID.
+        """
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": params},
+                       ensure_ascii=False)
+            for custom_id, params in requests
+        ]
+        upload = self.client.files.create(
+            file=("batch.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            **({"metadata": {"bulk_submission": submission}} if submission else {}),
+        )
+        return batch.id
+
+    def find(self, submission: Dict[str, Any]) -> Optional[str]:
+        """
+        Busca el batch de un envío interrumpido por sus metadatos.
+
+        Args:
+            submission: Marca de envío (submission, started_at)
+
+        Returns:
+            ID del batch o None si el envío no llegó al proveedor
+        """
+        for batch in self.client.batches.list(limit=100):
+            if batch.created_at < submission["started_at"] - SUBMISSION_CLOCK_SKEW:
+                break  # La lista va de más reciente a más antiguo
+            if (batch.metadata or {}).get("bulk_submission") == submission["submission"]:
+                return batch.id
+        return None
+
+    def is_done(self, batch_id: str) -> bool:
+        """Indica si el batch ha terminado (con éxito o no)."""
+        return self.client.batches.retrieve(batch_id).status in {"completed", "failed", "expired", "cancelled"}
+
+    def results(self, batch_id: str) -> Iterator[Tuple[str, Optional[AIMessage], Optional[str]]]:
+        """
+        Resultados del batch (fichero de salida y de errores).
+
+        Yields:
+            Tuplas (custom_id, respuesta o None, error o None)
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code") != 200:
+                    yield item["custom_id"], None, str(item.get("error") or response.get("body"))
+                    continue
+
+                body = response["body"]
+                usage = body.get("usage") or {}
+                cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+                yield item["custom_id"], AIMessage(
+                    content=body["choices"][0]["message"]["content"] or "",
+                    usage_metadata={
+                        "input_tokens": usage.get("prompt_tokens", 0),
+                        "output_tokens": usage.get("completion_tokens", 0),
+                        "total_tokens": usage.get("total_tokens", 0),
+                        "input_token_details": {"cache_read": cached},
+                    },
+                ), None
+
+
+def create_backend(provider: str):
+    """Backend batch del proveedor."""
+    if provider == "anthropic":
+        return AnthropicBatchBackend()
+    if provider == "openai":
+        return OpenAIBatchBackend()
+    raise ValueError(f"Proveedor no soportado: {provider}")
+
+
+class BulkJob:
+    """
+    Trabajo de generación masiva reanudable.
+
+    El estado (documentos, batches enviados y resultado de cada documento)
+    se guarda en un JSON tras cada paso; volver a ejecutar run() continúa
+    desde donde se quedó sin reenviar lo ya enviado. Cada batch se anota
+    como marca de envío antes de llamar al proveedor, de modo que un envío
+    interrumpido se localiza en el proveedor en lugar de pagarse dos veces,
+    y la línea de results.jsonl de cada ficha hace de confirmación: una
+    ficha escrita pero no guardada en el estado no se vuelve a procesar.
+    """
+
+    def __init__(
+        self,
+        state_path: str | Path,
+        output_dir: str | Path,
+        processor: Optional[LLMProcessor] = None,
+        backend=None,
+        ledger: Optional[UsageLedger] = None,
+        usuario: str = "PROYECTO_FICHAS_IA",
+    ):
+        """
+        Args:
+            state_path: Fichero JSON de estado del trabajo
+            output_dir: Directorio de los .docx y de results.jsonl
+            processor: LLMProcessor para construir y parsear las peticiones
+            backend: Backend batch (por defecto, el del proveedor del procesador)
+            ledger: Registro de uso (por defecto, el de USAGE_LEDGER_DIR)
+            usuario: Usuario al que se imputa el uso del trabajo
+        """
+        self.state_path = Path(state_path)
+        self.output_dir = Path(output_dir)
+        self.processor = processor or LLMProcessor()
+        self.backend = backend or create_backend(self.processor.provider)
+        self.ledger = ledger or UsageLedger(settings.USAGE_LEDGER_DIR)
+        self.usuario = usuario
+        self.extractor = PDFExtractor()
+        self.word_generator = WordGenerator()
+        self.state = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        if self.state_path.exists():
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            logger.info(f"Reanudando trabajo {self.state_path.name} ({len(state['documents'])} documentos)")
+            return state
+        return {
+            "provider": self.processor.provider,
+            "model": self.processor.model_name,
+            "documents": {},
+            "batches": [],
+        }
+
+    def _save(self) -> None:
+        """Guarda el estado (escritura atómica)."""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    def counts(self) -> Dict[str, int]:
+        """Número de documentos por estado."""
+        counts: Dict[str, int] = {}
+        for doc in self.state["documents"].values():
+            counts[doc["status"]] = counts.get(doc["status"], 0) + 1
+        return counts
+
+    def add_documents(self, pdf_paths: List[Path]) -> int:
+        """
+        Añade PDFs al trabajo (los ya presentes se ignoran).
+
+        Returns:
+            Número de documentos nuevos
+        """
+        known = {doc["pdf"] for doc in self.state["documents"].values()}
+        added = 0
+        for pdf_path in pdf_paths:
+            if str(pdf_path) in known:
+                continue
+            custom_id = f"doc-{len(self.state['documents']):05d}"
+            self.state["documents"][custom_id] = {"pdf": str(pdf_path), "status": PENDING}
+            added += 1
+        self._save()
+        return added
+
+    def submit(self, use_rag: bool = True) -> List[str]:
+        """
+        Construye y envía las peticiones de los documentos pendientes, en
+        batches de hasta BATCH_MAX_REQUESTS.
+
+        Antes de cada envío se guarda una marca (batch sin ID con sus
+        documentos); si el proceso cae durante el envío, la siguiente
+        ejecución la resuelve con _reconcile antes de reenviar nada.
+
+        Args:
+            use_rag: Si incluir ejemplos RAG en el prompt
+
+        Returns:
+            IDs de los batches enviados
+        """
+        self._reconcile()
+        pending = [cid for cid, doc in self.state["documents"].items() if doc["status"] == PENDING]
+        submitted = []
+
+        for start in range(0, len(pending), settings.BATCH_MAX_REQUESTS):
+            requests = []
+            for custom_id in pending[start:start + settings.BATCH_MAX_REQUESTS]:
+                doc = self.state["documents"][custom_id]
+                try:
+                    pdf_text = self.extractor.extract_text(doc["pdf"])
+                    request = self.processor.build_request_payload(pdf_text, use_rag=use_rag)
+                except Exception as e:
+                    doc.update(status=FAILED, error=f"Preparación: {e}")
+                    continue
+                doc["rag_examples_count"] = request.pop("rag_examples_count")
+                requests.append((custom_id, request["payload"]))
+
+            if not requests:
+                continue
+
+            batch = {
+                "id": None,
+                "documents": [cid for cid, _ in requests],
+                "collected": False,
+                "submission": uuid.uuid4().hex,
+                "started_at": time.time(),
+            }
+            self.state["batches"].append(batch)
+            self._save()
+
+            batch_id = self.backend.submit(requests, batch["submission"])
+            batch["id"] = batch_id
+            for custom_id, _ in requests:
+                self.state["documents"][custom_id].update(status=SUBMITTED, batch_id=batch_id)
+            self._save()
+            submitted.append(batch_id)
+            logger.info(f"Batch {batch_id} enviado con {len(requests)} peticiones")
+
+        return submitted
+
+    def _reconcile(self) -> None:
+        """
+        Resuelve las marcas de envío sin ID de batch: si el proveedor recibió
+        el batch se adopta su ID; si no, se descarta la marca y sus
+        documentos siguen pendientes.
+        """
+        for batch in [b for b in self.state["batches"] if b["id"] is None]:
+            batch_id = self.backend.find(batch)
+            if batch_id is None:
+                logger.warning(f"Envío {batch['submission']} interrumpido antes de llegar al proveedor: se reenviará")
+                self.state["batches"].remove(batch)
+            else:
+                logger.info(f"Envío {batch['submission']} interrumpido: recuperado el batch {batch_id}")
+                batch["id"] = batch_id
+                for custom_id in batch["documents"]:
+                    self.state["documents"][custom_id].update(status=SUBMITTED, batch_id=batch_id)
+            self._save()
+
+    def wait(self, poll_interval: float = 60.0, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que terminen los batches enviados.
+
+        Args:
+            poll_interval: Segundos entre consultas
+            timeout: Espera máxima (None = sin límite)
+
+        Returns:
+            True si todos han terminado
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            open_batches = [
+                b for b in self.state["batches"]
+                if b["id"] is not None and not b["collected"] and not self.backend.is_done(b["id"])
+            ]
+            if not open_batches:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            logger.info(f"{len(open_batches)} batches en proceso; nueva consulta en {poll_interval:.0f}s")
+            time.sleep(poll_interval)
+
+    def collect(self) -> int:
+        """
+        Procesa los resultados de los batches terminados: parseo, validación
+        (con reparación por campos), generación del .docx y registro del uso.
+
+        Las fichas que ya tienen línea en results.jsonl (escritas antes de
+        una interrupción) se marcan como generadas sin volver a procesarlas.
+
+        Returns:
+            Número de fichas generadas
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        written = self._written_results()
+        rendered = 0
+
+        for batch in self.state["batches"]:
+            if batch["id"] is None or batch["collected"] or not self.backend.is_done(batch["id"]):
+                continue
+
+            for custom_id, response, error in self.backend.results(batch["id"]):
+                doc = self.state["documents"].get(custom_id)
+                if doc is None or doc["status"] != SUBMITTED:
+                    continue
+                if custom_id in written:
+                    doc.update(status=RENDERED, docx=written[custom_id])
+                elif response is None:
+                    doc.update(status=FAILED, error=error)
+                else:
+                    rendered += self._render(custom_id, doc, response, batch["id"])
+                self._save()
+
+            # Documentos sin resultado (caducados o cancelados)
+            for custom_id in batch["documents"]:
+                doc = self.state["documents"][custom_id]
+                if doc["status"] == SUBMITTED:
+                    doc.update(status=FAILED, error="Sin resultado en el batch")
+            batch["collected"] = True
+            self._save()
+
+        return rendered
+
+    def _written_results(self) -> Dict[str, str]:
+        """Fichas ya escritas en results.jsonl: {custom_id: ruta del .docx}."""
+        path = self.output_dir / "results.jsonl"
+        if not path.exists():
+            return {}
+        written = {}
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Línea truncada por una interrupción
+            written[record["custom_id"]] = record["docx"]
+        return written
+
+    def _record_usage(self, entries: List[Dict[str, Any]]) -> None:
+        """Guarda registros de uso sin que un fallo del registro detenga el trabajo."""
+        for entry in entries:
+            try:
+                self.ledger.record(entry)
+            except Exception as e:
+                logger.error(f"Error registrando uso de {entry['ficha_id']}: {e}")
+
+    def _render(self, custom_id: str, doc: Dict[str, Any], response: AIMessage, batch_id: str) -> int:
+        """Valida la respuesta de un documento, genera su .docx y registra el uso."""
+        ficha_id = f"{self.state_path.stem}/{custom_id}"
+        pdf_path = Path(doc["pdf"])
+        try:
+            pdf_text = self.extractor.extract_text(pdf_path)
+            # Las reparaciones van por la API normal, detrás de las peticiones interactivas
+            with llm_priority(BULK):
+                result = self.processor.finish_batch_generation(
+                    response, pdf_text, batch_id, doc.get("rag_examples_count", 0)
+                )
+            output_path = self.output_dir / f"{custom_id}_{pdf_path.stem}.docx"
+            self.word_generator.generate(result["ficha"], output_path)
+        except Exception as e:
+            logger.warning(f"{custom_id} ({pdf_path.name}): {e}")
+            # La respuesta batch y las reparaciones ya se han facturado
+            self._record_usage(usage_entries(ficha_id, self.usuario, error=e))
+            doc.update(status=FAILED, error=str(e))
+            return 0
+
+        with open(self.output_dir / "results.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps({"custom_id": custom_id, "pdf": str(pdf_path), "docx": str(output_path),
+                                "metadata": result["metadata"]}, ensure_ascii=False, default=str) + "\n")
+        self._record_usage(usage_entries(ficha_id, self.usuario, result["metadata"]))
+        doc.update(status=RENDERED, docx=str(output_path))
+        return 1
+
+    def run(
+        self,
+        pdf_paths: List[Path],
+        use_rag: bool = True,
+        poll_interval: float = 60.0,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, int]:
+        """
+        Ejecuta (o reanuda) el trabajo completo.
+
+        Args:
+            pdf_paths: PDFs a procesar
+            use_rag: Si incluir ejemplos RAG
+            poll_interval: Segundos entre consultas de estado
+            timeout: Espera máxima de los batches (None = sin límite)
+
+        Returns:
+            Número de documentos por estado
+        """
+        self.add_documents(pdf_paths)
+        self.submit(use_rag=use_rag)
+        if self.wait(poll_interval, timeout):
+            self.collect()
+        return self.counts()
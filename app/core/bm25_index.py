@@ -0,0 +1,215 @@
+"""
+Índice léxico BM25 del sistema RAG.
+Índice invertido en memoria (persistido en JSON junto al almacén vectorial)
+que complementa la búsqueda densa: las fichas comparten mucha redacción
+fija, pero los términos raros (tipo de ayuda, colectivo, municipio) pesan
+más en BM25 que en un embedding.
+"""
+
+import re
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.vector_store import match_where
+
+
+# Palabras vacías del español (más las de la redacción fija de las fichas)
+STOPWORDS = frozenset(
+    """
+    a al algo ante antes como con contra cual cuando de del desde donde durante e el ella ellas ellos en entre
+    era es esa ese eso esta este esto estos estas ha han hasta la las le les lo los mas me mi mientras muy
+    nbsp ni no nos o otra otro para pero por porque que quien se sea ser si sin sobre su sus tambien te
+    tiene tienen todo todos tras tu un una uno unos unas y ya
+    podran beneficiarias cuantia ayuda ayudas sera siguientes requisitos optar son
+    """.split()
+)
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokens normalizados: minúsculas, sin tildes, sin palabras vacías ni
+    tokens de un carácter.
+
+    Args:
+        text: Texto
+
+    Returns:
+        Lista de tokens
+    """
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(char for char in text if unicodedata.category(char) != "Mn")
+    return [token for token in _TOKEN.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fusiona rankings por Reciprocal Rank Fusion: score = suma de 1 / (k + rango).
+
+    Args:
+        rankings: Listas de ids ordenadas de mejor a peor
+        k: Constante de RRF (60 en el artículo original)
+
+    Returns:
+        Lista (id, score) de mayor a menor score
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 (Okapi) con prefiltro de metadatos.
+
+    Se guardan las frecuencias de términos de cada documento; las listas
+    de postings (arrays NumPy por término) se reconstruyen tras cada cambio.
+    Los cambios se escriben a disco al llamar a flush(): reescribir el JSON
+    completo en cada upsert haría cuadrática la indexación por lotes.
+    """
+
+    def __init__(self, path: Optional[Path] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            path: Fichero JSON del índice (None = solo memoria)
+            k1: Saturación de la frecuencia de término
+            b: Normalización por longitud del documento
+        """
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._postings: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None
+        self.dirty = False
+
+        if self.path and self.path.exists():
+            try:
+                self.docs = json.loads(self.path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                logger.warning(f"Índice BM25 corrupto en {self.path}; se reconstruirá")
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _build(self) -> None:
+        """Reconstruye postings, longitudes e IDF a partir de las frecuencias."""
+        self._ids = list(self.docs)
+        self._metadatas = [self.docs[doc_id]["metadata"] for doc_id in self._ids]
+        self._lengths = np.array([self.docs[doc_id]["length"] for doc_id in self._ids], dtype=np.float32)
+        self._avgdl = float(self._lengths.mean()) if len(self._lengths) else 0.0
+
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for position, doc_id in enumerate(self._ids):
+            for term, tf in self.docs[doc_id]["tf"].items():
+                entry = postings.setdefault(term, ([], []))
+                entry[0].append(position)
+                entry[1].append(tf)
+
+        n = len(self._ids)
+        self._idf = {term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for term, (docs, _) in postings.items()}
+        self._postings = {
+            term: (np.array(docs, dtype=np.int32), np.array(tfs, dtype=np.float32))
+            for term, (docs, tfs) in postings.items()
+        }
+
+    def flush(self) -> None:
+        """Escribe el índice a disco (escritura atómica) si hay cambios pendientes."""
+        with self._lock:
+            if not self.dirty or not self.path:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.docs, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.path)
+            self.dirty = False
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """
+        Inserta o reemplaza documentos.
+
+        Args:
+            ids: Ids
+            documents: Textos
+            metadatas: Metadatos (para el prefiltro)
+        """
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                tokens = tokenize(document)
+                self.docs[doc_id] = {"tf": dict(Counter(tokens)), "length": len(tokens), "metadata": metadata}
+            self._postings = None
+            self.dirty = True
+
+    def delete(self, ids: List[str]) -> None:
+        """Elimina documentos por id."""
+        with self._lock:
+            for doc_id in ids:
+                self.docs.pop(doc_id, None)
+            self._postings = None
+            self.dirty = True
+
+    def clear(self) -> None:
+        """Vacía el índice."""
+        with self._lock:
+            self.docs = {}
+            self._postings = None
+            self.dirty = True
+
+    def search(
+        self,
+        query: str,
+        n: int,
+        where: Optional[Dict[str, Any]] = None,
+        max_query_terms: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Los n documentos con mayor puntuación BM25.
+
+        Con queries largas (un PDF completo) solo se usan los max_query_terms
+        términos con mayor frecuencia en la query × IDF.
+
+        Args:
+            query: Texto de búsqueda
+            n: Número de resultados
+            where: Filtro de metadatos con la sintaxis de ChromaDB
+            max_query_terms: Máximo de términos de la query (None = todos)
+
+        Returns:
+            Lista (id, score) de mayor a menor score (solo score > 0)
+        """
+        with self._lock:
+            if self._postings is None:
+                self._build()
+            postings, idf, ids = self._postings, self._idf, self._ids
+            lengths, avgdl, metadatas = self._lengths, self._avgdl, self._metadatas
+        if not ids:
+            return []
+
+        counts = Counter(term for term in tokenize(query) if term in postings)
+        terms = sorted(counts, key=lambda term: -counts[term] * idf[term])[:max_query_terms]
+
+        norm = self.k1 * (1 - self.b + self.b * lengths / (avgdl or 1.0))
+        scores = np.zeros(len(ids), dtype=np.float32)
+        for term in terms:
+            docs, tfs = postings[term]
+            scores[docs] += idf[term] * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        if where:
+            scores[[i for i, metadata in enumerate(metadatas) if not match_where(metadata, where)]] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(ids[i], float(scores[i])) for i in candidates]
@@ -0,0 +1,183 @@
+"""
+Backends de embeddings del sistema RAG.
+torch: SentenceTransformer (PyTorch). onnx: el mismo modelo exportado a ONNX
+(opcionalmente cuantizado a int8) con onnxruntime y tokenizers, sin importar
+torch, para nodos solo CPU.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+from app.core.embedding_cache import model_slug
+
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    """Directorio del modelo exportado (EMBEDDING_ONNX_DIR/<modelo>)."""
+    return Path(settings.EMBEDDING_ONNX_DIR) / model_slug(model_name)
+
+
+def mean_pooling(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """
+    Media de los estados de los tokens reales (sin padding), normalizada L2.
+
+    Es el pooling de all-MiniLM-L6-v2 (Pooling mean + Normalize).
+
+    Args:
+        hidden: Estados (batch, tokens, dimensión)
+        attention_mask: Máscara (batch, tokens)
+
+    Returns:
+        Embeddings (batch, dimensión)
+    """
+    mask = attention_mask[..., np.newaxis].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.clip(norms, 1e-12, None)
+
+
+class OnnxEmbeddingModel:
+    """
+    Modelo de sentence embeddings ejecutado con onnxruntime.
+
+    Espera en model_dir el tokenizer.json del modelo y model.onnx (y
+    model_int8.onnx si se cuantizó), tal como los genera
+    scripts/export_onnx_embeddings.py. encode() tiene la misma firma básica que
+    SentenceTransformer.encode.
+    """
+
+    def __init__(
+        self,
+        model_dir: Union[str, Path],
+        quantized: bool = True,
+        batch_size: int = 32,
+        threads: Optional[int] = None,
+    ):
+        """
+        Args:
+            model_dir: Directorio del modelo exportado
+            quantized: Usar model_int8.onnx si existe
+            batch_size: Textos por ejecución del modelo
+            threads: Hilos intra-op de onnxruntime (None = por defecto)
+
+        Raises:
+            FileNotFoundError: Si falta el modelo o el tokenizer
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        self.batch_size = batch_size
+
+        model_path = self.model_dir / ONNX_MODEL_FILE
+        if quantized:
+            if (self.model_dir / ONNX_INT8_MODEL_FILE).exists():
+                model_path = self.model_dir / ONNX_INT8_MODEL_FILE
+            else:
+                logger.warning(f"No hay {ONNX_INT8_MODEL_FILE} en {self.model_dir}; se usa el modelo sin cuantizar")
+        tokenizer_path = self.model_dir / "tokenizer.json"
+        for path in (model_path, tokenizer_path):
+            if not path.exists():
+                raise FileNotFoundError(
+                    f"{path} no existe; exporta el modelo con scripts/export_onnx_embeddings.py"
+                )
+
+        # Longitud máxima del modelo (sentence-transformers la guarda aparte)
+        max_length = 256
+        config_path = self.model_dir / "sentence_bert_config.json"
+        if config_path.exists():
+            max_length = json.loads(config_path.read_text(encoding="utf-8")).get("max_seq_length", max_length)
+        self.max_length = max_length
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        padding = self.tokenizer.padding or {}
+        self.tokenizer.enable_padding(pad_id=padding.get("pad_id", 0), pad_token=padding.get("pad_token", "[PAD]"))
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.model_path = model_path
+        # Los vectores int8 difieren ligeramente de los de torch: caché y manifiesto propios
+        self.embedding_id = f"{self.model_dir.name}+onnx-{model_path.stem}"
+        logger.info(f"Modelo de embeddings ONNX cargado: {model_path}")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        return mean_pooling(hidden, attention_mask)
+
+    def encode(self, sentences: Union[str, List[str]], **kwargs: Any) -> np.ndarray:
+        """
+        Genera embeddings normalizados.
+
+        Los textos se ordenan por longitud para que cada lote rellene lo mínimo.
+
+        Args:
+            sentences: Texto o lista de textos
+            batch_size: Textos por ejecución del modelo (por defecto el del constructor)
+
+        Returns:
+            Vector (un texto) o matriz (lista de textos)
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        batch_size = kwargs.get("batch_size") or self.batch_size
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                embeddings[i] = vector
+        result = np.array(embeddings, dtype=np.float32)
+        return result[0] if single else result
+
+
+def create_embedding_model(model_name: str, backend: Optional[str] = None):
+    """
+    Crea el modelo de embeddings del backend configurado.
+
+    Args:
+        model_name: Modelo (nombre de sentence-transformers)
+        backend: torch u onnx (None = EMBEDDING_BACKEND)
+
+    Returns:
+        Objeto con encode(textos) -> np.ndarray
+
+    Raises:
+        ValueError: Si el backend no existe
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "onnx":
+        return OnnxEmbeddingModel(
+            onnx_model_dir(model_name),
+            quantized=settings.EMBEDDING_ONNX_QUANTIZED,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            threads=settings.EMBEDDING_ONNX_THREADS or None,
+        )
+    if backend == "torch":
+        # Import diferido: torch solo se carga con este backend
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name)
+    raise ValueError(f"Backend de embeddings no soportado: {backend}")
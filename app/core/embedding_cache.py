@@ -0,0 +1,229 @@
+"""
+Caché de embeddings.
+Evita recalcular los embeddings de textos ya vistos (PDFs reenviados, fichas
+sin cambios al reindexar) con dos niveles: un LRU en memoria y un almacén en
+disco de solo anexado que se lee con memory-map.
+"""
+
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+def text_key(text: str) -> str:
+    """
+    Clave de caché de un texto normalizado (NFC y espacios colapsados).
+
+    Args:
+        text: Texto a codificar
+
+    Returns:
+        Hash SHA-1 en hexadecimal
+    """
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def model_slug(model_name: str) -> str:
+    """Nombre de directorio seguro para un modelo (p. ej. 'sentence-transformers/x')."""
+    return re.sub(r"[^\w.-]+", "_", model_name)
+
+
+class EmbeddingCache:
+    """
+    Caché de embeddings de un modelo, con clave (modelo, hash del texto).
+
+    En disco, cada modelo tiene su directorio con vectors.f32 (filas float32
+    anexadas) y keys.jsonl (clave y fila de cada vector); cambiar de modelo
+    usa otro directorio, así que los vectores de un modelo nunca se sirven a
+    otro. Las escrituras se anexan, de modo que varios procesos pueden
+    compartir el directorio: las filas que añaden los demás se descubren al
+    fallar en memoria.
+    """
+
+    def __init__(self, directory: Optional[str], model_name: str, max_memory_items: int = 10000):
+        """
+        Args:
+            directory: Directorio raíz del almacén en disco (None = solo memoria)
+            model_name: Modelo de embeddings
+            max_memory_items: Capacidad del LRU en memoria
+        """
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._rows: Dict[str, int] = {}
+        self._keys_offset = 0
+        self._dim: Optional[int] = None
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.dir = Path(directory) / model_slug(model_name) if directory else None
+        if self.dir:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            meta_path = self.dir / "meta.json"
+            if meta_path.exists():
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                if meta.get("model") == model_name:
+                    self._dim = meta["dim"]
+                    self._refresh()
+                else:
+                    logger.warning(f"Caché de embeddings de otro modelo en {self.dir}; se descarta")
+                    for name in ("vectors.f32", "keys.jsonl", "meta.json"):
+                        (self.dir / name).unlink(missing_ok=True)
+            logger.info(f"Caché de embeddings: {len(self._rows)} vectores en disco ({model_name})")
+
+    def __len__(self) -> int:
+        return len(self._rows) if self.dir else len(self._memory)
+
+    # --- Disco ---
+
+    def _refresh(self) -> None:
+        """Lee las claves anexadas desde la última lectura (también por otros procesos)."""
+        path = self.dir / "keys.jsonl"
+        if not path.exists() or path.stat().st_size == self._keys_offset:
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # Línea a medio escribir por otro proceso
+                self._keys_offset += len(line.encode("utf-8"))
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._rows[entry["k"]] = entry["r"]
+
+    def _read_row(self, row: int) -> Optional[np.ndarray]:
+        """Lee una fila del memory-map, reabriéndolo si el fichero creció."""
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            path = self.dir / "vectors.f32"
+            rows = path.stat().st_size // (4 * self._dim) if path.exists() else 0
+            if row >= rows:
+                return None
+            self._mmap = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return np.array(self._mmap[row])
+
+    def _write(self, keys: List[str], vectors: np.ndarray) -> None:
+        """Anexa vectores y sus claves al almacén en disco."""
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+            (self.dir / "meta.json").write_text(
+                json.dumps({"model": self.model_name, "dim": self._dim}), encoding="utf-8"
+            )
+        row_bytes = 4 * self._dim
+        lines = []
+        with open(self.dir / "vectors.f32", "ab") as f:
+            for key, vector in zip(keys, vectors):
+                f.write(np.asarray(vector, dtype=np.float32).tobytes())
+                f.flush()
+                # Con O_APPEND la posición tras escribir es el final de nuestra fila
+                row = f.tell() // row_bytes - 1
+                self._rows[key] = row
+                lines.append(json.dumps({"k": key, "r": row}) + "\n")
+        with open(self.dir / "keys.jsonl", "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    # --- Memoria ---
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    # --- API ---
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """
+        Busca el embedding de un texto (memoria y después disco).
+
+        Args:
+            text: Texto
+
+        Returns:
+            Vector o None si no está en caché
+        """
+        key = text_key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self.dir and self._dim is not None:
+                if key not in self._rows:
+                    self._refresh()
+                row = self._rows.get(key)
+                vector = self._read_row(row) if row is not None else None
+                if vector is not None:
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Guarda embeddings en memoria y en disco.
+
+        Args:
+            texts: Textos
+            vectors: Matriz (len(texts), dimensión)
+        """
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, np.asarray(vector, dtype=np.float32))
+            if self.dir:
+                new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._rows]
+                if new:
+                    self._write([key for key, _ in new], np.array([vector for _, vector in new]))
+
+    def encode(self, texts: List[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Devuelve los embeddings de los textos, codificando solo los que faltan.
+
+        Los fallos (sin duplicados) se codifican en una única llamada al encoder.
+
+        Args:
+            texts: Textos a codificar
+            encoder: Función de lista de textos a matriz de embeddings
+
+        Returns:
+            Matriz (len(texts), dimensión) en el orden de texts
+        """
+        found = [self.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, found) if vector is None))
+        if missing:
+            computed = np.atleast_2d(np.asarray(encoder(missing), dtype=np.float32))
+            self.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            found = [vector if vector is not None else by_text[text] for text, vector in zip(texts, found)]
+        return np.array(found, dtype=np.float32)
+
+    def stats(self) -> Dict[str, float]:
+        """Aciertos por nivel, tasa de acierto y tamaño."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "disk_items": len(self._rows),
+        }
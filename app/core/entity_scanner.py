@@ -0,0 +1,312 @@
+"""
+Pre-extracción determinista de entidades.
+Localiza fechas, importes, boletines, múltiplos de IPREM/SMI/IRSC, emails y
+teléfonos en una sola pasada con un patrón compilado.
+"""
+
+import re
+from datetime import date
+from typing import Dict, List, Any, Optional
+from loguru import logger
+
+from app.utils.helpers import (
+    EMAIL_PATTERN,
+    LONG_DATE_PATTERN,
+    PHONE_PATTERN,
+    SHORT_DATE_PATTERN,
+    parse_spanish_date,
+)
+from app.utils.validators import AMOUNT_INTEGER_PATTERN, BOLETIN_HEADER_PATTERNS, validate_boletin_format
+
+
+# Siglas de boletines oficiales reconocidas
+SIGLAS_BOLETIN = [
+    "BOP", "BOE", "BOJA", "BOCM", "DOGC", "BOPV", "BOCYL", "DOE", "BORM", "BOA",
+    "BOIB", "DOGV", "DOCV", "BOC", "BOPA", "BON", "BOR", "DOCM", "BOCCE", "BOME",
+]
+
+_FECHA_LARGA = rf"(?i:{LONG_DATE_PATTERN})"
+_FECHA_CORTA = SHORT_DATE_PATTERN
+_NUMERO_BOLETIN = r"(?i:n\.?\s*[º°o]\.?|n[úu]m(?:ero)?\.?)\s*(?P<bol_num>\d+)"
+
+# Cada alternativa es un grupo con nombre; el orden fija la prioridad
+# cuando dos patrones empiezan en la misma posición.
+_PATRONES = [
+    (
+        "email",
+        EMAIL_PATTERN,
+    ),
+    (
+        "bdns",
+        r"\bBDNS\s*(?:\(\s*Identif\.?\s*\)\s*)?(?i:N[º°o]\.?\s*|n[úu]m\.?\s*)?:?\s*(?P<bdns_num>\d{5,7})\b",
+    ),
+    (
+        "boletin",
+        rf"(?:\b(?P<bol_sigla>{'|'.join(SIGLAS_BOLETIN)}|B\.O\.P\.?|B\.O\.E\.?)"
+        rf"|(?P<bol_cabecera>(?i:{'|'.join(BOLETIN_HEADER_PATTERNS.values())})))"
+        r"(?:\s+(?i:de\s+)?\(?(?!(?i:n[úu]m|n\.))(?P<bol_prov>[A-ZÁÉÍÓÚÑ][A-Za-záéíóúñ]+(?:[ \t]+(?!(?i:n[úu]m|n\.))[A-ZÁÉÍÓÚÑ][A-Za-záéíóúñ]+)?)\)?)?"
+        rf"(?:[\s,]*{_NUMERO_BOLETIN})?"
+        rf"(?:[\s,]*(?:(?i:de)\s+(?:fecha\s+)?|el\s+)?(?P<bol_fecha>{_FECHA_LARGA}|{_FECHA_CORTA}))?",
+    ),
+    (
+        "fecha",
+        rf"\b(?:{_FECHA_LARGA}|{_FECHA_CORTA})\b",
+    ),
+    (
+        "indicador",
+        r"(?P<ind_num>\d+(?:,\d+)?)\s*(?P<ind_modo>%|(?i:por\s+ciento|veces))\s+(?i:del?\s+|el\s+)?"
+        r"(?P<ind_nombre>IPREM|SMI|IRSC)\b",
+    ),
+    (
+        "importe",
+        rf"(?<![\d.,])(?P<imp_entero>{AMOUNT_INTEGER_PATTERN})(?:,(?P<imp_dec>\d{{1,2}}))?\s*(?:€|(?i:euros?)\b|EUR\b)",
+    ),
+    (
+        "telefono",
+        PHONE_PATTERN,
+    ),
+]
+
+ENTITY_PATTERN = re.compile(
+    "|".join(f"(?P<{nombre}>{patron})" for nombre, patron in _PATRONES)
+)
+
+_TIPOS = [nombre for nombre, _ in _PATRONES]
+
+
+def parse_fecha(texto: str) -> Optional[date]:
+    """
+    Parsea una fecha en formato largo ("8 de febrero de 2022") o corto (dd/mm/aaaa).
+
+    Args:
+        texto: Texto con la fecha
+
+    Returns:
+        date o None si no es válida
+    """
+    parsed = parse_spanish_date(texto)
+    return parsed.date() if parsed else None
+
+
+class EntityScanner:
+    """
+    Escáner de entidades sobre el texto extraído del PDF.
+    Devuelve cada entidad con su valor normalizado y sus offsets.
+    """
+
+    def __init__(self, max_hints_per_type: int = 8):
+        """
+        Inicializa el escáner.
+
+        Args:
+            max_hints_per_type: Máximo de valores por tipo en el bloque de pistas
+        """
+        self.max_hints_per_type = max_hints_per_type
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Recorre el texto una única vez y devuelve las entidades encontradas.
+
+        Args:
+            text: Texto a analizar
+
+        Returns:
+            Lista de entidades {tipo, texto, valor, inicio, fin}
+        """
+        entities = []
+
+        for match in ENTITY_PATTERN.finditer(text):
+            tipo = next(t for t in _TIPOS if match.group(t) is not None)
+            valor = self._normalize(tipo, match)
+            if valor is None:
+                continue
+
+            entities.append(
+                {
+                    "tipo": tipo,
+                    "texto": match.group(0),
+                    "valor": valor,
+                    "inicio": match.start(),
+                    "fin": match.end(),
+                }
+            )
+
+        logger.debug(f"Entidades pre-extraídas: {len(entities)}")
+        return entities
+
+    @staticmethod
+    def _normalize(tipo: str, match: re.Match) -> Any:
+        """Convierte el texto de una entidad a su valor normalizado."""
+        if tipo == "email":
+            return match.group(0).lower()
+
+        if tipo == "bdns":
+            return {"tipo": "BDNS", "numero": match.group("bdns_num")}
+
+        if tipo == "boletin":
+            if match.group("bol_cabecera"):
+                cabecera = match.group("bol_cabecera")
+                sigla = next(
+                    s for s, p in BOLETIN_HEADER_PATTERNS.items()
+                    if re.fullmatch(p, cabecera, re.IGNORECASE)
+                )
+            else:
+                sigla = match.group("bol_sigla").replace(".", "")
+
+            fecha = match.group("bol_fecha")
+            return {
+                "tipo": sigla,
+                "provincia": match.group("bol_prov"),
+                "numero": match.group("bol_num"),
+                "fecha": parse_fecha(fecha) if fecha else None,
+            }
+
+        if tipo == "fecha":
+            return parse_fecha(match.group(0))
+
+        if tipo == "indicador":
+            numero = float(match.group("ind_num").replace(",", "."))
+            if match.group("ind_modo").lower() != "veces":
+                numero = numero / 100
+            return {"indicador": match.group("ind_nombre").upper(), "multiplo": numero}
+
+        if tipo == "importe":
+            entero = match.group("imp_entero").replace(".", "")
+            decimales = match.group("imp_dec") or "0"
+            return float(f"{entero}.{decimales}")
+
+        if tipo == "telefono":
+            digits = re.sub(r"\D", "", match.group(0))
+            return digits[-9:]
+
+        return match.group(0)
+
+    def summarize(self, entities: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """
+        Agrupa las entidades por tipo eliminando valores repetidos.
+
+        Args:
+            entities: Salida de scan()
+
+        Returns:
+            Dict tipo -> lista de valores únicos en orden de aparición
+        """
+        summary: Dict[str, List[Any]] = {tipo: [] for tipo in _TIPOS}
+        for entity in entities:
+            values = summary[entity["tipo"]]
+            if entity["valor"] not in values:
+                values.append(entity["valor"])
+        return summary
+
+    def suggest_fields(self, entities: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Propone valores de FichaData que pueden fijarse sin LLM.
+
+        Args:
+            entities: Salida de scan()
+
+        Returns:
+            Dict campo -> valor sugerido (solo campos con evidencia)
+        """
+        suggestions = {}
+
+        for entity in entities:
+            if entity["tipo"] == "boletin" and entity["valor"]["fecha"]:
+                suggestions["fecha_publicacion"] = entity["valor"]["fecha"]
+                break
+
+        return suggestions
+
+    def build_hints(self, entities: List[Dict[str, Any]]) -> str:
+        """
+        Formatea las entidades como bloque de pistas para el prompt.
+
+        Los boletines con provincia (si es BOP), número y fecha se marcan como
+        cita completa: tienen todos los datos de la referencia que exige
+        validate_boletin_format.
+
+        Args:
+            entities: Salida de scan()
+
+        Returns:
+            Texto del bloque (vacío si no hay entidades)
+        """
+        if not entities:
+            return ""
+
+        summary = self.summarize(entities)
+        labels = {
+            "bdns": "BDNS",
+            "boletin": "Boletines oficiales",
+            "fecha": "Fechas",
+            "indicador": "Indicadores (IPREM/SMI/IRSC)",
+            "importe": "Importes",
+            "email": "Emails",
+            "telefono": "Teléfonos",
+        }
+
+        lines = []
+        for tipo, label in labels.items():
+            values = summary.get(tipo, [])[: self.max_hints_per_type]
+            if values:
+                lines.append(f"- {label}: " + "; ".join(self._format_value(tipo, v) for v in values))
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format_value(tipo: str, valor: Any) -> str:
+        """Representación legible de un valor normalizado."""
+        if tipo == "fecha":
+            return valor.strftime("%d/%m/%Y")
+        if tipo == "bdns":
+            return f"BDNS Nº {valor['numero']}"
+        if tipo == "boletin":
+            parts = [valor["tipo"]]
+            if valor["provincia"]:
+                parts.append(f"({valor['provincia']})")
+            if valor["numero"]:
+                parts.append(f"núm. {valor['numero']}")
+            text = " ".join(parts)
+            if valor["fecha"]:
+                text += f", {valor['fecha'].strftime('%d/%m/%Y')}"
+            return f"{text} [cita completa]" if validate_boletin_format(text)[0] else text
+        if tipo == "indicador":
+            return f"{valor['multiplo']:g} x {valor['indicador']}"
+        if tipo == "importe":
+            return f"{valor:,.2f} €".replace(",", "X").replace(".", ",").replace("X", ".")
+        return str(valor)
+
+    def cross_check(self, ficha: Any, entities: List[Dict[str, Any]]) -> List[str]:
+        """
+        Contrasta una ficha generada con las entidades del documento.
+
+        Args:
+            ficha: FichaData generado
+            entities: Salida de scan() sobre el mismo documento
+
+        Returns:
+            Lista de advertencias (vacía si todo cuadra)
+        """
+        warnings = []
+        summary = self.summarize(entities)
+
+        # Importes de la ficha que no aparecen en el documento
+        importes_doc = set(summary["importe"])
+        if importes_doc:
+            textos = list(ficha.cuantia) + [ficha.importe_maximo]
+            for texto in textos:
+                for entity in self.scan(texto):
+                    if entity["tipo"] == "importe" and entity["valor"] not in importes_doc:
+                        warnings.append(
+                            f"Importe {entity['texto'].strip()} no encontrado en el documento"
+                        )
+
+        # Fecha de publicación distinta a la del boletín detectado
+        sugerida = self.suggest_fields(entities).get("fecha_publicacion")
+        if sugerida and ficha.fecha_publicacion and ficha.fecha_publicacion != sugerida:
+            warnings.append(
+                f"Fecha de publicación {ficha.fecha_publicacion.strftime('%d/%m/%Y')} "
+                f"distinta a la del boletín ({sugerida.strftime('%d/%m/%Y')})"
+            )
+
+        return warnings
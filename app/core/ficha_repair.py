@@ -0,0 +1,172 @@
+"""
+Reparación de fichas a nivel de campo.
+Separa los campos válidos de los que incumplen el schema y construye un
+prompt reducido para que el LLM corrija solo estos últimos.
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Tuple
+
+from app.models.ficha_schema import FichaData
+from app.core.json_stream import FieldViolation, IncrementalJSONParser, validate_field
+
+
+# Palabras clave para localizar en el documento el fragmento de cada campo
+FIELD_KEYWORDS: Dict[str, List[str]] = {
+    "nombre_ayuda": ["convocatoria", "bases reguladoras", "ayudas"],
+    "fecha_inicio": ["plazo", "solicitudes"],
+    "fecha_fin": ["plazo", "solicitudes"],
+    "fecha_publicacion": ["boletín", "BOP", "BOE", "publicación"],
+    "plazo_presentacion": ["plazo", "solicitudes"],
+    "ambito_territorial": ["ayuntamiento", "diputación", "consejería", "ministerio"],
+    "administracion": ["ayuntamiento", "diputación", "consejería", "ministerio"],
+    "requisitos_acceso": ["requisitos"],
+    "beneficiarios": ["beneficiari"],
+    "descripcion": ["objeto", "finalidad", "modalidad"],
+    "cuantia": ["cuantía", "importe", "€"],
+    "importe_maximo": ["cuantía", "importe", "máximo"],
+    "resolucion": ["resolución", "silencio"],
+    "documentos_presentar": ["documentación", "acompañar", "documentos"],
+    "costes_no_subvencionables": ["no subvencionable", "excluid"],
+    "criterios_concesion": ["criterios", "baremo", "puntuación"],
+    "normativa_reguladora": ["BOP", "boletín", "bases reguladoras"],
+    "referencia_legislativa": ["Ley ", "Decreto", "Orden "],
+    "lugar_presentacion": ["registro", "sede electrónica", "presentación"],
+}
+
+
+def load_json_fields(text: str) -> Dict[str, Any]:
+    """
+    Recupera los campos de primer nivel de una respuesta del LLM.
+
+    Si el JSON completo no es válido se conservan los campos que se cerraron
+    correctamente antes del primer error.
+
+    Args:
+        text: Respuesta del LLM
+
+    Returns:
+        Dict con los campos recuperados
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+
+    parser = IncrementalJSONParser()
+    try:
+        parser.feed(text)
+    except FieldViolation:
+        pass
+    return parser.fields
+
+
+def split_valid_fields(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Valida cada campo por separado.
+
+    Args:
+        data: Campos generados
+
+    Returns:
+        Tupla (campos válidos, {campo: error}) incluyendo obligatorios ausentes
+    """
+    valid: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+
+    for name, field in FichaData.model_fields.items():
+        if name not in data:
+            if field.is_required():
+                errors[name] = "Campo obligatorio ausente"
+            continue
+        try:
+            validate_field(FichaData, name, data[name])
+            valid[name] = data[name]
+        except FieldViolation as violation:
+            errors[name] = violation.message
+
+    return valid, errors
+
+
+def document_excerpt(text: str, fields: List[str], max_chars: int = 4000) -> str:
+    """
+    Extrae del documento los fragmentos relevantes para unos campos.
+
+    Args:
+        text: Texto completo del documento
+        fields: Campos a reparar
+        max_chars: Longitud máxima del extracto
+
+    Returns:
+        Fragmentos unidos por "[...]" (o el inicio del documento si no hay coincidencias)
+    """
+    keywords = [kw for name in fields for kw in FIELD_KEYWORDS.get(name, [])]
+    windows = []
+    for keyword in dict.fromkeys(keywords):
+        for match in re.finditer(re.escape(keyword), text, re.IGNORECASE):
+            windows.append((max(0, match.start() - 300), min(len(text), match.start() + 900)))
+            break
+
+    if not windows:
+        return text[:max_chars]
+
+    merged: List[List[int]] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    parts = []
+    remaining = max_chars
+    for start, end in merged:
+        if remaining <= 0:
+            break
+        chunk = text[start:min(end, start + remaining)]
+        parts.append(chunk)
+        remaining -= len(chunk)
+
+    return "\n[...]\n".join(parts)
+
+
+def build_repair_prompt(errors: Dict[str, str], data: Dict[str, Any], pdf_text: str) -> str:
+    """
+    Construye el prompt de reparación con solo los campos fallidos.
+
+    Args:
+        errors: {campo: error}
+        data: Valores generados (incluidos los inválidos)
+        pdf_text: Texto del documento
+
+    Returns:
+        User prompt de reparación
+    """
+    parts = [
+        "# REPARACIÓN DE CAMPOS\n",
+        "La ficha generada es válida salvo los campos siguientes. "
+        "Corrígelos según el schema y el documento.",
+    ]
+
+    for name, error in errors.items():
+        field = FichaData.model_fields[name]
+        parts.append(f"\n## Campo: {name}")
+        if field.description:
+            parts.append(f"Descripción: {field.description}")
+        parts.append(f"Error: {error}")
+        if name in data:
+            parts.append(f"Valor actual: {json.dumps(data[name], ensure_ascii=False, default=str)}")
+
+    parts.append("\n# FRAGMENTOS DEL DOCUMENTO\n")
+    parts.append(document_excerpt(pdf_text, list(errors)))
+
+    parts.append("\n# INSTRUCCIONES\n")
+    parts.append(
+        f"Devuelve ÚNICAMENTE un objeto JSON con los campos {json.dumps(list(errors))}, sin texto adicional."
+    )
+
+    return "\n".join(parts)
@@ -0,0 +1,139 @@
+"""
+Secciones etiquetadas de las fichas de referencia.
+Las fichas .docx del dataset tienen una tabla CAMPO / CONCEPTO con una fila
+por campo; se indexan por separado para dar al LLM ejemplos del campo que
+está redactando (cuantía, documentación...) en vez del inicio de la ficha.
+"""
+
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from loguru import logger
+
+
+# Etiqueta de la columna CAMPO (normalizada, primera línea) -> campo de FichaData
+SECTION_LABELS: Dict[str, str] = {
+    "denominacion normativa": "nombre_ayuda",
+    "nombre de la ayuda": "nombre_ayuda",
+    "portales": "portales",
+    "categoria": "categoria",
+    "materias": "tipo_ayuda",
+    "objeto": "descripcion",
+    "descripcion": "descripcion",
+    "fecha inicio": "fecha_inicio",
+    "fecha fin": "fecha_fin",
+    "fecha publicacion": "fecha_publicacion",
+    "ambito territorial": "ambito_territorial",
+    "administracion": "administracion",
+    "plazo de presentacion": "plazo_presentacion",
+    "requisitos": "requisitos_acceso",
+    "beneficiarios": "beneficiarios",
+    "cuantia": "cuantia",
+    "importe maximo": "importe_maximo",
+    "costes no subvencionables": "costes_no_subvencionables",
+    "criterios": "criterios_concesion",
+    "resolucion": "resolucion",
+    "documentos a presentar": "documentos_presentar",
+    "documentacion": "documentos_presentar",
+    "normativa reguladora": "normativa_reguladora",
+    "referencia legislativa": "referencia_legislativa",
+}
+
+SECTION_FIELDS: List[str] = sorted(set(SECTION_LABELS.values()))
+
+
+def normalize_label(label: str) -> str:
+    """Primera línea de la etiqueta en minúsculas, sin tildes ni puntuación."""
+    first_line = label.strip().split("\n")[0]
+    text = unicodedata.normalize("NFD", first_line.lower())
+    text = "".join(char for char in text if unicodedata.category(char) != "Mn")
+    return " ".join(re.findall(r"\w+", text))
+
+
+def field_for_label(label: str) -> Optional[str]:
+    """
+    Campo de FichaData de una etiqueta de la tabla.
+
+    Args:
+        label: Texto de la celda CAMPO
+
+    Returns:
+        Nombre del campo, o None si la etiqueta no corresponde a ninguno
+    """
+    normalized = normalize_label(label)
+    for prefix, field in SECTION_LABELS.items():
+        if normalized.startswith(prefix):
+            return field
+    return None
+
+
+def extract_sections(docx_path: Union[str, Path]) -> Dict[str, str]:
+    """
+    Extrae las secciones de una ficha .docx a partir de sus tablas CAMPO / CONCEPTO.
+
+    Las filas con la misma etiqueta se concatenan, las vacías se omiten y se
+    quitan las líneas en blanco (son tokens en el prompt).
+
+    Args:
+        docx_path: Ruta al .docx
+
+    Returns:
+        Dict {campo: texto}
+    """
+    from docx import Document
+
+    sections: Dict[str, str] = {}
+    try:
+        document = Document(docx_path)
+    except Exception as e:
+        logger.error(f"Error leyendo secciones de {Path(docx_path).name}: {e}")
+        return sections
+
+    for table in document.tables:
+        for row in table.rows:
+            cells = row.cells
+            if len(cells) < 2:
+                continue
+            field = field_for_label(cells[0].text)
+            value = re.sub(r"\n\s*\n", "\n", cells[1].text.strip())
+            if not field or not value:
+                continue
+            sections[field] = f"{sections[field]}\n{value}" if field in sections else value
+    return sections
+
+
+def section_id(ficha_id: str, field: str) -> str:
+    """Id de la sección de un campo de una ficha en el índice por campos."""
+    return f"{ficha_id}#{field}"
+
+
+def fit_snippets(snippets: Dict[str, str], max_chars: int) -> Dict[str, str]:
+    """
+    Recorta fragmentos para que quepan juntos en un presupuesto de caracteres.
+
+    El presupuesto se reparte a partes iguales; lo que no usa un fragmento
+    corto queda para los demás. Los recortes se hacen en límite de palabra.
+
+    Args:
+        snippets: {campo: texto}
+        max_chars: Presupuesto total
+
+    Returns:
+        {campo: texto recortado}, en el orden original
+    """
+    fitted: Dict[str, str] = {}
+    remaining = max_chars
+    pending = sorted(snippets, key=lambda field: len(snippets[field]))
+    for position, field in enumerate(pending):
+        share = max(0, remaining // (len(pending) - position))
+        text = snippets[field]
+        if len(text) > share:
+            head = text[:max(0, share - 1)]  # Sitio para "…"
+            cut = head.rsplit(" ", 1)[0] if " " in head else head
+            text = cut.rstrip() + "…" if cut.strip() else ""
+        if text:
+            fitted[field] = text
+        remaining -= len(text)
+    return {field: fitted[field] for field in snippets if field in fitted}
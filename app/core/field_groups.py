@@ -0,0 +1,83 @@
+"""
+Grupos de campos independientes de FichaData.
+Permiten generar la ficha en varias llamadas concurrentes más pequeñas,
+cada una con su propio sub-schema.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Type
+from pydantic import BaseModel, create_model
+
+from app.models.ficha_schema import FichaData
+
+
+# Grupos que pueden generarse sin conocer el resto de la ficha
+FIELD_GROUPS: Dict[str, List[str]] = {
+    "identificacion": [
+        "nombre_ayuda",
+        "portales",
+        "categoria",
+        "tipo_ayuda",
+        "ambito_territorial",
+        "administracion",
+    ],
+    "fechas": [
+        "fecha_inicio",
+        "fecha_fin",
+        "fecha_publicacion",
+        "plazo_presentacion",
+        "resolucion",
+    ],
+    "requisitos": [
+        "requisitos_acceso",
+        "beneficiarios",
+        "descripcion",
+        "criterios_concesion",
+        "costes_no_subvencionables",
+    ],
+    "cuantia": [
+        "cuantia",
+        "importe_maximo",
+    ],
+    "documentacion": [
+        "documentos_presentar",
+        "normativa_reguladora",
+        "referencia_legislativa",
+        "lugar_presentacion",
+        "otros_datos",
+    ],
+}
+
+
+@lru_cache(maxsize=None)
+def fields_model(fields: Tuple[str, ...], name: str = "FichaParcial") -> Type[BaseModel]:
+    """
+    Sub-schema Pydantic con un subconjunto de campos de FichaData.
+
+    Solo se usa para las instrucciones de formato y la salida estructurada;
+    la validación completa (incluidos los validadores de fórmula) se hace
+    sobre FichaData al unir los campos.
+
+    Args:
+        fields: Campos a incluir
+        name: Nombre del modelo
+
+    Returns:
+        Modelo con esos campos
+    """
+    definitions = {
+        field: (FichaData.model_fields[field].annotation, FichaData.model_fields[field])
+        for field in fields
+    }
+    return create_model(name, **definitions)
+
+
+def group_model(group: str) -> Type[BaseModel]:
+    """Sub-schema con los campos de un grupo."""
+    return fields_model(tuple(FIELD_GROUPS[group]), f"Ficha_{group}")
+
+
+def group_example(group: str) -> Dict[str, Any]:
+    """Campos del ejemplo del schema que pertenecen a un grupo."""
+    example = FichaData.model_config["json_schema_extra"]["example"]
+    return {name: example[name] for name in FIELD_GROUPS[group] if name in example}
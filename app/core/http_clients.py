@@ -0,0 +1,169 @@
+"""
+Clientes HTTP compartidos para los proveedores LLM.
+Un httpx.AsyncClient por proveedor con límites de conexión y keep-alive
+explícitos, reutilizado por todas las generaciones concurrentes. Las
+conexiones pertenecen al bucle de eventos que las abrió, así que el cliente
+mantiene un pool por bucle.
+"""
+
+import asyncio
+import threading
+import weakref
+from functools import cached_property
+from importlib.metadata import PackageNotFoundError, version
+from typing import Dict
+import anthropic
+import httpx
+from loguru import logger
+
+from app.config import settings
+
+
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+
+# Versiones de langchain-anthropic en las que se ha comprobado la inyección
+# del cliente HTTP (ver use_shared_anthropic_client)
+ANTHROPIC_INJECTION_VERSIONS = ("0.3.",)
+
+
+def _http2_available() -> bool:
+    """Comprueba si está instalado el soporte HTTP/2 de httpx (paquete h2)."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PerLoopTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte httpx con un pool de conexiones por bucle de eventos.
+
+    El cliente compartido se inyecta en los modelos al crearlos, fuera de
+    cualquier bucle, y luego lo usan bucles distintos (el de uvicorn, un
+    asyncio.run por script o test). Una conexión keep-alive abierta en un
+    bucle no sirve en otro, así que cada bucle recibe su propio
+    httpx.AsyncHTTPTransport; los de bucles ya cerrados se descartan.
+    """
+
+    def __init__(self, **transport_kwargs):
+        """
+        Args:
+            transport_kwargs: Argumentos de httpx.AsyncHTTPTransport (http2, limits...)
+        """
+        self._transport_kwargs = transport_kwargs
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        """Transporte del bucle en ejecución (lo crea si no existe)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Las conexiones de un bucle cerrado ya no se pueden usar ni cerrar
+            for closed in [owner for owner in self._transports if owner.is_closed()]:
+                del self._transports[closed]
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._transport_kwargs)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Cierra el pool del bucle actual y olvida los de otros bucles."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transports = dict(self._transports)
+            self._transports.clear()
+        if loop in transports:
+            await transports[loop].aclose()
+
+
+def get_async_http_client(provider: str) -> httpx.AsyncClient:
+    """
+    Devuelve el cliente HTTP asíncrono compartido de un proveedor.
+
+    Se puede usar desde cualquier bucle de eventos: cada uno tiene su propio
+    pool de conexiones (ver PerLoopTransport).
+
+    Args:
+        provider: Nombre del proveedor (openai/anthropic)
+
+    Returns:
+        httpx.AsyncClient con pool de conexiones configurado
+    """
+    client = _async_clients.get(provider)
+    if client is not None and not client.is_closed:
+        return client
+
+    http2 = settings.LLM_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 solicitado pero el paquete 'h2' no está instalado; usando HTTP/1.1")
+        http2 = False
+
+    client = httpx.AsyncClient(
+        transport=PerLoopTransport(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+            ),
+        ),
+        timeout=httpx.Timeout(settings.PROCESSING_TIMEOUT, connect=10.0),
+    )
+    _async_clients[provider] = client
+
+    logger.info(
+        f"Cliente HTTP compartido para {provider}: "
+        f"{settings.LLM_HTTP_MAX_CONNECTIONS} conexiones, HTTP/2={http2}"
+    )
+    return client
+
+
+def use_shared_anthropic_client(llm) -> bool:
+    """
+    Hace que un ChatAnthropic use el cliente HTTP asíncrono compartido.
+
+    ChatAnthropic no admite inyectar el cliente HTTP (a diferencia de
+    ChatOpenAI con http_async_client): crea el suyo en la cached_property
+    _async_client. Se precarga esa propiedad solo en las versiones
+    comprobadas y si conserva la forma esperada; si no, se avisa y el
+    modelo sigue con el cliente por defecto de LangChain.
+
+    Args:
+        llm: Instancia de ChatAnthropic
+
+    Returns:
+        True si el modelo usa el cliente compartido
+    """
+    try:
+        installed = version("langchain-anthropic")
+    except PackageNotFoundError:
+        installed = "desconocida"
+    expected_shape = isinstance(getattr(type(llm), "_async_client", None), cached_property) and hasattr(
+        llm, "_client_params"
+    )
+    if not installed.startswith(ANTHROPIC_INJECTION_VERSIONS) or not expected_shape:
+        logger.warning(
+            f"langchain-anthropic {installed}: no se puede inyectar el cliente HTTP compartido; "
+            "se usa el de LangChain (revisar use_shared_anthropic_client)"
+        )
+        return False
+
+    llm.__dict__["_async_client"] = anthropic.AsyncClient(
+        **llm._client_params,
+        http_client=get_async_http_client("anthropic"),
+    )
+    return True
+
+
+async def close_async_http_clients() -> None:
+    """Cierra todos los clientes compartidos (llamar en shutdown)."""
+    for provider, client in list(_async_clients.items()):
+        await client.aclose()
+        logger.debug(f"Cliente HTTP cerrado: {provider}")
+    _async_clients.clear()
@@ -0,0 +1,153 @@
+"""
+Parser JSON incremental para generación en streaming.
+Detecta cada campo de primer nivel en cuanto se cierra su valor y lo valida
+contra el schema, para poder abortar la generación en la primera violación.
+"""
+
+import json
+from typing import Any, Dict, List, Tuple, Type
+from pydantic import BaseModel, ValidationError
+
+
+class FieldViolation(ValueError):
+    """Un campo generado incumple el schema."""
+
+    def __init__(self, field: str, message: str, value: Any = None):
+        """
+        Args:
+            field: Nombre del campo ("<json>" si el JSON está mal formado)
+            message: Motivo de la violación
+            value: Valor generado
+        """
+        super().__init__(f"{field}: {message}")
+        self.field = field
+        self.message = message
+        self.value = value
+        self.chars = 0  # Caracteres generados al abortar
+        self.response = None  # Respuesta descartada con el uso facturado (la añade el procesador)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Resumen serializable de la violación."""
+        return {"campo": self.field, "error": self.message, "chars_generados": self.chars}
+
+
+class IncrementalJSONParser:
+    """
+    Parser de un objeto JSON recibido por fragmentos.
+
+    Solo sigue la profundidad y las cadenas; cuando un valor de primer nivel
+    termina (',' o '}' a profundidad 1) decodifica ese par clave/valor. El
+    texto previo al primer '{' (p. ej. una valla ```json) se ignora.
+    """
+
+    def __init__(self):
+        """Inicializa el estado del parser."""
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._segment_start = 0
+        self.done = False
+        self.fields: Dict[str, Any] = {}
+
+    @property
+    def text(self) -> str:
+        """Texto recibido hasta el momento."""
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Añade un fragmento y devuelve los campos completados en él.
+
+        Args:
+            chunk: Fragmento de texto del LLM
+
+        Returns:
+            Lista de (campo, valor) cerrados en este fragmento
+
+        Raises:
+            FieldViolation: Si un par clave/valor no es JSON válido
+        """
+        self._text += chunk
+        completed: List[Tuple[str, Any]] = []
+        text = self._text
+
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._segment_start = i + 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_segment(text[self._segment_start:i], completed)
+                    self.done = True
+            elif ch == "," and self._depth == 1:
+                self._close_segment(text[self._segment_start:i], completed)
+                self._segment_start = i + 1
+
+        self._pos = len(text)
+        return completed
+
+    def _close_segment(self, segment: str, completed: List[Tuple[str, Any]]) -> None:
+        """Decodifica un segmento '"clave": valor' de primer nivel."""
+        segment = segment.strip()
+        if not segment:
+            return
+
+        try:
+            pair = json.loads("{" + segment + "}")
+        except json.JSONDecodeError as e:
+            raise FieldViolation("<json>", f"JSON mal formado: {e.msg}", segment[:200])
+
+        for name, value in pair.items():
+            self.fields[name] = value
+            completed.append((name, value))
+
+
+def validate_field(model: Type[BaseModel], name: str, value: Any) -> Any:
+    """
+    Valida un único campo contra el modelo (tipos y validadores de campo).
+
+    Args:
+        model: Modelo Pydantic
+        name: Nombre del campo
+        value: Valor generado
+
+    Returns:
+        Valor validado (los campos desconocidos se devuelven sin cambios)
+
+    Raises:
+        FieldViolation: Si el valor incumple el schema
+    """
+    if name not in model.model_fields:
+        return value
+
+    instance = model.model_construct()
+    try:
+        model.__pydantic_validator__.validate_assignment(instance, name, value)
+    except ValidationError as e:
+        error = e.errors()[0]
+        raise FieldViolation(name, error["msg"], value)
+
+    return getattr(instance, name)
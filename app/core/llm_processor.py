@@ -3,19 +3,44 @@ Procesador LLM para generación de fichas.
 Orquesta la generación usando LangChain + Claude/GPT.
 """
 
-from typing import Dict, Any, Optional, Literal
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Literal
 from pathlib import Path
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import json
+import time
 from loguru import logger
 
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
 from langchain.output_parsers import PydanticOutputParser
+from langchain_core.exceptions import OutputParserException
 
 from app.config import settings
 from app.models.ficha_schema import FichaData
 from app.core.rag_system import RAGSystem
+from app.core.ficha_sections import fit_snippets
+from app.core.entity_scanner import EntityScanner
+from app.core.http_clients import get_async_http_client, use_shared_anthropic_client
+from app.core.llm_resilience import LatencyTracker, hedged, retry_async, retry_sync
+from app.core.json_stream import FieldViolation, IncrementalJSONParser, validate_field
+from app.core.ficha_repair import build_repair_prompt, load_json_fields, split_valid_fields
+from app.core.field_groups import FIELD_GROUPS, fields_model, group_example, group_model
+from app.core.structured_output import (
+    TOOL_NAME,
+    anthropic_tool,
+    bind_structured_output,
+    openai_response_format,
+    structured_message,
+)
+from app.core.map_reduce import ChunkCache, build_map_messages, build_reduce_document, chunk_key, split_document
+from app.core.near_duplicates import build_update_prompt
+from app.core.replay_llm import replay_llm
+from app.core.usage_ledger import BATCH_DISCOUNT, estimate_cost
+from app.core.rate_scheduler import estimate_tokens, get_scheduler
+from app.core.quality_checker import QualityChecker
 
 
 class LLMProcessor:
@@ -24,6 +49,12 @@ class LLMProcessor:
     Soporta OpenAI y Anthropic con LangChain.
     """
 
+    # Prefijos estáticos compilados (system + schema), por versión de instrucciones
+    _static_prefix_cache: Dict[str, str] = {}
+
+    # Latencias observadas por proveedor:modelo (para decidir el hedging)
+    _latency_trackers: Dict[str, LatencyTracker] = {}
+
     def __init__(
         self,
         provider: Optional[Literal["openai", "anthropic"]] = None,
@@ -44,30 +75,95 @@ class LLMProcessor:
         logger.info(f"Inicializando LLM Processor con proveedor: {self.provider}")
 
         # Inicializar LLM según proveedor
-        if self.provider == "openai":
-            self.llm = ChatOpenAI(
-                model=model_name or settings.OPENAI_MODEL,
+        self.model_name, self.llm = self._create_llm(self.provider, model_name)
+
+        # Cargar instrucciones de generación
+        self.instructions = self._load_instructions()
+
+        # Output parser
+        self.parser = PydanticOutputParser(pydantic_object=FichaData)
+
+        # Versión de instrucciones: identifica el prefijo cacheable
+        self.instructions_version = self.instructions.get("metadata", {}).get("version", "default")
+
+        # Escáner de entidades para pistas deterministas
+        self.entity_scanner = EntityScanner(max_hints_per_type=settings.ENTITY_HINTS_MAX_PER_TYPE)
+
+        # Reglas de las instrucciones compiladas para el control de calidad
+        self.quality_checker = QualityChecker(self.instructions)
+
+        # Modelo económico para la fase map de documentos largos
+        map_model = (
+            settings.MAP_REDUCE_ANTHROPIC_MODEL if self.provider == "anthropic" else settings.MAP_REDUCE_OPENAI_MODEL
+        )
+        self.map_model_name, self.map_llm = self._create_llm(self.provider, map_model)
+        self.chunk_cache = ChunkCache(settings.MAP_REDUCE_CACHE_DIR)
+
+        # Proveedor secundario para failover y peticiones cubiertas
+        self.fallback = None
+        fallback_provider = settings.LLM_FALLBACK_PROVIDER
+        if fallback_provider and fallback_provider != self.provider:
+            if settings.get_llm_api_key(fallback_provider):
+                fallback_model, fallback_llm = self._create_llm(fallback_provider)
+                self.fallback = (fallback_provider, fallback_model, fallback_llm)
+                logger.info(f"Proveedor secundario: {fallback_provider} ({fallback_model})")
+            else:
+                logger.warning(f"Proveedor secundario {fallback_provider} sin API key: failover desactivado")
+
+        logger.info(f"LLM Processor listo: {self.model_name}")
+
+    @staticmethod
+    def _create_llm(provider: str, model_name: Optional[str] = None):
+        """
+        Crea el cliente LangChain de un proveedor.
+
+        Las llamadas asíncronas comparten un httpx.AsyncClient por proveedor
+        (ver app.core.http_clients) para reutilizar conexiones keep-alive.
+        Con LLM_REPLAY_MODE el cliente se graba o se sustituye por respuestas
+        grabadas (ver app.core.replay_llm).
+
+        Args:
+            provider: Proveedor LLM (openai/anthropic)
+            model_name: Modelo (None = el configurado para el proveedor)
+
+        Returns:
+            Tupla (nombre del modelo, cliente LLM)
+        """
+        if provider not in ("openai", "anthropic"):
+            raise ValueError(f"Proveedor no soportado: {provider}")
+
+        # En replay no se construye el cliente real (no hace falta API key)
+        if settings.LLM_REPLAY_MODE == "replay":
+            model_name = model_name or (settings.OPENAI_MODEL if provider == "openai" else settings.ANTHROPIC_MODEL)
+            return model_name, replay_llm(model_name)
+
+        if provider == "openai":
+            model_name = model_name or settings.OPENAI_MODEL
+            llm = ChatOpenAI(
+                model=model_name,
                 temperature=settings.OPENAI_TEMPERATURE,
                 max_tokens=settings.OPENAI_MAX_TOKENS,
                 api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                http_async_client=get_async_http_client("openai"),
+                timeout=settings.PROCESSING_TIMEOUT,
+                max_retries=0,  # Los reintentos los gestiona llm_resilience
+                stream_usage=True,
             )
-        elif self.provider == "anthropic":
-            self.llm = ChatAnthropic(
-                model=model_name or settings.ANTHROPIC_MODEL,
+        elif provider == "anthropic":
+            model_name = model_name or settings.ANTHROPIC_MODEL
+            llm = ChatAnthropic(
+                model=model_name,
                 temperature=settings.ANTHROPIC_TEMPERATURE,
                 max_tokens=settings.ANTHROPIC_MAX_TOKENS,
                 api_key=settings.ANTHROPIC_API_KEY,
+                base_url=settings.ANTHROPIC_BASE_URL,
+                default_request_timeout=settings.PROCESSING_TIMEOUT,
+                max_retries=0,  # Los reintentos los gestiona llm_resilience
             )
-        else:
-            raise ValueError(f"Proveedor no soportado: {self.provider}")
+            use_shared_anthropic_client(llm)
 
-        # Cargar instrucciones de generación
-        self.instructions = self._load_instructions()
-
-        # Output parser
-        self.parser = PydanticOutputParser(pydantic_object=FichaData)
-
-        logger.info(f"LLM Processor listo: {self.llm.model_name}")
+        return model_name, replay_llm(model_name, llm)
 
     def _load_instructions(self) -> Dict[str, Any]:
         """
@@ -126,59 +222,214 @@ class LLMProcessor:
 
         return "\n".join(prompt_parts)
 
+    def _get_static_prefix(self, group: Optional[str] = None) -> str:
+        """
+        Devuelve el prefijo estático del prompt (reglas, valores de referencia,
+        schema y, opcionalmente, un ejemplo fijo), compilado una sola vez por
+        versión de instrucciones. Con LLM_OUTPUT_MODE=native se omite el schema.
+
+        Args:
+            group: Grupo de campos (None = ficha completa)
+
+        Returns:
+            Prefijo idéntico entre peticiones (cacheable por el proveedor)
+        """
+        native = settings.LLM_OUTPUT_MODE == "native"
+        cache_key = f"{self.instructions_version}|few_shot={settings.PROMPT_CACHE_FEW_SHOT}|native={native}"
+        if group:
+            cache_key += f"|group={group}"
+
+        prefix = self._static_prefix_cache.get(cache_key)
+        if prefix is None:
+            if native:
+                format_instructions = ""
+            elif group:
+                format_instructions = PydanticOutputParser(pydantic_object=group_model(group)).get_format_instructions()
+            else:
+                format_instructions = self.parser.get_format_instructions()
+
+            # En modo nativo el schema viaja como herramienta/response_format
+            parts = [self._build_system_prompt()]
+            if not native:
+                parts += ["\n# SCHEMA DE SALIDA\n", format_instructions]
+
+            if settings.PROMPT_CACHE_FEW_SHOT:
+                example = group_example(group) if group else FichaData.model_config["json_schema_extra"]["example"]
+                parts.append("\n# EJEMPLO DE SALIDA\n")
+                parts.append(json.dumps(example, ensure_ascii=False, indent=2))
+
+            prefix = "\n".join(parts)
+            self._static_prefix_cache[cache_key] = prefix
+
+            digest = hashlib.sha1(prefix.encode("utf-8")).hexdigest()[:10]
+            logger.info(f"Prefijo estático compilado ({cache_key}, {len(prefix)} caracteres, {digest})")
+
+        return prefix
+
+    def _get_fields_prefix(self, fields: List[str]) -> str:
+        """
+        Prefijo de sistema de una reparación: las reglas y el schema de los
+        campos indicados, sin el resto del schema ni el ejemplo.
+
+        Args:
+            fields: Campos a corregir
+
+        Returns:
+            Prefijo reducido (compilado una vez por conjunto de campos)
+        """
+        native = settings.LLM_OUTPUT_MODE == "native"
+        cache_key = f"{self.instructions_version}|native={native}|fields={','.join(fields)}"
+
+        prefix = self._static_prefix_cache.get(cache_key)
+        if prefix is None:
+            parts = [self._build_system_prompt()]
+            if not native:
+                parser = PydanticOutputParser(pydantic_object=fields_model(tuple(fields)))
+                parts += ["\n# SCHEMA DE SALIDA\n", parser.get_format_instructions()]
+            prefix = "\n".join(parts)
+            self._static_prefix_cache[cache_key] = prefix
+
+        return prefix
+
+    def _build_messages(
+        self,
+        user_prompt: str,
+        provider: Optional[str] = None,
+        group: Optional[str] = None,
+        prefix_fields: Optional[List[str]] = None,
+    ) -> List[BaseMessage]:
+        """
+        Construye los mensajes con el prefijo estático primero.
+
+        En Anthropic el bloque de sistema se marca con cache_control; en OpenAI
+        el caché es automático siempre que el prefijo sea idéntico y vaya primero.
+        El prefijo reducido de una reparación cambia con los campos fallidos,
+        así que no se marca (escribir el caché cuesta más que leerlo).
+
+        Args:
+            user_prompt: Parte variable del prompt (documento, ejemplos, pistas)
+            provider: Proveedor destino (None = el principal)
+            group: Grupo de campos (None = ficha completa)
+            prefix_fields: Campos cuyo schema lleva el prefijo (None = prefijo estático)
+
+        Returns:
+            Lista de mensajes para el LLM
+        """
+        provider = provider or self.provider
+        if prefix_fields:
+            return [SystemMessage(content=self._get_fields_prefix(prefix_fields)), HumanMessage(content=user_prompt)]
+
+        prefix = self._get_static_prefix(group)
+        if settings.ENABLE_PROMPT_CACHING and provider == "anthropic":
+            system_message = SystemMessage(
+                content=[
+                    {
+                        "type": "text",
+                        "text": prefix,
+                        "cache_control": {"type": "ephemeral"},
+                    }
+                ]
+            )
+        else:
+            system_message = SystemMessage(content=prefix)
+
+        return [system_message, HumanMessage(content=user_prompt)]
+
+    @staticmethod
+    def _extract_usage(message: AIMessage) -> Dict[str, int]:
+        """
+        Extrae el uso de tokens (incluido caché) de la respuesta del proveedor.
+
+        Args:
+            message: Respuesta del LLM
+
+        Returns:
+            Dict con tokens de entrada, salida y de lectura/escritura de caché
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+
+        return {
+            "input_tokens": usage.get("input_tokens") or 0,
+            "output_tokens": usage.get("output_tokens") or 0,
+            "cache_read_tokens": details.get("cache_read") or 0,
+            "cache_creation_tokens": details.get("cache_creation") or 0,
+        }
+
     def _build_user_prompt(
         self,
         pdf_text: str,
         rag_examples: Optional[list] = None,
+        entity_hints: str = "",
+        field_examples: Optional[Dict[str, Dict[str, Any]]] = None,
     ) -> str:
         """
         Construye el user prompt con el documento y ejemplos.
 
+        Con ejemplos por campo, de cada ficha de ejemplo solo va el inicio
+        (RAG_EXAMPLE_HEAD_CHARS) y los fragmentos de los campos se recortan
+        juntos a RAG_FIELD_EXAMPLE_TOKENS.
+
         Args:
             pdf_text: Texto extraído del PDF
             rag_examples: Ejemplos del RAG
+            entity_hints: Bloque de datos pre-extraídos del documento
+            field_examples: Sección más parecida de cada campo difícil
 
         Returns:
             User prompt formateado
         """
         parts = ["# DOCUMENTO A ANALIZAR\n", pdf_text]
 
+        if entity_hints:
+            parts.append("\n\n# DATOS PRE-EXTRAÍDOS\n")
+            parts.append("Valores localizados literalmente en el documento (úsalos para fechas, importes y boletines):\n")
+            parts.append(entity_hints)
+
         if rag_examples:
+            example_chars = settings.RAG_EXAMPLE_HEAD_CHARS if field_examples else 1500
             parts.append("\n\n# EJEMPLOS DE REFERENCIA\n")
             parts.append("Estos son ejemplos de fichas bien estructuradas:\n")
             for i, example in enumerate(rag_examples, 1):
                 parts.append(f"\n## Ejemplo {i}\n")
-                parts.append(example["text"][:1500])  # Limitar longitud
+                parts.append(example["text"][:example_chars])  # Limitar longitud
                 parts.append("\n---\n")
 
+        if field_examples:
+            snippets = fit_snippets(
+                {field: example["text"] for field, example in field_examples.items()},
+                settings.RAG_FIELD_EXAMPLE_TOKENS * 4,
+            )
+            parts.append("\n\n# EJEMPLOS POR CAMPO\n")
+            parts.append("Redacción de referencia de estos campos en fichas similares:\n")
+            for field, snippet in snippets.items():
+                parts.append(f"\n## {field}\n")
+                parts.append(snippet)
+
         parts.append("\n# INSTRUCCIONES\n")
         parts.append("Analiza el documento y genera una ficha siguiendo:")
-        parts.append("1. El schema JSON proporcionado")
+        parts.append("1. El schema JSON de salida indicado en las instrucciones de sistema")
         parts.append("2. Las reglas generales")
         parts.append("3. Los ejemplos de referencia")
         parts.append("\nGenera ÚNICAMENTE el JSON, sin texto adicional.")
 
         return "\n".join(parts)
 
-    def generate_ficha(
+    def _prepare_generation(
         self,
         pdf_text: str,
         use_rag: bool = True,
-        usuario: str = "PROYECTO_FICHAS_IA",
     ) -> Dict[str, Any]:
         """
-        Genera una ficha estructurada desde texto PDF.
+        Prepara una generación: ejemplos RAG, entidades y mensajes.
 
         Args:
             pdf_text: Texto extraído del PDF
             use_rag: Si usar sistema RAG para ejemplos
-            usuario: Usuario que genera la ficha
 
         Returns:
-            Dict con la ficha generada y metadata
+            Dict con pdf_text, user_prompt, rag_examples, field_examples y entities
         """
-        logger.info("Iniciando generación de ficha...")
-
         # 1. Recuperar ejemplos RAG si está habilitado
         rag_examples = []
         if use_rag and self.rag_system:
@@ -189,46 +440,1309 @@ class LLMProcessor:
             )
             logger.info(f"Recuperados {len(rag_examples)} ejemplos")
 
-        # 2. Construir prompts
-        system_prompt = self._build_system_prompt()
-        user_prompt = self._build_user_prompt(pdf_text, rag_examples)
+        # Secciones de ejemplo de los campos difíciles
+        field_examples = {}
+        fields = [field.strip() for field in settings.RAG_FIELD_EXAMPLE_FIELDS.split(",") if field.strip()]
+        if use_rag and self.rag_system and settings.RAG_FIELD_EXAMPLES and fields:
+            field_examples = self.rag_system.retrieve_field_examples(pdf_text, fields)
+
+        # 2. Pre-extraer entidades deterministas
+        entities = []
+        if settings.USE_ENTITY_HINTS:
+            entities = self.entity_scanner.scan(pdf_text)
+
+        # 3. Construir mensajes (prefijo estático cacheable + parte variable)
+        user_prompt = self._build_user_prompt(
+            pdf_text,
+            rag_examples,
+            entity_hints=self.entity_scanner.build_hints(entities),
+            field_examples=field_examples,
+        )
+
+        return {
+            "pdf_text": pdf_text,
+            "user_prompt": user_prompt,
+            "rag_examples": rag_examples,
+            "field_examples": field_examples,
+            "entities": entities,
+        }
+
+    def _needs_map_reduce(self, pdf_text: str) -> bool:
+        """Indica si el documento supera el umbral de map-reduce."""
+        return 0 < settings.MAP_REDUCE_THRESHOLD_CHARS < len(pdf_text)
+
+    def _start_map(self, pdf_text: str) -> tuple:
+        """
+        Divide el documento y recupera de la caché los fragmentos ya procesados.
+
+        Returns:
+            Tupla (fragmentos, claves, candidatos con None en los pendientes)
+        """
+        chunks = split_document(pdf_text, settings.MAP_REDUCE_CHUNK_CHARS)
+        keys = [chunk_key(chunk, self.map_model_name) for chunk in chunks]
+        candidates = [self.chunk_cache.get(key) for key in keys]
 
-        # 3. Añadir format instructions del parser
-        format_instructions = self.parser.get_format_instructions()
+        cached = sum(1 for found in candidates if found is not None)
+        logger.info(f"Map-reduce: {len(chunks)} fragmentos, {cached} en caché")
+        return chunks, keys, candidates
 
-        # 4. Crear template
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "{user_prompt}\n\n{format_instructions}"),
-        ])
+    def _store_candidates(self, key: str, response: AIMessage) -> Dict[str, Any]:
+        """Filtra los candidatos de un fragmento y los guarda en caché."""
+        found = load_json_fields(self._chunk_text(response))
+        found = {
+            name: value
+            for name, value in found.items()
+            if name in FichaData.model_fields and value not in (None, "", [])
+        }
+        self.chunk_cache.put(key, found)
+        return found
 
-        # 5. Crear chain
-        chain = prompt_template | self.llm | self.parser
+    def _finish_map(
+        self,
+        prepared: Dict[str, Any],
+        chunks: List[str],
+        candidates: List[Dict[str, Any]],
+        responses: List[AIMessage],
+        elapsed: float,
+    ) -> Dict[str, Any]:
+        """
+        Sustituye el documento del prompt por los candidatos consolidables.
 
-        # 6. Ejecutar generación
+        Returns:
+            prepared con user_prompt reducido y estadísticas de map-reduce
+        """
+        document = build_reduce_document(chunks, candidates, settings.MAP_REDUCE_HEAD_CHARS)
+        user_prompt = self._build_user_prompt(
+            document,
+            prepared["rag_examples"],
+            entity_hints=self.entity_scanner.build_hints(prepared["entities"]),
+            field_examples=prepared.get("field_examples"),
+        )
+
+        usage = [self._extract_usage(response) for response in responses]
+        return {
+            **prepared,
+            "user_prompt": user_prompt,
+            "map_reduce": {
+                "map_model": self.map_model_name,
+                "chunks": len(chunks),
+                "cached_chunks": len(chunks) - len(responses),
+                "map_input_tokens": sum(u["input_tokens"] for u in usage),
+                "map_output_tokens": sum(u["output_tokens"] for u in usage),
+                "map_cost_usd": round(sum(estimate_cost(self.map_model_name, **u) for u in usage), 6),
+                "map_latency": round(elapsed, 3),
+            },
+        }
+
+    def _map_reduce(self, prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fase map: extrae candidatos de los fragmentos no cacheados en paralelo.
+
+        Args:
+            prepared: Salida de _prepare_generation
+
+        Returns:
+            prepared listo para la llamada de consolidación
+        """
+        start = time.monotonic()
+        chunks, keys, candidates = self._start_map(prepared["pdf_text"])
+        pending = [i for i, found in enumerate(candidates) if found is None]
+
+        def run(i: int) -> AIMessage:
+            messages = build_map_messages(chunks[i], i + 1, len(chunks))
+            response, _ = retry_sync(
+                self._scheduled(
+                    lambda: self.map_llm.invoke(messages), self.provider, self.map_model_name, messages
+                ),
+                max_retries=settings.LLM_MAX_RETRIES,
+                base_delay=settings.LLM_RETRY_BASE_DELAY,
+                max_delay=settings.LLM_RETRY_MAX_DELAY,
+            )
+            return response
+
+        responses = []
+        if pending:
+            with ThreadPoolExecutor(max_workers=settings.MAP_REDUCE_CONCURRENCY) as executor:
+                responses = list(executor.map(run, pending))
+            for i, response in zip(pending, responses):
+                candidates[i] = self._store_candidates(keys[i], response)
+
+        return self._finish_map(prepared, chunks, candidates, responses, time.monotonic() - start)
+
+    async def _amap_reduce(self, prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """Versión asíncrona de _map_reduce."""
+        start = time.monotonic()
+        chunks, keys, candidates = self._start_map(prepared["pdf_text"])
+        pending = [i for i, found in enumerate(candidates) if found is None]
+        semaphore = asyncio.Semaphore(settings.MAP_REDUCE_CONCURRENCY)
+
+        async def run(i: int) -> AIMessage:
+            messages = build_map_messages(chunks[i], i + 1, len(chunks))
+            async with semaphore:
+                response, _ = await retry_async(
+                    self._ascheduled(
+                        lambda: self.map_llm.ainvoke(messages), self.provider, self.map_model_name, messages
+                    ),
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    base_delay=settings.LLM_RETRY_BASE_DELAY,
+                    max_delay=settings.LLM_RETRY_MAX_DELAY,
+                )
+            return response
+
+        responses = list(await asyncio.gather(*(run(i) for i in pending)))
+        for i, response in zip(pending, responses):
+            candidates[i] = self._store_candidates(keys[i], response)
+
+        return self._finish_map(prepared, chunks, candidates, responses, time.monotonic() - start)
+
+    def _targets(self) -> List[tuple]:
+        """Proveedores en orden de preferencia: (provider, model, llm)."""
+        targets = [(self.provider, self.model_name, self.llm)]
+        if self.fallback:
+            targets.append(self.fallback)
+        return targets
+
+    @classmethod
+    def _latency_tracker(cls, provider: str, model: str, metric: str = "latency") -> LatencyTracker:
+        """Tracker compartido por proveedor y modelo de la latencia total o del TTFT ("ttft")."""
+        key = f"{provider}:{model}:{metric}"
+        if key not in cls._latency_trackers:
+            cls._latency_trackers[key] = LatencyTracker(min_samples=settings.LLM_HEDGE_MIN_SAMPLES)
+        return cls._latency_trackers[key]
+
+    @staticmethod
+    def _chunk_text(chunk: BaseMessage) -> str:
+        """Texto de un fragmento de streaming (str o bloques de contenido)."""
+        content = chunk.content
+        if isinstance(content, str):
+            return content
+        # Bloques de texto o, con tool use en streaming, JSON parcial de la herramienta
+        return "".join(
+            (block.get("text") or block.get("partial_json") or "") if isinstance(block, dict) else str(block)
+            for block in content
+        )
+
+    def _consume_chunk(
+        self,
+        parser: IncrementalJSONParser,
+        chunk: BaseMessage,
+        on_field: Optional[Callable[[str, Any], None]],
+    ) -> None:
+        """
+        Pasa un fragmento al parser incremental y valida los campos cerrados.
+
+        Raises:
+            FieldViolation: En la primera violación del schema
+        """
         try:
-            logger.info("Invocando LLM...")
-            ficha_data = chain.invoke({
-                "user_prompt": user_prompt,
-                "format_instructions": format_instructions,
-            })
+            for name, value in parser.feed(self._chunk_text(chunk)):
+                value = validate_field(FichaData, name, value)
+                if on_field:
+                    on_field(name, value)
+        except FieldViolation as violation:
+            violation.chars = len(parser.text)
+            logger.warning(f"Streaming abortado en '{violation.field}': {violation.message}")
+            raise
+
+    def _stream_llm(
+        self,
+        llm,
+        messages: List[BaseMessage],
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        progress: Optional[Dict[str, Any]] = None,
+    ) -> AIMessage:
+        """
+        Genera en streaming validando cada campo en cuanto se cierra.
 
-            logger.info("✓ Ficha generada exitosamente")
+        Al cerrar el iterador se corta la conexión, de modo que una violación
+        deja de consumir tokens de salida de inmediato.
 
-            return {
-                "ficha": ficha_data,
-                "metadata": {
-                    "model": self.llm.model_name,
-                    "provider": self.provider,
-                    "rag_enabled": use_rag,
-                    "rag_examples_count": len(rag_examples),
+        Args:
+            llm: Modelo LangChain
+            messages: Mensajes a enviar
+            on_field: Callback (campo, valor) por cada campo válido
+            progress: Dict que se actualiza con el texto y el uso recibidos
+                hasta el momento (para facturar un stream abortado o cancelado)
+
+        Returns:
+            Respuesta completa con usage_metadata agregado
+
+        Raises:
+            FieldViolation: En la primera violación del schema
+        """
+        parser = IncrementalJSONParser()
+        aggregate: Optional[AIMessageChunk] = None
+        progress = progress if progress is not None else {}
+        start, ttft = time.monotonic(), None
+        stream = llm.stream(messages)
+        try:
+            for chunk in stream:
+                ttft = ttft if ttft is not None else time.monotonic() - start
+                aggregate = chunk if aggregate is None else aggregate + chunk
+                progress.update(text=parser.text + self._chunk_text(chunk), usage=aggregate.usage_metadata)
+                self._consume_chunk(parser, chunk, on_field)
+        finally:
+            stream.close()
+
+        usage = aggregate.usage_metadata if aggregate is not None else None
+        return AIMessage(content=parser.text, usage_metadata=usage, response_metadata={"ttft": ttft})
+
+    async def _astream_llm(
+        self,
+        llm,
+        messages: List[BaseMessage],
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        on_first_chunk: Optional[Callable[[float], None]] = None,
+        progress: Optional[Dict[str, Any]] = None,
+    ) -> AIMessage:
+        """Versión asíncrona de _stream_llm (on_first_chunk recibe el TTFT)."""
+        parser = IncrementalJSONParser()
+        aggregate: Optional[AIMessageChunk] = None
+        progress = progress if progress is not None else {}
+        start, ttft = time.monotonic(), None
+        stream = llm.astream(messages)
+        try:
+            async for chunk in stream:
+                if ttft is None:
+                    ttft = time.monotonic() - start
+                    if on_first_chunk is not None:
+                        on_first_chunk(ttft)
+                aggregate = chunk if aggregate is None else aggregate + chunk
+                progress.update(text=parser.text + self._chunk_text(chunk), usage=aggregate.usage_metadata)
+                self._consume_chunk(parser, chunk, on_field)
+        finally:
+            await stream.aclose()
+
+        usage = aggregate.usage_metadata if aggregate is not None else None
+        return AIMessage(content=parser.text, usage_metadata=usage, response_metadata={"ttft": ttft})
+
+    def _output_runnable(self, llm, provider: str, fields: Optional[List[str]] = None):
+        """
+        Devuelve el LLM con salida estructurada nativa si LLM_OUTPUT_MODE=native.
+
+        Args:
+            llm: Modelo LangChain
+            provider: Proveedor del modelo
+            fields: Campos esperados (None = FichaData completa)
+
+        Returns:
+            Runnable a invocar
+        """
+        if settings.LLM_OUTPUT_MODE != "native":
+            return llm
+        model = fields_model(tuple(fields)) if fields else FichaData
+        return bind_structured_output(llm, provider, model)
+
+    @staticmethod
+    async def _ainvoke_structured(runnable, messages: List[BaseMessage]) -> AIMessage:
+        """ainvoke normalizando la respuesta estructurada a texto JSON."""
+        return structured_message(await runnable.ainvoke(messages))
+
+    @staticmethod
+    def _scheduled(call: Callable[[], Any], provider: str, model: str, messages: List[BaseMessage]):
+        """
+        Hace pasar cada intento de la llamada por el planificador RPM/TPM del
+        modelo (si ENABLE_LLM_SCHEDULER).
+
+        Args:
+            call: Función sin argumentos que invoca al LLM
+            provider: Proveedor del modelo
+            model: Nombre del modelo
+            messages: Mensajes (para estimar los tokens)
+
+        Returns:
+            Función sin argumentos equivalente
+        """
+        if not settings.ENABLE_LLM_SCHEDULER:
+            return call
+        scheduler, tokens = get_scheduler(provider, model), estimate_tokens(messages)
+        return lambda: scheduler.run_sync(call, tokens)
+
+    @staticmethod
+    def _ascheduled(call: Callable[[], Any], provider: str, model: str, messages: List[BaseMessage]):
+        """Versión asíncrona de _scheduled (call devuelve un awaitable)."""
+        if not settings.ENABLE_LLM_SCHEDULER:
+            return call
+        scheduler, tokens = get_scheduler(provider, model), estimate_tokens(messages)
+        return lambda: scheduler.run(call, tokens)
+
+    @staticmethod
+    def _invocation_data(response: AIMessage, provider: str, model: str, attempts: int, latency: float) -> Dict[str, Any]:
+        """
+        Datos de una invocación: proveedor, modelo, intentos, latencia total y
+        tiempo hasta el primer token (igual a la latencia si no hubo streaming).
+
+        La latencia, el proveedor y el modelo se anotan también en la
+        respuesta para contabilizar el tiempo y el coste de cada respuesta
+        (una reparación puede haber ido al proveedor secundario).
+        """
+        response.response_metadata.update(llm_latency=latency, llm_provider=provider, llm_model=model)
+        ttft = response.response_metadata.get("ttft")
+        return {
+            "provider": provider,
+            "model": model,
+            "attempts": attempts,
+            "hedged": False,
+            "llm_latency": round(latency, 3),
+            "ttft": round(ttft if ttft is not None else latency, 3),
+        }
+
+    @staticmethod
+    def _discarded_response(
+        messages: List[BaseMessage],
+        progress: Dict[str, Any],
+        provider: str,
+        model: str,
+    ) -> AIMessage:
+        """
+        Respuesta facturada pero descartada (stream abortado por una violación
+        o rama cancelada de una petición cubierta), para contabilizar su gasto.
+
+        Usa el uso informado en el stream si llegó y, si no, lo estima a ~4
+        caracteres por token a partir de los mensajes y del texto recibido.
+
+        Args:
+            messages: Mensajes enviados
+            progress: Texto y uso recibidos (ver _stream_llm)
+            provider: Proveedor de la llamada
+            model: Modelo de la llamada
+
+        Returns:
+            AIMessage marcado como descartado en response_metadata
+        """
+        text = progress.get("text", "")
+        usage = progress.get("usage") or {}
+        input_tokens = usage.get("input_tokens") or estimate_tokens(messages, output_tokens=0)
+        output_tokens = max(usage.get("output_tokens") or 0, len(text) // 4)
+        return AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": usage.get("input_token_details") or {},
+            },
+            response_metadata={"llm_provider": provider, "llm_model": model, "discarded": True},
+        )
+
+    def _response_cost(self, response: AIMessage, model: str) -> float:
+        """
+        Coste de una respuesta con el modelo que la generó (model si no
+        está anotado); las respuestas unidas de grupos traen su coste.
+        """
+        if "llm_cost" in response.response_metadata:
+            return response.response_metadata["llm_cost"]
+        return estimate_cost(response.response_metadata.get("llm_model", model), **self._extract_usage(response))
+
+    def _invoke_llm(
+        self,
+        user_prompt: str,
+        stream: bool = False,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        deadline: Optional[float] = None,
+        group: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        prefix_fields: Optional[List[str]] = None,
+        spent: Optional[List[AIMessage]] = None,
+    ) -> tuple:
+        """
+        Invoca el LLM con reintentos, plazo máximo y failover al secundario.
+
+        Un stream abortado por una violación se factura igualmente: su uso
+        viaja en violation.response y se añade a spent.
+
+        Args:
+            user_prompt: Parte variable del prompt
+            stream: Generar en streaming con validación incremental
+            on_field: Callback de campos válidos (solo en streaming)
+            deadline: Instante límite (time.monotonic); None = PROCESSING_TIMEOUT
+            group: Grupo de campos (None = ficha completa)
+            output_fields: Campos esperados en la respuesta (por defecto los del grupo)
+            prefix_fields: Campos cuyo schema lleva el prefijo de sistema (None = prefijo estático)
+            spent: Lista a la que se añaden las respuestas descartadas pero facturadas
+
+        Returns:
+            Tupla (respuesta, datos de la invocación)
+        """
+        deadline = deadline or time.monotonic() + settings.PROCESSING_TIMEOUT
+        targets = self._targets()
+        fields = output_fields or (FIELD_GROUPS[group] if group else None)
+
+        for i, (provider, model, llm) in enumerate(targets):
+            messages = self._build_messages(user_prompt, provider, group, prefix_fields)
+            runnable = self._output_runnable(llm, provider, fields)
+            progress: Dict[str, Any] = {}
+            start = time.monotonic()
+            try:
+                response, attempts = retry_sync(
+                    self._scheduled(
+                        (lambda: self._stream_llm(runnable, messages, on_field, progress))
+                        if stream
+                        else (lambda: structured_message(runnable.invoke(messages))),
+                        provider,
+                        model,
+                        messages,
+                    ),
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    base_delay=settings.LLM_RETRY_BASE_DELAY,
+                    max_delay=settings.LLM_RETRY_MAX_DELAY,
+                    deadline=deadline,
+                )
+            except FieldViolation as violation:
+                violation.response = self._discarded_response(messages, progress, provider, model)
+                if spent is not None:
+                    spent.append(violation.response)
+                raise
+            except Exception as e:
+                if i == len(targets) - 1 or time.monotonic() >= deadline:
+                    raise
+                logger.warning(f"Fallo en {provider} ({e}); failover a {targets[i + 1][0]}")
+                continue
+
+            latency = time.monotonic() - start
+            self._latency_tracker(provider, model).record(latency)
+            if response.response_metadata.get("ttft") is not None:
+                self._latency_tracker(provider, model, "ttft").record(response.response_metadata["ttft"])
+            return response, self._invocation_data(response, provider, model, attempts, latency)
+
+    async def _ainvoke_llm(
+        self,
+        user_prompt: str,
+        stream: bool = False,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        deadline: Optional[float] = None,
+        group: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        prefix_fields: Optional[List[str]] = None,
+        spent: Optional[List[AIMessage]] = None,
+    ) -> tuple:
+        """
+        Invoca el LLM de forma asíncrona con reintentos, plazo máximo y,
+        si está habilitado, petición cubierta al proveedor secundario cuando
+        el principal supera su percentil de latencia observado (de TTFT en
+        streaming: un primario que ya está emitiendo no se cubre).
+
+        Las dos ramas de la petición cubierta alimentan los trackers; la que
+        se cancela anota el tiempo que llevaba (una cota inferior), para que
+        los primarios lentos no desaparezcan de la muestra. Mientras las dos
+        ramas están en curso sus campos se retienen y al terminar solo se
+        entregan a on_field los de la ganadora; una rama que corre sola los
+        entrega en cuanto se validan. La rama cancelada que ya había enviado
+        su petición se añade a spent con el uso recibido o estimado, igual
+        que un stream abortado por una violación.
+
+        Args:
+            user_prompt: Parte variable del prompt
+            stream: Generar en streaming con validación incremental
+            on_field: Callback de campos válidos (solo en streaming)
+            deadline: Instante límite (time.monotonic); None = PROCESSING_TIMEOUT
+            group: Grupo de campos (None = ficha completa)
+            output_fields: Campos esperados en la respuesta (por defecto los del grupo)
+            prefix_fields: Campos cuyo schema lleva el prefijo de sistema (None = prefijo estático)
+            spent: Lista a la que se añaden las respuestas descartadas pero facturadas
+
+        Returns:
+            Tupla (respuesta, datos de la invocación)
+        """
+        deadline = deadline or time.monotonic() + settings.PROCESSING_TIMEOUT
+        targets = self._targets()
+        fields = output_fields or (FIELD_GROUPS[group] if group else None)
+
+        def leg(
+            target: tuple,
+            emit: Optional[Callable[[str, Any], None]],
+            started: Optional[asyncio.Event] = None,
+        ):
+            provider, model, llm = target
+            messages = self._build_messages(user_prompt, provider, group, prefix_fields)
+            runnable = self._output_runnable(llm, provider, fields)
+            latency_tracker = self._latency_tracker(provider, model)
+            ttft_tracker = self._latency_tracker(provider, model, "ttft")
+            first_chunks: List[float] = []
+            progress: Dict[str, Any] = {}
+
+            def call() -> Awaitable[AIMessage]:
+                # Cada intento parte de cero; "sent" marca una petición en vuelo
+                progress.clear()
+                progress["sent"] = True
+                if stream:
+                    return self._astream_llm(runnable, messages, emit, first_chunk, progress)
+                return self._ainvoke_structured(runnable, messages)
+
+            def discard() -> AIMessage:
+                response = self._discarded_response(messages, progress, provider, model)
+                if spent is not None:
+                    spent.append(response)
+                return response
+
+            def first_chunk(ttft: float) -> None:
+                first_chunks.append(ttft)
+                ttft_tracker.record(ttft)
+                if started is not None:
+                    started.set()
+
+            async def run():
+                start = time.monotonic()
+                try:
+                    response, attempts = await retry_async(
+                        self._ascheduled(call, provider, model, messages),
+                        max_retries=settings.LLM_MAX_RETRIES,
+                        base_delay=settings.LLM_RETRY_BASE_DELAY,
+                        max_delay=settings.LLM_RETRY_MAX_DELAY,
+                        deadline=deadline,
+                    )
+                except FieldViolation as violation:
+                    violation.response = discard()
+                    raise
+                except asyncio.CancelledError:
+                    # Rama perdedora de una petición cubierta
+                    elapsed = time.monotonic() - start
+                    latency_tracker.record(elapsed)
+                    if stream and not first_chunks:
+                        ttft_tracker.record(elapsed)
+                    if progress:
+                        discard()
+                    raise
+                latency = time.monotonic() - start
+                latency_tracker.record(latency)
+                return response, self._invocation_data(response, provider, model, attempts, latency)
+
+            return run
+
+        if settings.ENABLE_LLM_HEDGING and len(targets) > 1:
+            metric = "ttft" if stream else "latency"
+            observed = self._latency_tracker(self.provider, self.model_name, metric).percentile(
+                settings.LLM_HEDGE_PERCENTILE
+            )
+            hedge_delay = observed if observed is not None else settings.LLM_HEDGE_DEFAULT_DELAY
+            started = asyncio.Event() if stream else None
+            running: set = set()
+            held: Dict[str, List[tuple]] = {"primary": [], "secondary": []}
+
+            def relay(name: str) -> Optional[Callable[[str, Any], None]]:
+                if on_field is None:
+                    return None
+
+                def emit(field: str, value: Any) -> None:
+                    if len(running) > 1 or held[name]:
+                        held[name].append((field, value))
+                    else:
+                        on_field(field, value)
+
+                return emit
+
+            def tracked(name: str, run: Callable[[], Awaitable[tuple]]) -> Callable[[], Awaitable[tuple]]:
+                async def tracked_run() -> tuple:
+                    running.add(name)
+                    try:
+                        return await run()
+                    finally:
+                        running.discard(name)
+
+                return tracked_run
+
+            # Una violación del schema se corrige reprompteando, no cubriendo la petición
+            (response, invocation), winner = await hedged(
+                tracked("primary", leg(targets[0], relay("primary"), started)),
+                tracked("secondary", leg(targets[1], relay("secondary"))),
+                hedge_delay,
+                primary_started=started,
+                fatal=(FieldViolation,),
+            )
+            for field, value in held[winner] if on_field is not None else []:
+                on_field(field, value)
+            return response, {**invocation, "hedged": winner == "secondary"}
+
+        for i, target in enumerate(targets):
+            try:
+                response, invocation = await leg(target, on_field)()
+                return response, {**invocation, "hedged": False}
+            except FieldViolation:
+                raise
+            except Exception as e:
+                if i == len(targets) - 1 or time.monotonic() >= deadline:
+                    raise
+                logger.warning(f"Fallo en {target[0]} ({e}); failover a {targets[i + 1][0]}")
+
+    @staticmethod
+    def _build_group_prompt(user_prompt: str, group: str) -> str:
+        """Restringe el prompt a los campos de un grupo."""
+        return (
+            f"{user_prompt}\n\n# CAMPOS A GENERAR\n"
+            f"Genera ÚNICAMENTE un objeto JSON con los campos {json.dumps(FIELD_GROUPS[group])}."
+        )
+
+    def _merge_groups(self, results: Dict[str, tuple]) -> tuple:
+        """
+        Une las respuestas de los grupos en una única respuesta.
+
+        Args:
+            results: {grupo: (respuesta, invocación)}
+
+        Returns:
+            Tupla (respuesta con el JSON unido y el uso sumado, invocación)
+        """
+        data: Dict[str, Any] = {}
+        usage = {"input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_creation_tokens": 0}
+        for group, (response, _) in results.items():
+            fields = load_json_fields(self._chunk_text(response))
+            data.update({name: value for name, value in fields.items() if name in FIELD_GROUPS[group]})
+            for key, value in self._extract_usage(response).items():
+                usage[key] += value
+
+        # Cada grupo se factura con el modelo que lo generó (puede haber failover)
+        cost = sum(self._response_cost(response, invocation["model"]) for response, invocation in results.values())
+        response = AIMessage(
+            content=json.dumps(data, ensure_ascii=False),
+            response_metadata={"llm_cost": cost},
+            usage_metadata={
+                "input_tokens": usage["input_tokens"],
+                "output_tokens": usage["output_tokens"],
+                "total_tokens": usage["input_tokens"] + usage["output_tokens"],
+                "input_token_details": {
+                    "cache_read": usage["cache_read_tokens"],
+                    "cache_creation": usage["cache_creation_tokens"],
                 },
+            },
+        )
+
+        invocations = [invocation for _, invocation in results.values()]
+        invocation = {
+            "provider": invocations[0]["provider"],
+            "model": invocations[0]["model"],
+            "attempts": sum(inv["attempts"] for inv in invocations),
+            "hedged": any(inv["hedged"] for inv in invocations),
+            "llm_latency": max(inv["llm_latency"] for inv in invocations),
+            "ttft": min(inv["ttft"] for inv in invocations),
+            "group_latencies": {group: inv["llm_latency"] for group, (_, inv) in results.items()},
+        }
+        return response, invocation
+
+    def _invoke_groups(self, user_prompt: str, spent: Optional[List[AIMessage]] = None) -> tuple:
+        """
+        Genera los grupos de campos en paralelo (hilos) y los une.
+
+        Args:
+            user_prompt: Parte variable del prompt
+            spent: Lista a la que se añaden las respuestas descartadas pero facturadas
+
+        Returns:
+            Tupla (respuesta unida, datos de la invocación)
+        """
+        deadline = time.monotonic() + settings.PROCESSING_TIMEOUT
+        with ThreadPoolExecutor(max_workers=len(FIELD_GROUPS)) as executor:
+            futures = {
+                group: executor.submit(
+                    self._invoke_llm,
+                    self._build_group_prompt(user_prompt, group),
+                    deadline=deadline,
+                    group=group,
+                    spent=spent,
+                )
+                for group in FIELD_GROUPS
             }
+            results = {group: future.result() for group, future in futures.items()}
+
+        return self._merge_groups(results)
+
+    async def _ainvoke_groups(self, user_prompt: str, spent: Optional[List[AIMessage]] = None) -> tuple:
+        """Versión asíncrona de _invoke_groups (una corrutina por grupo)."""
+        deadline = time.monotonic() + settings.PROCESSING_TIMEOUT
+        responses = await asyncio.gather(
+            *(
+                self._ainvoke_llm(
+                    self._build_group_prompt(user_prompt, group), deadline=deadline, group=group, spent=spent
+                )
+                for group in FIELD_GROUPS
+            )
+        )
+        return self._merge_groups(dict(zip(FIELD_GROUPS, responses)))
+
+    @staticmethod
+    def _build_correction_prompt(user_prompt: str, violations: List[FieldViolation]) -> str:
+        """
+        Añade al prompt las violaciones de intentos anteriores.
+
+        Args:
+            user_prompt: Prompt original
+            violations: Violaciones detectadas al abortar el streaming
+
+        Returns:
+            Prompt con la sección de corrección
+        """
+        lines = ["\n# CORRECCIÓN\n", "En un intento anterior la salida incumplió el schema:"]
+        for violation in violations:
+            lines.append(f"- Campo '{violation.field}': {violation.message}")
+        lines.append("Respeta exactamente las fórmulas obligatorias de cada campo.")
+        return user_prompt + "\n".join(lines)
+
+    def _stream_with_reprompts(
+        self,
+        user_prompt: str,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        spent: Optional[List[AIMessage]] = None,
+    ) -> tuple:
+        """
+        Genera en streaming y, si se aborta por una violación, vuelve a pedir
+        la ficha indicando el error (hasta LLM_STREAM_MAX_REPROMPTS veces).
+
+        Args:
+            user_prompt: Parte variable del prompt
+            on_field: Callback (campo, valor) por cada campo válido; tras un
+                reintento los campos se vuelven a emitir
+            spent: Lista a la que se añade el uso de cada stream abortado
+
+        Returns:
+            Tupla (respuesta, datos de la invocación)
+        """
+        deadline = time.monotonic() + settings.PROCESSING_TIMEOUT
+        violations: List[FieldViolation] = []
+        prompt = user_prompt
+
+        while True:
+            try:
+                response, invocation = self._invoke_llm(
+                    prompt, stream=True, on_field=on_field, deadline=deadline, spent=spent
+                )
+                return response, {**invocation, "stream_aborts": [v.to_dict() for v in violations]}
+            except FieldViolation as violation:
+                violations.append(violation)
+                if len(violations) > settings.LLM_STREAM_MAX_REPROMPTS:
+                    raise
+                prompt = self._build_correction_prompt(user_prompt, violations)
+
+    async def _astream_with_reprompts(
+        self,
+        user_prompt: str,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        spent: Optional[List[AIMessage]] = None,
+    ) -> tuple:
+        """Versión asíncrona de _stream_with_reprompts."""
+        deadline = time.monotonic() + settings.PROCESSING_TIMEOUT
+        violations: List[FieldViolation] = []
+        prompt = user_prompt
+
+        while True:
+            try:
+                response, invocation = await self._ainvoke_llm(
+                    prompt, stream=True, on_field=on_field, deadline=deadline, spent=spent
+                )
+                return response, {**invocation, "stream_aborts": [v.to_dict() for v in violations]}
+            except FieldViolation as violation:
+                violations.append(violation)
+                if len(violations) > settings.LLM_STREAM_MAX_REPROMPTS:
+                    raise
+                prompt = self._build_correction_prompt(user_prompt, violations)
+
+    def _parse_or_start_repair(self, response: AIMessage) -> tuple:
+        """
+        Parsea la respuesta; si falla, recupera los campos para repararlos.
+
+        Args:
+            response: Respuesta del LLM
+
+        Returns:
+            Tupla (FichaData, None) si es válida o (None, campos recuperados)
+
+        Raises:
+            OutputParserException: Si la reparación está desactivada
+        """
+        try:
+            return self.parser.invoke(response), None
+        except OutputParserException as e:
+            if settings.LLM_REPAIR_MAX_ROUNDS <= 0:
+                raise
+            logger.warning(f"Ficha inválida, iniciando reparación por campos: {str(e)[:200]}")
+            return None, load_json_fields(self._chunk_text(response))
+
+    def _next_repair_prompt(self, data: Dict[str, Any], pdf_text: str) -> tuple:
+        """
+        Calcula los campos que siguen fallando y su prompt de reparación.
+
+        Returns:
+            Tupla ({campo: error}, prompt o None si no hay errores)
+        """
+        _, errors = split_valid_fields(data)
+        if not errors:
+            return errors, None
+        logger.info(f"Reparando campos: {', '.join(errors)}")
+        return errors, build_repair_prompt(errors, data, pdf_text)
+
+    def _merge_repair(self, data: Dict[str, Any], errors: Dict[str, str], response: AIMessage) -> Dict[str, Any]:
+        """Sustituye los campos fallidos por los valores corregidos."""
+        fixed = load_json_fields(self._chunk_text(response))
+        return {**data, **{name: value for name, value in fixed.items() if name in errors}}
+
+    def _repair_ficha(self, response: AIMessage, pdf_text: str, spent: Optional[List[AIMessage]] = None) -> tuple:
+        """
+        Parsea la respuesta reparando solo los campos inválidos.
+
+        Los campos válidos se conservan; al LLM se le envían únicamente los
+        fallidos con su error, su schema y el fragmento relevante del
+        documento, y las correcciones se fusionan hasta LLM_REPAIR_MAX_ROUNDS
+        rondas.
+
+        Args:
+            response: Respuesta del LLM
+            pdf_text: Texto del documento
+            spent: Lista a la que se añade cada respuesta de reparación en
+                cuanto llega (para contabilizarla aunque la reparación falle),
+                junto con las descartadas pero facturadas
+
+        Returns:
+            Tupla (FichaData, respuestas de reparación, campos reparados)
+        """
+        ficha_data, data = self._parse_or_start_repair(response)
+        if ficha_data is not None:
+            return ficha_data, [], []
+
+        responses, repaired = [], []
+        for _ in range(settings.LLM_REPAIR_MAX_ROUNDS):
+            errors, prompt = self._next_repair_prompt(data, pdf_text)
+            if prompt is None:
+                break
+            repair_response, _ = self._invoke_llm(
+                prompt, output_fields=list(errors), prefix_fields=list(errors), spent=spent
+            )
+            responses.append(repair_response)
+            if spent is not None:
+                spent.append(repair_response)
+            repaired.extend(name for name in errors if name not in repaired)
+            data = self._merge_repair(data, errors, repair_response)
+
+        return FichaData(**data), responses, repaired
+
+    async def _arepair_ficha(self, response: AIMessage, pdf_text: str, spent: Optional[List[AIMessage]] = None) -> tuple:
+        """Versión asíncrona de _repair_ficha."""
+        ficha_data, data = self._parse_or_start_repair(response)
+        if ficha_data is not None:
+            return ficha_data, [], []
+
+        responses, repaired = [], []
+        for _ in range(settings.LLM_REPAIR_MAX_ROUNDS):
+            errors, prompt = self._next_repair_prompt(data, pdf_text)
+            if prompt is None:
+                break
+            repair_response, _ = await self._ainvoke_llm(
+                prompt, output_fields=list(errors), prefix_fields=list(errors), spent=spent
+            )
+            responses.append(repair_response)
+            if spent is not None:
+                spent.append(repair_response)
+            repaired.extend(name for name in errors if name not in repaired)
+            data = self._merge_repair(data, errors, repair_response)
+
+        return FichaData(**data), responses, repaired
+
+    @staticmethod
+    def _kept_responses(responses: List[AIMessage]) -> List[AIMessage]:
+        """Respuestas usadas (generación y reparaciones), sin las descartadas."""
+        return [response for response in responses if not response.response_metadata.get("discarded")]
+
+    def _usage_totals(
+        self,
+        responses: List[AIMessage],
+        prepared: Dict[str, Any],
+        invocation: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """
+        Tokens, coste y tiempo de LLM de una generación: llamada principal,
+        reparaciones, respuestas descartadas pero facturadas y fase map.
+
+        Cada respuesta se valora con el modelo que la generó; las descartadas
+        (streams abortados, ramas cubiertas canceladas) suman tokens y coste
+        pero no tiempo, que ya está en la llamada que las sustituyó.
+
+        Args:
+            responses: Respuestas del LLM (generación, reparaciones y descartadas)
+            prepared: Salida de _prepare_generation (con map_reduce si hubo)
+            invocation: Proveedor, modelo y latencia de la llamada principal
+
+        Returns:
+            Dict con los tokens por tipo, cost_usd y llm_time
+        """
+        usage = {"input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_creation_tokens": 0}
+        for response in responses:
+            for key, value in self._extract_usage(response).items():
+                usage[key] += value
+
+        map_stats = prepared.get("map_reduce", {})
+        cost_usd = sum(self._response_cost(response, invocation["model"]) for response in responses)
+        cost_usd += map_stats.get("map_cost_usd", 0.0)
+        kept = self._kept_responses(responses)
+        llm_time = (
+            invocation.get("llm_latency", 0.0)
+            + sum(extra.response_metadata.get("llm_latency", 0.0) for extra in kept[1:])
+            + map_stats.get("map_latency", 0.0)
+        )
+        return {**usage, "cost_usd": round(cost_usd, 6), "llm_time": round(llm_time, 3)}
+
+    def _failed_usage(
+        self,
+        responses: List[AIMessage],
+        prepared: Dict[str, Any],
+        invocation: Optional[Dict[str, Any]],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Gasto ya facturado de una generación que ha fallado (p. ej. ficha
+        inválida tras las reparaciones), o None si no llegó a haber respuestas.
+
+        Se adjunta a la excepción como llm_usage para que la cascada y el
+        registro de uso no lo pierdan.
+        """
+        if not responses and "map_reduce" not in prepared:
+            return None
+        invocation = invocation or {"provider": self.provider, "model": self.model_name}
+        return {
+            "provider": invocation["provider"],
+            "model": invocation["model"],
+            **self._usage_totals(responses, prepared, invocation),
+        }
+
+    def _finalize_generation(
+        self,
+        ficha_data: FichaData,
+        responses: List[AIMessage],
+        prepared: Dict[str, Any],
+        use_rag: bool,
+        invocation: Dict[str, Any],
+        repaired_fields: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Completa la ficha parseada y construye el resultado con metadata.
+
+        Args:
+            ficha_data: Ficha validada
+            responses: Respuestas del LLM (generación, reparaciones y descartadas)
+            prepared: Salida de _prepare_generation
+            use_rag: Si se usó RAG
+            invocation: Proveedor, modelo, intentos y latencia de la llamada
+            repaired_fields: Campos corregidos por el bucle de reparación
+
+        Returns:
+            Dict con la ficha generada y metadata
+        """
+        # Tokens, coste y tiempo de LLM: llamada principal, reparaciones y fase map
+        usage = self._usage_totals(responses, prepared, invocation)
+        if usage["cache_read_tokens"] or usage["cache_creation_tokens"]:
+            logger.info(
+                f"Caché de prompt: {usage['cache_read_tokens']} tokens leídos, "
+                f"{usage['cache_creation_tokens']} escritos"
+            )
+
+        # Completar campos fijables sin LLM y contrastar con el documento
+        entities = prepared["entities"]
+        entity_warnings = []
+        if entities:
+            suggestions = self.entity_scanner.suggest_fields(entities)
+            if ficha_data.fecha_publicacion is None and "fecha_publicacion" in suggestions:
+                ficha_data.fecha_publicacion = suggestions["fecha_publicacion"]
+            entity_warnings = self.entity_scanner.cross_check(ficha_data, entities)
+            for warning in entity_warnings:
+                logger.warning(f"Contraste con documento: {warning}")
+
+        quality = self.quality_checker.check(ficha_data) if settings.ENABLE_QUALITY_CHECK else None
+        if quality and not quality["passed"]:
+            logger.warning(
+                f"Control de calidad: {quality['score']}/100, "
+                f"{len(quality['issues'])} incidencias ({quality['issues'][0]['message']})"
+            )
+
+        logger.info("✓ Ficha generada exitosamente")
+
+        return {
+            "ficha": ficha_data,
+            "metadata": {
+                "rag_enabled": use_rag,
+                "rag_examples_count": len(prepared["rag_examples"]),
+                "field_examples": sorted(prepared.get("field_examples") or {}),
+                "entities_found": len(entities),
+                "entity_warnings": entity_warnings,
+                "instructions_version": self.instructions_version,
+                "output_mode": settings.LLM_OUTPUT_MODE,
+                "repair_rounds": len(self._kept_responses(responses)) - 1,
+                "repaired_fields": repaired_fields or [],
+                **({"quality": quality} if quality else {}),
+                **({"map_reduce": prepared["map_reduce"]} if "map_reduce" in prepared else {}),
+                **invocation,
+                **usage,
+            },
+        }
+
+    def generate_ficha(
+        self,
+        pdf_text: str,
+        use_rag: bool = True,
+        usuario: str = "PROYECTO_FICHAS_IA",
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Genera una ficha estructurada desde texto PDF.
+
+        Con ENABLE_STREAMING (o si se pasa on_field) la respuesta se genera en
+        streaming: cada campo se valida al cerrarse, la generación se aborta
+        en la primera violación y se vuelve a pedir indicando el error.
+        Con ENABLE_PARALLEL_GROUPS los grupos de campos se generan en llamadas
+        concurrentes (tiene prioridad sobre el streaming). Los documentos de más
+        de MAP_REDUCE_THRESHOLD_CHARS caracteres se reducen antes con map-reduce.
+
+        Args:
+            pdf_text: Texto extraído del PDF
+            use_rag: Si usar sistema RAG para ejemplos
+            usuario: Usuario que genera la ficha
+            on_field: Callback (campo, valor) con cada campo válido generado
+
+        Returns:
+            Dict con la ficha generada y metadata
+        """
+        logger.info("Iniciando generación de ficha...")
+
+        prepared = self._prepare_generation(pdf_text, use_rag)
+        spent: List[AIMessage] = []
+        invocation = None
+
+        try:
+            if self._needs_map_reduce(pdf_text):
+                prepared = self._map_reduce(prepared)
+
+            logger.info("Invocando LLM...")
+            if settings.ENABLE_PARALLEL_GROUPS:
+                response, invocation = self._invoke_groups(prepared["user_prompt"], spent)
+            elif settings.ENABLE_STREAMING or on_field:
+                response, invocation = self._stream_with_reprompts(prepared["user_prompt"], on_field, spent)
+            else:
+                response, invocation = self._invoke_llm(prepared["user_prompt"], spent=spent)
+            spent.append(response)
+            ficha_data, _, repaired = self._repair_ficha(response, prepared["pdf_text"], spent)
+            return self._finalize_generation(ficha_data, spent, prepared, use_rag, invocation, repaired)
+
+        except Exception as e:
+            logger.error(f"Error generando ficha: {e}")
+            e.llm_usage = self._failed_usage(spent, prepared, invocation)
+            raise
+
+    async def agenerate_ficha(
+        self,
+        pdf_text: str,
+        use_rag: bool = True,
+        usuario: str = "PROYECTO_FICHAS_IA",
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de generate_ficha.
+
+        La preparación (embeddings RAG) se ejecuta en un hilo y la llamada al
+        LLM usa ainvoke sobre el cliente HTTP compartido, de modo que un solo
+        worker puede atender muchas generaciones concurrentes.
+
+        Args:
+            pdf_text: Texto extraído del PDF
+            use_rag: Si usar sistema RAG para ejemplos
+            usuario: Usuario que genera la ficha
+            on_field: Callback (campo, valor) con cada campo válido generado
+
+        Returns:
+            Dict con la ficha generada y metadata
+        """
+        logger.info("Iniciando generación de ficha (async)...")
+
+        prepared = await asyncio.to_thread(self._prepare_generation, pdf_text, use_rag)
+        spent: List[AIMessage] = []
+        invocation = None
+
+        try:
+            if self._needs_map_reduce(pdf_text):
+                prepared = await self._amap_reduce(prepared)
+
+            logger.info("Invocando LLM (async)...")
+            if settings.ENABLE_PARALLEL_GROUPS:
+                response, invocation = await self._ainvoke_groups(prepared["user_prompt"], spent)
+            elif settings.ENABLE_STREAMING or on_field:
+                response, invocation = await self._astream_with_reprompts(prepared["user_prompt"], on_field, spent)
+            else:
+                response, invocation = await self._ainvoke_llm(prepared["user_prompt"], spent=spent)
+            spent.append(response)
+            ficha_data, _, repaired = await self._arepair_ficha(response, prepared["pdf_text"], spent)
+            return self._finalize_generation(ficha_data, spent, prepared, use_rag, invocation, repaired)
 
         except Exception as e:
             logger.error(f"Error generando ficha: {e}")
+            e.llm_usage = self._failed_usage(spent, prepared, invocation)
+            raise
+
+    def build_request_payload(self, pdf_text: str, use_rag: bool = True) -> Dict[str, Any]:
+        """
+        Construye el cuerpo de la petición de generación del proveedor
+        principal (Messages API de Anthropic o Chat Completions de OpenAI)
+        para las APIs batch, con los mismos mensajes y parámetros que la
+        llamada síncrona.
+
+        Los documentos largos no pasan por map-reduce en este modo.
+
+        Args:
+            pdf_text: Texto extraído del PDF
+            use_rag: Si usar sistema RAG para ejemplos
+
+        Returns:
+            Dict con payload (parámetros de la petición) y rag_examples_count
+        """
+        prepared = self._prepare_generation(pdf_text, use_rag)
+        system, human = self._build_messages(prepared["user_prompt"])
+        native = settings.LLM_OUTPUT_MODE == "native"
+
+        if self.provider == "anthropic":
+            payload = {
+                "model": self.model_name,
+                "max_tokens": settings.ANTHROPIC_MAX_TOKENS,
+                "temperature": settings.ANTHROPIC_TEMPERATURE,
+                "system": system.content,
+                "messages": [{"role": "user", "content": human.content}],
+            }
+            if native:
+                payload["tools"] = [anthropic_tool(FichaData)]
+                payload["tool_choice"] = {"type": "tool", "name": TOOL_NAME}
+        else:
+            payload = {
+                "model": self.model_name,
+                "max_completion_tokens": settings.OPENAI_MAX_TOKENS,
+                "temperature": settings.OPENAI_TEMPERATURE,
+                "messages": [
+                    {"role": "system", "content": system.content},
+                    {"role": "user", "content": human.content},
+                ],
+            }
+            if native:
+                payload["response_format"] = openai_response_format(FichaData)
+
+        return {"payload": payload, "rag_examples_count": len(prepared["rag_examples"])}
+
+    def finish_batch_generation(
+        self,
+        response: AIMessage,
+        pdf_text: str,
+        batch_id: str,
+        rag_examples_count: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Parsea, repara y completa la respuesta de una petición batch.
+
+        Las reparaciones se hacen con llamadas normales; el coste de la
+        respuesta batch se calcula con BATCH_DISCOUNT. Si la ficha no se
+        puede validar, la excepción lleva el gasto en llm_usage.
+
+        Args:
+            response: Respuesta del batch (contenido JSON y usage_metadata)
+            pdf_text: Texto del documento
+            batch_id: ID del batch del proveedor
+            rag_examples_count: Ejemplos RAG incluidos en la petición
+
+        Returns:
+            Dict con la ficha generada y metadata
+        """
+        prepared = {
+            "pdf_text": pdf_text,
+            "rag_examples": [],
+            "entities": self.entity_scanner.scan(pdf_text) if settings.USE_ENTITY_HINTS else [],
+        }
+        invocation = {
+            "provider": self.provider,
+            "model": self.model_name,
+            "attempts": 1,
+            "hedged": False,
+            "llm_latency": 0.0,
+            "ttft": 0.0,
+            "batch_id": batch_id,
+        }
+        batch_cost = self._response_cost(response, self.model_name) * (1 - BATCH_DISCOUNT)
+        response.response_metadata.update(llm_latency=0.0, llm_cost=batch_cost)
+        spent = [response]
+
+        try:
+            ficha_data, _, repaired = self._repair_ficha(response, pdf_text, spent)
+            result = self._finalize_generation(
+                ficha_data, spent, prepared, rag_examples_count > 0, invocation, repaired
+            )
+        except Exception as e:
+            e.llm_usage = self._failed_usage(spent, prepared, invocation)
             raise
 
+        result["metadata"]["rag_examples_count"] = rag_examples_count
+        return result
+
+    def _prepare_update(
+        self,
+        pdf_text: str,
+        previous: Dict[str, Any],
+        fields: List[str],
+        diff_lines: List[str],
+    ) -> tuple:
+        """
+        Prepara la actualización de una ficha anterior.
+
+        Returns:
+            Tupla (user prompt, datos preparados para _finalize_generation)
+        """
+        entities = self.entity_scanner.scan(pdf_text) if settings.USE_ENTITY_HINTS else []
+        prepared = {"pdf_text": pdf_text, "rag_examples": [], "entities": entities}
+        return build_update_prompt(fields, previous, pdf_text, diff_lines), prepared
+
+    def _merge_update(self, previous: Dict[str, Any], fields: List[str], response: AIMessage) -> AIMessage:
+        """Ficha anterior con los campos regenerados, como respuesta a validar."""
+        merged = self._merge_repair(previous, dict.fromkeys(fields), response)
+        return AIMessage(content=json.dumps(merged, ensure_ascii=False, default=str))
+
+    def update_ficha(
+        self,
+        pdf_text: str,
+        previous: Dict[str, Any],
+        fields: List[str],
+        diff_lines: List[str],
+    ) -> Dict[str, Any]:
+        """
+        Actualiza la ficha de una versión anterior del documento regenerando
+        solo los campos afectados por los cambios.
+
+        Args:
+            pdf_text: Texto del documento nuevo
+            previous: Ficha anterior (JSON)
+            fields: Campos a regenerar
+            diff_lines: Cambios respecto al documento anterior
+
+        Returns:
+            Dict con la ficha y metadata (incluye "updated_fields")
+        """
+        logger.info(f"Actualizando ficha anterior: {', '.join(fields)}")
+        prompt, prepared = self._prepare_update(pdf_text, previous, fields, diff_lines)
+
+        spent: List[AIMessage] = []
+        response, invocation = self._invoke_llm(prompt, output_fields=fields, spent=spent)
+        spent.append(response)
+        ficha_data, _, repaired = self._repair_ficha(self._merge_update(previous, fields, response), pdf_text, spent)
+        result = self._finalize_generation(ficha_data, spent, prepared, False, invocation, repaired)
+        result["metadata"]["updated_fields"] = fields
+        return result
+
+    async def aupdate_ficha(
+        self,
+        pdf_text: str,
+        previous: Dict[str, Any],
+        fields: List[str],
+        diff_lines: List[str],
+    ) -> Dict[str, Any]:
+        """Versión asíncrona de update_ficha."""
+        logger.info(f"Actualizando ficha anterior (async): {', '.join(fields)}")
+        prompt, prepared = self._prepare_update(pdf_text, previous, fields, diff_lines)
+
+        spent: List[AIMessage] = []
+        response, invocation = await self._ainvoke_llm(prompt, output_fields=fields, spent=spent)
+        spent.append(response)
+        ficha_data, _, repaired = await self._arepair_ficha(
+            self._merge_update(previous, fields, response), pdf_text, spent
+        )
+        result = self._finalize_generation(ficha_data, spent, prepared, False, invocation, repaired)
+        result["metadata"]["updated_fields"] = fields
+        return result
+
     def validate_ficha(self, ficha_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Valida una ficha contra el schema.
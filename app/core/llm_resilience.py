@@ -0,0 +1,230 @@
+"""
+Políticas de resiliencia para llamadas a LLMs.
+Reintentos con backoff exponencial y jitter, plazo máximo por llamada y
+peticiones cubiertas (hedging) contra un proveedor secundario.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, Tuple, Type
+import httpx
+from loguru import logger
+
+
+# Códigos HTTP que merece la pena reintentar (529 = Anthropic sobrecargado)
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Indica si un error del proveedor es transitorio.
+
+    Args:
+        error: Excepción capturada
+
+    Returns:
+        True si conviene reintentar
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException, httpx.NetworkError)):
+        return True
+
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    if status in RETRYABLE_STATUS:
+        return True
+
+    # Errores de conexión/timeout de los SDKs de OpenAI y Anthropic
+    return type(error).__name__ in {"APIConnectionError", "APITimeoutError", "RateLimitError"}
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Calcula la espera antes de un reintento (backoff exponencial con full jitter).
+
+    Args:
+        attempt: Número de reintento (0 = primero)
+        base_delay: Espera base (segundos)
+        max_delay: Espera máxima (segundos)
+
+    Returns:
+        Segundos a esperar
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """
+    Ventana deslizante de latencias observadas de un proveedor/modelo.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Inicializa el tracker.
+
+        Args:
+            window: Número de muestras a conservar
+            min_samples: Muestras mínimas para estimar percentiles
+        """
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        """Registra una latencia."""
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Devuelve el percentil q (0-1) o None si no hay muestras suficientes.
+        """
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def retry_sync(
+    call: Callable[[], Any],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float,
+    deadline: Optional[float] = None,
+) -> Tuple[Any, int]:
+    """
+    Ejecuta una llamada síncrona con reintentos.
+
+    Args:
+        call: Función sin argumentos a ejecutar
+        max_retries: Reintentos máximos tras el primer intento
+        base_delay: Espera base del backoff
+        max_delay: Espera máxima del backoff
+        deadline: Instante límite (time.monotonic) o None
+
+    Returns:
+        Tupla (resultado, intentos realizados)
+    """
+    attempt = 0
+    while True:
+        try:
+            return call(), attempt + 1
+        except Exception as e:
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            remaining = _remaining(deadline)
+            if attempt >= max_retries or not is_retryable(e) or (remaining is not None and remaining <= delay):
+                raise
+            logger.warning(f"Error transitorio del LLM ({type(e).__name__}), reintento en {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+async def retry_async(
+    call: Callable[[], Awaitable[Any]],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float,
+    deadline: Optional[float] = None,
+) -> Tuple[Any, int]:
+    """
+    Ejecuta una llamada asíncrona con reintentos y plazo máximo.
+
+    Args:
+        call: Función sin argumentos que devuelve el awaitable a ejecutar
+        max_retries: Reintentos máximos tras el primer intento
+        base_delay: Espera base del backoff
+        max_delay: Espera máxima del backoff
+        deadline: Instante límite (time.monotonic) o None
+
+    Returns:
+        Tupla (resultado, intentos realizados)
+
+    Raises:
+        TimeoutError: Si se agota el plazo
+    """
+    attempt = 0
+    while True:
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError("Plazo de la llamada al LLM agotado")
+
+        try:
+            return await asyncio.wait_for(call(), timeout=remaining), attempt + 1
+        except Exception as e:
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            remaining = _remaining(deadline)
+            if attempt >= max_retries or not is_retryable(e) or (remaining is not None and remaining <= delay):
+                raise
+            logger.warning(f"Error transitorio del LLM ({type(e).__name__}), reintento en {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[Any]],
+    secondary: Callable[[], Awaitable[Any]],
+    hedge_delay: float,
+    primary_started: Optional[asyncio.Event] = None,
+    fatal: Tuple[Type[BaseException], ...] = (),
+) -> Tuple[Any, str]:
+    """
+    Lanza la llamada primaria y, si no ha terminado tras hedge_delay, lanza
+    también la secundaria. Devuelve el primer resultado correcto y cancela
+    la otra, esperando a que termine de cancelarse. Si la primaria falla (aunque ya hubiera empezado a emitir) y la
+    secundaria no se había lanzado, se lanza entonces como failover.
+
+    Args:
+        primary: Llamada al proveedor principal
+        secondary: Llamada al proveedor secundario
+        hedge_delay: Segundos de espera antes de cubrir la petición
+        primary_started: Evento que el primario activa al recibir el primer
+            token (streaming); si llega antes de hedge_delay no se cubre
+        fatal: Errores que se propagan en cuanto aparecen, sin lanzar ni
+            esperar a la otra llamada
+
+    Returns:
+        Tupla (resultado, "primary" | "secondary")
+    """
+    first = asyncio.ensure_future(primary())
+    tasks = {first: "primary"}
+    started = asyncio.ensure_future(primary_started.wait()) if primary_started is not None else None
+
+    try:
+        watched = [first, started] if started else [first]
+        await asyncio.wait(watched, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+        failed = first.done() and first.exception() is not None
+        if failed and isinstance(first.exception(), fatal):
+            raise first.exception()
+        if failed or not (first.done() or (started is not None and started.done())):
+            logger.info(f"Primario sin respuesta en {hedge_delay:.2f}s: lanzando petición cubierta")
+            tasks[asyncio.ensure_future(secondary())] = "secondary"
+
+        errors = []
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), tasks[task]
+                if isinstance(task.exception(), fatal):
+                    raise task.exception()
+                errors.append(task.exception())
+                if "secondary" not in tasks.values():
+                    logger.warning(f"Fallo del primario ({task.exception()}): failover al secundario")
+                    second = asyncio.ensure_future(secondary())
+                    tasks[second] = "secondary"
+                    pending.add(second)
+
+        raise errors[0]
+
+    finally:
+        cancelled = [task for task in [*tasks, *([started] if started else [])] if not task.done()]
+        for task in cancelled:
+            task.cancel()
+        # La rama cancelada anota su latencia y su uso al recibir la cancelación
+        await asyncio.gather(*cancelled, return_exceptions=True)
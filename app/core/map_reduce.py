@@ -0,0 +1,172 @@
+"""
+Map-reduce para documentos largos.
+Divide el documento en fragmentos, extrae valores candidatos de cada uno con
+un modelo económico (con caché por hash de fragmento) y prepara el documento
+reducido para la llamada final de consolidación.
+"""
+
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from app.models.ficha_schema import FichaData
+
+
+# Versión del prompt de extracción: forma parte de la clave de caché
+MAP_PROMPT_VERSION = "map-v1"
+
+
+def split_document(text: str, chunk_chars: int = 12000) -> List[str]:
+    """
+    Divide el documento en fragmentos por límites de párrafo.
+
+    Los cortes dependen del contenido (hash de cada párrafo) y no de la
+    posición, de modo que una modificación en un anexo solo cambia los
+    fragmentos afectados y el resto conserva su hash.
+
+    Args:
+        text: Texto completo
+        chunk_chars: Tamaño máximo aproximado de un fragmento
+
+    Returns:
+        Lista de fragmentos
+    """
+    min_chars = chunk_chars // 3
+    paragraphs = []
+    for paragraph in text.split("\n"):
+        while len(paragraph) > chunk_chars:
+            paragraphs.append(paragraph[:chunk_chars])
+            paragraph = paragraph[chunk_chars:]
+        paragraphs.append(paragraph)
+
+    chunks, current, size = [], [], 0
+    for paragraph in paragraphs:
+        if current and size + len(paragraph) > chunk_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+
+        current.append(paragraph)
+        size += len(paragraph) + 1
+
+        # Corte definido por contenido: ~1 de cada 8 párrafos es frontera
+        digest = hashlib.md5(paragraph.encode("utf-8")).digest()
+        if size >= min_chars and paragraph.strip() and digest[0] % 8 == 0:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+
+    if current and "\n".join(current).strip():
+        chunks.append("\n".join(current))
+
+    return chunks
+
+
+def chunk_key(chunk: str, model: str) -> str:
+    """Clave de caché de un fragmento para un modelo y versión de prompt."""
+    payload = f"{MAP_PROMPT_VERSION}|{model}|{chunk}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChunkCache:
+    """
+    Caché en disco de los candidatos extraídos por fragmento.
+    Un fichero JSON por clave, repartidos en subdirectorios por prefijo.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        Args:
+            cache_dir: Directorio de la caché
+        """
+        self.cache_dir = Path(cache_dir)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Devuelve los candidatos guardados o None."""
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Entrada de caché ilegible {path.name}: {e}")
+            return None
+
+    def put(self, key: str, candidates: Dict[str, Any]) -> None:
+        """Guarda los candidatos de un fragmento (escritura atómica)."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(candidates, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+
+def _map_system_prompt() -> str:
+    """Prompt de extracción: lista de campos con su descripción."""
+    lines = [
+        "Eres un asistente que extrae datos de convocatorias de ayudas sociales en España.",
+        "Recibirás UN FRAGMENTO de un documento más largo. Extrae solo los valores que",
+        "aparezcan en el fragmento, copiando literalmente fechas, importes y referencias.",
+        "\n# CAMPOS\n",
+    ]
+    for name, field in FichaData.model_fields.items():
+        lines.append(f"- {name}: {field.description or ''}")
+    lines.append("\nDevuelve ÚNICAMENTE un objeto JSON {campo: valor} con los campos encontrados; omite el resto.")
+    return "\n".join(lines)
+
+
+MAP_SYSTEM_PROMPT = _map_system_prompt()
+
+
+def build_map_messages(chunk: str, index: int, total: int) -> List[BaseMessage]:
+    """
+    Mensajes de extracción para un fragmento.
+
+    Args:
+        chunk: Texto del fragmento
+        index: Posición del fragmento (1..total)
+        total: Número de fragmentos
+
+    Returns:
+        Mensajes para el modelo de extracción
+    """
+    return [
+        SystemMessage(content=MAP_SYSTEM_PROMPT),
+        HumanMessage(content=f"# FRAGMENTO {index} DE {total}\n\n{chunk}"),
+    ]
+
+
+def build_reduce_document(chunks: List[str], candidates: List[Dict[str, Any]], head_chars: int = 4000) -> str:
+    """
+    Documento reducido para la consolidación: candidatos de cada fragmento
+    más el inicio del documento original como contexto.
+
+    Args:
+        chunks: Fragmentos del documento
+        candidates: Candidatos extraídos de cada fragmento
+        head_chars: Caracteres del inicio del documento a incluir
+
+    Returns:
+        Texto a usar como documento en el prompt final
+    """
+    total_chars = sum(len(chunk) for chunk in chunks)
+    parts = [
+        f"El documento original ({total_chars} caracteres) se ha dividido en {len(chunks)} fragmentos.",
+        "Consolida los valores candidatos en una única ficha: ante valores contradictorios",
+        "prevalece el del extracto o la convocatoria frente al de los anexos.",
+        "\n## CANDIDATOS POR FRAGMENTO\n",
+    ]
+    for i, found in enumerate(candidates, 1):
+        if found:
+            parts.append(f"### Fragmento {i}")
+            parts.append(json.dumps(found, ensure_ascii=False, indent=1))
+
+    parts.append("\n## INICIO DEL DOCUMENTO\n")
+    parts.append(chunks[0][:head_chars] if chunks else "")
+
+    return "\n".join(parts)
@@ -0,0 +1,229 @@
+"""
+Pool de modelos LLM y cascada por coste.
+Mantiene un LLMProcessor preconstruido por modelo para atender la selección
+por petición y prueba primero un modelo económico, escalando al premium solo
+si la ficha no supera la validación.
+"""
+
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.exceptions import OutputParserException
+from loguru import logger
+from pydantic import ValidationError
+
+from app.config import settings
+from app.core.json_stream import FieldViolation
+from app.core.llm_processor import LLMProcessor
+from app.core.rag_system import RAGSystem
+from app.core.usage_ledger import SUM_FIELDS
+
+
+# Errores que indican una ficha inválida (se escala); los demás (red, límites
+# del proveedor...) se propagan sin gastar el siguiente nivel
+ESCALATION_ERRORS = (OutputParserException, ValidationError, FieldViolation)
+
+
+# Alias expuestos en la API -> (proveedor, modelo)
+MODEL_ALIASES: Dict[str, Tuple[str, str]] = {
+    "claude-3.5-sonnet": ("anthropic", "claude-3-5-sonnet-20241022"),
+    "claude-3.5-haiku": ("anthropic", "claude-3-5-haiku-20241022"),
+    "gpt-4o": ("openai", "gpt-4o"),
+    "gpt-4o-mini": ("openai", "gpt-4o-mini"),
+    "gpt-3.5-turbo": ("openai", "gpt-3.5-turbo"),
+}
+
+# Tipo de documento según la cabecera (orden = prioridad)
+DOCUMENT_TYPES: List[Tuple[str, re.Pattern]] = [
+    ("correccion", re.compile(r"correcci[óo]n de errores", re.IGNORECASE)),
+    ("modificacion", re.compile(r"modificaci[óo]n de las bases|se modifica", re.IGNORECASE)),
+    ("extracto", re.compile(r"\bextracto\b", re.IGNORECASE)),
+    ("bases", re.compile(r"bases reguladoras", re.IGNORECASE)),
+    ("convocatoria", re.compile(r"\bconvocatoria\b", re.IGNORECASE)),
+]
+
+
+def _tier_usage(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Modelo, proveedor y gasto (SUM_FIELDS) de la metadata de una generación."""
+    return {
+        "provider": metadata.get("provider"),
+        "model": metadata.get("model"),
+        **{field: metadata.get(field, 0) for field in SUM_FIELDS},
+    }
+
+
+def _sum_usage(discarded: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Suma el gasto de los niveles descartados de la cascada."""
+    totals = {field: sum(entry["usage"].get(field, 0) for entry in discarded if entry.get("usage")) for field in SUM_FIELDS}
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    totals["llm_time"] = round(totals["llm_time"], 3)
+    return totals
+
+
+def document_type(pdf_text: str, head_chars: int = 2000) -> str:
+    """
+    Clasifica el documento por su cabecera (extracto, bases, convocatoria...).
+
+    Args:
+        pdf_text: Texto del documento
+        head_chars: Caracteres iniciales a examinar
+
+    Returns:
+        Tipo de documento u "otro"
+    """
+    head = pdf_text[:head_chars]
+    for name, pattern in DOCUMENT_TYPES:
+        if pattern.search(head):
+            return name
+    return "otro"
+
+
+class EscalationStats:
+    """
+    Contadores de la cascada por tipo de documento (seguros entre hilos).
+    """
+
+    def __init__(self):
+        """Inicializa los contadores."""
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"total": 0, "escalated": 0, "failed": 0})
+
+    def record(self, doc_type: str, escalated: bool, failed: bool = False) -> None:
+        """Registra el resultado de una generación en cascada."""
+        with self._lock:
+            counts = self._counts[doc_type]
+            counts["total"] += 1
+            counts["escalated"] += int(escalated)
+            counts["failed"] += int(failed)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Contadores y tasa de escalado por tipo de documento."""
+        with self._lock:
+            return {
+                doc_type: {**counts, "escalation_rate": round(counts["escalated"] / counts["total"], 3)}
+                for doc_type, counts in self._counts.items()
+            }
+
+
+class ModelPool:
+    """
+    Pool de procesadores LLM preconstruidos, uno por modelo disponible.
+    """
+
+    def __init__(self, rag_system: Optional[RAGSystem] = None):
+        """
+        Construye un LLMProcessor por cada alias cuyo proveedor tenga API key.
+
+        Args:
+            rag_system: Sistema RAG compartido por todos los procesadores
+        """
+        self.default = LLMProcessor(rag_system=rag_system)
+        self.processors: Dict[str, LLMProcessor] = {}
+        self.stats = EscalationStats()
+
+        for alias, (provider, model_name) in MODEL_ALIASES.items():
+            if not settings.get_llm_api_key(provider):
+                continue
+            if provider == self.default.provider and model_name == self.default.model_name:
+                self.processors[alias] = self.default
+            else:
+                self.processors[alias] = LLMProcessor(provider=provider, model_name=model_name, rag_system=rag_system)
+
+        self.cascade = [alias.strip() for alias in settings.LLM_CASCADE_MODELS.split(",") if alias.strip()]
+        logger.info(f"Pool de modelos: {', '.join(self.processors) or 'solo por defecto'} | cascada: {self.cascade}")
+
+    def available(self) -> List[str]:
+        """Alias de modelos disponibles."""
+        return list(self.processors)
+
+    def get(self, alias: Optional[str] = None) -> LLMProcessor:
+        """
+        Devuelve el procesador de un modelo.
+
+        Args:
+            alias: Alias del modelo (None = procesador por defecto)
+
+        Returns:
+            LLMProcessor preconstruido
+
+        Raises:
+            ValueError: Si el modelo no existe o su proveedor no está configurado
+        """
+        if alias is None:
+            return self.default
+        if alias not in self.processors:
+            raise ValueError(f"Modelo no disponible: {alias}. Disponibles: {', '.join(self.processors)}")
+        return self.processors[alias]
+
+    async def agenerate_cascade(
+        self,
+        pdf_text: str,
+        use_rag: bool = True,
+        usuario: str = "PROYECTO_FICHAS_IA",
+    ) -> Dict[str, Any]:
+        """
+        Genera la ficha probando los modelos de LLM_CASCADE_MODELS en orden
+        (de más barato a más caro) y escalando solo si falla la validación o
+        el control de calidad determinista. Los errores que no son de
+        validación (red, límites del proveedor...) se propagan sin escalar.
+
+        Args:
+            pdf_text: Texto extraído del PDF
+            use_rag: Si usar sistema RAG para ejemplos
+            usuario: Usuario que genera la ficha
+
+        Returns:
+            Dict con la ficha generada y metadata (incluye "cascade", con los
+            niveles descartados, el motivo, su gasto y el total en
+            "discarded_usage")
+
+        Raises:
+            Exception: Error del último nivel o no relacionado con la
+                validación; lleva los niveles descartados en cascade_discarded
+        """
+        doc_type = document_type(pdf_text)
+        tiers = [alias for alias in self.cascade if alias in self.processors] or [None]
+        tried, discarded = [], []
+
+        for i, alias in enumerate(tiers):
+            processor = self.get(alias)
+            tried.append(alias or processor.model_name)
+            try:
+                result = await processor.agenerate_ficha(pdf_text, use_rag=use_rag, usuario=usuario)
+            except Exception as e:
+                if i == len(tiers) - 1 or not isinstance(e, ESCALATION_ERRORS):
+                    self.stats.record(doc_type, escalated=i > 0, failed=True)
+                    e.cascade_discarded = discarded
+                    raise
+                logger.warning(f"Cascada: {tried[-1]} no superó la validación ({str(e)[:120]}); escalando")
+                discarded.append({
+                    "tier": tried[-1],
+                    "reason": "validation",
+                    "error": str(e)[:200],
+                    "usage": getattr(e, "llm_usage", None),
+                })
+                continue
+
+            quality = result["metadata"].get("quality")
+            if quality and not quality["passed"] and i < len(tiers) - 1:
+                logger.warning(
+                    f"Cascada: {tried[-1]} no superó el control de calidad ({quality['score']}/100); escalando"
+                )
+                discarded.append({
+                    "tier": tried[-1],
+                    "reason": "quality",
+                    "quality": quality,
+                    "usage": _tier_usage(result["metadata"]),
+                })
+                continue
+
+            self.stats.record(doc_type, escalated=i > 0)
+            result["metadata"]["cascade"] = {
+                "document_type": doc_type,
+                "tiers_tried": tried,
+                "escalated": i > 0,
+                "discarded": discarded,
+                "discarded_usage": _sum_usage(discarded),
+            }
+            return result
@@ -0,0 +1,327 @@
+"""
+Detección de documentos casi duplicados.
+Índice MinHash/LSH sobre los textos ya procesados: las convocatorias que se
+republican con cambios mínimos reutilizan la ficha anterior y solo se
+regeneran los campos afectados por el diff.
+"""
+
+import re
+import json
+import zlib
+import difflib
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from loguru import logger
+
+from app.models.ficha_schema import FichaData
+from app.core.ficha_repair import FIELD_KEYWORDS, document_excerpt
+
+
+# Primo de Mersenne para las permutaciones universales (a*x + b) mod p
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Fechas e importes de un valor de la ficha que delatan un cambio en el diff
+_VALUE_TOKEN = re.compile(r"\d{1,2}/\d{1,2}/\d{2,4}|\d[\d.]*,\d{2}|\b\d{3,}\b")
+
+
+def shingle_hashes(text: str, k: int = 5) -> Set[int]:
+    """
+    Hashes de los k-shingles de palabras del texto normalizado.
+
+    Args:
+        text: Texto del documento
+        k: Palabras por shingle
+
+    Returns:
+        Conjunto de hashes de 32 bits
+    """
+    words = re.sub(r"\s+", " ", text.lower()).split()
+    if len(words) < k:
+        words = words + [""] * (k - len(words))
+    return {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    """Similitud de Jaccard exacta entre dos conjuntos de shingles."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """
+    Firmas MinHash con num_perm permutaciones universales.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        """
+        Args:
+            num_perm: Número de permutaciones (longitud de la firma)
+            seed: Semilla de las permutaciones (fija para que las firmas persistidas sigan siendo comparables)
+        """
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles: Set[int]) -> np.ndarray:
+        """
+        Firma MinHash de un conjunto de shingles.
+
+        Args:
+            shingles: Hashes de los shingles
+
+        Returns:
+            Array uint64 de longitud num_perm
+        """
+        if not shingles:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        permuted = ((values[:, None] * self.a + self.b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=0)
+
+
+class DuplicateIndex:
+    """
+    Índice LSH de documentos procesados, persistido en disco.
+
+    index.jsonl guarda una firma por línea; docs/<id>.json, el texto, la
+    ficha y la metadata de cada documento (necesarios para el diff).
+    """
+
+    def __init__(self, index_dir: str, num_perm: int = 128, bands: int = 32, shingle_size: int = 5):
+        """
+        Args:
+            index_dir: Directorio del índice
+            num_perm: Longitud de la firma MinHash
+            bands: Bandas LSH (num_perm debe ser múltiplo)
+            shingle_size: Palabras por shingle
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) debe ser múltiplo de bands ({bands})")
+
+        self.index_dir = Path(index_dir)
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[tuple, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Carga las firmas persistidas."""
+        path = self.index_dir / "index.jsonl"
+        if not path.exists():
+            return
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._insert(entry["doc_id"], np.array(entry["signature"], dtype=np.uint64))
+        logger.info(f"Índice de duplicados: {len(self._signatures)} documentos")
+
+    def _insert(self, doc_id: str, signature: np.ndarray) -> None:
+        self._signatures[doc_id] = signature
+        for band in range(self.bands):
+            key = (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            self._buckets.setdefault(key, set()).add(doc_id)
+
+    def _doc_path(self, doc_id: str) -> Path:
+        return self.index_dir / "docs" / f"{doc_id}.json"
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, doc_id: str, text: str, ficha: FichaData, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Añade un documento procesado al índice.
+
+        Args:
+            doc_id: Identificador (ficha_id)
+            text: Texto extraído del documento
+            ficha: Ficha generada
+            metadata: Datos de la generación a conservar (modelo, proveedor...)
+        """
+        signature = self.hasher.signature(shingle_hashes(text, self.shingle_size))
+        doc = {"text": text, "ficha": ficha.model_dump(mode="json"), "metadata": metadata or {}}
+
+        with self._lock:
+            path = self._doc_path(doc_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+            with open(self.index_dir / "index.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps({"doc_id": doc_id, "signature": signature.tolist()}) + "\n")
+            self._insert(doc_id, signature)
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Texto, ficha y metadata de un documento indexado (o None)."""
+        path = self._doc_path(doc_id)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def find(self, text: str, threshold: float = 0.9) -> Optional[Dict[str, Any]]:
+        """
+        Busca el documento indexado más parecido por encima del umbral.
+
+        Los candidatos salen de los buckets LSH y se ordenan por similitud
+        estimada con la firma; el mejor se confirma con Jaccard exacto.
+
+        Args:
+            text: Texto del documento nuevo
+            threshold: Similitud de Jaccard mínima
+
+        Returns:
+            Dict con doc_id, similarity, text, ficha y metadata, o None
+        """
+        shingles = shingle_hashes(text, self.shingle_size)
+        signature = self.hasher.signature(shingles)
+
+        candidates: Set[str] = set()
+        for band in range(self.bands):
+            key = (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            candidates |= self._buckets.get(key, set())
+
+        ranked = sorted(
+            ((float(np.mean(self._signatures[doc_id] == signature)), doc_id) for doc_id in candidates),
+            reverse=True,
+        )
+        for estimate, doc_id in ranked:
+            if estimate < threshold - 0.1:
+                break
+            doc = self.get(doc_id)
+            if doc is None:
+                continue
+            similarity = jaccard(shingles, shingle_hashes(doc["text"], self.shingle_size))
+            if similarity >= threshold:
+                return {"doc_id": doc_id, "similarity": round(similarity, 4), **doc}
+        return None
+
+
+def text_diff(old: str, new: str, max_lines: int = 200) -> List[str]:
+    """
+    Líneas añadidas ("+") y eliminadas ("-") entre dos versiones del texto.
+
+    Args:
+        old: Texto anterior
+        new: Texto nuevo
+        max_lines: Máximo de líneas devueltas
+
+    Returns:
+        Líneas del diff sin cabeceras
+    """
+    lines = [
+        line
+        for line in difflib.unified_diff(old.splitlines(), new.splitlines(), n=0, lineterm="")
+        if line[:1] in "+-" and not line.startswith(("+++", "---")) and line[1:].strip()
+    ]
+    return lines[:max_lines]
+
+
+def _value_tokens(value: Any) -> List[str]:
+    """Fechas e importes de un valor de la ficha (fechas ISO también en dd/mm/aaaa)."""
+    text = json.dumps(value, ensure_ascii=False, default=str)
+    iso_dates = re.findall(r"(\d{4})-(\d{2})-(\d{2})", text)
+    return _VALUE_TOKEN.findall(text) + [f"{d}/{m}/{y}" for y, m, d in iso_dates]
+
+
+def touched_fields(diff_lines: List[str], previous: Dict[str, Any]) -> List[str]:
+    """
+    Campos de la ficha afectados por un diff.
+
+    Un campo se considera afectado si una línea cambiada contiene alguna de
+    sus palabras clave o si una línea eliminada contenía una fecha o importe
+    de su valor anterior.
+
+    Args:
+        diff_lines: Salida de text_diff
+        previous: Ficha anterior (JSON)
+
+    Returns:
+        Campos a regenerar
+    """
+    changed = "\n".join(line[1:] for line in diff_lines).lower()
+    removed = "\n".join(line[1:] for line in diff_lines if line.startswith("-"))
+
+    touched = []
+    for name in FichaData.model_fields:
+        keywords = FIELD_KEYWORDS.get(name, [])
+        if any(keyword.lower() in changed for keyword in keywords) or any(
+            token in removed for token in _value_tokens(previous.get(name))
+        ):
+            touched.append(name)
+    return touched
+
+
+def restamp_ficha(ficha: FichaData, usuario: str, today: Optional[date] = None) -> FichaData:
+    """
+    Copia de una ficha reutilizada con el USUARIO y la FECHA de la petición
+    actual (la anterior conserva los de quien la generó).
+
+    Args:
+        ficha: Ficha anterior (o actualizada a partir de ella)
+        usuario: Usuario de la petición
+        today: Fecha de creación (por defecto, hoy)
+
+    Returns:
+        Ficha con otros_datos actualizados
+    """
+    otros_datos = ficha.otros_datos.model_copy(update={
+        "USUARIO": usuario,
+        "FECHA": (today or date.today()).strftime("%d/%m/%Y"),
+    })
+    return ficha.model_copy(update={"otros_datos": otros_datos})
+
+
+def build_update_prompt(
+    fields: List[str],
+    previous: Dict[str, Any],
+    pdf_text: str,
+    diff_lines: List[str],
+) -> str:
+    """
+    Prompt para actualizar una ficha anterior con los cambios del documento.
+
+    Args:
+        fields: Campos a regenerar
+        previous: Ficha anterior (JSON)
+        pdf_text: Texto del documento nuevo
+        diff_lines: Cambios respecto al documento anterior
+
+    Returns:
+        User prompt de actualización
+    """
+    parts = [
+        "# ACTUALIZACIÓN DE FICHA\n",
+        "El documento es una nueva versión de otro ya procesado. "
+        "Revisa los campos siguientes según los cambios y el documento nuevo.",
+    ]
+
+    for name in fields:
+        field = FichaData.model_fields[name]
+        parts.append(f"\n## Campo: {name}")
+        if field.description:
+            parts.append(f"Descripción: {field.description}")
+        if name in previous:
+            parts.append(f"Valor anterior: {json.dumps(previous[name], ensure_ascii=False)}")
+
+    parts.append("\n# CAMBIOS RESPECTO A LA VERSIÓN ANTERIOR\n")
+    parts.append("\n".join(diff_lines))
+
+    parts.append("\n# FRAGMENTOS DEL DOCUMENTO NUEVO\n")
+    parts.append(document_excerpt(pdf_text, fields))
+
+    parts.append("\n# INSTRUCCIONES\n")
+    parts.append(
+        f"Devuelve ÚNICAMENTE un objeto JSON con los campos {json.dumps(fields)}, sin texto adicional."
+    )
+
+    return "\n".join(parts)
@@ -3,13 +3,17 @@ Módulo de extracción de PDFs.
 Extrae texto, tablas y metadatos de documentos PDF legales.
 """
 
+import io
 import re
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 import pymupdf  # PyMuPDF
 import pdfplumber
 from loguru import logger
 
+from app.utils.validators import BOLETIN_HEADER_PATTERNS
+
 
 class PDFExtractor:
     """
@@ -56,11 +60,12 @@ class PDFExtractor:
                     text_parts.append(text)
                     logger.debug(f"Página {page_num}: {len(text)} caracteres")
 
+            page_count = len(doc)
             doc.close()
 
             raw_text = "\n\n".join(text_parts)
             logger.info(
-                f"Extracción completa: {len(raw_text)} caracteres, {len(doc)} páginas"
+                f"Extracción completa: {len(raw_text)} caracteres, {page_count} páginas"
             )
 
             # Limpiar texto
@@ -72,12 +77,47 @@ class PDFExtractor:
             logger.error(f"Error extrayendo texto del PDF: {e}")
             raise
 
-    def extract_tables(self, pdf_path: str | Path) -> List[Dict[str, Any]]:
+    def extract_pages(self, pdf_path: str | Path, doc: Optional[pymupdf.Document] = None) -> List[Dict[str, Any]]:
+        """
+        Extrae el texto página a página con estadísticas básicas.
+
+        Args:
+            pdf_path: Ruta al archivo PDF
+            doc: Documento ya abierto (no se cierra); None = abrir pdf_path
+
+        Returns:
+            Lista de páginas con texto bruto y métricas (caracteres, palabras, imágenes)
+        """
+        pdf_path = Path(pdf_path)
+
+        if doc is None and not pdf_path.exists():
+            raise FileNotFoundError(f"PDF no encontrado: {pdf_path}")
+
+        pages = []
+        with pymupdf.open(pdf_path) if doc is None else nullcontext(doc) as doc:
+            for page_num, page in enumerate(doc, start=1):
+                text = page.get_text()
+                pages.append(
+                    {
+                        "page": page_num,
+                        "text": text,
+                        "chars": len(text),
+                        "words": len(text.split()),
+                        "lines": text.count("\n"),
+                        "images": len(page.get_images()),
+                        "has_text": bool(text.strip()),
+                    }
+                )
+
+        return pages
+
+    def extract_tables(self, pdf_path: str | Path, data: Optional[bytes] = None) -> List[Dict[str, Any]]:
         """
         Extrae tablas del PDF.
 
         Args:
             pdf_path: Ruta al archivo PDF
+            data: Contenido ya leído del PDF; None = leer pdf_path
 
         Returns:
             Lista de tablas extraídas (cada tabla como dict con metadata)
@@ -88,7 +128,7 @@ class PDFExtractor:
         tables_data = []
 
         try:
-            with pdfplumber.open(pdf_path) as pdf:
+            with pdfplumber.open(pdf_path if data is None else io.BytesIO(data)) as pdf:
                 for page_num, page in enumerate(pdf.pages, start=1):
                     tables = page.extract_tables()
 
@@ -115,12 +155,13 @@ class PDFExtractor:
             logger.error(f"Error extrayendo tablas: {e}")
             return []
 
-    def extract_metadata(self, pdf_path: str | Path) -> Dict[str, Any]:
+    def extract_metadata(self, pdf_path: str | Path, doc: Optional[pymupdf.Document] = None) -> Dict[str, Any]:
         """
         Extrae metadatos del PDF.
 
         Args:
             pdf_path: Ruta al archivo PDF
+            doc: Documento ya abierto (no se cierra); None = abrir pdf_path
 
         Returns:
             Diccionario con metadatos
@@ -129,25 +170,24 @@ class PDFExtractor:
         logger.info(f"Extrayendo metadatos de: {pdf_path.name}")
 
         try:
-            doc = pymupdf.open(pdf_path)
-            metadata = doc.metadata or {}
-
-            info = {
-                "filename": pdf_path.name,
-                "size_bytes": pdf_path.stat().st_size,
-                "size_mb": round(pdf_path.stat().st_size / (1024 * 1024), 2),
-                "pages": len(doc),
-                "title": metadata.get("title", ""),
-                "author": metadata.get("author", ""),
-                "subject": metadata.get("subject", ""),
-                "creator": metadata.get("creator", ""),
-                "producer": metadata.get("producer", ""),
-                "creation_date": metadata.get("creationDate", ""),
-                "modification_date": metadata.get("modDate", ""),
-                "encrypted": doc.is_encrypted,
-            }
-
-            doc.close()
+            with pymupdf.open(pdf_path) if doc is None else nullcontext(doc) as doc:
+                metadata = doc.metadata or {}
+                size_bytes = pdf_path.stat().st_size
+
+                info = {
+                    "filename": pdf_path.name,
+                    "size_bytes": size_bytes,
+                    "size_mb": round(size_bytes / (1024 * 1024), 2),
+                    "pages": len(doc),
+                    "title": metadata.get("title", ""),
+                    "author": metadata.get("author", ""),
+                    "subject": metadata.get("subject", ""),
+                    "creator": metadata.get("creator", ""),
+                    "producer": metadata.get("producer", ""),
+                    "creation_date": metadata.get("creationDate", ""),
+                    "modification_date": metadata.get("modDate", ""),
+                    "encrypted": doc.is_encrypted,
+                }
 
             logger.info(f"Metadatos extraídos: {info['pages']} páginas, {info['size_mb']} MB")
             return info
@@ -243,18 +283,8 @@ class PDFExtractor:
         text = self.extract_text(pdf_path)
         metadata = self.extract_metadata(pdf_path)
 
-        # Patrones de detección
-        patterns = {
-            "BOP": r"BOLET[ÍI]N OFICIAL DE LA PROVINCIA",
-            "BOE": r"BOLET[ÍI]N OFICIAL DEL ESTADO",
-            "BOJA": r"BOLET[ÍI]N OFICIAL DE LA JUNTA DE ANDALUC[ÍI]A",
-            "BOCM": r"BOLET[ÍI]N OFICIAL DE LA COMUNIDAD DE MADRID",
-            "DOGC": r"DIARI OFICIAL DE LA GENERALITAT DE CATALUNYA",
-            "BOPV": r"BOLET[ÍI]N OFICIAL DEL PA[ÍI]S VASCO",
-        }
-
         detected = {}
-        for tipo, pattern in patterns.items():
+        for tipo, pattern in BOLETIN_HEADER_PATTERNS.items():
             match = re.search(pattern, text[:2000], re.IGNORECASE)
             if match:
                 detected["tipo"] = tipo
@@ -0,0 +1,407 @@
+"""
+Control de calidad determinista de fichas.
+Compila una sola vez las reglas de las instrucciones V4.4 (frases de inicio,
+formatos de fecha, importe y boletín, valores IPREM/SMI/IRSC, repeticiones
+entre campos y coherencia de portales) y las aplica a cada ficha sin llamar
+al LLM, devolviendo las incidencias y una puntuación de 0 a 100.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.core.entity_scanner import SIGLAS_BOLETIN
+from app.models.ficha_schema import FichaData, ValoresReferencia2025
+
+
+# Penalización por incidencia según su gravedad
+SEVERITY_PENALTY = {"error": 15, "warning": 5}
+
+# Campos de texto libre que se revisan (los de lista se unen por líneas)
+TEXT_FIELDS = [
+    "nombre_ayuda",
+    "plazo_presentacion",
+    "requisitos_acceso",
+    "beneficiarios",
+    "descripcion",
+    "cuantia",
+    "importe_maximo",
+    "resolucion",
+    "documentos_presentar",
+    "costes_no_subvencionables",
+    "criterios_concesion",
+    "normativa_reguladora",
+    "referencia_legislativa",
+]
+
+# Campos en los que un mismo dato no debe repetirse ("cada dato va una sola
+# vez en su campo"; importe_maximo repite a propósito el máximo de cuantía)
+NO_REPEAT_FIELDS = [
+    "requisitos_acceso",
+    "beneficiarios",
+    "descripcion",
+    "cuantia",
+    "resolucion",
+    "documentos_presentar",
+    "costes_no_subvencionables",
+    "criterios_concesion",
+]
+
+# Portal esperado según el tipo de ayuda
+TIPO_PORTALES = {
+    "Violencia de Género": ("Mujer",),
+    "Natalidad": ("Familia",),
+    "Conciliación": ("Familia",),
+    "Familia": ("Familia",),
+    "Acogimiento": ("Familia",),
+    "Atención temprana": ("Familia", "Discapacidad"),
+    "Discapacidad": ("Discapacidad",),
+    "Accesibilidad": ("Discapacidad", "Mayores"),
+    "Complementarias Dependencias": ("Mayores", "Discapacidad"),
+    "Paliativos": ("Salud",),
+    "Salud": ("Salud",),
+}
+
+# Colectivos de beneficiarios que implican un portal
+BENEFICIARIOS_PORTALES = [
+    ("Mayores", r"personas\s+mayores|mayores\s+de\s+6\d\s+años"),
+    ("Discapacidad", r"discapacidad"),
+    ("Mujer", r"violencia\s+de\s+g[ée]nero|mujeres\s+v[íi]ctimas"),
+]
+
+# Defaults si el JSON de instrucciones no está disponible
+DEFAULT_START_PHRASES = {
+    "requisitos_acceso": "Los requisitos para optar a las ayudas son los siguientes:",
+    "beneficiarios": "Podrán ser beneficiarias:",
+    "cuantia": "La cuantía de la ayuda será:",
+}
+DEFAULT_PLAZO_FORMULA = "El plazo permanecerá abierto hasta"
+DEFAULT_PORTAL_ORDER = ["Mayores", "Discapacidad", "Familia", "Mujer", "Salud"]
+DEFAULT_FRASE_MAX_WORDS = 20
+AMBITOS_CON_FRASE = ("estatal", "autonómic", "autonomic", "provincial")
+
+
+class QualityChecker:
+    """
+    Verificador de las reglas de las instrucciones sobre fichas ya validadas
+    por el schema. Las reglas se compilan en el constructor; check() solo
+    recorre la ficha con patrones precompilados.
+    """
+
+    def __init__(self, instructions: Optional[Dict[str, Any]] = None):
+        """
+        Compila las reglas.
+
+        Args:
+            instructions: Instrucciones JSON (LLMProcessor.instructions); None o
+                vacías = reglas por defecto equivalentes a la V4.4
+        """
+        instructions = instructions or {}
+        campos = instructions.get("campos", {})
+
+        # Frases de inicio: "Se inicia el texto con la frase: '...'"
+        self.start_phrases = dict(DEFAULT_START_PHRASES)
+        for field, spec in campos.items():
+            for rule in spec.get("reglas", []):
+                match = re.search(r"inicia el texto con la frase:\s*'([^']+)'", rule)
+                if match and field in FichaData.model_fields:
+                    self.start_phrases[field] = match.group(1)
+
+        # Fórmula del plazo: "Usa la fórmula única: 'El plazo ... hasta (Fecha de fin)'"
+        self.plazo_formula = DEFAULT_PLAZO_FORMULA
+        for rule in campos.get("plazo_presentacion", {}).get("reglas", []):
+            match = re.search(r"fórmula[^']*'([^'(]+)", rule)
+            if match:
+                self.plazo_formula = match.group(1).strip()
+
+        restricciones = campos.get("portales", {}).get("restricciones", {})
+        self.portal_order = restricciones.get("orden_obligatorio", DEFAULT_PORTAL_ORDER)
+        self.no_duplicate_pairs = [
+            (field, other)
+            for field in ("portales", "categoria")
+            for other in campos.get(field, {}).get("restricciones", {}).get("no_duplicar_con", [])
+            if field < other
+        ] or [("categoria", "portales")]
+
+        self.frase_max_words = DEFAULT_FRASE_MAX_WORDS
+        for rule in campos.get("otros_datos", {}).get("reglas", []):
+            match = re.search(r"FRASE PARA PUBLICITAR:.*?máx\.?\s*(\d+)\s*palabras", rule)
+            if match:
+                self.frase_max_words = int(match.group(1))
+
+        # Valores de referencia: {indicador: {"600,00 €", ...}}
+        valores = ValoresReferencia2025().model_dump()
+        self.reference_values = {
+            "IPREM": set(valores["iprem"].values()),
+            "SMI": set(valores["smi"].values()),
+            "IRSC": set(valores["irsc_cataluna"].values()),
+        }
+
+        # Patrones
+        self.amount_pattern = re.compile(
+            r"(?<![\w.,])(?P<num>\d[\d.,]*\d|\d)\s*(?P<unit>€|(?i:euros?)\b|EUR\b)|€\s*\d"
+        )
+        self.amount_hint = re.compile(r"€|(?i:euro)|EUR")
+        self.valid_amount = re.compile(r"\d+(?:\.\d{3})*,\d{2}")
+        self.numeric_date = re.compile(r"\b\d{1,4}([/.-])\d{1,2}\1\d{2,4}\b")
+        self.valid_date = re.compile(r"\d{2}/\d{2}/\d{4}")
+        self.relative_term = re.compile(r"\b\d+\s+d[íi]as\b|\bdesde\s+el\s+d[íi]a\s+siguiente\b", re.IGNORECASE)
+        siglas = "|".join(SIGLAS_BOLETIN)
+        self.boletin_mention = re.compile(rf"\b(?:{siglas}|B\.O\.P\.?|B\.O\.E\.?)(?![\w])")
+        self.boletin_format = re.compile(
+            rf"\b(?:{siglas})(?:\s+(?:\([^)]+\)|[A-ZÁÉÍÓÚÑ][\wáéíóúñ-]*(?:\s+(?:de\s+)?[A-ZÁÉÍÓÚÑ][\wáéíóúñ-]*)*))?"
+            r"\s+núm\.\s+\d+,\s+\d{2}/\d{2}/\d{4}"
+        )
+        self.bdns_mention = re.compile(r"\bBDNS\b|Base de Datos Nacional de Subvenciones", re.IGNORECASE)
+        self.bdns_format = re.compile(
+            r"(?:Base de Datos Nacional de Subvenciones|BDNS)\s+N[º°]\s*\d+(?:,\s+\d{2}/\d{2}/\d{4})?"
+        )
+        self.indicator = re.compile(r"\b(IPREM|SMI|IRSC)\b")
+        self.multiplier = re.compile(r"\bveces\b|%|por\s+ciento|\b\d+(?:,\d+)?\s*x\b|\bx\s*\d", re.IGNORECASE)
+        self.local_admin = re.compile(
+            r"^(?:Ayuntamiento|Diputaci[óo]n|Mancomunidad|Consell\s+Comarcal|Comarca|Cabildo|Concello)\b",
+            re.IGNORECASE,
+        )
+        self.sentence_split = re.compile(r"\n+|(?<=[.;:])\s+")
+        self.beneficiarios_portales = [
+            (portal, re.compile(pattern, re.IGNORECASE)) for portal, pattern in BENEFICIARIOS_PORTALES
+        ]
+
+    # --- Utilidades ---
+
+    @staticmethod
+    def _text(value: Any) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return "\n".join(value)
+        return str(value)
+
+    @staticmethod
+    def _issue(issues: List[Dict[str, str]], rule: str, field: str, severity: str, message: str) -> None:
+        issues.append({"rule": rule, "field": field, "severity": severity, "message": message})
+
+    # --- Reglas ---
+
+    def _check_start_phrases(self, ficha: FichaData, issues: List[Dict[str, str]]) -> None:
+        for field, phrase in self.start_phrases.items():
+            value = getattr(ficha, field, None)
+            text = value[0] if isinstance(value, list) and value else self._text(value)
+            if text and not text.startswith(phrase):
+                self._issue(issues, "frase_inicio", field, "error", f"Debe iniciar con: '{phrase}'")
+
+    def _check_dates(self, ficha: FichaData, texts: Dict[str, str], issues: List[Dict[str, str]]) -> None:
+        if ficha.fecha_fin < ficha.fecha_inicio:
+            self._issue(issues, "fechas", "fecha_fin", "error", "La fecha de fin es anterior a la de inicio")
+        if ficha.fecha_publicacion and ficha.fecha_publicacion > ficha.fecha_inicio:
+            self._issue(
+                issues, "fechas", "fecha_inicio", "warning",
+                "El plazo empieza antes de la publicación oficial",
+            )
+        if not self.valid_date.fullmatch(ficha.otros_datos.FECHA):
+            self._issue(issues, "formato_fecha", "otros_datos.FECHA", "error", "FECHA debe ser dd/mm/aaaa")
+
+        for field, text in texts.items():
+            for match in self.numeric_date.finditer(text):
+                if not self.valid_date.fullmatch(match.group(0)):
+                    self._issue(
+                        issues, "formato_fecha", field, "warning",
+                        f"Fecha '{match.group(0)}' no está en formato dd/mm/aaaa",
+                    )
+
+        plazo = ficha.plazo_presentacion
+        if self.relative_term.search(plazo):
+            self._issue(issues, "plazo", "plazo_presentacion", "error", "No usar plazos relativos")
+        fin = ficha.fecha_fin.strftime("%d/%m/%Y")
+        if fin not in plazo:
+            self._issue(
+                issues, "plazo", "plazo_presentacion", "error",
+                f"Debe ser '{self.plazo_formula} {fin}' (fecha de fin)",
+            )
+
+    def _check_amounts(self, texts: Dict[str, str], issues: List[Dict[str, str]]) -> None:
+        for field, text in texts.items():
+            if not self.amount_hint.search(text):
+                continue
+            for match in self.amount_pattern.finditer(text):
+                if field == "descripcion":
+                    self._issue(
+                        issues, "importe_en_descripcion", field, "error",
+                        "Los importes van en 'Cuantía', no en 'Descripción'",
+                    )
+                    break
+                number, unit = match.group("num"), match.group("unit")
+                if number is None or unit != "€" or not self.valid_amount.fullmatch(number):
+                    self._issue(
+                        issues, "formato_importe", field, "error",
+                        f"Importe '{match.group(0).strip()}' debe tener el formato X.XXX,XX €",
+                    )
+
+        if not self.valid_amount.search(texts.get("importe_maximo", "")):
+            self._issue(issues, "formato_importe", "importe_maximo", "warning", "Sin importe en formato X.XXX,XX €")
+
+        cuantia = texts.get("cuantia", "")
+        if "|" in cuantia or "\t" in cuantia:
+            self._issue(issues, "cuantia_sin_tablas", "cuantia", "warning", "La cuantía no debe usar tablas")
+
+    def _check_boletines(self, ficha: FichaData, issues: List[Dict[str, str]]) -> None:
+        for item in ficha.normativa_reguladora:
+            if self.boletin_mention.search(item) and not self.boletin_format.search(item):
+                self._issue(
+                    issues, "formato_boletin", "normativa_reguladora", "error",
+                    f"Boletín sin formato 'BOP (provincia) núm. (número), (dd/mm/aaaa)': {item[:80]}",
+                )
+            if self.bdns_mention.search(item) and not self.bdns_format.search(item):
+                self._issue(
+                    issues, "formato_boletin", "normativa_reguladora", "warning",
+                    f"BDNS sin formato 'Base de Datos Nacional de Subvenciones Nº (número)': {item[:80]}",
+                )
+        for field in ("normativa_reguladora", "referencia_legislativa"):
+            for item in getattr(ficha, field):
+                if not item.rstrip().endswith("."):
+                    self._issue(issues, "punto_final", field, "warning", f"Falta el punto final: {item[:80]}")
+
+    def _check_indicators(self, texts: Dict[str, str], issues: List[Dict[str, str]]) -> None:
+        fields_with_value: Dict[str, List[str]] = {}
+        for field, text in texts.items():
+            if not self.indicator.search(text):
+                continue
+            for line in text.split("\n"):
+                for match in self.indicator.finditer(line):
+                    name = match.group(1)
+                    window = line[match.start():match.end() + 80]
+                    amounts = [f"{m.group('num')} €" for m in self.amount_pattern.finditer(window) if m.group("num")]
+                    if not amounts:
+                        continue
+                    if any(amount in self.reference_values[name] for amount in amounts):
+                        fields_with_value.setdefault(name, []).append(field)
+                    elif not self.multiplier.search(line, max(0, match.start() - 40), match.end() + 80):
+                        self._issue(
+                            issues, "valor_referencia", field, "error",
+                            f"{name} con importe {amounts[0]} distinto de los valores de referencia 2025",
+                        )
+
+        for name, fields in fields_with_value.items():
+            if len(fields) > 1:
+                self._issue(
+                    issues, "valor_referencia_repetido", fields[1], "warning",
+                    f"El valor de referencia del {name} debe aparecer una sola vez (aparece en {', '.join(fields)})",
+                )
+
+    def _check_repetitions(self, texts: Dict[str, str], issues: List[Dict[str, str]]) -> None:
+        seen: Dict[str, str] = {}
+        reported = set()
+        for field in NO_REPEAT_FIELDS:
+            for sentence in self.sentence_split.split(texts.get(field, "")):
+                key = sentence.strip(" \t-•*.;:,").lower()
+                if len(key) < 30:
+                    continue
+                first = seen.setdefault(key, field)
+                if first != field and (first, field) not in reported:
+                    reported.add((first, field))
+                    self._issue(
+                        issues, "repeticion", field, "warning",
+                        f"Contenido repetido en '{first}' y '{field}': {sentence.strip()[:60]}",
+                    )
+
+    def _check_portals(self, ficha: FichaData, issues: List[Dict[str, str]]) -> None:
+        order = [self.portal_order.index(p) for p in ficha.portales if p in self.portal_order]
+        if order != sorted(order):
+            self._issue(issues, "orden_portales", "portales", "warning", f"Orden obligatorio: {self.portal_order}")
+
+        for field, other in self.no_duplicate_pairs:
+            if set(getattr(ficha, field)) == set(getattr(ficha, other)):
+                self._issue(issues, "portales_categoria", field, "warning", f"'{field}' duplica '{other}'")
+
+        expected = TIPO_PORTALES.get(ficha.tipo_ayuda)
+        if expected and not set(expected) & set(ficha.portales):
+            self._issue(
+                issues, "coherencia_portales", "portales", "warning",
+                f"El tipo '{ficha.tipo_ayuda}' corresponde al portal {' o '.join(expected)}",
+            )
+        for portal, pattern in self.beneficiarios_portales:
+            if portal not in ficha.portales and pattern.search(ficha.beneficiarios):
+                self._issue(
+                    issues, "coherencia_portales", "portales", "warning",
+                    f"Los beneficiarios apuntan al portal {portal}",
+                )
+
+    def _check_otros(self, ficha: FichaData, issues: List[Dict[str, str]]) -> None:
+        if self.local_admin.match(ficha.administracion) and "(" not in ficha.administracion:
+            self._issue(
+                issues, "administracion", "administracion", "warning",
+                "Administración local sin la provincia entre paréntesis",
+            )
+
+        otros = ficha.otros_datos
+        if otros.USUARIO != otros.USUARIO.upper():
+            self._issue(issues, "usuario", "otros_datos.USUARIO", "warning", "USUARIO debe ir en mayúsculas")
+        if otros.FRASE_PARA_PUBLICITAR:
+            ambito = ficha.ambito_territorial.lower()
+            if not any(name in ambito for name in AMBITOS_CON_FRASE):
+                self._issue(
+                    issues, "frase_publicitar", "otros_datos.FRASE_PARA_PUBLICITAR", "warning",
+                    "Solo para ayudas estatales, autonómicas o provinciales",
+                )
+            for frase in otros.FRASE_PARA_PUBLICITAR:
+                if len(frase.split()) > self.frase_max_words:
+                    self._issue(
+                        issues, "frase_publicitar", "otros_datos.FRASE_PARA_PUBLICITAR", "warning",
+                        f"Máximo {self.frase_max_words} palabras",
+                    )
+
+    # --- API ---
+
+    def check(self, ficha: FichaData) -> Dict[str, Any]:
+        """
+        Aplica todas las reglas a una ficha.
+
+        Args:
+            ficha: Ficha validada por el schema
+
+        Returns:
+            Dict con score (0-100), passed (sin errores y score >= QUALITY_MIN_SCORE)
+            e issues (rule, field, severity, message)
+        """
+        issues: List[Dict[str, str]] = []
+        texts = {field: self._text(getattr(ficha, field)) for field in TEXT_FIELDS}
+
+        self._check_start_phrases(ficha, issues)
+        self._check_dates(ficha, texts, issues)
+        self._check_amounts(texts, issues)
+        self._check_boletines(ficha, issues)
+        self._check_indicators(texts, issues)
+        self._check_repetitions(texts, issues)
+        self._check_portals(ficha, issues)
+        self._check_otros(ficha, issues)
+
+        score = max(0, 100 - sum(SEVERITY_PENALTY[issue["severity"]] for issue in issues))
+        return {
+            "score": score,
+            "passed": score >= settings.QUALITY_MIN_SCORE and not any(i["severity"] == "error" for i in issues),
+            "issues": issues,
+        }
+
+    def check_many(self, fichas: Iterable[FichaData]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Revisa un lote de fichas.
+
+        Args:
+            fichas: Fichas validadas
+
+        Returns:
+            Tupla (informes por ficha, resumen con media, aprobadas y reglas más frecuentes)
+        """
+        reports = [self.check(ficha) for ficha in fichas]
+        rules: Dict[str, int] = {}
+        for report in reports:
+            for issue in report["issues"]:
+                rules[issue["rule"]] = rules.get(issue["rule"], 0) + 1
+
+        summary = {
+            "fichas": len(reports),
+            "avg_score": round(sum(r["score"] for r in reports) / len(reports), 1) if reports else 0.0,
+            "passed": sum(1 for r in reports if r["passed"]),
+            "issues_by_rule": dict(sorted(rules.items(), key=lambda item: -item[1])),
+        }
+        return reports, summary
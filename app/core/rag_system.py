@@ -3,20 +3,219 @@ Sistema RAG (Retrieval Augmented Generation).
 Búsqueda semántica de ejemplos similares para mejorar la generación.
 """
 
+import hashlib
+import json
+import time
+from concurrent.futures import Executor
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional, Tuple
+import numpy as np
 from loguru import logger
 
 from app.config import settings
+from app.core.embedding_cache import EmbeddingCache
+from app.core.embedding_backends import create_embedding_model
+from app.core.vector_store import create_vector_store
+from app.core.bm25_index import BM25Index, reciprocal_rank_fusion
+from app.core.ficha_sections import SECTION_FIELDS, section_id
+
+
+def file_sha256(path: Path) -> str:
+    """Hash SHA-256 del contenido de un fichero."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Agrupa un iterable en listas de hasta size elementos sin materializarlo entero."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _load_safely(
+    load: Callable[[str, Path], Optional[Dict[str, Any]]],
+    file_id: str,
+    path: Path,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Ejecuta load sin propagar errores (se usa también en procesos hijos)."""
+    try:
+        return load(file_id, path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _load_batches(
+    batches: Iterable[List[Tuple[str, Tuple[Path, str]]]],
+    load: Callable[[str, Path], Optional[Dict[str, Any]]],
+    executor: Optional[Executor] = None,
+) -> Iterator[List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]]:
+    """
+    Lee los ficheros lote a lote.
+
+    Con executor el lote siguiente se lee en paralelo mientras se indexa el
+    actual; nunca hay más de dos lotes en memoria.
+
+    Yields:
+        Lista de (id, ficha o None, error o None) por lote
+    """
+    if executor is None:
+        for batch in batches:
+            yield [(file_id, *_load_safely(load, file_id, path)) for file_id, (path, _) in batch]
+        return
+
+    submitted = None
+    for batch in batches:
+        futures = [(file_id, executor.submit(_load_safely, load, file_id, path)) for file_id, (path, _) in batch]
+        if submitted is not None:
+            yield [(file_id, *future.result()) for file_id, future in submitted]
+        submitted = futures
+    if submitted is not None:
+        yield [(file_id, *future.result()) for file_id, future in submitted]
+
+
+def split_query_chunks(
+    text: str,
+    chunk_words: int,
+    overlap: int = 0,
+    max_chunks: Optional[int] = None,
+) -> List[str]:
+    """
+    Divide un texto en ventanas de palabras solapadas.
+
+    Si salen más de max_chunks ventanas se eligen repartidas por todo el
+    documento (siempre la primera y la última), no solo las del principio.
+
+    Args:
+        text: Texto a dividir
+        chunk_words: Palabras por ventana
+        overlap: Palabras compartidas entre ventanas consecutivas
+        max_chunks: Máximo de ventanas (None = todas)
+
+    Returns:
+        Lista de ventanas (al menos una si el texto no está vacío)
+    """
+    words = text.split()
+    if not words:
+        return []
+
+    step = max(1, chunk_words - overlap)
+    starts = list(range(0, max(1, len(words) - overlap), step))
+    if max_chunks and len(starts) > max_chunks:
+        if max_chunks == 1:
+            starts = starts[:1]
+        else:
+            last = len(starts) - 1
+            starts = [starts[round(i * last / (max_chunks - 1))] for i in range(max_chunks)]
+    return [" ".join(words[start:start + chunk_words]) for start in starts]
+
+
+class IndexManifest:
+    """
+    Registro de los ficheros indexados (hash, tamaño y fecha de modificación)
+    para que la sincronización solo vuelva a generar embeddings de lo que cambió.
+    """
+
+    def __init__(self, path: Path, embedding_model: str):
+        """
+        Args:
+            path: Fichero JSON del manifiesto
+            embedding_model: Modelo de embeddings del índice; si cambia, el
+                manifiesto se descarta y todo se vuelve a indexar
+        """
+        self.path = Path(path)
+        self.embedding_model = embedding_model
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        self.stale = False
+
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("embedding_model") == embedding_model:
+                self.files = data.get("files", {})
+            else:
+                logger.warning(
+                    f"Manifiesto creado con {data.get('embedding_model')}; se reindexará con {embedding_model}"
+                )
+                self.stale = True
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def diff(self, files: Dict[str, Path]) -> Tuple[Dict[str, Tuple[Path, str]], List[str]]:
+        """
+        Compara los ficheros actuales con el manifiesto.
+
+        Si el tamaño y la fecha de modificación coinciden no se recalcula el hash.
+
+        Args:
+            files: {id: ruta} de los ficheros a indexar
+
+        Returns:
+            Tupla ({id: (ruta, hash)} nuevos o modificados, ids eliminados)
+        """
+        changed = {}
+        for file_id, path in files.items():
+            stat = path.stat()
+            entry = self.files.get(file_id)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            sha256 = file_sha256(path)
+            if entry and entry["sha256"] == sha256:
+                # Mismo contenido (copiado o tocado): solo se actualiza la fecha
+                entry.update(size=stat.st_size, mtime=stat.st_mtime)
+                self.dirty = True
+                continue
+            changed[file_id] = (path, sha256)
+
+        removed = [file_id for file_id in self.files if file_id not in files]
+        return changed, removed
+
+    def update(self, file_id: str, path: Path, sha256: str, indexed: bool = True, sections: int = 0) -> None:
+        """
+        Registra un fichero (indexed=False si se descartó y no está en la
+        colección; sections = secciones escritas en el índice por campos).
+        """
+        stat = path.stat()
+        self.files[file_id] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "indexed": indexed,
+            "sections": sections,
+        }
+        self.dirty = True
+
+    def remove(self, file_id: str) -> None:
+        """Quita un fichero del manifiesto."""
+        self.files.pop(file_id, None)
+        self.dirty = True
+
+    def clear(self) -> None:
+        """Vacía el manifiesto."""
+        self.files = {}
+        self.dirty = True
+
+    def save(self) -> None:
+        """Guarda el manifiesto (escritura atómica)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps({"embedding_model": self.embedding_model, "files": self.files}, ensure_ascii=False, indent=1),
+            encoding="utf-8",
+        )
+        tmp.replace(self.path)
+        self.dirty = False
 
 
 class RAGSystem:
     """
     Sistema de Retrieval Augmented Generation.
-    Usa ChromaDB para almacenar y buscar fichas similares.
+    Usa un almacén vectorial (ChromaDB o NumPy) para guardar y buscar fichas similares.
     """
 
     def __init__(
@@ -29,7 +228,7 @@ class RAGSystem:
         Inicializa el sistema RAG.
 
         Args:
-            persist_directory: Directorio de persistencia de ChromaDB
+            persist_directory: Directorio de persistencia del almacén vectorial
             collection_name: Nombre de la colección
             embedding_model: Modelo de embeddings a usar
         """
@@ -40,26 +239,77 @@ class RAGSystem:
         logger.info(f"Inicializando RAG System con modelo: {self.embedding_model_name}")
 
         # Inicializar modelo de embeddings
-        self.embedding_model = SentenceTransformer(self.embedding_model_name)
-
-        # Inicializar ChromaDB
-        self.client = chromadb.Client(
-            Settings(
-                persist_directory=self.persist_directory,
-                anonymized_telemetry=False,
+        self.embedding_model = create_embedding_model(self.embedding_model_name)
+        # Identifica los vectores (modelo y backend) para la caché y el manifiesto
+        self.embedding_id = getattr(self.embedding_model, "embedding_id", self.embedding_model_name)
+        self.embedding_cache = (
+            EmbeddingCache(
+                settings.EMBEDDING_CACHE_DIR,
+                self.embedding_id,
+                max_memory_items=settings.EMBEDDING_CACHE_MEMORY_ITEMS,
             )
+            if settings.ENABLE_EMBEDDING_CACHE
+            else None
         )
 
-        # Obtener o crear colección
-        try:
-            self.collection = self.client.get_collection(name=self.collection_name)
-            logger.info(f"Colección existente cargada: {self.collection_name}")
-        except Exception:
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"description": "Fichas de ayudas sociales para RAG"},
-            )
-            logger.info(f"Nueva colección creada: {self.collection_name}")
+        # Almacén vectorial (ChromaDB persistente o matriz NumPy)
+        self.store = create_vector_store(
+            settings.VECTOR_STORE_BACKEND, self.persist_directory, self.collection_name
+        )
+        # Índice por campos: una entrada por sección CAMPO / CONCEPTO de cada ficha
+        self.sections = (
+            create_vector_store(settings.VECTOR_STORE_BACKEND, self.persist_directory, f"{self.collection_name}_campos")
+            if settings.RAG_FIELD_EXAMPLES
+            else None
+        )
+
+        # Manifiesto de ficheros indexados para la sincronización incremental
+        self.manifest = IndexManifest(
+            Path(self.persist_directory) / f"{self.collection_name}.manifest.json",
+            self.embedding_id,
+        )
+        if self.manifest.stale and self.store.count():
+            # Los embeddings de otro modelo no son comparables con los nuevos
+            self.delete_all()
+        elif len(self.manifest) and self.store.count() == 0:
+            logger.warning("Colección vacía con manifiesto previo: se reindexará todo")
+            self.manifest.clear()
+        elif self.sections is not None and self.sections.count() == 0 and any(
+            "sections" not in entry for entry in self.manifest.files.values() if entry.get("indexed", True)
+        ):
+            # Fichas indexadas antes del índice por campos: la sincronización las relee
+            logger.warning("Índice por campos vacío: se reindexarán las fichas")
+            self.manifest.clear()
+
+        # Índice léxico BM25 para la búsqueda híbrida
+        self.bm25 = None
+        if settings.RAG_HYBRID:
+            self.bm25 = BM25Index(Path(self.persist_directory) / f"{self.collection_name}.bm25.json")
+            if len(self.bm25) != self.store.count():
+                # Índice creado antes que el BM25 (o desincronizado): se rehace desde la colección
+                contents = self.store.get()
+                self.bm25.clear()
+                self.bm25.upsert(contents["ids"], contents["documents"], contents["metadatas"])
+                self.bm25.flush()
+                logger.info(f"Índice BM25 reconstruido: {len(self.bm25)} fichas")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Genera embeddings en un solo lote, reutilizando los de la caché.
+
+        Args:
+            texts: Textos a codificar
+
+        Returns:
+            Matriz (len(texts), dimensión)
+        """
+        if self.embedding_cache is None:
+            return np.atleast_2d(self._encode_model(texts))
+        return self.embedding_cache.encode(texts, self._encode_model)
+
+    def _encode_model(self, texts: List[str]) -> np.ndarray:
+        """Codifica con el modelo en pasadas de EMBEDDING_BATCH_SIZE textos."""
+        return self.embedding_model.encode(texts, batch_size=settings.EMBEDDING_BATCH_SIZE)
 
     def index_ficha(
         self,
@@ -78,98 +328,418 @@ class RAGSystem:
         logger.debug(f"Indexando ficha: {ficha_id}")
 
         # Generar embedding
-        embedding = self.embedding_model.encode(text).tolist()
+        embedding = self.encode([text])[0].tolist()
 
-        # Añadir a ChromaDB
-        self.collection.add(
+        # Añadir al almacén vectorial
+        self.store.add(
             ids=[ficha_id],
             embeddings=[embedding],
             documents=[text],
             metadatas=[metadata],
         )
+        if self.bm25 is not None:
+            self.bm25.upsert([ficha_id], [text], [metadata])
+        self.flush()
 
         logger.info(f"Ficha indexada: {ficha_id}")
 
     def index_multiple(
+        self,
+        fichas: Iterable[Dict[str, Any]],
+        batch_size: Optional[int] = None,
+    ) -> int:
+        """
+        Indexa múltiples fichas en lotes.
+
+        Acepta cualquier iterable (p. ej. un generador que lee del disco): solo
+        se mantiene en memoria un lote de fichas y sus embeddings.
+
+        Args:
+            fichas: Iterable de diccionarios con {id, text, metadata}
+            batch_size: Fichas por lote (None = RAG_INDEX_BATCH_SIZE)
+
+        Returns:
+            Número de fichas indexadas
+        """
+        batch_size = batch_size or settings.RAG_INDEX_BATCH_SIZE
+        logger.info(f"Indexando fichas en lotes de {batch_size}...")
+
+        total = 0
+        for batch in iter_batches(fichas, batch_size):
+            ids = [f["id"] for f in batch]
+            texts = [f["text"] for f in batch]
+            metadatas = [f["metadata"] for f in batch]
+
+            # Generar embeddings del lote y añadirlo al almacén vectorial
+            self.store.add(
+                ids=ids,
+                embeddings=self.encode(texts).tolist(),
+                documents=texts,
+                metadatas=metadatas,
+            )
+            if self.bm25 is not None:
+                self.bm25.upsert(ids, texts, metadatas)
+            total += len(batch)
+            logger.debug(f"{total} fichas indexadas...")
+        self.flush()
+
+        logger.info(f"✓ {total} fichas indexadas correctamente")
+        return total
+
+    def flush(self) -> None:
+        """Persiste los cambios pendientes del índice BM25 (los almacenes vectoriales escriben en cada operación)."""
+        if self.bm25 is not None:
+            self.bm25.flush()
+
+    def upsert_multiple(
         self,
         fichas: List[Dict[str, Any]],
     ) -> int:
         """
-        Indexa múltiples fichas en lote.
+        Inserta o actualiza fichas en lotes de RAG_INDEX_BATCH_SIZE.
 
         Args:
             fichas: Lista de diccionarios con {id, text, metadata}
 
         Returns:
-            Número de fichas indexadas
+            Número de fichas escritas
+        """
+        count = self._upsert_fichas(fichas)
+        self.flush()
+        return count
+
+    def _upsert_fichas(self, fichas: List[Dict[str, Any]]) -> int:
+        """upsert_multiple sin persistir el índice BM25 (lo hace el llamante con flush)."""
+        batch_size = settings.RAG_INDEX_BATCH_SIZE
+        for start in range(0, len(fichas), batch_size):
+            batch = fichas[start:start + batch_size]
+            texts = [f["text"] for f in batch]
+            self.store.upsert(
+                ids=[f["id"] for f in batch],
+                embeddings=self.encode(texts).tolist(),
+                documents=texts,
+                metadatas=[f["metadata"] for f in batch],
+            )
+        if self.bm25 is not None and fichas:
+            self.bm25.upsert([f["id"] for f in fichas], [f["text"] for f in fichas], [f["metadata"] for f in fichas])
+        self.upsert_sections([f for f in fichas if "sections" in f])
+        return len(fichas)
+
+    def upsert_sections(self, fichas: List[Dict[str, Any]]) -> int:
         """
-        logger.info(f"Indexando {len(fichas)} fichas en lote...")
+        Reemplaza las secciones de las fichas en el índice por campos.
 
-        if not fichas:
-            return 0
+        Args:
+            fichas: Lista de diccionarios con {id, metadata, sections: {campo: texto}}
 
-        ids = [f["id"] for f in fichas]
-        texts = [f["text"] for f in fichas]
-        metadatas = [f["metadata"] for f in fichas]
+        Returns:
+            Número de secciones escritas
+        """
+        if self.sections is None or not fichas:
+            return 0
+        self.delete_sections([f["id"] for f in fichas])
+
+        items = [
+            (section_id(f["id"], field), text, {**f["metadata"], "ficha_id": f["id"], "field": field})
+            for f in fichas
+            for field, text in f["sections"].items()
+        ]
+        batch_size = settings.RAG_INDEX_BATCH_SIZE
+        for start in range(0, len(items), batch_size):
+            ids, texts, metadatas = zip(*items[start:start + batch_size])
+            self.sections.upsert(
+                ids=list(ids),
+                embeddings=self.encode(list(texts)).tolist(),
+                documents=list(texts),
+                metadatas=list(metadatas),
+            )
+        return len(items)
+
+    def delete_sections(self, ficha_ids: List[str]) -> None:
+        """Elimina del índice por campos las secciones de las fichas indicadas."""
+        if self.sections is not None and ficha_ids:
+            self.sections.delete(ids=[section_id(ficha_id, field) for ficha_id in ficha_ids for field in SECTION_FIELDS])
+
+    def delete_fichas(self, ficha_ids: List[str]) -> None:
+        """Elimina fichas de la colección, del índice BM25 y del índice por campos."""
+        self._delete_fichas(ficha_ids)
+        self.flush()
+
+    def _delete_fichas(self, ficha_ids: List[str]) -> None:
+        """delete_fichas sin persistir el índice BM25 (lo hace el llamante con flush)."""
+        if not ficha_ids:
+            return
+        self.store.delete(ids=ficha_ids)
+        if self.bm25 is not None:
+            self.bm25.delete(ficha_ids)
+        self.delete_sections(ficha_ids)
+
+    def sync_files(
+        self,
+        files: Dict[str, Path],
+        load: Callable[[str, Path], Optional[Dict[str, Any]]],
+        executor: Optional[Executor] = None,
+        batch_size: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Sincroniza la colección con un conjunto de ficheros.
+
+        Solo se leen y se generan embeddings de los ficheros nuevos o
+        modificados según el manifiesto; los que ya no existen se eliminan.
+        Los cambios se procesan en lotes: se leen (en paralelo si hay
+        executor), se codifican, se escriben y se guarda el manifiesto, así
+        que la memoria queda acotada a un par de lotes y, si el proceso se
+        interrumpe, la siguiente sincronización continúa tras el último lote
+        confirmado. Los ficheros que fallan al leerse no se registran y se
+        reintentan la próxima vez. El índice BM25 se escribe una vez por lote,
+        justo antes que el manifiesto.
+
+        Con VECTOR_STORE_BACKEND=numpy cada escritura en el almacén reescribe la
+        matriz y el sidecar completos (ver NumpyVectorStore), así que una
+        sincronización de n ficheros en lotes de b cuesta O(n²/b) en E/S;
+        para corpus grandes conviene Chroma o un batch_size mayor.
 
-        # Generar embeddings en lote
-        embeddings = self.embedding_model.encode(texts).tolist()
+        Args:
+            files: {id: ruta} de los ficheros a indexar
+            load: Función (id, ruta) -> {text, metadata[, sections]}, o None si
+                el fichero no se debe indexar (con un ProcessPoolExecutor debe
+                poder serializarse con pickle)
+            executor: Pool para leer los ficheros en paralelo (None = secuencial)
+            batch_size: Ficheros por lote (None = RAG_INDEX_BATCH_SIZE)
 
-        # Añadir a ChromaDB
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas,
+        Returns:
+            Dict con added, updated, deleted, skipped, errors y unchanged
+        """
+        changed, removed = self.manifest.diff(files)
+        stats = {"added": 0, "updated": 0, "deleted": 0, "skipped": 0, "errors": 0,
+                 "unchanged": len(files) - len(changed)}
+
+        # Ficheros eliminados
+        to_delete = [file_id for file_id in removed if self.manifest.files[file_id].get("indexed", True)]
+        self._delete_fichas(to_delete)
+        stats["deleted"] = len(to_delete)
+        for file_id in removed:
+            self.manifest.remove(file_id)
+        self._commit()
+
+        # Nuevos y modificados, lote a lote
+        done, start = 0, time.perf_counter()
+        batches = iter_batches(changed.items(), batch_size or settings.RAG_INDEX_BATCH_SIZE)
+        for loaded in _load_batches(batches, load, executor):
+            fichas, stale = [], []
+            for file_id, ficha, error in loaded:
+                path, sha256 = changed[file_id]
+                previous = self.manifest.files.get(file_id)
+                if error:
+                    stats["errors"] += 1
+                    logger.error(f"Error leyendo {path.name}: {error}")
+                    continue
+                if ficha is None:
+                    # Se registra igualmente para no volver a leerlo mientras no cambie
+                    stats["skipped"] += 1
+                    if previous and previous.get("indexed", True):
+                        stale.append(file_id)
+                    self.manifest.update(file_id, path, sha256, indexed=False)
+                    continue
+                fichas.append(dict(ficha, id=file_id))
+                stats["updated" if previous and previous.get("indexed", True) else "added"] += 1
+
+            self._delete_fichas(stale)
+            stats["deleted"] += len(stale)
+            self._upsert_fichas(fichas)
+            for ficha in fichas:
+                path, sha256 = changed[ficha["id"]]
+                self.manifest.update(ficha["id"], path, sha256, sections=len(ficha.get("sections") or {}))
+            # Lote confirmado: una interrupción a partir de aquí no lo repite
+            self._commit()
+
+            done += len(loaded)
+            logger.info(f"[{done}/{len(changed)}] ficheros sincronizados | {done / (time.perf_counter() - start):.1f}/s")
+
+        logger.info(
+            f"Sincronización: {stats['added']} nuevas, {stats['updated']} actualizadas, "
+            f"{stats['deleted']} eliminadas, {stats['unchanged']} sin cambios, {stats['errors']} errores"
         )
+        return stats
 
-        logger.info(f"✓ {len(fichas)} fichas indexadas correctamente")
-        return len(fichas)
+    def _commit(self) -> None:
+        """Persiste el índice BM25 y, después, el manifiesto de la sincronización."""
+        self.flush()
+        if self.manifest.dirty:
+            self.manifest.save()
+
+    def encode_query(self, query: str, pooling: Optional[str] = None) -> np.ndarray:
+        """
+        Genera los embeddings de una query larga.
+
+        El modelo trunca a 256 word pieces, así que el texto se divide en
+        ventanas (RAG_QUERY_CHUNK_WORDS, hasta RAG_QUERY_MAX_CHUNKS) que se
+        codifican en una sola llamada por lotes.
+
+        Args:
+            query: Texto de búsqueda (PDF extraído)
+            pooling: maxsim (un vector por ventana), mean (media normalizada)
+                o first (texto completo, solo ve el inicio); None = RAG_QUERY_POOLING
+
+        Returns:
+            Matriz (n_vectores, dimensión)
+        """
+        pooling = pooling or settings.RAG_QUERY_POOLING
+        if pooling == "first":
+            return self.encode([query])
+
+        chunks = split_query_chunks(
+            query,
+            settings.RAG_QUERY_CHUNK_WORDS,
+            settings.RAG_QUERY_CHUNK_OVERLAP,
+            settings.RAG_QUERY_MAX_CHUNKS,
+        ) or [query]
+        embeddings = self.encode(chunks)
+
+        if pooling == "mean":
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            mean = (embeddings / np.where(norms == 0, 1, norms)).mean(axis=0)
+            return mean[np.newaxis, :] / (np.linalg.norm(mean) or 1)
+        return embeddings
 
     def retrieve_similar(
         self,
         query: str,
         k: int = 3,
         filter_metadata: Optional[Dict[str, Any]] = None,
+        pooling: Optional[str] = None,
+        hybrid: Optional[bool] = None,
     ) -> List[Dict[str, Any]]:
         """
         Recupera las k fichas más similares a la query.
 
+        Con varias ventanas cada ficha puntúa por su ventana más cercana
+        (max-sim): basta con pedir k resultados por ventana para obtener el
+        top k exacto. En modo híbrido se toman RAG_HYBRID_CANDIDATES fichas de
+        la búsqueda densa y de BM25 y se fusionan por Reciprocal Rank Fusion.
+
         Args:
             query: Texto de búsqueda (PDF extraído)
             k: Número de resultados a devolver
-            filter_metadata: Filtros por metadatos (ej. {"tipo": "emergencia"})
+            filter_metadata: Filtros por metadatos (ej. {"tipo": "emergencia"},
+                {"provincia": "Madrid"}); se aplican antes de puntuar
+            pooling: Estrategia de encode_query (None = RAG_QUERY_POOLING)
+            hybrid: Fusionar con BM25 (None = si RAG_HYBRID está activo)
 
         Returns:
             Lista de fichas similares con sus scores
         """
         logger.info(f"Buscando {k} fichas similares...")
+        hybrid = self.bm25 is not None if hybrid is None else hybrid and self.bm25 is not None
+        candidates = max(k, settings.RAG_HYBRID_CANDIDATES) if hybrid else k
 
-        # Generar embedding de la query
-        query_embedding = self.embedding_model.encode(query).tolist()
+        # Generar embeddings de la query (una fila por ventana)
+        query_embeddings = self.encode_query(query, pooling)
 
-        # Buscar en ChromaDB
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=k,
+        # Buscar en el almacén vectorial
+        results = self.store.query(
+            query_embeddings=query_embeddings.tolist(),
+            n_results=candidates,
             where=filter_metadata,
         )
 
-        # Formatear resultados
-        similar_fichas = []
-        for i in range(len(results["ids"][0])):
-            similar_fichas.append(
-                {
-                    "id": results["ids"][0][i],
-                    "text": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i] if "distances" in results else None,
-                }
-            )
-
-        logger.info(f"Encontradas {len(similar_fichas)} fichas similares")
+        # Quedarse con la menor distancia de cada ficha entre todas las ventanas
+        best: Dict[str, Dict[str, Any]] = {}
+        distances = results.get("distances")
+        for row in range(len(results["ids"])):
+            for i, ficha_id in enumerate(results["ids"][row]):
+                distance = distances[row][i] if distances else None
+                current = best.get(ficha_id)
+                if current is None or (distance is not None and distance < current["distance"]):
+                    best[ficha_id] = {
+                        "id": ficha_id,
+                        "text": results["documents"][row][i],
+                        "metadata": results["metadatas"][row][i],
+                        "distance": distance,
+                    }
+
+        dense = sorted(
+            best.values(), key=lambda ficha: ficha["distance"] if ficha["distance"] is not None else 0.0
+        )[:candidates]
+        if not hybrid:
+            similar_fichas = dense[:k]
+            logger.info(f"Encontradas {len(similar_fichas)} fichas similares ({len(query_embeddings)} ventanas)")
+            return similar_fichas
+
+        # Ranking léxico y fusión
+        lexical = self.bm25.search(
+            query, candidates, where=filter_metadata, max_query_terms=settings.RAG_BM25_MAX_QUERY_TERMS
+        )
+        bm25_scores = dict(lexical)
+        fused = reciprocal_rank_fusion(
+            [[ficha["id"] for ficha in dense], [ficha_id for ficha_id, _ in lexical]], k=settings.RAG_RRF_K
+        )[:k]
+
+        # Las fichas que solo aparecen en BM25 se leen del almacén
+        missing = [ficha_id for ficha_id, _ in fused if ficha_id not in best]
+        if missing:
+            contents = self.store.get(ids=missing)
+            for ficha_id, text, metadata in zip(contents["ids"], contents["documents"], contents["metadatas"]):
+                best[ficha_id] = {"id": ficha_id, "text": text, "metadata": metadata, "distance": None}
+
+        similar_fichas = [
+            dict(best[ficha_id], bm25_score=bm25_scores.get(ficha_id, 0.0), rrf_score=round(score, 6))
+            for ficha_id, score in fused
+            if ficha_id in best
+        ]
+        logger.info(
+            f"Encontradas {len(similar_fichas)} fichas similares (híbrido: {len(dense)} densas, {len(lexical)} BM25)"
+        )
         return similar_fichas
 
+    def retrieve_field_examples(
+        self,
+        query: str,
+        fields: List[str],
+        filter_metadata: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Recupera, para cada campo, la sección de ficha más cercana a la query.
+
+        Se busca con las mismas ventanas que retrieve_similar (max-sim), así
+        que la sección de cuantía de un ejemplo compite con la parte del PDF
+        que habla de la cuantía y no con su cabecera.
+
+        Args:
+            query: Texto de búsqueda (PDF extraído)
+            fields: Campos de FichaData (ej. ["cuantia", "documentos_presentar"])
+            filter_metadata: Filtros por metadatos de la ficha (ej. {"tipo": "emergencia"})
+
+        Returns:
+            Dict {campo: {id, ficha_id, text, metadata, distance}} (solo los
+            campos con alguna sección indexada)
+        """
+        if self.sections is None or not fields or self.sections.count() == 0:
+            return {}
+
+        query_embeddings = self.encode_query(query).tolist()
+        examples: Dict[str, Dict[str, Any]] = {}
+        for field in fields:
+            where = {"$and": [{"field": field}, *({key: value} for key, value in (filter_metadata or {}).items())]}
+            if len(where["$and"]) == 1:
+                where = where["$and"][0]
+            results = self.sections.query(query_embeddings=query_embeddings, n_results=1, where=where)
+            for ids, documents, metadatas, distances in zip(
+                results["ids"], results["documents"], results["metadatas"], results["distances"]
+            ):
+                for section, text, metadata, distance in zip(ids, documents, metadatas, distances):
+                    if field not in examples or distance < examples[field]["distance"]:
+                        examples[field] = {
+                            "id": section,
+                            "ficha_id": metadata.get("ficha_id"),
+                            "text": text,
+                            "metadata": metadata,
+                            "distance": distance,
+                        }
+
+        logger.info(f"Ejemplos por campo: {len(examples)}/{len(fields)}")
+        return examples
+
     def build_context(
         self,
         pdf_text: str,
@@ -205,16 +775,19 @@ class RAGSystem:
         Returns:
             Número de fichas en la colección
         """
-        return self.collection.count()
+        return self.store.count()
 
     def delete_all(self) -> None:
         """Elimina todas las fichas de la colección."""
         logger.warning("Eliminando todas las fichas de la colección...")
-        self.client.delete_collection(name=self.collection_name)
-        self.collection = self.client.create_collection(
-            name=self.collection_name,
-            metadata={"description": "Fichas de ayudas sociales para RAG"},
-        )
+        self.store.reset()
+        if getattr(self, "bm25", None) is not None:
+            self.bm25.clear()
+            self.bm25.flush()
+        if self.sections is not None:
+            self.sections.reset()
+        self.manifest.clear()
+        self.manifest.save()
         logger.info("Colección reiniciada")
 
     def get_collection_info(self) -> Dict[str, Any]:
@@ -227,6 +800,11 @@ class RAGSystem:
         return {
             "name": self.collection_name,
             "count": self.count(),
-            "metadata": self.collection.metadata,
+            "metadata": self.store.metadata,
+            "backend": settings.VECTOR_STORE_BACKEND,
             "persist_directory": self.persist_directory,
+            "manifest_files": len(self.manifest),
+            "bm25_documents": len(self.bm25) if self.bm25 is not None else None,
+            "field_sections": self.sections.count() if self.sections is not None else None,
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
         }
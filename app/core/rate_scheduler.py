@@ -0,0 +1,409 @@
+"""
+Planificador de llamadas al LLM por proveedor y modelo.
+Admite cada llamada solo cuando caben sus peticiones por minuto (RPM) y sus
+tokens estimados por minuto (TPM), ajusta la concurrencia con AIMD según los
+429/529 y la latencia observada, y atiende antes las peticiones interactivas
+que las masivas.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence
+from loguru import logger
+
+from app.config import settings
+from app.core.llm_resilience import LatencyTracker
+
+
+INTERACTIVE, BULK = "interactive", "bulk"
+PRIORITIES = {INTERACTIVE: 0, BULK: 1}
+
+# Errores que indican saturación del proveedor (rate limit / sobrecarga)
+CONGESTION_STATUS = {429, 529}
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(level: str) -> Iterator[None]:
+    """
+    Fija la prioridad de las llamadas al LLM hechas dentro del bloque
+    (se hereda en las tareas asyncio y en asyncio.to_thread).
+
+    Args:
+        level: interactive o bulk
+    """
+    if level not in PRIORITIES:
+        raise ValueError(f"Prioridad no válida: {level}. Válidas: {list(PRIORITIES)}")
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(messages: Sequence[Any], output_tokens: Optional[int] = None) -> int:
+    """
+    Estimación de los tokens de una llamada (~4 caracteres por token de
+    entrada más la salida esperada).
+
+    Args:
+        messages: Mensajes LangChain
+        output_tokens: Salida esperada (None = LLM_SCHEDULER_OUTPUT_TOKENS)
+
+    Returns:
+        Tokens estimados
+    """
+    chars = 0
+    for message in messages:
+        content = message.content
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(block.get("text", "")) for block in content if isinstance(block, dict))
+    if output_tokens is None:
+        output_tokens = settings.LLM_SCHEDULER_OUTPUT_TOKENS
+    return chars // 4 + output_tokens
+
+
+def _is_congestion(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in CONGESTION_STATUS or type(error).__name__ == "RateLimitError"
+
+
+def _used_tokens(response: Any) -> Optional[int]:
+    """Tokens que cuentan para el TPM según el uso real de la respuesta."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return None
+    cache_read = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    return max(0, (usage.get("input_tokens") or 0) - cache_read) + (usage.get("output_tokens") or 0)
+
+
+class TokenBucket:
+    """
+    Cubo de tokens con recarga continua de per_minute unidades por minuto.
+
+    El nivel puede quedar negativo al ajustar con el consumo real, lo que
+    retrasa las admisiones siguientes. per_minute <= 0 = sin límite.
+    """
+
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: Capacidad y recarga por minuto
+        """
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: Optional[float] = None) -> float:
+        """Segundos hasta que haya amount unidades disponibles (0 = ya)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now or time.monotonic())
+        amount = min(amount, self.per_minute)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.per_minute
+
+    def consume(self, amount: float) -> None:
+        """Descuenta amount unidades (negativo = devolverlas)."""
+        if not self.unlimited:
+            self.level = min(self.per_minute, self.level - amount)
+
+    def drain(self) -> None:
+        """Vacía el cubo (tras un 429 del proveedor)."""
+        if not self.unlimited:
+            self.level = min(self.level, 0.0)
+
+
+class RateScheduler:
+    """
+    Admisión de llamadas a un proveedor/modelo con presupuestos RPM/TPM,
+    concurrencia adaptativa (AIMD) y cola con prioridades.
+
+    Válido desde hilos y desde asyncio: el estado se protege con un lock y
+    las esperas se hacen con time.sleep o asyncio.sleep según el caso.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        latency_tolerance: float = 2.0,
+        poll_interval: float = 0.05,
+    ):
+        """
+        Args:
+            name: Identificador (proveedor:modelo)
+            rpm: Peticiones por minuto (0 = sin límite)
+            tpm: Tokens por minuto (0 = sin límite)
+            max_concurrency: Llamadas simultáneas máximas
+            min_concurrency: Llamadas simultáneas mínimas tras reducir
+            latency_tolerance: Una latencia mayor que esta veces la mediana reduce la concurrencia
+            poll_interval: Espera entre comprobaciones de los que no están en cabeza de cola
+        """
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.poll_interval = poll_interval
+
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.latencies = LatencyTracker()
+        self._last_decrease = 0.0
+        self._waiting: List[tuple] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+        self.admitted = 0
+        self.rate_limited = 0
+        self.throttle_time = 0.0
+
+    # --- Admisión ---
+
+    def _enqueue(self) -> tuple:
+        ticket = (PRIORITIES[_priority.get()], next(self._seq))
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _dequeue(self, ticket: tuple) -> None:
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+
+    def _try_admit(self, ticket: tuple, tokens: int) -> float:
+        """
+        Admite la llamada si le toca y caben sus presupuestos.
+
+        Returns:
+            0 si se admite; si no, segundos a esperar antes de reintentar
+        """
+        with self._lock:
+            if self._waiting[0] != ticket or self.in_flight >= int(self.limit):
+                return self.poll_interval
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+
+            heapq.heappop(self._waiting)
+            self.in_flight += 1
+            self.admitted += 1
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            return 0.0
+
+    def acquire_sync(self, tokens: int) -> float:
+        """
+        Espera (bloqueando el hilo) hasta que se admita la llamada.
+
+        Args:
+            tokens: Tokens estimados de la llamada
+
+        Returns:
+            Segundos de espera
+        """
+        start = time.monotonic()
+        ticket = self._enqueue()
+        try:
+            while (wait := self._try_admit(ticket, tokens)) > 0:
+                time.sleep(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        return self._throttled(time.monotonic() - start)
+
+    async def acquire(self, tokens: int) -> float:
+        """Versión asíncrona de acquire_sync."""
+        start = time.monotonic()
+        ticket = self._enqueue()
+        try:
+            while (wait := self._try_admit(ticket, tokens)) > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        return self._throttled(time.monotonic() - start)
+
+    def _throttled(self, waited: float) -> float:
+        with self._lock:
+            self.throttle_time += waited
+        return waited
+
+    # --- AIMD ---
+
+    def _decrease(self, factor: float, now: float) -> None:
+        """Reducción multiplicativa, como mucho una vez por latencia típica."""
+        cooldown = self.latencies.percentile(0.5) or 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(float(self.min_concurrency), self.limit * factor)
+        if int(self.limit) < int(previous):
+            logger.info(f"Planificador {self.name}: concurrencia {int(previous)} -> {int(self.limit)}")
+
+    def release(
+        self,
+        tokens: int,
+        latency: Optional[float] = None,
+        used_tokens: Optional[int] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """
+        Libera la llamada y ajusta concurrencia y presupuestos.
+
+        Args:
+            tokens: Tokens estimados al admitirla
+            latency: Latencia de la llamada (si terminó bien)
+            used_tokens: Tokens reales (ajusta el TPM frente a la estimación)
+            error: Excepción de la llamada
+        """
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+
+            if error is not None:
+                if _is_congestion(error):
+                    self.rate_limited += 1
+                    self.requests.drain()
+                    self.tokens.drain()
+                    self._decrease(0.5, now)
+                return
+
+            if used_tokens is not None:
+                self.tokens.consume(used_tokens - tokens)
+
+            if latency is not None:
+                median = self.latencies.percentile(0.5)
+                self.latencies.record(latency)
+                if median is not None and latency > median * self.latency_tolerance:
+                    self._decrease(0.9, now)
+                    return
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    # --- Ejecución ---
+
+    def run_sync(self, call: Callable[[], Any], tokens: int) -> Any:
+        """
+        Ejecuta una llamada síncrona cuando el planificador la admite.
+
+        Args:
+            call: Función sin argumentos
+            tokens: Tokens estimados
+
+        Returns:
+            Resultado de la llamada
+        """
+        self.acquire_sync(tokens)
+        start = time.monotonic()
+        try:
+            result = call()
+        except BaseException as e:
+            self.release(tokens, error=e)
+            raise
+        self.release(tokens, time.monotonic() - start, _used_tokens(result))
+        return result
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: int) -> Any:
+        """Versión asíncrona de run_sync."""
+        await self.acquire(tokens)
+        start = time.monotonic()
+        try:
+            result = await call()
+        except BaseException as e:
+            self.release(tokens, error=e)
+            raise
+        self.release(tokens, time.monotonic() - start, _used_tokens(result))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas del planificador."""
+        with self._lock:
+            by_priority = {name: 0 for name in PRIORITIES}
+            for priority, _ in self._waiting:
+                by_priority[next(name for name, value in PRIORITIES.items() if value == priority)] += 1
+            return {
+                "name": self.name,
+                "rpm": self.requests.per_minute,
+                "tpm": self.tokens.per_minute,
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiting),
+                "queue_depth_by_priority": by_priority,
+                "admitted": self.admitted,
+                "rate_limited": self.rate_limited,
+                "throttle_time": round(self.throttle_time, 3),
+                "avg_throttle_time": round(self.throttle_time / self.admitted, 3) if self.admitted else 0.0,
+            }
+
+
+_schedulers: Dict[str, RateScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def rate_limits_for(model: str) -> Dict[str, int]:
+    """
+    Límites RPM/TPM de un modelo: LLM_RATE_LIMITS (nombre exacto o prefijo
+    más largo) o, si no aparece, LLM_RATE_LIMIT_RPM/LLM_RATE_LIMIT_TPM.
+    """
+    limits = settings.LLM_RATE_LIMITS
+    matches = [name for name in limits if model.startswith(name)]
+    specific = limits[max(matches, key=len)] if matches else {}
+    return {
+        "rpm": specific.get("rpm", settings.LLM_RATE_LIMIT_RPM),
+        "tpm": specific.get("tpm", settings.LLM_RATE_LIMIT_TPM),
+    }
+
+
+def get_scheduler(provider: str, model: str) -> RateScheduler:
+    """
+    Planificador compartido de un proveedor y modelo.
+
+    Args:
+        provider: openai/anthropic
+        model: Nombre del modelo
+
+    Returns:
+        RateScheduler
+    """
+    key = f"{provider}:{model}"
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = RateScheduler(
+                key,
+                max_concurrency=settings.LLM_SCHEDULER_MAX_CONCURRENCY,
+                latency_tolerance=settings.LLM_SCHEDULER_LATENCY_TOLERANCE,
+                **rate_limits_for(model),
+            )
+        return _schedulers[key]
+
+
+def scheduler_stats() -> List[Dict[str, Any]]:
+    """Métricas de todos los planificadores creados."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [scheduler.stats() for scheduler in schedulers]
@@ -0,0 +1,240 @@
+"""
+LLM de grabación/reproducción para benchmarks y tests sin red.
+En modo record envuelve al cliente real y guarda cada respuesta por hash de
+la petición; en modo replay la sirve desde disco con latencia, streaming por
+tokens y errores (429/5xx) simulados.
+"""
+
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from loguru import logger
+
+from app.config import settings
+from app.core.map_reduce import ChunkCache
+
+
+# Argumentos de la llamada que cambian la respuesta (el resto no forma parte de la clave)
+_KEY_KWARGS = ("stop", "tools", "tool_choice", "response_format")
+
+# Caracteres por "token" al trocear la respuesta en streaming
+_CHARS_PER_TOKEN = 4
+
+
+class ReplayMissError(LookupError):
+    """La petición no está grabada."""
+
+
+class SimulatedAPIError(Exception):
+    """Error HTTP simulado (reintentable según llm_resilience.is_retryable)."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message} (simulado)")
+        self.status_code = status_code
+
+
+def request_key(model_name: str, messages: List[BaseMessage], **kwargs: Any) -> str:
+    """
+    Clave de una petición: hash del modelo, los mensajes y los argumentos
+    que afectan a la respuesta (herramientas, formato de salida...).
+
+    Args:
+        model_name: Modelo
+        messages: Mensajes enviados
+        **kwargs: Argumentos de la llamada
+
+    Returns:
+        Hash SHA-256 hexadecimal
+    """
+    payload = {
+        "model": model_name,
+        "messages": [[message.type, message.content] for message in messages],
+        "kwargs": {name: kwargs[name] for name in _KEY_KWARGS if kwargs.get(name) is not None},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _as_message(chunk: AIMessageChunk) -> AIMessage:
+    """Convierte el agregado de un stream en un AIMessage."""
+    return AIMessage(
+        content=chunk.content,
+        tool_calls=chunk.tool_calls,
+        usage_metadata=chunk.usage_metadata,
+        response_metadata=chunk.response_metadata,
+    )
+
+
+class RecordingChatModel(BaseChatModel):
+    """
+    Envuelve un chat model real y graba cada respuesta (y su latencia).
+    """
+
+    inner: BaseChatModel
+    model_name: str
+    cassette_dir: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _save(self, key: str, message: AIMessage, latency: float, ttft: Optional[float] = None) -> None:
+        ChunkCache(self.cassette_dir).put(key, {
+            "model": self.model_name,
+            "message": message_to_dict(message),
+            "latency": round(latency, 4),
+            "ttft": round(ttft, 4) if ttft is not None else None,
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.monotonic()
+        message = self.inner.invoke(messages, stop=stop, **kwargs)
+        self._save(request_key(self.model_name, messages, stop=stop, **kwargs), message, time.monotonic() - start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.monotonic()
+        message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        self._save(request_key(self.model_name, messages, stop=stop, **kwargs), message, time.monotonic() - start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        start, ttft, aggregate = time.monotonic(), None, None
+        for chunk in self.inner.stream(messages, stop=stop, **kwargs):
+            ttft = ttft if ttft is not None else time.monotonic() - start
+            aggregate = chunk if aggregate is None else aggregate + chunk
+            yield ChatGenerationChunk(message=chunk)
+        if aggregate is not None:
+            key = request_key(self.model_name, messages, stop=stop, **kwargs)
+            self._save(key, _as_message(aggregate), time.monotonic() - start, ttft)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        start, ttft, aggregate = time.monotonic(), None, None
+        async for chunk in self.inner.astream(messages, stop=stop, **kwargs):
+            ttft = ttft if ttft is not None else time.monotonic() - start
+            aggregate = chunk if aggregate is None else aggregate + chunk
+            yield ChatGenerationChunk(message=chunk)
+        if aggregate is not None:
+            key = request_key(self.model_name, messages, stop=stop, **kwargs)
+            self._save(key, _as_message(aggregate), time.monotonic() - start, ttft)
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Sirve respuestas grabadas sin red.
+
+    latency fija el tiempo hasta el primer token (None = el grabado) y
+    tokens_per_second el ritmo del streaming (0 = sin espera). Antes de
+    responder se sortean 429 (rate_limit_rate) y 529/500 (error_rate).
+    """
+
+    model_name: str
+    cassette_dir: str
+    latency: Optional[float] = None
+    tokens_per_second: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: Optional[int] = None
+    rng: Any = None
+
+    def model_post_init(self, __context: Any) -> None:
+        self.rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _lookup(self, messages: List[BaseMessage], **kwargs: Any) -> Dict[str, Any]:
+        """Recupera la grabación o lanza ReplayMissError; sortea los errores simulados."""
+        key = request_key(self.model_name, messages, **kwargs)
+        record = ChunkCache(self.cassette_dir).get(key)
+        if record is None:
+            raise ReplayMissError(f"Petición no grabada para {self.model_name} (clave {key[:12]})")
+
+        draw = self.rng.random()
+        if draw < self.rate_limit_rate:
+            raise SimulatedAPIError(429, "rate_limit_error")
+        if draw < self.rate_limit_rate + self.error_rate:
+            raise SimulatedAPIError(self.rng.choice([500, 529]), "overloaded_error")
+        return record
+
+    def _first_token_delay(self, record: Dict[str, Any]) -> float:
+        if self.latency is not None:
+            return self.latency
+        return record.get("ttft") or record.get("latency") or 0.0
+
+    def _pieces(self, message: AIMessage) -> List[str]:
+        """Texto de la respuesta troceado en "tokens" (JSON de la herramienta si es tool use)."""
+        text = message.content if isinstance(message.content, str) else ""
+        if message.tool_calls:
+            text = json.dumps(message.tool_calls[0]["args"], ensure_ascii=False)
+        return [text[i:i + _CHARS_PER_TOKEN] for i in range(0, len(text), _CHARS_PER_TOKEN)] or [""]
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _chunks(self, message: AIMessage) -> Iterator[AIMessageChunk]:
+        pieces = self._pieces(message)
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            yield AIMessageChunk(content=piece, usage_metadata=message.usage_metadata if last else None)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        record = self._lookup(messages, stop=stop, **kwargs)
+        message = messages_from_dict([record["message"]])[0]
+        time.sleep(self._first_token_delay(record) + self._token_delay() * len(self._pieces(message)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        record = self._lookup(messages, stop=stop, **kwargs)
+        message = messages_from_dict([record["message"]])[0]
+        await asyncio.sleep(self._first_token_delay(record) + self._token_delay() * len(self._pieces(message)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        record = self._lookup(messages, stop=stop, **kwargs)
+        time.sleep(self._first_token_delay(record))
+        for chunk in self._chunks(messages_from_dict([record["message"]])[0]):
+            yield ChatGenerationChunk(message=chunk)
+            time.sleep(self._token_delay())
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        record = self._lookup(messages, stop=stop, **kwargs)
+        await asyncio.sleep(self._first_token_delay(record))
+        for chunk in self._chunks(messages_from_dict([record["message"]])[0]):
+            yield ChatGenerationChunk(message=chunk)
+            await asyncio.sleep(self._token_delay())
+
+
+def replay_llm(model_name: str, inner: Optional[BaseChatModel] = None) -> BaseChatModel:
+    """
+    Aplica LLM_REPLAY_MODE a un cliente LLM.
+
+    Args:
+        model_name: Modelo (forma parte de la clave de grabación)
+        inner: Cliente real (obligatorio en modo record)
+
+    Returns:
+        RecordingChatModel, ReplayChatModel o el propio cliente si el modo es off
+    """
+    mode = settings.LLM_REPLAY_MODE
+    if mode == "record":
+        logger.info(f"Grabando respuestas de {model_name} en {settings.LLM_REPLAY_DIR}")
+        return RecordingChatModel(inner=inner, model_name=model_name, cassette_dir=settings.LLM_REPLAY_DIR)
+    if mode == "replay":
+        return ReplayChatModel(
+            model_name=model_name,
+            cassette_dir=settings.LLM_REPLAY_DIR,
+            latency=settings.LLM_REPLAY_LATENCY,
+            tokens_per_second=settings.LLM_REPLAY_TOKENS_PER_SECOND,
+            error_rate=settings.LLM_REPLAY_ERROR_RATE,
+            rate_limit_rate=settings.LLM_REPLAY_RATE_LIMIT_RATE,
+            seed=settings.LLM_REPLAY_SEED,
+        )
+    return inner
@@ -0,0 +1,106 @@
+"""
+Salida estructurada nativa de los proveedores.
+Anthropic: tool use forzado con el schema como input_schema.
+OpenAI: response_format json_schema en modo strict.
+"""
+
+import copy
+import json
+from typing import Any, Dict, Type
+from pydantic import BaseModel
+from langchain_core.messages import AIMessage
+
+
+# Herramienta que Anthropic debe invocar con la ficha como argumentos
+TOOL_NAME = "registrar_ficha"
+
+
+def strict_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    JSON schema compatible con el modo strict de OpenAI: todos los objetos
+    cierran additionalProperties y declaran todas sus propiedades como
+    obligatorias (los opcionales siguen admitiendo null).
+
+    Args:
+        model: Modelo Pydantic
+
+    Returns:
+        JSON schema
+    """
+    schema = copy.deepcopy(model.model_json_schema())
+
+    def visit(node: Any) -> None:
+        if isinstance(node, dict):
+            node.pop("default", None)
+            if node.get("type") == "object" and "properties" in node:
+                node["additionalProperties"] = False
+                node["required"] = list(node["properties"])
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for value in node:
+                visit(value)
+
+    visit(schema)
+    return schema
+
+
+def anthropic_tool(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Definición de herramienta de Anthropic con el schema del modelo."""
+    return {
+        "name": TOOL_NAME,
+        "description": "Registra la ficha extraída del documento.",
+        "input_schema": model.model_json_schema(),
+    }
+
+
+def openai_response_format(model: Type[BaseModel]) -> Dict[str, Any]:
+    """response_format json_schema strict de OpenAI para el modelo."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "schema": strict_json_schema(model),
+            "strict": True,
+        },
+    }
+
+
+def bind_structured_output(llm, provider: str, model: Type[BaseModel]):
+    """
+    Vincula al LLM la salida estructurada nativa de su proveedor.
+
+    Args:
+        llm: Modelo LangChain
+        provider: openai/anthropic
+        model: Schema de salida
+
+    Returns:
+        Runnable que devuelve AIMessage
+    """
+    if provider == "anthropic":
+        return llm.bind(tools=[anthropic_tool(model)], tool_choice={"type": "tool", "name": TOOL_NAME})
+    return llm.bind(response_format=openai_response_format(model))
+
+
+def structured_message(message: AIMessage) -> AIMessage:
+    """
+    Normaliza una respuesta a texto JSON: los argumentos de la herramienta si
+    el proveedor respondió con tool use, o el contenido de texto si no.
+
+    Args:
+        message: Respuesta del LLM
+
+    Returns:
+        AIMessage con el JSON como contenido y el mismo usage_metadata
+    """
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        content = json.dumps(tool_calls[0]["args"], ensure_ascii=False)
+    elif isinstance(message.content, str):
+        return message
+    else:
+        content = "".join(
+            block.get("text", "") for block in message.content if isinstance(block, dict)
+        )
+    return AIMessage(content=content, usage_metadata=getattr(message, "usage_metadata", None))
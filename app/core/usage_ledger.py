@@ -0,0 +1,260 @@
+"""
+Contabilidad de tokens, coste y latencia por generación.
+Estima el coste con la tabla de precios de docs/COST_ANALYSIS.md y guarda un
+registro por generación en ficheros JSONL mensuales, agregables por día,
+modelo y usuario.
+"""
+
+import csv
+import io
+import json
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from loguru import logger
+
+from app.config import settings
+
+
+# USD por millón de tokens (docs/COST_ANALYSIS.md, "Pricing Detallado"; los
+# modelos y precios de caché que no aparecen allí, según la tarifa pública).
+# cache_read/cache_write: lectura y escritura de la caché de prompt.
+DEFAULT_PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-4o": {"input": 2.50, "output": 10.00, "cache_read": 1.25},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60, "cache_read": 0.075},
+    "gpt-3.5-turbo": {"input": 0.50, "output": 1.50},
+    "claude-3-5-sonnet": {"input": 3.00, "output": 15.00, "cache_read": 0.30, "cache_write": 3.75},
+    "claude-3-5-haiku": {"input": 0.80, "output": 4.00, "cache_read": 0.08, "cache_write": 1.00},
+    "claude-3-haiku": {"input": 0.25, "output": 1.25, "cache_read": 0.03, "cache_write": 0.30},
+}
+
+# Descuento de las APIs batch de ambos proveedores sobre la tarifa normal
+BATCH_DISCOUNT = 0.5
+
+# Campos numéricos que se suman al agregar
+SUM_FIELDS = ["input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens", "cost_usd", "llm_time"]
+
+# Campos de uso que se guardan de cada generación
+USAGE_FIELDS = ["input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens", "cost_usd", "ttft", "llm_time"]
+
+# Dimensiones de agregación admitidas
+GROUP_FIELDS = ["day", "model", "provider", "usuario"]
+
+_unknown_models: set = set()
+
+
+def price_for(model: str) -> Optional[Dict[str, float]]:
+    """
+    Precios de un modelo (LLM_PRICE_OVERRIDES tiene prioridad).
+
+    Se busca el nombre exacto y, si no, el prefijo más largo
+    (claude-3-5-sonnet-20241022 -> claude-3-5-sonnet).
+
+    Args:
+        model: Nombre del modelo
+
+    Returns:
+        Dict con input/output (y opcionalmente cache_read/cache_write) o None
+    """
+    prices = {**DEFAULT_PRICES, **settings.LLM_PRICE_OVERRIDES}
+    if model in prices:
+        return prices[model]
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_creation_tokens: int = 0,
+) -> float:
+    """
+    Coste estimado en USD de una llamada.
+
+    input_tokens incluye los tokens leídos/escritos en caché (así lo
+    reportan LangChain para ambos proveedores); se cobran aparte con su
+    propio precio (por defecto 10% y 125% del de entrada).
+
+    Args:
+        model: Nombre del modelo
+        input_tokens: Tokens de entrada totales
+        output_tokens: Tokens de salida
+        cache_read_tokens: Tokens leídos de caché
+        cache_creation_tokens: Tokens escritos en caché
+
+    Returns:
+        Coste en USD (0 si el modelo no tiene precio)
+    """
+    price = price_for(model)
+    if price is None:
+        if model not in _unknown_models:
+            _unknown_models.add(model)
+            logger.warning(f"Sin precio para el modelo {model}: coste estimado 0 (ver LLM_PRICE_OVERRIDES)")
+        return 0.0
+
+    uncached = max(0, input_tokens - cache_read_tokens - cache_creation_tokens)
+    cost = (
+        uncached * price["input"]
+        + cache_read_tokens * price.get("cache_read", price["input"] * 0.1)
+        + cache_creation_tokens * price.get("cache_write", price["input"] * 1.25)
+        + output_tokens * price["output"]
+    )
+    return round(cost / 1_000_000, 6)
+
+
+def usage_entries(
+    ficha_id: str,
+    usuario: str,
+    metadata: Optional[Dict[str, Any]] = None,
+    error: Optional[BaseException] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Registros de uso de una petición: la generación final y los niveles de
+    la cascada descartados, o lo ya gastado si la generación falló.
+
+    Args:
+        ficha_id: Id de la ficha
+        usuario: Usuario de la petición
+        metadata: Metadata de la generación (None si falló)
+        error: Excepción de la generación; puede llevar llm_usage (gasto del
+            intento fallido) y cascade_discarded (niveles descartados)
+
+    Returns:
+        Registros en el orden en que se gastaron, con status success,
+        discarded o error
+    """
+    cascade = (metadata or {}).get("cascade") or {}
+    discarded = cascade.get("discarded") or getattr(error, "cascade_discarded", None) or []
+    spent = [(tier["usage"], "discarded") for tier in discarded if tier.get("usage")]
+    if metadata is not None:
+        spent.append((metadata, "success"))
+    elif getattr(error, "llm_usage", None):
+        spent.append((error.llm_usage, "error"))
+
+    return [
+        {
+            "ficha_id": ficha_id,
+            "usuario": usuario,
+            "model": usage.get("model"),
+            "provider": usage.get("provider"),
+            **{name: usage.get(name, 0) for name in USAGE_FIELDS},
+            "status": status,
+        }
+        for usage, status in spent
+    ]
+
+
+class UsageLedger:
+    """
+    Registro de uso por generación en ficheros usage-AAAA-MM.jsonl.
+    """
+
+    def __init__(self, ledger_dir: str):
+        """
+        Args:
+            ledger_dir: Directorio de los ficheros de uso
+        """
+        self.ledger_dir = Path(ledger_dir)
+        self._lock = threading.Lock()
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """
+        Añade el registro de una generación.
+
+        Args:
+            entry: Datos de la generación (se completan timestamp y day)
+        """
+        now = datetime.now()
+        entry = {"timestamp": now.isoformat(timespec="seconds"), "day": now.date().isoformat(), **entry}
+        path = self.ledger_dir / f"usage-{entry['day'][:7]}.jsonl"
+
+        with self._lock:
+            self.ledger_dir.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def entries(self, since: Optional[date] = None, until: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Registros entre dos fechas (incluidas).
+
+        Args:
+            since: Fecha inicial (None = sin límite)
+            until: Fecha final (None = sin límite)
+
+        Yields:
+            Registros de uso
+        """
+        for path in sorted(self.ledger_dir.glob("usage-*.jsonl")):
+            month = path.stem[len("usage-"):]
+            if (since and month < since.isoformat()[:7]) or (until and month > until.isoformat()[:7]):
+                continue
+            for line in path.read_text(encoding="utf-8").splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if (since and entry["day"] < since.isoformat()) or (until and entry["day"] > until.isoformat()):
+                    continue
+                yield entry
+
+    def summary(
+        self,
+        group_by: Sequence[str] = ("day", "model", "usuario"),
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Agrega el uso por las dimensiones indicadas.
+
+        Args:
+            group_by: Dimensiones (day, model, provider, usuario)
+            since: Fecha inicial
+            until: Fecha final
+
+        Returns:
+            Filas con las dimensiones, requests, sumas y TTFT/tiempo LLM medios
+
+        Raises:
+            ValueError: Si alguna dimensión no es válida
+        """
+        invalid = [name for name in group_by if name not in GROUP_FIELDS]
+        if invalid:
+            raise ValueError(f"Dimensiones no válidas: {invalid}. Válidas: {GROUP_FIELDS}")
+
+        groups: Dict[tuple, Dict[str, Any]] = {}
+        for entry in self.entries(since, until):
+            key = tuple(entry.get(name) for name in group_by)
+            row = groups.setdefault(key, {
+                **dict(zip(group_by, key)),
+                "requests": 0,
+                **{name: 0 for name in SUM_FIELDS},
+                "ttft_total": 0.0,
+            })
+            row["requests"] += 1
+            for name in SUM_FIELDS:
+                row[name] += entry.get(name) or 0
+            row["ttft_total"] += entry.get("ttft") or 0
+
+        rows = []
+        for row in groups.values():
+            ttft_total = row.pop("ttft_total")
+            row["cost_usd"] = round(row["cost_usd"], 6)
+            row["llm_time"] = round(row["llm_time"], 3)
+            row["avg_ttft"] = round(ttft_total / row["requests"], 3)
+            row["avg_llm_time"] = round(row["llm_time"] / row["requests"], 3)
+            rows.append(row)
+        return sorted(rows, key=lambda row: tuple(str(row[name]) for name in group_by))
+
+
+def to_csv(rows: List[Dict[str, Any]]) -> str:
+    """Exporta filas de summary a CSV."""
+    if not rows:
+        return ""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
@@ -0,0 +1,357 @@
+"""
+Almacenes vectoriales del sistema RAG.
+Interfaz común (con la forma de resultados de ChromaDB) y dos backends:
+ChromaDB persistente y una matriz NumPy en memoria mapeada para corpus
+pequeños, sin SQLite ni HNSW.
+"""
+
+import json
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+COLLECTION_METADATA = {"description": "Fichas de ayudas sociales para RAG"}
+
+
+class VectorStore(ABC):
+    """
+    Colección de embeddings con documentos y metadatos.
+
+    Los resultados siguen el formato de ChromaDB (listas por query en
+    query(), distancias L2 al cuadrado) para que RAGSystem no dependa del
+    backend.
+    """
+
+    name: str
+    metadata: Dict[str, Any]
+
+    @abstractmethod
+    def count(self) -> int:
+        """Número de elementos."""
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        """Inserta o reemplaza elementos."""
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        """Inserta elementos (mismo comportamiento que upsert salvo en Chroma)."""
+        self.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        """Elimina elementos por id."""
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """Devuelve {ids, documents, metadatas} de los ids indicados (o de todos)."""
+
+    @abstractmethod
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, List[List[Any]]]:
+        """Los n_results más cercanos a cada embedding de query."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Elimina todos los elementos."""
+
+
+class ChromaVectorStore(VectorStore):
+    """Colección de ChromaDB con cliente persistente."""
+
+    def __init__(self, persist_directory: str, collection_name: str):
+        """
+        Args:
+            persist_directory: Directorio de ChromaDB
+            collection_name: Nombre de la colección
+        """
+        import chromadb
+        from chromadb.config import Settings
+
+        self.name = collection_name
+        # Cliente persistente: el índice sobrevive a los reinicios
+        self.client = chromadb.PersistentClient(
+            path=persist_directory,
+            settings=Settings(anonymized_telemetry=False),
+        )
+
+        # Obtener o crear colección
+        try:
+            self.collection = self.client.get_collection(name=collection_name)
+            logger.info(f"Colección existente cargada: {collection_name}")
+        except Exception:
+            self.collection = self.client.create_collection(name=collection_name, metadata=COLLECTION_METADATA)
+            logger.info(f"Nueva colección creada: {collection_name}")
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.collection.metadata
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: List[str]) -> None:
+        self.collection.delete(ids=ids)
+
+    def get(self, ids: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        return self.collection.get(ids=ids)
+
+    def query(self, query_embeddings, n_results, where=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+    def reset(self) -> None:
+        self.client.delete_collection(name=self.name)
+        self.collection = self.client.create_collection(name=self.name, metadata=COLLECTION_METADATA)
+
+
+# Operadores de filtro de ChromaDB
+_WHERE_OPERATORS = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$gt": lambda value, target: value is not None and value > target,
+    "$gte": lambda value, target: value is not None and value >= target,
+    "$lt": lambda value, target: value is not None and value < target,
+    "$lte": lambda value, target: value is not None and value <= target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+}
+
+
+def match_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evalúa un filtro de metadatos con la sintaxis de ChromaDB.
+
+    Admite igualdad directa ({"tipo": "x"}), los operadores $eq, $ne, $gt,
+    $gte, $lt, $lte, $in y $nin, y la combinación con $and / $or. Varias
+    claves en el mismo nivel se combinan con AND.
+
+    Args:
+        metadata: Metadatos de un elemento
+        where: Filtro (None = todo)
+
+    Returns:
+        True si el elemento cumple el filtro
+
+    Raises:
+        ValueError: Si el filtro usa un operador desconocido
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, target in condition.items():
+                if operator not in _WHERE_OPERATORS:
+                    raise ValueError(f"Operador de filtro no soportado: {operator}")
+                if not _WHERE_OPERATORS[operator](value, target):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Colección en una matriz NumPy de embeddings normalizados.
+
+    La matriz se guarda en <colección>.npy (abierta con memory-map) y los ids,
+    documentos y metadatos en <colección>.json. Una query es un producto
+    matriz-vector y un argpartition; la distancia devuelta es la L2 al
+    cuadrado entre vectores normalizados (2 - 2·coseno), la misma escala que
+    Chroma con embeddings normalizados. Las escrituras reescriben ambos
+    ficheros, pensado para corpus de hasta unos miles de fichas.
+    """
+
+    def __init__(self, persist_directory: str, collection_name: str):
+        """
+        Args:
+            persist_directory: Directorio de los ficheros
+            collection_name: Nombre de la colección
+        """
+        self.name = collection_name
+        self.metadata = dict(COLLECTION_METADATA)
+        self.directory = Path(persist_directory)
+        self.matrix_path = self.directory / f"{collection_name}.npy"
+        self.sidecar_path = self.directory / f"{collection_name}.json"
+        self._lock = threading.Lock()
+
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.matrix: Optional[np.ndarray] = None
+
+        if self.sidecar_path.exists() and self.matrix_path.exists():
+            sidecar = json.loads(self.sidecar_path.read_text(encoding="utf-8"))
+            self.matrix = np.load(self.matrix_path, mmap_mode="r")
+            self.ids, self.documents, self.metadatas = sidecar["ids"], sidecar["documents"], sidecar["metadatas"]
+            self.metadata = sidecar.get("metadata", self.metadata)
+            if len(self.ids) != self.matrix.shape[0]:
+                logger.warning(f"Colección {collection_name} inconsistente en disco; se descarta")
+                self.ids, self.documents, self.metadatas, self.matrix = [], [], [], None
+            else:
+                logger.info(f"Colección existente cargada: {collection_name} ({len(self.ids)} elementos)")
+        self._positions = {ficha_id: i for i, ficha_id in enumerate(self.ids)}
+
+    def _save(self, matrix: Optional[np.ndarray]) -> None:
+        """Escribe la matriz y el sidecar (escritura atómica) y reabre el memory-map."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if matrix is None or not len(matrix):
+            self.matrix_path.unlink(missing_ok=True)
+            self.matrix = None
+        else:
+            tmp = self.matrix_path.with_suffix(".tmp.npy")
+            np.save(tmp, matrix)
+            tmp.replace(self.matrix_path)
+            self.matrix = np.load(self.matrix_path, mmap_mode="r")
+
+        tmp = self.sidecar_path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {"metadata": self.metadata, "ids": self.ids, "documents": self.documents, "metadatas": self.metadatas},
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        tmp.replace(self.sidecar_path)
+        self._positions = {ficha_id: i for i, ficha_id in enumerate(self.ids)}
+
+    @staticmethod
+    def _normalize(embeddings: Any) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            matrix = np.array(self.matrix) if self.matrix is not None else np.empty((0, vectors.shape[1]), np.float32)
+            new_rows = []
+            for ficha_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+                position = self._positions.get(ficha_id)
+                if position is None:
+                    self._positions[ficha_id] = len(self.ids)
+                    self.ids.append(ficha_id)
+                    self.documents.append(document)
+                    self.metadatas.append(metadata)
+                    new_rows.append(vector)
+                else:
+                    if position < len(matrix):
+                        matrix[position] = vector
+                    else:
+                        new_rows[position - len(matrix)] = vector
+                    self.documents[position] = document
+                    self.metadatas[position] = metadata
+            if new_rows:
+                matrix = np.vstack([matrix, np.array(new_rows, dtype=np.float32)])
+            self._save(matrix)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            remove = {self._positions[ficha_id] for ficha_id in ids if ficha_id in self._positions}
+            if not remove:
+                return
+            keep = [i for i in range(len(self.ids)) if i not in remove]
+            self.ids = [self.ids[i] for i in keep]
+            self.documents = [self.documents[i] for i in keep]
+            self.metadatas = [self.metadatas[i] for i in keep]
+            self._save(np.array(self.matrix[keep]) if keep else None)
+
+    def get(self, ids: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        positions = (
+            range(len(self.ids)) if ids is None else [self._positions[i] for i in ids if i in self._positions]
+        )
+        return {
+            "ids": [self.ids[i] for i in positions],
+            "documents": [self.documents[i] for i in positions],
+            "metadatas": [self.metadatas[i] for i in positions],
+        }
+
+    def query(self, query_embeddings, n_results, where=None):
+        empty = {key: [[] for _ in query_embeddings] for key in ("ids", "documents", "metadatas", "distances")}
+        if self.matrix is None or not self.ids:
+            return empty
+
+        matrix = self.matrix
+        candidates = None
+        if where:
+            candidates = np.array([i for i, metadata in enumerate(self.metadatas) if match_where(metadata, where)])
+            if not len(candidates):
+                return empty
+            matrix = matrix[candidates]
+
+        similarities = self._normalize(query_embeddings) @ matrix.T
+        n = min(n_results, similarities.shape[1])
+        results: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for row in similarities:
+            top = np.argpartition(-row, n - 1)[:n] if n < len(row) else np.arange(len(row))
+            top = top[np.argsort(-row[top])]
+            positions = candidates[top] if candidates is not None else top
+            results["ids"].append([self.ids[i] for i in positions])
+            results["documents"].append([self.documents[i] for i in positions])
+            results["metadatas"].append([self.metadatas[i] for i in positions])
+            results["distances"].append([float(2.0 - 2.0 * s) for s in row[top]])
+        return results
+
+    def reset(self) -> None:
+        with self._lock:
+            self.ids, self.documents, self.metadatas = [], [], []
+            self._save(None)
+
+
+def create_vector_store(backend: str, persist_directory: str, collection_name: str) -> VectorStore:
+    """
+    Crea el almacén vectorial configurado.
+
+    Args:
+        backend: chroma o numpy
+        persist_directory: Directorio de persistencia
+        collection_name: Nombre de la colección
+
+    Returns:
+        VectorStore
+
+    Raises:
+        ValueError: Si el backend no existe
+    """
+    if backend == "chroma":
+        return ChromaVectorStore(persist_directory, collection_name)
+    if backend == "numpy":
+        return NumpyVectorStore(persist_directory, collection_name)
+    raise ValueError(f"Backend de vectores no soportado: {backend}")
@@ -12,6 +12,7 @@ import sys
 from app.config import settings
 from app.api import router
 from app.api.routes import initialize_services
+from app.core.http_clients import close_async_http_clients
 from app import __version__
 
 
@@ -53,6 +54,7 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Cerrando aplicación...")
+    await close_async_http_clients()
 
 
 # Crear aplicación
@@ -271,8 +271,8 @@ class FichaData(BaseModel):
                 "beneficiarios": "Podrán ser beneficiarias:\n- Personas físicas empadronadas.\n- Unidades de convivencia.",
                 "descripcion": "Ayudas económicas para situaciones de emergencia social...",
                 "cuantia": [
-                    "Hasta 600,00 € por solicitud",
-                    "Máximo 2 solicitudes por año",
+                    "La cuantía de la ayuda será: hasta 600,00 € por solicitud",
+                    "Máximo 2 solicitudes por año (1.200,00 € anuales)",
                 ],
                 "importe_maximo": "600,00 € por solicitud",
                 "resolucion": "Plazo máximo de 3 meses. Silencio administrativo negativo.",
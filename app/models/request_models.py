@@ -20,9 +20,11 @@ class FichaGenerateRequest(BaseModel):
         description="Validar la ficha generada contra el schema",
     )
 
-    model: Optional[Literal["claude-3.5-sonnet", "gpt-4o", "gpt-3.5-turbo"]] = Field(
+    model: Optional[
+        Literal["claude-3.5-sonnet", "claude-3.5-haiku", "gpt-4o", "gpt-4o-mini", "gpt-3.5-turbo", "cascade"]
+    ] = Field(
         default=None,
-        description="Modelo LLM a usar (None = usar configuración por defecto)",
+        description="Modelo LLM a usar (None = configuración por defecto, 'cascade' = económico y escalado si falla)",
     )
 
     usuario: str = Field(
@@ -30,6 +32,11 @@ class FichaGenerateRequest(BaseModel):
         description="Usuario que genera la ficha (para campo 'USUARIO' en Otros datos)",
     )
 
+    priority: Literal["interactive", "bulk"] = Field(
+        default="interactive",
+        description="Prioridad ante los límites del proveedor (las interactivas se atienden antes)",
+    )
+
 
 class FichaGenerateResponse(BaseModel):
     """Response después de generar una ficha."""
@@ -8,6 +8,34 @@ from datetime import datetime
 from pathlib import Path
 
 
+# Meses en español (con la variante "setiembre")
+SPANISH_MONTHS = {
+    "enero": 1,
+    "febrero": 2,
+    "marzo": 3,
+    "abril": 4,
+    "mayo": 5,
+    "junio": 6,
+    "julio": 7,
+    "agosto": 8,
+    "septiembre": 9,
+    "setiembre": 9,
+    "octubre": 10,
+    "noviembre": 11,
+    "diciembre": 12,
+}
+
+# Fecha larga ("8 de febrero de 2022", "1 de mayo 2025"; en minúsculas) y corta (dd/mm/aaaa, con / . o -)
+LONG_DATE_PATTERN = rf"(\d{{1,2}})\s+de\s+({'|'.join(SPANISH_MONTHS)})\s+(?:del?\s+)?(\d{{4}})"
+SHORT_DATE_PATTERN = r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})"
+
+EMAIL_PATTERN = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b"
+
+# Teléfonos españoles (fijos y móviles, con o sin +34: "944020200", "944 020 200",
+# "944 02 02 00"), sin tomar las cifras de importes o referencias
+PHONE_PATTERN = r"(?<![\d.,])(?:\+34\s?)?[6789]\d{2}(?:\s?\d{3}\s?\d{3}|\s\d{2}\s\d{2}\s\d{2})(?!\d|,\d)"
+
+
 def generate_unique_id() -> str:
     """
     Genera un ID único usando UUID4.
@@ -81,7 +109,7 @@ def truncate_text(text: str, max_length: int = 100, suffix: str = "...") -> str:
 
 def parse_spanish_date(date_str: str) -> datetime | None:
     """
-    Parsea fecha en español (ej: "15 de enero de 2025").
+    Parsea fecha en español (ej: "15 de enero de 2025" o "15/01/2025").
 
     Args:
         date_str: String con fecha
@@ -89,37 +117,19 @@ def parse_spanish_date(date_str: str) -> datetime | None:
     Returns:
         Datetime o None si falla
     """
-    months = {
-        "enero": 1,
-        "febrero": 2,
-        "marzo": 3,
-        "abril": 4,
-        "mayo": 5,
-        "junio": 6,
-        "julio": 7,
-        "agosto": 8,
-        "septiembre": 9,
-        "octubre": 10,
-        "noviembre": 11,
-        "diciembre": 12,
-    }
-
-    pattern = r"(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})"
-    match = re.search(pattern, date_str.lower())
-
+    match = re.search(LONG_DATE_PATTERN, date_str.lower())
     if match:
-        day = int(match.group(1))
-        month_name = match.group(2)
-        year = int(match.group(3))
+        day, month, year = int(match.group(1)), SPANISH_MONTHS[match.group(2)], int(match.group(3))
+    else:
+        match = re.search(SHORT_DATE_PATTERN, date_str)
+        if not match:
+            return None
+        day, month, year = (int(group) for group in match.groups())
 
-        if month_name in months:
-            month = months[month_name]
-            try:
-                return datetime(year, month, day)
-            except ValueError:
-                return None
-
-    return None
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
 
 
 def format_currency(amount: float, decimals: int = 2) -> str:
@@ -156,8 +166,7 @@ def extract_email(text: str) -> list[str]:
     Returns:
         Lista de emails encontrados
     """
-    pattern = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
-    return re.findall(pattern, text)
+    return re.findall(EMAIL_PATTERN, text)
 
 
 def extract_phone(text: str) -> list[str]:
@@ -170,16 +179,4 @@ def extract_phone(text: str) -> list[str]:
     Returns:
         Lista de teléfonos encontrados
     """
-    # Patrones comunes de teléfonos españoles
-    patterns = [
-        r"\b\d{9}\b",  # 9 dígitos
-        r"\b\d{3}\s\d{3}\s\d{3}\b",  # 123 456 789
-        r"\b\d{3}\s\d{2}\s\d{2}\s\d{2}\b",  # 123 45 67 89
-        r"\+34\s?\d{9}\b",  # +34 123456789
-    ]
-
-    phones = []
-    for pattern in patterns:
-        phones.extend(re.findall(pattern, text))
-
-    return list(set(phones))  # Eliminar duplicados
+    return list(dict.fromkeys(re.findall(PHONE_PATTERN, text)))  # Eliminar duplicados
@@ -2,11 +2,29 @@
 Funciones de validación.
 """
 
+import re
 from pathlib import Path
 from datetime import date
 from typing import Tuple
 
 
+# Parte entera de un importe: con puntos de miles ("1.200") o sin ellos ("300")
+AMOUNT_INTEGER_PATTERN = r"\d{1,3}(?:\.\d{3})+|\d+"
+
+# Cuantía en el formato de la ficha: "1.200,00 €"
+CUANTIA_PATTERN = rf"(?:{AMOUNT_INTEGER_PATTERN}),\d{{2}}\s*€"
+
+# Cabeceras largas de los boletines oficiales, por sigla (sin distinguir mayúsculas)
+BOLETIN_HEADER_PATTERNS = {
+    "BOP": r"BOLET[ÍI]N\s+OFICIAL\s+DE\s+LA\s+PROVINCIA",
+    "BOE": r"BOLET[ÍI]N\s+OFICIAL\s+DEL\s+ESTADO",
+    "BOJA": r"BOLET[ÍI]N\s+OFICIAL\s+DE\s+LA\s+JUNTA\s+DE\s+ANDALUC[ÍI]A",
+    "BOCM": r"BOLET[ÍI]N\s+OFICIAL\s+DE\s+LA\s+COMUNIDAD\s+DE\s+MADRID",
+    "DOGC": r"DIARI\s+OFICIAL\s+DE\s+LA\s+GENERALITAT\s+DE\s+CATALUNYA",
+    "BOPV": r"BOLET[ÍI]N\s+OFICIAL\s+DEL\s+PA[ÍI]S\s+VASCO",
+}
+
+
 def validate_pdf_file(file_path: str | Path) -> Tuple[bool, str]:
     """
     Valida que el archivo es un PDF válido.
@@ -75,17 +93,12 @@ def validate_cuantia_format(cuantia_text: str) -> Tuple[bool, str]:
     Returns:
         Tupla (es_válido, mensaje_error)
     """
-    import re
-
     # Debe contener el símbolo €
     if "€" not in cuantia_text:
         return False, "La cuantía debe incluir el símbolo €"
 
-    # Verificar formato de números (coma decimal)
-    # Pattern: número con coma decimal y dos decimales
-    pattern = r"\d+(?:\.\d{3})*,\d{2}\s*€"
-
-    matches = re.findall(pattern, cuantia_text)
+    # Verificar formato de números (coma decimal y dos decimales)
+    matches = re.findall(CUANTIA_PATTERN, cuantia_text)
     if not matches:
         return False, "La cuantía debe tener formato: X.XXX,XX €"
 
@@ -102,8 +115,6 @@ def validate_boletin_format(boletin_text: str) -> Tuple[bool, str]:
     Returns:
         Tupla (es_válido, mensaje_error)
     """
-    import re
-
     # Pattern esperado: BOP (provincia) núm. X, dd/mm/aaaa
     patterns = [
         r"BOP\s+\([^)]+\)\s+núm\.\s+\d+,\s+\d{2}/\d{2}/\d{4}",
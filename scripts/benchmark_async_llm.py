@@ -0,0 +1,184 @@
+"""
+Benchmark de la ruta de generación síncrona frente a la asíncrona.
+Lanza un servidor LLM simulado local (o reproduce respuestas grabadas con
+--replay) y mide throughput y latencias de generate_ficha (secuencial) y
+agenerate_ficha (concurrente).
+"""
+
+import sys
+import time
+import asyncio
+import statistics
+from pathlib import Path
+from typing import List
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+import argparse
+
+from app.config import settings
+from mock_llm_server import create_app, run_in_thread
+
+
+SAMPLE_TEXT = (
+    "BOLETÍN OFICIAL DE LA PROVINCIA DE BADAJOZ. Bases reguladoras de ayudas de "
+    "emergencia social. La cuantía máxima será de 600,00 € por solicitud. "
+) * 20
+
+
+def _report(name: str, latencies: List[float], elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    p99 = latencies[int(0.99 * (len(latencies) - 1))]
+    logger.info(
+        f"{name:<10} | {len(latencies)} generaciones en {elapsed:.2f}s | "
+        f"{len(latencies) / elapsed:.1f} gen/s | p50 {statistics.median(latencies):.3f}s | "
+        f"p95 {p95:.3f}s | p99 {p99:.3f}s"
+    )
+
+
+def run_sync(processor, requests: int) -> None:
+    """Generaciones secuenciales con generate_ficha."""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        processor.generate_ficha(SAMPLE_TEXT, use_rag=False)
+        latencies.append(time.perf_counter() - t0)
+    _report("sync", latencies, time.perf_counter() - start)
+
+
+async def run_async(processor, requests: int, concurrency: int) -> None:
+    """Generaciones concurrentes con agenerate_ficha."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+
+    async def one() -> None:
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                await processor.agenerate_ficha(SAMPLE_TEXT, use_rag=False)
+            except Exception as e:
+                failures.append(type(e).__name__)
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    _report(f"async x{concurrency}", latencies, time.perf_counter() - start)
+    if failures:
+        logger.warning(f"{len(failures)} generaciones fallidas: {sorted(set(failures))}")
+
+    from app.core.rate_scheduler import scheduler_stats
+
+    for stats in scheduler_stats():
+        logger.info(
+            f"planificador {stats['name']} | concurrencia {stats['concurrency_limit']} | "
+            f"429/529 {stats['rate_limited']} | espera total {stats['throttle_time']:.2f}s | "
+            f"espera media {stats['avg_throttle_time']:.3f}s"
+        )
+
+
+async def _run_async_and_close(processor, requests: int, concurrency: int) -> None:
+    from app.core.http_clients import close_async_http_clients
+
+    try:
+        await run_async(processor, requests, concurrency)
+    finally:
+        await close_async_http_clients()
+
+
+def run_replay(args) -> None:
+    """Benchmark sin red sobre respuestas grabadas con --record."""
+    settings.LLM_REPLAY_MODE = "replay"
+    settings.LLM_REPLAY_DIR = args.replay
+    settings.LLM_REPLAY_LATENCY = args.latency
+    settings.LLM_REPLAY_ERROR_RATE = args.error_rate
+    settings.LLM_REPLAY_RATE_LIMIT_RATE = args.rate_limit_rate
+    settings.LLM_REPLAY_TOKENS_PER_SECOND = args.tokens_per_second
+    if args.hedge or args.stall_rate:
+        logger.warning("--hedge y --stall-rate no se aplican en modo --replay")
+
+    from app.core.llm_processor import LLMProcessor
+
+    processor = LLMProcessor(provider=args.provider)
+
+    logger.info(f"Reproduciendo {args.replay} | latencia {args.latency}s | proveedor {args.provider}")
+    run_sync(processor, args.sync_requests)
+    asyncio.run(_run_async_and_close(processor, args.requests, args.concurrency))
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async contra un LLM simulado")
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default="anthropic")
+    parser.add_argument("--requests", type=int, default=50, help="Número de generaciones")
+    parser.add_argument("--concurrency", type=int, default=25, help="Concurrencia de la ruta async")
+    parser.add_argument("--latency", type=float, default=0.5, help="Latencia simulada del LLM (s)")
+    parser.add_argument("--sync-requests", type=int, default=5, help="Generaciones de la ruta síncrona")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Errores 429/529 del primario")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Bloqueos del primario")
+    parser.add_argument("--hedge", action="store_true", help="Activar hedging contra un secundario simulado")
+    parser.add_argument("--record", type=str, default=None, help="Grabar las respuestas en este directorio")
+    parser.add_argument("--replay", type=str, default=None, help="Reproducir respuestas grabadas (sin servidor)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 simulados (solo --replay)")
+    parser.add_argument("--rpm", type=int, default=0, help="Límite de peticiones por minuto del planificador")
+    parser.add_argument("--tpm", type=int, default=0, help="Límite de tokens por minuto del planificador")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Ritmo del streaming (solo --replay)")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", filter=lambda r: r["name"] == "__main__")
+
+    settings.LLM_RETRY_BASE_DELAY = 0.05
+    settings.LLM_RATE_LIMIT_RPM = args.rpm
+    settings.LLM_RATE_LIMIT_TPM = args.tpm
+    if args.replay:
+        run_replay(args)
+        return
+    if args.record:
+        settings.LLM_REPLAY_MODE = "record"
+        settings.LLM_REPLAY_DIR = args.record
+
+    primary_app = create_app(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=settings.PROCESSING_TIMEOUT,
+    )
+    server, port = run_in_thread(primary_app)
+    secondary, secondary_port = run_in_thread(create_app(latency=args.latency))
+
+    # El proveedor elegido apunta al servidor primario y el otro al secundario
+    other = "openai" if args.provider == "anthropic" else "anthropic"
+    urls = {
+        args.provider: f"http://127.0.0.1:{port}",
+        other: f"http://127.0.0.1:{secondary_port}",
+    }
+    settings.OPENAI_BASE_URL = urls["openai"] + "/v1"
+    settings.ANTHROPIC_BASE_URL = urls["anthropic"]
+    settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or "mock"
+    settings.ANTHROPIC_API_KEY = settings.ANTHROPIC_API_KEY or "mock"
+    if args.hedge:
+        settings.LLM_FALLBACK_PROVIDER = other
+        settings.ENABLE_LLM_HEDGING = True
+        settings.LLM_HEDGE_MIN_SAMPLES = 10
+        settings.LLM_HEDGE_DEFAULT_DELAY = args.latency * 3
+
+    from app.core.llm_processor import LLMProcessor
+
+    processor = LLMProcessor(provider=args.provider)
+
+    logger.info(f"Servidor simulado en :{port} | latencia {args.latency}s | proveedor {args.provider}")
+    run_sync(processor, args.sync_requests)
+    asyncio.run(_run_async_and_close(processor, args.requests, args.concurrency))
+    logger.info(f"Peticiones recibidas: primario {primary_app.state.requests}")
+
+    server.should_exit = True
+    secondary.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark de los backends de embeddings.
+Cada backend (torch, onnx, onnx int8) se mide en un proceso nuevo: tiempo de
+import y carga, memoria residual máxima y textos por segundo. Después se
+compara cada backend ONNX con torch por similitud coseno de sus vectores.
+Requiere haber exportado el modelo con scripts/export_onnx_embeddings.py.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+
+import numpy as np
+
+
+BACKENDS = {
+    "torch": {"EMBEDDING_BACKEND": "torch"},
+    "onnx": {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZED": "false"},
+    "onnx-int8": {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZED": "true"},
+}
+
+
+def load_texts(dataset: str, limit: int) -> list:
+    """Ventanas de texto de las fichas del dataset (o frases sintéticas si no hay)."""
+    texts = []
+    for path in sorted(Path(dataset).rglob("*.docx"))[:limit]:
+        try:
+            from docx import Document
+
+            text = " ".join(p.text for p in Document(path).paragraphs if p.text.strip())
+        except Exception:
+            continue
+        words = text.split()
+        texts.extend(" ".join(words[i:i + 160]) for i in range(0, len(words), 160))
+    if not texts:
+        texts = [
+            f"Ayuda número {i} para personas empadronadas con ingresos inferiores al IPREM. " * (1 + i % 6)
+            for i in range(256)
+        ]
+    return texts[:limit]
+
+
+def worker(texts_path: str, output_path: str) -> None:
+    """Carga el backend de las variables de entorno, codifica y escribe sus métricas."""
+    start = time.perf_counter()
+    from app.config import settings
+    from app.core.embedding_backends import create_embedding_model
+
+    model = create_embedding_model(settings.EMBEDDING_MODEL)
+    load_time = time.perf_counter() - start
+
+    texts = json.loads(Path(texts_path).read_text(encoding="utf-8"))
+    model.encode(texts[:8])  # Calentamiento
+    start = time.perf_counter()
+    vectors = np.asarray(model.encode(texts), dtype=np.float32)
+    encode_time = time.perf_counter() - start
+
+    np.save(output_path, vectors)
+    print(json.dumps({
+        "load_time": load_time,
+        "encode_time": encode_time,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "torch_imported": "torch" in sys.modules,
+    }))
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Benchmark de backends de embeddings (torch / ONNX / int8)")
+    parser.add_argument("--dataset", type=str, default="Fichas y documentación")
+    parser.add_argument("--limit", type=int, default=256, help="Textos a codificar")
+    parser.add_argument("--backends", type=str, default="torch,onnx,onnx-int8")
+    parser.add_argument("--worker", nargs=2, metavar=("TEXTS", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    texts = load_texts(args.dataset, args.limit)
+    with tempfile.TemporaryDirectory() as directory:
+        texts_path = Path(directory) / "texts.json"
+        texts_path.write_text(json.dumps(texts, ensure_ascii=False), encoding="utf-8")
+
+        results, vectors = {}, {}
+        for backend in args.backends.split(","):
+            output = Path(directory) / f"{backend}.npy"
+            process = subprocess.run(
+                [sys.executable, __file__, "--worker", str(texts_path), str(output)],
+                env={**os.environ, **BACKENDS[backend]},
+                capture_output=True,
+                text=True,
+            )
+            if process.returncode != 0:
+                print(f"{backend}: error\n{process.stderr[-800:]}")
+                continue
+            results[backend] = json.loads(process.stdout.strip().splitlines()[-1])
+            vectors[backend] = np.load(output)
+
+    print(f"\n{len(texts)} textos")
+    print(f"{'backend':<10} {'carga':>8} {'RSS':>9} {'textos/s':>9} {'torch':>6} {'coseno medio':>13} {'mínimo':>7}")
+    for backend, result in results.items():
+        cosine = ""
+        if backend != "torch" and "torch" in vectors:
+            similarity = (vectors[backend] * vectors["torch"]).sum(axis=1)
+            cosine = f"{similarity.mean():>13.4f} {similarity.min():>7.4f}"
+        print(
+            f"{backend:<10} {result['load_time']:>7.2f}s {result['rss_mb']:>7.0f}MB "
+            f"{len(texts) / result['encode_time']:>9.1f} {'sí' if result['torch_imported'] else 'no':>6} {cosine}"
+        )
+
+
+if __name__ == "__main__":
+    main()
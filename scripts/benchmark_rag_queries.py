@@ -0,0 +1,104 @@
+"""
+Benchmark de la codificación de queries del RAG.
+Compara el embedding del PDF completo (truncado por el modelo) con la
+codificación por ventanas (media y max-sim), la búsqueda léxica BM25 y la
+híbrida (max-sim + BM25 fusionados por RRF): tiempo de encode, latencia de
+búsqueda y tasa de acierto, tomando como verdad que la ficha correcta de cada PDF es la de su
+misma carpeta del dataset (indexado con scripts/setup_vector_db.py).
+"""
+
+import sys
+import time
+import statistics
+from pathlib import Path
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+import argparse
+
+from app.config import settings
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Benchmark de encode y acierto de las queries del RAG")
+    parser.add_argument("--dataset", type=str, default="Fichas y documentación", help="Carpeta con PDFs y fichas")
+    parser.add_argument("--k", type=int, default=settings.RAG_TOP_K, help="Acierto si la ficha está en el top k")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de PDFs")
+    parser.add_argument("--max-chunks", type=int, default=settings.RAG_QUERY_MAX_CHUNKS)
+    parser.add_argument("--modes", type=str, default="first,mean,maxsim,bm25,hybrid", help="Estrategias a comparar")
+    args = parser.parse_args()
+
+    from app.core.pdf_extractor import PDFExtractor
+    from app.core.bm25_index import BM25Index
+    from app.core.rag_system import RAGSystem
+
+    dataset_path = Path(args.dataset)
+    pdfs = sorted(dataset_path.rglob("*.pdf"))[: args.limit]
+    if not pdfs:
+        print(f"No hay PDFs en {dataset_path}")
+        sys.exit(1)
+
+    settings.RAG_QUERY_MAX_CHUNKS = args.max_chunks
+    rag = RAGSystem()
+    if rag.count() == 0:
+        print("El índice está vacío: ejecuta antes scripts/setup_vector_db.py")
+        sys.exit(1)
+
+    extractor = PDFExtractor()
+    queries = []
+    for pdf in pdfs:
+        try:
+            queries.append((pdf.parent.name, extractor.extract_text(pdf)))
+        except Exception as e:
+            logger.warning(f"{pdf.name}: {e}")
+
+    # Calentar el modelo para no medir la carga
+    rag.encode_query(queries[0][1], "first")
+
+    # Construcción del índice BM25 desde la colección (lo que hace RAGSystem si falta)
+    start = time.perf_counter()
+    contents = rag.store.get()
+    bm25 = BM25Index()
+    bm25.upsert(contents["ids"], contents["documents"], contents["metadatas"])
+    bm25.search("ayuda", 1)
+    print(f"\nÍndice BM25: {len(bm25)} fichas en {(time.perf_counter() - start) * 1000:.0f}ms")
+    if rag.bm25 is None:
+        rag.bm25 = bm25
+    folders = {ficha_id: metadata.get("folder") for ficha_id, metadata in zip(contents["ids"], contents["metadatas"])}
+
+    print(f"\n{len(queries)} PDFs, {rag.count()} fichas indexadas, top {args.k}")
+    print(f"{'modo':<8} {'encode p50':>11} {'búsqueda p50':>13} {'búsqueda p95':>13} {'vectores':>9} {'acierto':>8}")
+    for mode in args.modes.split(","):
+        encode_times, search_times, vectors, hits = [], [], [], 0
+        for folder, text in queries:
+            if mode == "bm25":
+                start = time.perf_counter()
+                results = rag.bm25.search(text, args.k, max_query_terms=settings.RAG_BM25_MAX_QUERY_TERMS)
+                search_times.append(time.perf_counter() - start)
+                hits += any(folders.get(ficha_id) == folder for ficha_id, _ in results)
+                continue
+
+            pooling = "maxsim" if mode == "hybrid" else mode
+            start = time.perf_counter()
+            embeddings = rag.encode_query(text, pooling)
+            encode_times.append(time.perf_counter() - start)
+            vectors.append(len(embeddings))
+
+            start = time.perf_counter()
+            results = rag.retrieve_similar(text, k=args.k, pooling=pooling, hybrid=mode == "hybrid")
+            search_times.append(time.perf_counter() - start)
+            hits += any(r["metadata"].get("folder") == folder for r in results)
+
+        search_times.sort()
+        p95 = search_times[int(0.95 * (len(search_times) - 1))]
+        encode = f"{statistics.median(encode_times) * 1000:>9.1f}ms" if encode_times else f"{'-':>11}"
+        print(
+            f"{mode:<8} {encode} {statistics.median(search_times) * 1000:>11.1f}ms {p95 * 1000:>11.1f}ms "
+            f"{statistics.mean(vectors) if vectors else 0:>9.1f} {hits / len(queries):>8.1%}"
+        )
+
+if __name__ == "__main__":
+    main()
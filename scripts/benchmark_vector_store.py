@@ -0,0 +1,97 @@
+"""
+Benchmark de los almacenes vectoriales del RAG.
+Compara ChromaDB con el backend NumPy sobre un corpus sintético del tamaño
+del de fichas: tiempo de apertura, de indexación y de consulta (con y sin
+filtro), y recall del top k frente a la búsqueda exacta (Chroma usa HNSW).
+"""
+
+import sys
+import time
+import tempfile
+import statistics
+from pathlib import Path
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+
+import numpy as np
+
+from app.core.vector_store import create_vector_store
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Benchmark ChromaDB frente a NumPy")
+    parser.add_argument("--n", type=int, default=2000, help="Fichas en el corpus sintético")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensión (384 = all-MiniLM-L6-v2)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--chunks", type=int, default=8, help="Vectores por query (ventanas)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.n, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"ficha-{i}" for i in range(args.n)]
+    documents = [f"Texto de la ficha {i}" for i in range(args.n)]
+    metadatas = [{"tipo": ["emergencia", "vivienda", "dependencia"][i % 3], "organismo": f"org-{i % 40}"}
+                 for i in range(args.n)]
+    queries = rng.normal(size=(args.queries, args.chunks, args.dim)).astype(np.float32)
+
+    print(f"\n{args.n} fichas x {args.dim} dims, {args.queries} queries de {args.chunks} vectores, top {args.k}")
+    print(f"{'backend':<8} {'apertura':>9} {'indexado':>9} {'query p50':>10} {'query p95':>10} "
+          f"{'filtro p50':>11} {'recall':>7}")
+
+    # Top k exacto por fuerza bruta
+    exact = [[set(np.argsort(-(vectors @ vector))[: args.k]) for vector in query] for query in queries]
+    positions = {ficha_id: i for i, ficha_id in enumerate(ids)}
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in ("chroma", "numpy"):
+            path = str(Path(directory) / backend)
+            store = create_vector_store(backend, path, "benchmark")
+            start = time.perf_counter()
+            for offset in range(0, args.n, 1000):
+                store.upsert(
+                    ids=ids[offset:offset + 1000],
+                    embeddings=vectors[offset:offset + 1000].tolist(),
+                    documents=documents[offset:offset + 1000],
+                    metadatas=metadatas[offset:offset + 1000],
+                )
+            index_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = create_vector_store(backend, path, "benchmark")
+            store.count()
+            open_time = time.perf_counter() - start
+
+            latencies, filtered, results = [], [], []
+            for query in queries:
+                start = time.perf_counter()
+                result = store.query(query_embeddings=query.tolist(), n_results=args.k)
+                latencies.append(time.perf_counter() - start)
+                results.append([{positions[i] for i in row} for row in result["ids"]])
+
+                start = time.perf_counter()
+                store.query(query_embeddings=query.tolist(), n_results=args.k, where={"tipo": "vivienda"})
+                filtered.append(time.perf_counter() - start)
+
+            recall = statistics.mean(
+                len(a & b) / args.k for ref, res in zip(exact, results) for a, b in zip(ref, res)
+            )
+
+            print(
+                f"{backend:<8} {open_time * 1000:>7.1f}ms {index_time:>8.2f}s "
+                f"{statistics.median(latencies) * 1000:>8.2f}ms {_percentile(latencies, 0.95) * 1000:>8.2f}ms "
+                f"{statistics.median(filtered) * 1000:>9.2f}ms {recall:>7.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
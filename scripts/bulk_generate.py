@@ -0,0 +1,69 @@
+"""
+Generación masiva offline con las APIs batch de los proveedores.
+Envía todos los PDFs de una carpeta como un batch (Anthropic Message Batches
+u OpenAI Batch API), espera a que termine y genera los .docx. Relanzar con el
+mismo --job reanuda el trabajo sin reenviar lo ya enviado.
+"""
+
+import sys
+from pathlib import Path
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+import argparse
+
+from app.config import settings
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Genera fichas en bloque con las APIs batch")
+    parser.add_argument("--input", type=str, required=True, help="Carpeta con los PDFs (recursivo)")
+    parser.add_argument("--output", type=str, default=settings.OUTPUT_DIR, help="Carpeta de los .docx")
+    parser.add_argument("--job", type=str, default="bulk", help="Nombre del trabajo (estado en BATCH_STATE_DIR)")
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default=settings.DEFAULT_LLM_PROVIDER)
+    parser.add_argument("--no-rag", action="store_true", help="No incluir ejemplos RAG")
+    parser.add_argument("--poll-interval", type=float, default=settings.BATCH_POLL_INTERVAL)
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de PDFs")
+    parser.add_argument("--stub", action="store_true", help="Usar el servidor LLM simulado local")
+    args = parser.parse_args()
+
+    server = None
+    if args.stub:
+        from scripts.mock_llm_server import create_app, run_in_thread
+
+        server, port = run_in_thread(create_app(latency=0))
+        settings.OPENAI_BASE_URL = f"http://127.0.0.1:{port}/v1"
+        settings.ANTHROPIC_BASE_URL = f"http://127.0.0.1:{port}"
+        setattr(settings, f"{args.provider.upper()}_API_KEY", "stub")
+        logger.info(f"Servidor simulado en el puerto {port}")
+
+    from app.core.batch_jobs import BulkJob
+    from app.core.llm_processor import LLMProcessor
+
+    pdfs = sorted(Path(args.input).rglob("*.pdf"))[: args.limit]
+    if not pdfs:
+        print(f"No hay PDFs en {args.input}")
+        sys.exit(1)
+
+    job = BulkJob(
+        Path(settings.BATCH_STATE_DIR) / f"{args.job}.json",
+        args.output,
+        processor=LLMProcessor(provider=args.provider),
+    )
+    try:
+        counts = job.run(pdfs, use_rag=not args.no_rag, poll_interval=args.poll_interval)
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    print(f"\nTrabajo {args.job}: " + ", ".join(f"{status}={n}" for status, n in sorted(counts.items())))
+    for custom_id, doc in job.state["documents"].items():
+        if doc.get("error"):
+            print(f"  {custom_id} {Path(doc['pdf']).name}: {doc['error']}")
+
+
+if __name__ == "__main__":
+    main()
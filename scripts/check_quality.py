@@ -0,0 +1,85 @@
+"""
+Control de calidad determinista de fichas ya generadas.
+Aplica las reglas compiladas de las instrucciones V4.4 a fichas en JSON o
+JSONL (una ficha por línea, o {"ficha": {...}}) sin llamar al LLM, y mide el
+coste por ficha con --benchmark.
+"""
+
+import sys
+from pathlib import Path
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import json
+import time
+
+from app.core.quality_checker import QualityChecker
+from app.models.ficha_schema import FichaData
+
+
+def load_fichas(path: Path):
+    """Lee las fichas de un .json (objeto o lista) o .jsonl."""
+    text = path.read_text(encoding="utf-8")
+    if path.suffix == ".jsonl":
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        data = json.loads(text)
+        items = data if isinstance(data, list) else [data]
+    for i, item in enumerate(items):
+        yield f"{path.name}:{i + 1}", FichaData(**item.get("ficha", item))
+
+
+def load_instructions() -> dict:
+    """Carga las instrucciones V4.4 (mismo fichero que LLMProcessor)."""
+    path = Path("docs/schemas_prompts/Instrucciones Ficha Social Definitivas ChatGPT V4.4 (1).json")
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {}
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Revisa fichas con las reglas de las instrucciones")
+    parser.add_argument("paths", nargs="*", type=Path, help="Ficheros .json/.jsonl con fichas")
+    parser.add_argument("--benchmark", type=int, default=0, help="Revisar N veces la ficha de ejemplo y medir")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar todas las incidencias")
+    args = parser.parse_args()
+
+    checker = QualityChecker(load_instructions())
+
+    if args.benchmark:
+        ficha = FichaData(**FichaData.model_config["json_schema_extra"]["example"])
+        start = time.perf_counter()
+        _, summary = checker.check_many([ficha] * args.benchmark)
+        elapsed = time.perf_counter() - start
+        print(f"{args.benchmark} fichas en {elapsed * 1000:.1f} ms "
+              f"({elapsed / args.benchmark * 1e6:.1f} µs/ficha, puntuación {summary['avg_score']})")
+
+    if not args.paths:
+        if not args.benchmark:
+            parser.error("indica ficheros de fichas o --benchmark")
+        return
+
+    names, fichas = [], []
+    for path in args.paths:
+        for name, ficha in load_fichas(path):
+            names.append(name)
+            fichas.append(ficha)
+
+    reports, summary = checker.check_many(fichas)
+    for name, report in zip(names, reports):
+        status = "OK " if report["passed"] else "NOK"
+        print(f"{status} {report['score']:3d}  {name}")
+        if args.verbose or not report["passed"]:
+            for issue in report["issues"]:
+                print(f"        [{issue['severity']}] {issue['field']}: {issue['message']}")
+
+    print(f"\n{summary['passed']}/{summary['fichas']} aprobadas, puntuación media {summary['avg_score']}")
+    for rule, count in summary["issues_by_rule"].items():
+        print(f"  {rule}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Comparación de modos de salida del LLM: schema como instrucciones de texto
+(prompt) frente a salida estructurada nativa del proveedor (native).
+Mide el tamaño de la petición y, con --dataset y API key, la tasa de fallos
+de parseo sobre PDFs reales.
+"""
+
+import sys
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+import argparse
+
+from app.config import settings
+
+
+MODES = ["prompt", "native"]
+
+
+def request_size(processor, mode: str, user_prompt: str) -> Dict[str, int]:
+    """
+    Tamaño de la petición que se enviaría al proveedor (sin red).
+
+    Args:
+        processor: LLMProcessor
+        mode: prompt/native
+        user_prompt: Parte variable del prompt
+
+    Returns:
+        Caracteres del prefijo estático y de la petición completa
+    """
+    settings.LLM_OUTPUT_MODE = mode
+    messages = processor._build_messages(user_prompt)
+    runnable = processor._output_runnable(processor.llm, processor.provider)
+    llm, kwargs = (runnable.bound, runnable.kwargs) if runnable is not processor.llm else (processor.llm, {})
+    payload = llm._get_request_payload(messages, **kwargs)
+
+    return {
+        "prefix_chars": len(processor._get_static_prefix()),
+        "request_chars": len(json.dumps(payload, ensure_ascii=False)),
+    }
+
+
+def run_dataset(processor, mode: str, pdfs: List[Path]) -> Dict[str, Any]:
+    """
+    Genera fichas sin reparación y cuenta los fallos de parseo/validación.
+
+    Args:
+        processor: LLMProcessor
+        mode: prompt/native
+        pdfs: PDFs a procesar
+
+    Returns:
+        Estadísticas del modo
+    """
+    from app.core.pdf_extractor import PDFExtractor
+
+    settings.LLM_OUTPUT_MODE = mode
+    settings.LLM_REPAIR_MAX_ROUNDS = 0
+    extractor = PDFExtractor()
+
+    failures, input_tokens, output_tokens, latencies = 0, [], [], []
+    for pdf_path in pdfs:
+        text = extractor.extract_text(pdf_path)
+        start = time.perf_counter()
+        try:
+            result = processor.generate_ficha(text, use_rag=False)
+            input_tokens.append(result["metadata"]["input_tokens"])
+            output_tokens.append(result["metadata"]["output_tokens"])
+        except Exception as e:
+            failures += 1
+            logger.warning(f"[{mode}] {pdf_path.name}: {str(e)[:120]}")
+        latencies.append(time.perf_counter() - start)
+
+    n = len(pdfs)
+    return {
+        "documents": n,
+        "parse_failures": failures,
+        "failure_rate": round(failures / n, 3) if n else 0.0,
+        "avg_input_tokens": round(sum(input_tokens) / len(input_tokens)) if input_tokens else 0,
+        "avg_output_tokens": round(sum(output_tokens) / len(output_tokens)) if output_tokens else 0,
+        "avg_latency": round(sum(latencies) / n, 2) if n else 0.0,
+    }
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Compara los modos de salida prompt y native")
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default=settings.DEFAULT_LLM_PROVIDER)
+    parser.add_argument("--dataset", type=str, default=None, help="Carpeta de PDFs para medir fallos de parseo")
+    parser.add_argument("--limit", type=int, default=10, help="PDFs a procesar por modo")
+    parser.add_argument("--output", type=str, default=None, help="Guardar el informe en JSON")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    online = bool(args.dataset and settings.get_llm_api_key(args.provider))
+    if not settings.get_llm_api_key(args.provider):
+        # La medición de tamaño no hace llamadas: basta una clave ficticia
+        setattr(settings, f"{args.provider.upper()}_API_KEY", "offline")
+
+    from app.core.llm_processor import LLMProcessor
+
+    processor = LLMProcessor(provider=args.provider)
+    sample = processor._build_user_prompt("Texto de ejemplo de una convocatoria. " * 200)
+
+    report: Dict[str, Any] = {"provider": args.provider, "model": processor.model_name, "modes": {}}
+    for mode in MODES:
+        report["modes"][mode] = request_size(processor, mode, sample)
+
+    if online:
+        pdfs = sorted(Path(args.dataset).rglob("*.pdf"))[: args.limit]
+        for mode in MODES:
+            report["modes"][mode].update(run_dataset(processor, mode, pdfs))
+    elif args.dataset:
+        print(f"Sin API key de {args.provider}: solo se compara el tamaño de la petición")
+
+    print(f"\n{'modo':<8} {'prefijo':>9} {'petición':>9} {'fallos':>8} {'tokens in':>10} {'tokens out':>11}")
+    for mode, stats in report["modes"].items():
+        failures = f"{stats['failure_rate']:.0%}" if "failure_rate" in stats else "-"
+        print(
+            f"{mode:<8} {stats['prefix_chars']:>9} {stats['request_chars']:>9} {failures:>8} "
+            f"{stats.get('avg_input_tokens', '-'):>10} {stats.get('avg_output_tokens', '-'):>11}"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nInforme guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
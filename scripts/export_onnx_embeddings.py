@@ -0,0 +1,78 @@
+"""
+Exporta el modelo de embeddings a ONNX para EMBEDDING_BACKEND=onnx.
+Genera en EMBEDDING_ONNX_DIR/<modelo>/ model.onnx, model_int8.onnx
+(cuantización dinámica de pesos a int8), tokenizer.json y
+sentence_bert_config.json. Es un paso offline: necesita torch,
+sentence-transformers y onnx, que después no hacen falta en los workers.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+import argparse
+
+from app.config import settings
+from app.core.embedding_backends import ONNX_INT8_MODEL_FILE, ONNX_MODEL_FILE, onnx_model_dir
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Exporta el modelo de embeddings a ONNX (+ int8)")
+    parser.add_argument("--model", type=str, default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--output", type=str, default=None, help="Directorio (por defecto EMBEDDING_ONNX_DIR/<modelo>)")
+    parser.add_argument("--no-quantize", action="store_true", help="No generar la versión int8")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output = Path(args.output) if args.output else onnx_model_dir(args.model)
+    output.mkdir(parents=True, exist_ok=True)
+
+    model = SentenceTransformer(args.model, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    # Entrada de ejemplo para trazar el grafo (ejes dinámicos de lote y tokens)
+    sample = tokenizer(["Ayudas de emergencia social", "Texto de ejemplo"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "tokens"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "tokens"}
+
+    model_path = output / ONNX_MODEL_FILE
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            str(model_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=args.opset,
+            dynamo=False,
+        )
+    logger.info(f"✓ Modelo exportado: {model_path} ({model_path.stat().st_size / 1e6:.1f} MB)")
+
+    tokenizer.save_pretrained(str(output))
+    (output / "sentence_bert_config.json").write_text(
+        json.dumps({"max_seq_length": model.max_seq_length, "model": args.model}), encoding="utf-8"
+    )
+
+    if not args.no_quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = output / ONNX_INT8_MODEL_FILE
+        quantize_dynamic(str(model_path), str(int8_path), weight_type=QuantType.QInt8)
+        logger.info(f"✓ Modelo int8: {int8_path} ({int8_path.stat().st_size / 1e6:.1f} MB)")
+
+    print(f"\nListo. Para usarlo: EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_DIR={output.parent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+Extracción masiva del corpus de PDFs.
+Recorre el dataset, extrae texto, estadísticas por página, tablas y metadatos
+en paralelo y los guarda como dataset JSONL (y Parquet si pyarrow está disponible).
+"""
+
+import sys
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, Iterator
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+import argparse
+
+
+DOCUMENTS_FILE = "documents.jsonl"
+PAGES_FILE = "pages.jsonl"
+TABLES_FILE = "tables.jsonl"
+ERRORS_FILE = "errors.jsonl"
+
+_extractor = None
+
+
+def _init_worker(log_level: str) -> None:
+    """Inicializa cada proceso del pool con logging reducido."""
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+
+
+def document_id(pdf_path: Path, root: Path) -> str:
+    """
+    Calcula un ID estable para un PDF a partir de su ruta, tamaño y fecha.
+
+    Args:
+        pdf_path: Ruta al PDF
+        root: Raíz del dataset
+
+    Returns:
+        ID hexadecimal (cambia si el fichero se modifica)
+    """
+    stat = pdf_path.stat()
+    key = f"{pdf_path.relative_to(root).as_posix()}|{stat.st_size}|{int(stat.st_mtime)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_pdfs(root: Path) -> Iterator[Path]:
+    """
+    Recorre el dataset devolviendo los PDFs en orden estable.
+
+    Args:
+        root: Raíz del dataset
+
+    Yields:
+        Rutas a PDFs
+    """
+    for pdf_path in sorted(root.rglob("*")):
+        if pdf_path.is_file() and pdf_path.suffix.lower() == ".pdf" and not pdf_path.name.startswith("~"):
+            yield pdf_path
+
+
+def extract_document(pdf_path: str, root: str, doc_id: str, include_tables: bool) -> Dict[str, Any]:
+    """
+    Extrae un PDF completo (se ejecuta en un proceso del pool).
+
+    Args:
+        pdf_path: Ruta al PDF
+        root: Raíz del dataset
+        doc_id: ID del documento
+        include_tables: Si extraer tablas con pdfplumber
+
+    Returns:
+        Dict con registros de documento, páginas y tablas
+    """
+    import pymupdf
+
+    global _extractor
+    if _extractor is None:
+        from app.core.pdf_extractor import PDFExtractor
+
+        _extractor = PDFExtractor()
+
+    path = Path(pdf_path)
+    start = time.perf_counter()
+
+    # Una sola lectura del fichero: PyMuPDF (páginas y metadatos) y
+    # pdfplumber (tablas) trabajan sobre los mismos bytes
+    data = path.read_bytes()
+    with pymupdf.open(stream=data, filetype="pdf") as doc:
+        pages = _extractor.extract_pages(path, doc)
+        metadata = _extractor.extract_metadata(path, doc)
+    raw_text = "\n\n".join(p["text"] for p in pages if p["has_text"])
+    text = _extractor.clean_text(raw_text)
+    tables = _extractor.extract_tables(path, data) if include_tables else []
+
+    relative = path.relative_to(root)
+    document = {
+        "doc_id": doc_id,
+        "path": relative.as_posix(),
+        "folder": relative.parent.as_posix(),
+        "filename": path.name,
+        "text": text,
+        "chars": len(text),
+        "pages": len(pages),
+        "empty_pages": sum(1 for p in pages if not p["has_text"]),
+        "tables": len(tables),
+        "metadata": metadata,
+        "extraction_seconds": round(time.perf_counter() - start, 4),
+    }
+
+    page_rows = [
+        {"doc_id": doc_id, **{k: v for k, v in p.items() if k != "text"}}
+        for p in pages
+    ]
+    table_rows = [
+        {
+            "doc_id": doc_id,
+            "page": t["page"],
+            "table_index": t["table_index"],
+            "rows": t["rows"],
+            "columns": t["columns"],
+            "markdown": t["markdown"],
+        }
+        for t in tables
+    ]
+
+    return {"document": document, "pages": page_rows, "tables": table_rows}
+
+
+def load_checkpoint(output_dir: Path) -> Dict[str, str]:
+    """
+    Lee los documentos ya completados de una ejecución anterior.
+
+    Si un PDF se modificó y se volvió a extraer, su ruta aparece con varios
+    doc_id: vale el último, y las filas de las versiones anteriores quedan
+    sustituidas.
+
+    Args:
+        output_dir: Directorio de salida
+
+    Returns:
+        Dict ruta relativa -> doc_id vigente
+    """
+    documents_path = output_dir / DOCUMENTS_FILE
+    if not documents_path.exists():
+        return {}
+
+    done = {}
+    with open(documents_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                done[row["path"]] = row["doc_id"]
+            except (json.JSONDecodeError, KeyError):
+                # Línea truncada por una interrupción: se reprocesa
+                continue
+    return done
+
+
+def trim_partial_line(path: Path) -> None:
+    """
+    Quita la última línea de un JSONL si quedó a medias por una interrupción,
+    para que lo que se añada al reanudar empiece en una línea nueva.
+
+    Args:
+        path: Fichero JSONL
+    """
+    if not path.exists():
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        # Se lee hacia atrás por bloques: documents.jsonl lleva el texto completo
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
+
+
+def _append_jsonl(handle, rows) -> None:
+    for row in rows:
+        handle.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+
+
+def write_parquet(output_dir: Path) -> bool:
+    """
+    Convierte los JSONL a Parquet (uno por tabla) si pyarrow está instalado.
+    Descarta filas huérfanas o duplicadas de ejecuciones interrumpidas y las
+    de versiones anteriores de un PDF modificado.
+
+    Args:
+        output_dir: Directorio de salida
+
+    Returns:
+        True si se generaron los ficheros Parquet
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        logger.warning("pyarrow no instalado: dataset disponible solo en JSONL")
+        return False
+
+    committed = set(load_checkpoint(output_dir).values())
+
+    for name, key in [
+        (DOCUMENTS_FILE, ("doc_id",)),
+        (PAGES_FILE, ("doc_id", "page")),
+        (TABLES_FILE, ("doc_id", "page", "table_index")),
+    ]:
+        jsonl_path = output_dir / name
+        if not jsonl_path.exists():
+            continue
+
+        rows, seen = [], set()
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                row_key = tuple(row.get(k) for k in key)
+                if row["doc_id"] in committed and row_key not in seen:
+                    seen.add(row_key)
+                    if "metadata" in row:
+                        row["metadata"] = json.dumps(row["metadata"], ensure_ascii=False)
+                    rows.append(row)
+
+        if rows:
+            pq.write_table(pa.Table.from_pylist(rows), output_dir / name.replace(".jsonl", ".parquet"))
+            logger.info(f"✓ {name.replace('.jsonl', '.parquet')}: {len(rows)} filas")
+
+    return True
+
+
+def extract_corpus(
+    dataset_path: Path,
+    output_dir: Path,
+    workers: int,
+    include_tables: bool = True,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """
+    Extrae todos los PDFs del dataset con checkpoints reanudables.
+
+    Args:
+        dataset_path: Raíz del dataset
+        output_dir: Directorio de salida
+        workers: Número de procesos
+        include_tables: Si extraer tablas
+        restart: Si True, descarta resultados anteriores
+
+    Returns:
+        Estadísticas de la ejecución
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if restart:
+        for name in (DOCUMENTS_FILE, PAGES_FILE, TABLES_FILE, ERRORS_FILE):
+            (output_dir / name).unlink(missing_ok=True)
+
+    for name in (DOCUMENTS_FILE, PAGES_FILE, TABLES_FILE, ERRORS_FILE):
+        trim_partial_line(output_dir / name)
+
+    # Un PDF modificado cambia de doc_id y se vuelve a extraer
+    done = load_checkpoint(output_dir)
+    pending, current = [], 0
+    for pdf_path in iter_pdfs(dataset_path):
+        doc_id = document_id(pdf_path, dataset_path)
+        if done.get(pdf_path.relative_to(dataset_path).as_posix()) == doc_id:
+            current += 1
+        else:
+            pending.append((pdf_path, doc_id))
+
+    logger.info(f"PDFs ya extraídos: {current} | pendientes: {len(pending)}")
+
+    stats = {"documents": 0, "pages": 0, "tables": 0, "errors": 0, "seconds": 0.0}
+    if not pending:
+        return stats
+
+    start = time.perf_counter()
+
+    with open(output_dir / DOCUMENTS_FILE, "a", encoding="utf-8") as documents_f, \
+            open(output_dir / PAGES_FILE, "a", encoding="utf-8") as pages_f, \
+            open(output_dir / TABLES_FILE, "a", encoding="utf-8") as tables_f, \
+            open(output_dir / ERRORS_FILE, "a", encoding="utf-8") as errors_f, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=("WARNING",)) as pool:
+
+        futures = {
+            pool.submit(extract_document, str(path), str(dataset_path), doc_id, include_tables): (path, doc_id)
+            for path, doc_id in pending
+        }
+
+        for future in as_completed(futures):
+            path, doc_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error(f"Error extrayendo {path.name}: {e}")
+                _append_jsonl(errors_f, [{"doc_id": doc_id, "path": str(path), "error": str(e)}])
+                errors_f.flush()
+                continue
+
+            # Páginas y tablas primero: la línea del documento marca el checkpoint
+            _append_jsonl(pages_f, result["pages"])
+            _append_jsonl(tables_f, result["tables"])
+            pages_f.flush()
+            tables_f.flush()
+            _append_jsonl(documents_f, [result["document"]])
+            documents_f.flush()
+
+            stats["documents"] += 1
+            stats["pages"] += result["document"]["pages"]
+            stats["tables"] += result["document"]["tables"]
+
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"[{stats['documents']}/{len(pending)}] {path.name}: "
+                f"{result['document']['pages']} págs | {stats['pages'] / elapsed:.1f} págs/s"
+            )
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Extraer el corpus de PDFs a un dataset columnar")
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default="Fichas y documentación",
+        help="Ruta al dataset de PDFs",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="./data/corpus",
+        help="Directorio de salida del dataset",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Número de procesos de extracción",
+    )
+    parser.add_argument(
+        "--no-tables",
+        action="store_true",
+        help="No extraer tablas (pdfplumber es la parte más lenta)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Descartar el checkpoint y extraer todo de nuevo",
+    )
+    parser.add_argument(
+        "--no-parquet",
+        action="store_true",
+        help="No convertir el resultado a Parquet",
+    )
+    args = parser.parse_args()
+
+    logger.info("=" * 60)
+    logger.info("Extracción masiva del corpus")
+    logger.info("=" * 60)
+
+    dataset_path = Path(args.dataset)
+    if not dataset_path.exists():
+        logger.error(f"Dataset no encontrado: {dataset_path}")
+        logger.error("Asegúrate de ejecutar desde el directorio raíz del proyecto")
+        sys.exit(1)
+
+    output_dir = Path(args.output)
+    stats = extract_corpus(
+        dataset_path.resolve(),
+        output_dir,
+        workers=args.workers,
+        include_tables=not args.no_tables,
+        restart=args.restart,
+    )
+
+    if not args.no_parquet:
+        write_parquet(output_dir)
+
+    throughput = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+    logger.info("=" * 60)
+    logger.info(f"✓ Documentos extraídos: {stats['documents']} ({stats['errors']} errores)")
+    logger.info(f"✓ Páginas: {stats['pages']} | Tablas: {stats['tables']}")
+    logger.info(f"✓ Tiempo: {stats['seconds']:.2f}s | Throughput: {throughput:.1f} págs/s")
+    logger.info(f"✓ Dataset: {output_dir}")
+    logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Servidor LLM simulado para benchmarks y pruebas locales.
+Expone endpoints compatibles con OpenAI (/v1/chat/completions) y Anthropic
+(/v1/messages) que devuelven una ficha fija tras una latencia configurable,
+y las APIs batch de ambos (/v1/batches + /v1/files, /v1/messages/batches).
+"""
+
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import random
+import threading
+from email.parser import BytesParser
+from pathlib import Path
+from typing import Optional, Tuple
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+import uvicorn
+import argparse
+
+from app.models.ficha_schema import FichaData
+
+
+def default_completion() -> str:
+    """Ficha de ejemplo del schema serializada como respuesta del LLM."""
+    return json.dumps(FichaData.model_config["json_schema_extra"]["example"], ensure_ascii=False)
+
+
+def create_app(
+    latency: float = 0.5,
+    jitter: float = 0.0,
+    completion: Optional[str] = None,
+    error_rate: float = 0.0,
+    stall_rate: float = 0.0,
+    stall_seconds: float = 30.0,
+    batch_latency: float = 0.0,
+) -> FastAPI:
+    """
+    Crea la aplicación del servidor simulado.
+
+    Args:
+        latency: Latencia base por respuesta (segundos)
+        jitter: Variación aleatoria máxima añadida a la latencia (segundos)
+        completion: Texto a devolver (por defecto la ficha de ejemplo)
+        error_rate: Probabilidad de responder 429/529 (prueba de reintentos)
+        stall_rate: Probabilidad de bloquearse stall_seconds (prueba de hedging)
+        stall_seconds: Duración de un bloqueo
+        batch_latency: Segundos hasta que un batch aparece como terminado
+
+    Returns:
+        Aplicación FastAPI
+    """
+    app = FastAPI(title="Mock LLM")
+    text = completion or default_completion()
+    app.state.requests = 0
+
+    async def _wait() -> Optional[JSONResponse]:
+        app.state.requests += 1
+        if random.random() < error_rate:
+            status = random.choice([429, 529])
+            return JSONResponse(
+                status_code=status,
+                content={"type": "error", "error": {"type": "overloaded_error", "message": "simulado"}},
+            )
+        delay = latency + random.uniform(0, jitter)
+        if random.random() < stall_rate:
+            delay = stall_seconds
+        await asyncio.sleep(delay)
+        return None
+
+    app.state.files = {}
+    app.state.batches = {}
+
+    def _openai_completion(body: dict) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": len(json.dumps(body["messages"])) // 4,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": (len(json.dumps(body["messages"])) + len(text)) // 4,
+            },
+        }
+
+    def _anthropic_message(body: dict) -> dict:
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:12]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "mock"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": len(json.dumps(body["messages"])) // 4,
+                "output_tokens": len(text) // 4,
+            },
+        }
+
+    def _batch_ended(batch: dict) -> bool:
+        return time.time() - batch["created_at"] >= batch_latency
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        error = await _wait()
+        if error:
+            return error
+        return _openai_completion(body)
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        error = await _wait()
+        if error:
+            return error
+        return _anthropic_message(body)
+
+    # --- Anthropic Message Batches ---
+
+    def _anthropic_batch(batch: dict, request: Request) -> dict:
+        ended = _batch_ended(batch)
+        count = len(batch["requests"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created_at"])),
+            "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created_at"] + 86400)),
+            "ended_at": None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{str(request.base_url).rstrip('/')}/v1/messages/batches/{batch['id']}/results"
+            if ended else None,
+        }
+
+    @app.post("/v1/messages/batches")
+    async def anthropic_batch_create(request: Request):
+        body = await request.json()
+        batch = {"id": f"msgbatch_{uuid.uuid4().hex[:12]}", "created_at": time.time(), "requests": body["requests"]}
+        app.state.batches[batch["id"]] = batch
+        return _anthropic_batch(batch, request)
+
+    @app.get("/v1/messages/batches")
+    async def anthropic_batch_list(request: Request):
+        data = [_anthropic_batch(batch, request) for batch in reversed(app.state.batches.values())]
+        return {
+            "data": data,
+            "has_more": False,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None,
+        }
+
+    @app.get("/v1/messages/batches/{batch_id}")
+    async def anthropic_batch_retrieve(batch_id: str, request: Request):
+        return _anthropic_batch(app.state.batches[batch_id], request)
+
+    @app.get("/v1/messages/batches/{batch_id}/results")
+    async def anthropic_batch_results(batch_id: str):
+        lines = [
+            json.dumps({
+                "custom_id": item["custom_id"],
+                "result": {"type": "succeeded", "message": _anthropic_message(item["params"])},
+            }, ensure_ascii=False)
+            for item in app.state.batches[batch_id]["requests"]
+        ]
+        return PlainTextResponse("\n".join(lines), media_type="application/binary")
+
+    # --- OpenAI Batch API ---
+
+    @app.post("/v1/files")
+    async def openai_file_create(request: Request):
+        # Multipart parseado a mano (sin depender de python-multipart)
+        raw = await request.body()
+        header = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+        message = BytesParser().parsebytes(header + raw)
+        content, filename, purpose = b"", "upload", ""
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                content = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+            elif name == "purpose":
+                purpose = part.get_payload(decode=True).decode()
+
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        app.state.files[file_id] = content
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    @app.get("/v1/files/{file_id}/content")
+    async def openai_file_content(file_id: str):
+        return PlainTextResponse(app.state.files[file_id].decode("utf-8"))
+
+    def _openai_batch(batch: dict) -> dict:
+        ended = _batch_ended(batch)
+        if ended and batch["output_file_id"] is None:
+            lines = []
+            for line in app.state.files[batch["input_file_id"]].decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                lines.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": item["custom_id"],
+                    "response": {"status_code": 200, "body": _openai_completion(item["body"])},
+                    "error": None,
+                }, ensure_ascii=False))
+            batch["output_file_id"] = f"file-{uuid.uuid4().hex[:12]}"
+            app.state.files[batch["output_file_id"]] = "\n".join(lines).encode("utf-8")
+
+        return {
+            "id": batch["id"],
+            "object": "batch",
+            "endpoint": batch["endpoint"],
+            "input_file_id": batch["input_file_id"],
+            "completion_window": batch["completion_window"],
+            "status": "completed" if ended else "in_progress",
+            "output_file_id": batch["output_file_id"],
+            "error_file_id": None,
+            "created_at": int(batch["created_at"]),
+            "metadata": batch["metadata"],
+        }
+
+    @app.post("/v1/batches")
+    async def openai_batch_create(request: Request):
+        body = await request.json()
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:12]}",
+            "created_at": time.time(),
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "output_file_id": None,
+            "metadata": body.get("metadata"),
+        }
+        app.state.batches[batch["id"]] = batch
+        return _openai_batch(batch)
+
+    @app.get("/v1/batches")
+    async def openai_batch_list():
+        data = [_openai_batch(batch) for batch in reversed(app.state.batches.values())]
+        return {
+            "object": "list",
+            "data": data,
+            "has_more": False,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None,
+        }
+
+    @app.get("/v1/batches/{batch_id}")
+    async def openai_batch_retrieve(batch_id: str):
+        return _openai_batch(app.state.batches[batch_id])
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_in_thread(app: FastAPI, port: Optional[int] = None) -> Tuple[uvicorn.Server, int]:
+    """
+    Arranca el servidor en un hilo en segundo plano.
+
+    Args:
+        app: Aplicación a servir
+        port: Puerto (None = uno libre)
+
+    Returns:
+        Tupla (servidor, puerto); server.should_exit = True para pararlo
+    """
+    port = port or _free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    return server, port
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Servidor LLM simulado (OpenAI/Anthropic)")
+    parser.add_argument("--port", type=int, default=9100, help="Puerto de escucha")
+    parser.add_argument("--latency", type=float, default=0.5, help="Latencia por respuesta (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variación aleatoria de latencia (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de error 429/529")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Probabilidad de bloqueo")
+    parser.add_argument("--stall-seconds", type=float, default=30.0, help="Duración de un bloqueo (s)")
+    parser.add_argument("--batch-latency", type=float, default=0.0, help="Tiempo hasta terminar un batch (s)")
+    args = parser.parse_args()
+
+    app = create_app(
+        args.latency,
+        args.jitter,
+        error_rate=args.error_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        batch_latency=args.batch_latency,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
 """
 Script de inicialización de ChromaDB.
-Indexa las fichas de ejemplo del dataset para el sistema RAG.
+Indexa las fichas de ejemplo del dataset para el sistema RAG. Es incremental:
+relanzarlo solo procesa las fichas nuevas, modificadas o eliminadas. Las
+fichas se leen en paralelo y se indexan por lotes; si se interrumpe, volver a
+lanzarlo continúa tras el último lote completado.
 """
 
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Añadir el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.config import settings
 from app.core.rag_system import RAGSystem
+from app.core.ficha_sections import extract_sections
 from app.core.pdf_extractor import PDFExtractor
 from loguru import logger
 import argparse
@@ -60,59 +67,92 @@ def extract_metadata_from_folder_name(folder_name: str) -> dict:
         metadata["organismo"] = parts[0].strip()
         metadata["tipo"] = parts[1].strip()
 
+    # Provincia entre paréntesis, para prefiltrar el RAG: {"provincia": "Badajoz"}
+    provincia = re.search(r"\(([^)]+)\)", parts[0])
+    if provincia:
+        metadata["provincia"] = provincia.group(1).strip()
+
     return metadata
 
 
-def index_dataset(rag: RAGSystem, dataset_path: Path, reindex: bool = False):
+def find_fichas(dataset_path: Path) -> dict:
     """
-    Indexa todas las fichas del dataset.
+    Busca los .docx de fichas del dataset.
 
     Args:
-        rag: Sistema RAG
         dataset_path: Ruta al dataset
-        reindex: Si True, elimina índice existente
+
+    Returns:
+        Dict {id: ruta}, con la ruta relativa sin extensión como id
     """
-    if reindex:
-        logger.warning("Reindexando: eliminando colección existente...")
-        rag.delete_all()
+    return {
+        docx_file.relative_to(dataset_path).with_suffix("").as_posix(): docx_file
+        for docx_file in sorted(dataset_path.rglob("*.docx"))
+        # Filtrar por nombre (debe contener "Ficha" o "FICHA")
+        if "ficha" in docx_file.name.lower() and not docx_file.name.startswith("~")
+    }
 
-    logger.info(f"Buscando fichas en: {dataset_path}")
 
-    # Buscar todos los archivos .docx que sean fichas
-    fichas = []
-    for docx_file in dataset_path.rglob("*.docx"):
-        # Filtrar por nombre (debe contener "Ficha" o "FICHA")
-        if "ficha" in docx_file.name.lower() and not docx_file.name.startswith("~"):
-            logger.debug(f"Encontrada ficha: {docx_file.name}")
+def load_ficha(ficha_id: str, docx_file: Path):
+    """
+    Lee una ficha para indexarla.
 
-            # Extraer texto
-            text = extract_ficha_text(docx_file)
+    Args:
+        ficha_id: ID de la ficha
+        docx_file: Ruta al .docx
 
-            if text and len(text) > 100:
-                # Extraer metadatos del folder
-                folder_name = docx_file.parent.name
-                metadata = extract_metadata_from_folder_name(folder_name)
-                metadata["filename"] = docx_file.name
-                metadata["folder"] = folder_name
+    Returns:
+        Dict {text, metadata, sections}, o None si el texto es demasiado corto
+    """
+    logger.debug(f"Leyendo ficha: {docx_file.name}")
+    text = extract_ficha_text(docx_file)
+    if not text or len(text) <= 100:
+        return None
+
+    # Extraer metadatos del folder
+    folder_name = docx_file.parent.name
+    metadata = extract_metadata_from_folder_name(folder_name)
+    metadata["filename"] = docx_file.name
+    metadata["folder"] = folder_name
+    # Secciones de la tabla CAMPO / CONCEPTO para los ejemplos por campo
+    return {"text": text, "metadata": metadata, "sections": extract_sections(docx_file)}
+
+
+def index_dataset(
+    rag: RAGSystem,
+    dataset_path: Path,
+    reindex: bool = False,
+    workers: int = 1,
+    batch_size: int = None,
+) -> dict:
+    """
+    Sincroniza el índice con las fichas del dataset.
 
-                fichas.append(
-                    {
-                        "id": docx_file.stem,
-                        "text": text,
-                        "metadata": metadata,
-                    }
-                )
+    Solo se generan embeddings de las fichas nuevas o modificadas (según el
+    hash de cada .docx en el manifiesto) y se eliminan las que ya no existen.
 
-    if not fichas:
-        logger.warning("No se encontraron fichas para indexar")
-        return
+    Args:
+        rag: Sistema RAG
+        dataset_path: Ruta al dataset
+        reindex: Si True, elimina índice existente
+        workers: Procesos que leen los .docx (1 = en este proceso)
+        batch_size: Fichas por lote (None = RAG_INDEX_BATCH_SIZE)
 
-    logger.info(f"Total de fichas encontradas: {len(fichas)}")
+    Returns:
+        Dict con added, updated, deleted, skipped, errors y unchanged
+    """
+    if reindex:
+        logger.warning("Reindexando: eliminando colección existente...")
+        rag.delete_all()
 
-    # Indexar en lote
-    rag.index_multiple(fichas)
+    logger.info(f"Buscando fichas en: {dataset_path}")
+    files = find_fichas(dataset_path)
+    logger.info(f"Total de fichas encontradas: {len(files)}")
 
-    logger.info(f"✓ {len(fichas)} fichas indexadas correctamente")
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return rag.sync_files(files, load_ficha, executor=executor, batch_size=batch_size)
+    return rag.sync_files(files, load_ficha, batch_size=batch_size)
 
 
 def main():
@@ -127,7 +167,19 @@ def main():
     parser.add_argument(
         "--reindex",
         action="store_true",
-        help="Reindexar (eliminar índice existente)",
+        help="Reindexar todo (eliminar índice existente)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.RAG_INDEX_WORKERS,
+        help="Procesos que leen los .docx en paralelo",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.RAG_INDEX_BATCH_SIZE,
+        help="Fichas por lote (memoria acotada y punto de reanudación)",
     )
     args = parser.parse_args()
 
@@ -150,26 +202,23 @@ def main():
     current_count = rag.count()
     logger.info(f"Fichas actualmente indexadas: {current_count}")
 
-    if current_count > 0 and not args.reindex:
-        logger.warning("Ya existen fichas indexadas.")
-        logger.warning("Usa --reindex para eliminar y reindexar.")
-        confirm = input("¿Continuar y añadir más fichas? (s/n): ")
-        if confirm.lower() != "s":
-            logger.info("Cancelado por el usuario")
-            sys.exit(0)
-
-    # Indexar dataset
-    index_dataset(rag, dataset_path, args.reindex)
+    # Sincronizar dataset (solo cambios)
+    stats = index_dataset(rag, dataset_path, args.reindex, workers=args.workers, batch_size=args.batch_size)
 
     # Stats finales
     final_count = rag.count()
     logger.info("=" * 60)
     logger.info(f"✓ Setup completado")
     logger.info(f"✓ Total de fichas en el sistema: {final_count}")
-    logger.info(f"✓ Fichas añadidas: {final_count - current_count}")
+    logger.info(
+        f"✓ Nuevas: {stats['added']}, actualizadas: {stats['updated']}, "
+        f"eliminadas: {stats['deleted']}, sin cambios: {stats['unchanged']}, descartadas: {stats['skipped']}, "
+        f"errores: {stats['errors']}"
+    )
 
     info = rag.get_collection_info()
     logger.info(f"✓ Colección: {info['name']}")
+    logger.info(f"✓ Secciones por campo: {info['field_sections']}")
     logger.info(f"✓ Ubicación: {info['persist_directory']}")
     logger.info("=" * 60)
 
@@ -0,0 +1,38 @@
+"""
+Fixtures compartidas por los tests del procesador LLM.
+"""
+
+import copy
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.config import settings
+from app.core.llm_processor import LLMProcessor
+from app.models.ficha_schema import FichaData
+
+
+@pytest.fixture
+def ficha():
+    """Copia de la ficha válida de ejemplo del schema."""
+    return copy.deepcopy(FichaData.model_config["json_schema_extra"]["example"])
+
+
+@pytest.fixture
+def ficha_json(ficha):
+    """Ficha válida de ejemplo serializada."""
+    return json.dumps(ficha, ensure_ascii=False)
+
+
+@pytest.fixture
+def api_key(monkeypatch):
+    """Clave ficticia de Anthropic (los tests no llaman al proveedor)."""
+    monkeypatch.setattr(settings, "ANTHROPIC_API_KEY", "test-key")
+
+
+@pytest.fixture
+def processor(api_key, ficha_json):
+    """Procesador Anthropic cuyo LLM simulado responde con la ficha de ejemplo."""
+    processor = LLMProcessor(provider="anthropic")
+    processor.llm = FakeListChatModel(responses=[ficha_json])
+    return processor
@@ -0,0 +1,201 @@
+"""
+Tests para la generación masiva con APIs batch (contra el servidor simulado).
+"""
+
+import json
+import fitz
+import pytest
+
+from app.config import settings
+from app.core.batch_jobs import BulkJob, RENDERED, SUBMITTED, create_backend
+from app.core.llm_processor import LLMProcessor
+from app.core.usage_ledger import UsageLedger, estimate_cost
+from scripts.mock_llm_server import create_app, run_in_thread
+
+
+@pytest.fixture(autouse=True)
+def usage_dir(monkeypatch, tmp_path):
+    """Registro de uso de los trabajos en un directorio temporal."""
+    monkeypatch.setattr(settings, "USAGE_LEDGER_DIR", str(tmp_path / "usage"))
+    return tmp_path / "usage"
+
+
+@pytest.fixture
+def mock_server():
+    """Servidor LLM simulado con las APIs batch."""
+    app = create_app(latency=0)
+    server, port = run_in_thread(app)
+    yield app, port
+    server.should_exit = True
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    """Dos PDFs de convocatoria."""
+    paths = []
+    for i in range(2):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((50, 72), f"BOP Madrid núm. 45, 15/01/2025. Convocatoria de ayudas {i}. " * 3, fontsize=8)
+        path = tmp_path / f"convocatoria_{i}.pdf"
+        doc.save(str(path))
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def _processor(monkeypatch, provider: str, port: int) -> LLMProcessor:
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+    monkeypatch.setattr(settings, "ANTHROPIC_BASE_URL", f"http://127.0.0.1:{port}")
+    return LLMProcessor(provider=provider)
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+@pytest.mark.parametrize("output_mode", ["prompt", "native"])
+def test_request_payload_with_replay_client(monkeypatch, tmp_path, provider, output_mode):
+    """El cuerpo batch se construye sin el cliente del proveedor (p. ej. con LLM_REPLAY_MODE=replay)."""
+    monkeypatch.setattr(settings, "LLM_REPLAY_MODE", "replay")
+    monkeypatch.setattr(settings, "LLM_REPLAY_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LLM_OUTPUT_MODE", output_mode)
+    processor = LLMProcessor(provider=provider)
+
+    pdf_text = "BOP Madrid núm. 45, 15/01/2025. " * 10
+
+    request = processor.build_request_payload(pdf_text, use_rag=False)
+    payload = json.loads(json.dumps(request["payload"]))  # Serializable tal cual al JSONL del batch
+    system, human = processor._build_messages(processor._prepare_generation(pdf_text, False)["user_prompt"])
+
+    assert payload["model"] == processor.model_name
+    assert request["rag_examples_count"] == 0
+    if provider == "anthropic":
+        assert payload["max_tokens"] == settings.ANTHROPIC_MAX_TOKENS
+        assert payload["system"] == system.content
+        assert payload["system"][0]["cache_control"] == {"type": "ephemeral"}
+        assert payload["messages"] == [{"role": "user", "content": human.content}]
+        assert ("tool_choice" in payload) == (output_mode == "native")
+    else:
+        assert payload["max_completion_tokens"] == settings.OPENAI_MAX_TOKENS
+        assert payload["messages"][0] == {"role": "system", "content": system.content}
+        assert ("response_format" in payload) == (output_mode == "native")
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_bulk_job_renders_all_documents(monkeypatch, tmp_path, mock_server, pdfs, provider):
+    """Un trabajo completo genera un .docx por PDF con la API batch del proveedor."""
+    app, port = mock_server
+    job = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=_processor(monkeypatch, provider, port))
+
+    counts = job.run(pdfs, use_rag=False, poll_interval=0.01)
+
+    assert counts == {RENDERED: 2}
+    assert app.state.requests == 0  # Nada por la API síncrona
+    results = [json.loads(line) for line in (tmp_path / "out" / "results.jsonl").read_text().splitlines()]
+    assert len(results) == 2
+    assert all((tmp_path / "out" / r["docx"].split("/")[-1]).exists() for r in results)
+    assert results[0]["metadata"]["batch_id"] == job.state["batches"][0]["id"]
+
+
+def test_batch_cost_is_discounted(monkeypatch, tmp_path, mock_server, pdfs):
+    """El coste de la respuesta batch es la mitad de la tarifa normal."""
+    _, port = mock_server
+    processor = _processor(monkeypatch, "anthropic", port)
+    job = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=processor)
+
+    job.run(pdfs[:1], use_rag=False, poll_interval=0.01)
+
+    metadata = json.loads((tmp_path / "out" / "results.jsonl").read_text())["metadata"]
+    full = estimate_cost(processor.model_name, metadata["input_tokens"], metadata["output_tokens"])
+    assert metadata["cost_usd"] == pytest.approx(full / 2, abs=1e-6)
+
+
+def test_bulk_job_resumes_after_restart(monkeypatch, tmp_path, pdfs):
+    """Tras un reinicio se recogen los batches ya enviados sin reenviarlos."""
+    app = create_app(latency=0, batch_latency=0.5)
+    server, port = run_in_thread(app)
+    try:
+        processor = _processor(monkeypatch, "openai", port)
+        first = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=processor)
+        assert first.run(pdfs, use_rag=False, poll_interval=0.01, timeout=0) == {SUBMITTED: 2}
+
+        resumed = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=processor)
+        counts = resumed.run(pdfs, use_rag=False, poll_interval=0.05)
+    finally:
+        server.should_exit = True
+
+    assert counts == {RENDERED: 2}
+    assert len(app.state.batches) == 1
+
+
+class CrashingBackend:
+    """Backend que simula la caída del proceso durante el envío, antes o después de llegar al proveedor."""
+
+    def __init__(self, backend, reached: bool):
+        self.backend, self.reached = backend, reached
+
+    def submit(self, requests, submission=None):
+        if self.reached:
+            self.backend.submit(requests, submission)
+        raise KeyboardInterrupt
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+@pytest.mark.parametrize("reached", [True, False])
+def test_interrupted_submission_is_not_sent_twice(monkeypatch, tmp_path, mock_server, pdfs, provider, reached):
+    """Un envío interrumpido se recupera del proveedor si llegó y se reenvía solo si no llegó."""
+    app, port = mock_server
+    processor = _processor(monkeypatch, provider, port)
+    crashing = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=processor,
+                       backend=CrashingBackend(create_backend(provider), reached))
+    with pytest.raises(KeyboardInterrupt):
+        crashing.run(pdfs, use_rag=False, poll_interval=0.01)
+
+    counts = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=processor).run(
+        pdfs, use_rag=False, poll_interval=0.01
+    )
+
+    assert counts == {RENDERED: 2}
+    assert len(app.state.batches) == 1
+
+
+def test_collect_resumes_without_duplicating_results(monkeypatch, tmp_path, mock_server, pdfs):
+    """Una ficha escrita en results.jsonl antes de guardar el estado no se vuelve a procesar."""
+    app, port = mock_server
+    processor = _processor(monkeypatch, "openai", port)
+    job = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=processor)
+    results = tmp_path / "out" / "results.jsonl"
+    save = job._save
+
+    def crash_after_first_result():
+        if results.exists():
+            raise KeyboardInterrupt
+        save()
+
+    monkeypatch.setattr(job, "_save", crash_after_first_result)
+    with pytest.raises(KeyboardInterrupt):
+        job.run(pdfs, use_rag=False, poll_interval=0.01)
+    assert len(results.read_text().splitlines()) == 1
+
+    resumed = BulkJob(tmp_path / "job.json", tmp_path / "out", processor=processor)
+    assert resumed.collect() == 1
+
+    assert resumed.counts() == {RENDERED: 2}
+    assert sorted(json.loads(line)["custom_id"] for line in results.read_text().splitlines()) == [
+        "doc-00000", "doc-00001"
+    ]
+
+
+def test_collect_records_usage(monkeypatch, tmp_path, mock_server, pdfs, usage_dir):
+    """Cada ficha del trabajo queda en el registro de uso con su coste con descuento batch."""
+    _, port = mock_server
+    job = BulkJob(tmp_path / "archivo2024.json", tmp_path / "out", processor=_processor(monkeypatch, "anthropic", port))
+
+    job.run(pdfs, use_rag=False, poll_interval=0.01)
+
+    entries = list(UsageLedger(str(usage_dir)).entries())
+    results = [json.loads(line) for line in (tmp_path / "out" / "results.jsonl").read_text().splitlines()]
+    assert [(e["ficha_id"], e["status"]) for e in entries] == [
+        ("archivo2024/doc-00000", "success"), ("archivo2024/doc-00001", "success")
+    ]
+    assert [e["cost_usd"] for e in entries] == [r["metadata"]["cost_usd"] for r in results]
@@ -0,0 +1,50 @@
+"""
+Tests para el índice léxico BM25 y la fusión de rankings.
+"""
+
+from app.core.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+FICHAS = [
+    {"id": "tele", "text": "boletín " * 30 + "Servicio de teleasistencia domiciliaria",
+     "metadata": {"tipo": "dependencia", "provincia": "Badajoz"}},
+    {"id": "agua", "text": "agua " * 30 + "Ayuda para el recibo del agua",
+     "metadata": {"tipo": "suministros", "provincia": "Cáceres"}},
+    {"id": "luz", "text": "luz " * 40 + "Ayuda para el recibo de la luz",
+     "metadata": {"tipo": "suministros", "provincia": "Badajoz"}},
+]
+
+
+def test_tokenize_normalizes_and_drops_stopwords():
+    """Minúsculas, sin tildes y sin palabras vacías."""
+    assert tokenize("Cuantía de la AYUDA para la Rehabilitación, año 2025") == ["rehabilitacion", "ano", "2025"]
+    assert tokenize("de la y a") == []
+
+
+def test_bm25_ranks_rare_terms_and_prefilters(tmp_path):
+    """El término raro decide el orden, el filtro se aplica antes y el índice persiste."""
+    index = BM25Index(tmp_path / "bm25.json")
+    index.upsert([f["id"] for f in FICHAS], [f["text"] for f in FICHAS], [f["metadata"] for f in FICHAS])
+
+    results = index.search("recibo de teleasistencia", n=3)
+    assert results[0][0] == "tele"
+    assert {ficha_id for ficha_id, _ in results} == {"tele", "agua", "luz"}
+    assert [r[0] for r in index.search("recibo", n=3, where={"provincia": "Badajoz"})] == ["luz"]
+    assert index.search("vivienda", n=3) == []
+
+    # Los cambios solo se escriben a disco con flush()
+    assert not (tmp_path / "bm25.json").exists()
+    index.flush()
+    reopened = BM25Index(tmp_path / "bm25.json")
+    reopened.delete(["tele"])
+    assert len(reopened) == 2
+    assert reopened.search("teleasistencia", n=3) == []
+    assert len(BM25Index(tmp_path / "bm25.json")) == 3
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    """Un documento bien situado en ambos rankings supera a los que solo están en uno."""
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert fused[0][0] == "b"
+    assert [item for item, _ in fused] == ["b", "a", "d", "c"]
+
@@ -0,0 +1,103 @@
+"""
+Tests para los backends de embeddings (ONNX sin torch).
+"""
+
+import subprocess
+import sys
+
+import numpy as np
+import onnxruntime
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+from app.core.embedding_backends import (
+    ONNX_INT8_MODEL_FILE,
+    ONNX_MODEL_FILE,
+    OnnxEmbeddingModel,
+    mean_pooling,
+)
+
+
+VOCAB = {"[PAD]": 0, "[UNK]": 1, "ayuda": 2, "social": 3, "vivienda": 4, "mayores": 5}
+TABLE = np.random.default_rng(0).normal(size=(len(VOCAB), 6)).astype(np.float32)
+
+
+def expected(text: str) -> np.ndarray:
+    """Embedding de referencia: media de las filas de los tokens, normalizada."""
+    ids = [VOCAB.get(word, 1) for word in text.split()]
+    vector = TABLE[ids].mean(axis=0)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeInput:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeSession:
+    """Sesión de onnxruntime que devuelve la fila de TABLE de cada token."""
+
+    paths = []
+
+    def __init__(self, path, sess_options=None, providers=None):
+        FakeSession.paths.append(path)
+
+    def get_inputs(self):
+        return [FakeInput("input_ids"), FakeInput("attention_mask")]
+
+    def run(self, output_names, feeds):
+        assert set(feeds) == {"input_ids", "attention_mask"}
+        return [TABLE[feeds["input_ids"]]]
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    """Directorio de modelo exportado con un tokenizer real y una sesión falsa."""
+    tokenizer = Tokenizer(models.WordLevel(VOCAB, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+    (tmp_path / ONNX_MODEL_FILE).write_bytes(b"")
+    monkeypatch.setattr(onnxruntime, "InferenceSession", FakeSession)
+    return tmp_path
+
+
+def test_mean_pooling_ignores_padding():
+    """Los tokens de relleno no cuentan en la media."""
+    hidden = np.array([[[1.0, 0.0], [0.0, 1.0], [9.0, 9.0]]])
+    mask = np.array([[1, 1, 0]])
+
+    np.testing.assert_allclose(mean_pooling(hidden, mask), [[np.sqrt(0.5), np.sqrt(0.5)]])
+
+
+def test_onnx_model_encodes_in_input_order(model_dir):
+    """Los lotes se ordenan por longitud pero el resultado respeta el orden de entrada."""
+    model = OnnxEmbeddingModel(model_dir, quantized=True, batch_size=2)
+    texts = ["ayuda social vivienda mayores", "ayuda", "vivienda desconocida", "social mayores"]
+
+    vectors = model.encode(texts)
+
+    assert vectors.shape == (4, 6)
+    for text, vector in zip(texts, vectors):
+        np.testing.assert_allclose(vector, expected(text), rtol=1e-5)
+    assert model.encode("ayuda social").shape == (6,)
+    # Sin model_int8.onnx se usa el modelo completo
+    assert model.embedding_id.endswith("+onnx-model")
+
+
+def test_quantized_model_preferred_when_present(model_dir):
+    """Con EMBEDDING_ONNX_QUANTIZED se carga model_int8.onnx si existe."""
+    (model_dir / ONNX_INT8_MODEL_FILE).write_bytes(b"")
+
+    assert OnnxEmbeddingModel(model_dir, quantized=True).model_path.name == ONNX_INT8_MODEL_FILE
+    assert OnnxEmbeddingModel(model_dir, quantized=False).model_path.name == ONNX_MODEL_FILE
+    with pytest.raises(FileNotFoundError):
+        OnnxEmbeddingModel(model_dir / "no-existe")
+
+
+def test_rag_imports_do_not_load_torch():
+    """El sistema RAG y el backend ONNX se importan sin cargar torch."""
+    code = (
+        "import sys; import app.core.rag_system, app.core.embedding_backends; "
+        "sys.exit('torch' in sys.modules or 'sentence_transformers' in sys.modules)"
+    )
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
@@ -0,0 +1,74 @@
+"""
+Tests para la caché de embeddings en memoria y disco.
+"""
+
+import numpy as np
+
+from app.core.embedding_cache import EmbeddingCache, text_key
+
+
+class CountingEncoder:
+    """Encoder determinista que registra los lotes recibidos."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[len(t), t.count("a"), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_encode_only_computes_misses_in_one_batch():
+    """Los textos ya vistos (y los repetidos) no se vuelven a codificar."""
+    cache = EmbeddingCache(None, "model")
+    encoder = CountingEncoder()
+
+    first = cache.encode(["uno", "dos"], encoder)
+    second = cache.encode(["dos", "tres", "tres", "uno "], encoder)
+
+    assert encoder.batches == [["uno", "dos"], ["tres"]]
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_array_equal(second[3], first[0])  # Texto normalizado
+    assert text_key("a  b\n") == text_key("a b")
+    assert cache.stats()["memory_hits"] == 2
+
+
+def test_memory_tier_is_bounded_lru():
+    """El LRU expulsa el menos usado al superar su capacidad."""
+    cache = EmbeddingCache(None, "model", max_memory_items=2)
+    encoder = CountingEncoder()
+    cache.encode(["a", "b"], encoder)
+    cache.get("a")
+    cache.encode(["c"], encoder)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["memory_items"] == 2
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Una instancia nueva lee los vectores del disco con memory-map."""
+    encoder = CountingEncoder()
+    EmbeddingCache(str(tmp_path), "model").encode(["uno", "dos"], encoder)
+
+    cache = EmbeddingCache(str(tmp_path), "model", max_memory_items=10)
+    vectors = cache.encode(["dos", "uno"], encoder)
+
+    assert len(encoder.batches) == 1
+    np.testing.assert_array_equal(vectors[0], [3, 0, 1])
+    stats = cache.stats()
+    assert stats["disk_hits"] == 2 and stats["hit_rate"] == 1.0
+
+
+def test_model_change_and_shared_directory(tmp_path):
+    """Otro modelo no reutiliza vectores; otra instancia del mismo modelo sí ve lo anexado."""
+    encoder = CountingEncoder()
+    reader = EmbeddingCache(str(tmp_path), "model")
+    writer = EmbeddingCache(str(tmp_path), "model")
+    writer.encode(["uno"], encoder)
+    reader.encode(["cero"], encoder)
+    writer.encode(["dos"], encoder)
+
+    assert reader.get("dos") is not None
+    assert EmbeddingCache(str(tmp_path), "other/model").get("uno") is None
+    assert len(EmbeddingCache(str(tmp_path), "model")) == 3
@@ -0,0 +1,107 @@
+"""
+Tests para el escáner de entidades.
+"""
+
+import pytest
+from datetime import date
+from app.core.entity_scanner import EntityScanner, parse_fecha
+from app.utils.helpers import extract_email, extract_phone, parse_spanish_date
+
+
+@pytest.fixture
+def scanner():
+    """Fixture del escáner."""
+    return EntityScanner()
+
+
+def _by_tipo(entities, tipo):
+    return [e for e in entities if e["tipo"] == tipo]
+
+
+def test_scan_boletin_con_numero_y_fecha(scanner):
+    """Detecta referencia de boletín con número y fecha."""
+    text = "publicadas en el BOP n.º 78, de fecha 8 de febrero de 2022, y en el BOE núm. 12, 14/01/2025."
+    boletines = _by_tipo(scanner.scan(text), "boletin")
+
+    assert len(boletines) == 2
+    assert boletines[0]["valor"]["numero"] == "78"
+    assert boletines[0]["valor"]["fecha"] == date(2022, 2, 8)
+    assert boletines[1]["valor"]["tipo"] == "BOE"
+    assert boletines[1]["valor"]["fecha"] == date(2025, 1, 14)
+
+
+def test_scan_bdns(scanner):
+    """Detecta identificadores BDNS."""
+    entities = scanner.scan("Extracto. BDNS (Identif.): 831276. Otro texto.")
+    bdns = _by_tipo(entities, "bdns")
+
+    assert len(bdns) == 1
+    assert bdns[0]["valor"]["numero"] == "831276"
+
+
+def test_scan_importes_e_indicadores(scanner):
+    """Distingue importes de múltiplos de IPREM."""
+    text = "Hasta 1.200,50 € (1,25 veces el IPREM) o un 70% del IPREM, mínimo 300 euros."
+    entities = scanner.scan(text)
+
+    assert [e["valor"] for e in _by_tipo(entities, "importe")] == [1200.5, 300.0]
+    indicadores = [e["valor"] for e in _by_tipo(entities, "indicador")]
+    assert indicadores == [
+        {"indicador": "IPREM", "multiplo": 1.25},
+        {"indicador": "IPREM", "multiplo": 0.7},
+    ]
+
+
+def test_scan_contactos(scanner):
+    """Detecta emails y teléfonos."""
+    text = "Contacto: servicios.sociales@ayto.es o en el teléfono 944 020 200."
+    entities = scanner.scan(text)
+
+    assert _by_tipo(entities, "email")[0]["valor"] == "servicios.sociales@ayto.es"
+    assert _by_tipo(entities, "telefono")[0]["valor"] == "944020200"
+
+
+def test_scan_offsets(scanner):
+    """Los offsets apuntan al texto original."""
+    text = "Plazo hasta el 31/12/2025 inclusive."
+    fecha = scanner.scan(text)[0]
+
+    assert text[fecha["inicio"]:fecha["fin"]] == "31/12/2025"
+    assert fecha["valor"] == date(2025, 12, 31)
+
+
+def test_suggest_fecha_publicacion(scanner):
+    """Sugiere fecha de publicación desde el boletín."""
+    entities = scanner.scan("BOP Madrid núm. 45, 15/01/2025")
+
+    assert scanner.suggest_fields(entities) == {"fecha_publicacion": date(2025, 1, 15)}
+
+
+def test_build_hints_marca_citas_completas(scanner):
+    """Solo las referencias con todos los datos que pide validate_boletin_format se marcan como completas."""
+    hints = scanner.build_hints(scanner.scan("BOP Madrid núm. 45, 15/01/2025. Ver también el BOE núm. 12."))
+
+    assert "BOP (Madrid) núm. 45, 15/01/2025 [cita completa]" in hints
+    assert "BOE núm. 12" in hints and "BOE núm. 12 [cita completa]" not in hints
+
+
+def test_build_hints_vacio(scanner):
+    """Sin entidades no hay bloque de pistas."""
+    assert scanner.build_hints([]) == ""
+
+
+def test_parse_fecha_invalida():
+    """Fechas imposibles devuelven None."""
+    assert parse_fecha("31/02/2025") is None
+    assert parse_fecha("1 de mayo 2025") == date(2025, 5, 1)
+
+
+def test_scanner_and_helpers_agree(scanner):
+    """El escáner y las utilidades de app.utils reconocen las mismas fechas y contactos."""
+    text = "Registro: registro@dipbadajoz.es, tel. 924 212 400. Plazo: 1 de setiembre de 2025. Ref. 123456789012."
+    entities = scanner.scan(text)
+
+    assert [e["texto"] for e in _by_tipo(entities, "email")] == extract_email(text)
+    assert [e["texto"] for e in _by_tipo(entities, "telefono")] == extract_phone(text) == ["924 212 400"]
+    assert parse_spanish_date("15/01/2025").date() == parse_fecha("15/01/2025") == date(2025, 1, 15)
+    assert _by_tipo(entities, "fecha")[0]["valor"] == date(2025, 9, 1)
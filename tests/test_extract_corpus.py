@@ -0,0 +1,115 @@
+"""
+Tests para la extracción masiva del corpus (checkpoints y Parquet).
+"""
+
+import json
+import pytest
+import pymupdf
+
+from scripts import extract_corpus as corpus
+from scripts.extract_corpus import DOCUMENTS_FILE, PAGES_FILE, extract_corpus, extract_document, write_parquet
+
+
+def make_pdf(path, pages):
+    """Crea un PDF con una línea de texto por página."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = pymupdf.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Dataset pequeño con tres PDFs en dos carpetas."""
+    root = tmp_path / "dataset"
+    make_pdf(root / "Badajoz" / "agua.pdf", ["Ayuda para el recibo del agua", "Requisitos"])
+    make_pdf(root / "Badajoz" / "luz.pdf", ["Ayuda para el recibo de la luz"])
+    make_pdf(root / "Cáceres" / "teleasistencia.pdf", ["Servicio de teleasistencia", "Cuantía", "Plazo"])
+    return root
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_extract_document_opens_pdf_once(dataset, monkeypatch):
+    """Páginas, metadatos y tablas salen de una sola apertura de PyMuPDF y una lectura del fichero."""
+    opened = []
+    real_open = pymupdf.open
+    monkeypatch.setattr(pymupdf, "open", lambda *args, **kwargs: opened.append(args or kwargs) or real_open(*args, **kwargs))
+    monkeypatch.setattr(corpus, "_extractor", None)
+
+    result = extract_document(str(dataset / "Cáceres" / "teleasistencia.pdf"), str(dataset), "tele", True)
+
+    assert len(opened) == 1
+    assert result["document"]["pages"] == 3
+    assert result["document"]["metadata"]["pages"] == 3
+    assert "teleasistencia" in result["document"]["text"]
+
+
+def test_resume_after_interruption(dataset, tmp_path):
+    """Tras una interrupción solo se extraen los pendientes y el Parquet no duplica filas."""
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    output = tmp_path / "corpus"
+    stats = extract_corpus(dataset, output, workers=1, include_tables=False)
+    assert stats["documents"] == 3
+
+    # Interrupción: queda un documento confirmado, la línea del siguiente
+    # truncada y sus páginas escritas sin checkpoint
+    documents = (output / DOCUMENTS_FILE).read_text(encoding="utf-8").splitlines()
+    (output / DOCUMENTS_FILE).write_text(documents[0] + "\n" + documents[1][:40], encoding="utf-8")
+
+    resumed = extract_corpus(dataset, output, workers=1, include_tables=False)
+    assert resumed["documents"] == 2
+    assert extract_corpus(dataset, output, workers=1, include_tables=False)["documents"] == 0
+
+    assert write_parquet(output)
+    table = pq.read_table(output / "documents.parquet").to_pylist()
+    assert sorted(row["filename"] for row in table) == ["agua.pdf", "luz.pdf", "teleasistencia.pdf"]
+    assert isinstance(json.loads(table[0]["metadata"]), dict)
+
+    # pages.jsonl tiene las páginas repetidas de la ejecución interrumpida
+    assert len(read_jsonl(output / PAGES_FILE)) > 6
+    pages = pq.read_table(output / "pages.parquet").to_pylist()
+    assert len(pages) == 6
+    assert len({(row["doc_id"], row["page"]) for row in pages}) == 6
+
+
+def test_modified_pdf_replaces_previous_version(dataset, tmp_path):
+    """Un PDF modificado se vuelve a extraer y el Parquet solo conserva su versión nueva."""
+    pytest.importorskip("pyarrow")
+    import os
+    import pyarrow.parquet as pq
+
+    output = tmp_path / "corpus"
+    extract_corpus(dataset, output, workers=1, include_tables=False)
+
+    agua = make_pdf(dataset / "Badajoz" / "agua.pdf", ["Ayuda para el recibo del agua", "Requisitos", "Plazo"])
+    stat = agua.stat()
+    os.utime(agua, (stat.st_atime, stat.st_mtime + 10))
+
+    assert extract_corpus(dataset, output, workers=1, include_tables=False)["documents"] == 1
+    assert len(read_jsonl(output / DOCUMENTS_FILE)) == 4
+
+    assert write_parquet(output)
+    documents = pq.read_table(output / "documents.parquet").to_pylist()
+    assert sorted((row["filename"], row["pages"]) for row in documents) == [
+        ("agua.pdf", 3), ("luz.pdf", 1), ("teleasistencia.pdf", 3)
+    ]
+    assert len(pq.read_table(output / "pages.parquet")) == 7
+
+
+def test_restart_discards_checkpoint(dataset, tmp_path):
+    """Con restart se vuelve a extraer todo el dataset."""
+    output = tmp_path / "corpus"
+    extract_corpus(dataset, output, workers=1, include_tables=False)
+
+    stats = extract_corpus(dataset, output, workers=1, include_tables=False, restart=True)
+
+    assert stats["documents"] == 3
+    assert len(read_jsonl(output / DOCUMENTS_FILE)) == 3
@@ -0,0 +1,98 @@
+"""
+Tests para la reparación de fichas a nivel de campo.
+"""
+
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.config import settings
+from app.core.ficha_repair import build_repair_prompt, document_excerpt, load_json_fields, split_valid_fields
+
+
+DOCUMENTO = (
+    "BASES REGULADORAS. " + "Texto general de la convocatoria. " * 200
+    + "Artículo 4. Requisitos. Los solicitantes deberán estar empadronados. "
+    + "Disposiciones finales. " * 200
+)
+
+
+def test_split_valid_fields(ficha):
+    """Solo se marcan los campos inválidos o ausentes."""
+    data = dict(ficha, plazo_presentacion="Hasta fin de año")
+    del data["beneficiarios"]
+
+    valid, errors = split_valid_fields(data)
+
+    assert set(errors) == {"plazo_presentacion", "beneficiarios"}
+    assert "requisitos_acceso" in valid
+
+
+def test_load_json_fields_recovers_truncated_output(ficha):
+    """De un JSON truncado se conservan los campos cerrados."""
+    text = json.dumps(ficha, ensure_ascii=False)
+    truncated = text[: text.index('"descripcion"') + 20]
+
+    data = load_json_fields(truncated)
+
+    assert data["nombre_ayuda"] == ficha["nombre_ayuda"]
+    assert "descripcion" not in data
+
+
+def test_document_excerpt_targets_field():
+    """El extracto se centra en la sección del campo."""
+    excerpt = document_excerpt(DOCUMENTO, ["requisitos_acceso"])
+
+    assert "empadronados" in excerpt
+    assert len(excerpt) < len(DOCUMENTO) / 4
+
+
+def test_repair_prompt_is_small(ficha):
+    """El prompt de reparación incluye solo los campos fallidos."""
+    prompt = build_repair_prompt({"requisitos_acceso": "Debe iniciar con la fórmula"}, ficha, DOCUMENTO)
+
+    assert "## Campo: requisitos_acceso" in prompt
+    assert "## Campo: beneficiarios" not in prompt
+    assert len(prompt) < len(DOCUMENTO) / 4
+
+
+def test_generate_repairs_only_failing_fields(processor, ficha):
+    """Una ficha con un campo inválido se repara sin regenerarla entera."""
+    bad = dict(ficha, plazo_presentacion="Hasta el 31/12/2025")
+    fix = {"plazo_presentacion": "El plazo permanecerá abierto hasta 31/12/2025", "nombre_ayuda": "Otro"}
+    processor.llm = FakeListChatModel(responses=[json.dumps(bad, ensure_ascii=False), json.dumps(fix)])
+
+    result = processor.generate_ficha(DOCUMENTO, use_rag=False)
+
+    assert result["ficha"].plazo_presentacion == fix["plazo_presentacion"]
+    assert result["ficha"].nombre_ayuda == ficha["nombre_ayuda"]
+    assert result["metadata"]["repaired_fields"] == ["plazo_presentacion"]
+    assert result["metadata"]["repair_rounds"] == 1
+
+
+def test_repair_disabled_raises(monkeypatch, processor, ficha):
+    """Sin rondas de reparación el error de parseo se propaga."""
+    monkeypatch.setattr(settings, "LLM_REPAIR_MAX_ROUNDS", 0)
+    bad = dict(ficha, plazo_presentacion="Hasta el 31/12/2025")
+    processor.llm = FakeListChatModel(responses=[json.dumps(bad, ensure_ascii=False)])
+
+    with pytest.raises(ValueError):
+        processor.generate_ficha(DOCUMENTO, use_rag=False)
+
+
+def test_repair_sends_only_failing_field_schema(monkeypatch, processor, ficha):
+    """La ronda de reparación no reenvía el schema completo ni el ejemplo."""
+    bad = dict(ficha, plazo_presentacion="Hasta el 31/12/2025")
+    fix = {"plazo_presentacion": "El plazo permanecerá abierto hasta 31/12/2025"}
+    processor.llm = FakeListChatModel(responses=[json.dumps(bad, ensure_ascii=False), json.dumps(fix)])
+    build_messages = processor._build_messages
+    sent = []
+    monkeypatch.setattr(processor, "_build_messages", lambda *args: sent.append(build_messages(*args)) or sent[-1])
+
+    processor.generate_ficha(DOCUMENTO, use_rag=False)
+
+    full, repair = (messages[0].content for messages in sent)
+    assert isinstance(repair, str)
+    assert "plazo_presentacion" in repair and "beneficiarios" not in repair
+    assert "# EJEMPLO DE SALIDA" not in repair
+    assert len(repair) < len(full[0]["text"]) / 2
@@ -0,0 +1,60 @@
+"""
+Tests para la extracción de secciones de las fichas de referencia.
+"""
+
+from docx import Document
+
+from app.core.ficha_sections import extract_sections, field_for_label, fit_snippets
+
+
+def make_docx(path, rows):
+    """Crea una ficha .docx con párrafos de cabecera y la tabla CAMPO / CONCEPTO."""
+    document = Document()
+    document.add_paragraph("USUARIO: PRUEBA")
+    table = document.add_table(rows=0, cols=2)
+    for label, value in [("CAMPO", "CONCEPTO"), *rows]:
+        cells = table.add_row().cells
+        cells[0].text, cells[1].text = label, value
+    document.save(path)
+    return path
+
+
+def test_labels_map_to_ficha_fields():
+    """Las etiquetas de la tabla se normalizan (tildes, mayúsculas, segunda línea)."""
+    assert field_for_label("Denominación normativa\nNombre de la ayuda") == "nombre_ayuda"
+    assert field_for_label("CUANTÍA") == "cuantia"
+    assert field_for_label("Objeto/Objetivos/Finalidad\nDescripción") == "descripcion"
+    assert field_for_label("Costes NO subvencionables") == "costes_no_subvencionables"
+    assert field_for_label("Publicación normativa") is None
+    assert field_for_label("CAMPO") is None
+
+
+def test_extract_sections_from_table(tmp_path):
+    """Cada fila con etiqueta conocida y valor es una sección; se quitan líneas en blanco."""
+    path = make_docx(tmp_path / "ficha.docx", [
+        ("Cuantía", "Hasta 1.200 euros por unidad de convivencia.\n\n- 50% de los gastos generales."),
+        ("Importe máximo", "1.200 euros"),
+        ("Costes NO subvencionables", ""),
+        ("Publicación normativa", "Véase el apartado Normativa"),
+        ("Documentos a presentar", "- DNI\n- Libro de familia"),
+    ])
+
+    sections = extract_sections(path)
+    assert sections == {
+        "cuantia": "Hasta 1.200 euros por unidad de convivencia.\n- 50% de los gastos generales.",
+        "importe_maximo": "1.200 euros",
+        "documentos_presentar": "- DNI\n- Libro de familia",
+    }
+    assert extract_sections(tmp_path / "no_existe.docx") == {}
+
+
+def test_fit_snippets_shares_budget():
+    """Los fragmentos cortos caben enteros y el resto del presupuesto va a los largos."""
+    snippets = {"cuantia": "palabra " * 100, "importe_maximo": "1.200 euros", "documentos_presentar": "dni " * 100}
+    fitted = fit_snippets(snippets, 200)
+
+    assert list(fitted) == list(snippets)
+    assert fitted["importe_maximo"] == "1.200 euros"
+    assert sum(len(text) for text in fitted.values()) <= 200
+    assert fitted["cuantia"].endswith("palabra…")
+    assert fit_snippets(snippets, 0) == {}
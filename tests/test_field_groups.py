@@ -0,0 +1,73 @@
+"""
+Tests para la generación por grupos de campos en paralelo.
+"""
+
+import json
+import time
+import asyncio
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from app.config import settings
+from app.core.field_groups import FIELD_GROUPS, group_example
+from app.models.ficha_schema import FichaData
+
+
+GROUP_DELAY = 0.3
+
+
+class GroupFakeChatModel(FakeListChatModel):
+    """LLM simulado que responde con el ejemplo del grupo pedido."""
+
+    def _group(self, messages) -> str:
+        prompt = messages[-1].content
+        return next(group for group in FIELD_GROUPS if json.dumps(FIELD_GROUPS[group]) in prompt)
+
+    def invoke(self, messages, *args, **kwargs):
+        time.sleep(GROUP_DELAY)
+        return AIMessage(content=json.dumps(group_example(self._group(messages)), ensure_ascii=False))
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        await asyncio.sleep(GROUP_DELAY)
+        return AIMessage(content=json.dumps(group_example(self._group(messages)), ensure_ascii=False))
+
+
+@pytest.fixture
+def processor(processor, monkeypatch):
+    """Procesador con generación por grupos activada."""
+    monkeypatch.setattr(settings, "ENABLE_PARALLEL_GROUPS", True)
+    processor.llm = GroupFakeChatModel(responses=["{}"])
+    return processor
+
+
+def test_groups_cover_schema():
+    """Cada campo de FichaData pertenece a exactamente un grupo."""
+    fields = [name for group in FIELD_GROUPS.values() for name in group]
+
+    assert sorted(fields) == sorted(FichaData.model_fields)
+
+
+def test_group_prefix_is_smaller(processor):
+    """El sub-schema de un grupo reduce el prefijo estático."""
+    assert len(processor._get_static_prefix("cuantia")) < len(processor._get_static_prefix()) / 2
+
+
+def test_agenerate_groups_concurrently(processor):
+    """La latencia total se aproxima a la del grupo más lento."""
+    start = time.monotonic()
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+    elapsed = time.monotonic() - start
+
+    assert isinstance(result["ficha"], FichaData)
+    assert set(result["metadata"]["group_latencies"]) == set(FIELD_GROUPS)
+    assert elapsed < GROUP_DELAY * len(FIELD_GROUPS) / 2
+
+
+def test_generate_groups_with_threads(processor):
+    """La ruta síncrona también genera los grupos en paralelo."""
+    start = time.monotonic()
+    result = processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)
+
+    assert result["ficha"].cuantia == FichaData.model_config["json_schema_extra"]["example"]["cuantia"]
+    assert time.monotonic() - start < GROUP_DELAY * len(FIELD_GROUPS) / 2
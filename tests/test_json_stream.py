@@ -0,0 +1,73 @@
+"""
+Tests para el parser JSON incremental y la generación en streaming.
+"""
+
+import json
+import asyncio
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.config import settings
+from app.core.json_stream import FieldViolation, IncrementalJSONParser, validate_field
+from app.models.ficha_schema import FichaData
+
+
+def test_parser_emits_fields_as_they_close():
+    """Cada campo de primer nivel se emite al cerrarse su valor."""
+    parser = IncrementalJSONParser()
+    text = '```json\n{"a": "x, {y}", "b": [1, {"c": 2}], "d": null}\n```'
+
+    emitted = []
+    for ch in text:
+        emitted.extend(parser.feed(ch))
+
+    assert emitted == [("a", "x, {y}"), ("b", [1, {"c": 2}]), ("d", None)]
+    assert parser.done
+
+
+def test_parser_handles_escaped_quotes():
+    """Las comillas escapadas no cierran la cadena."""
+    parser = IncrementalJSONParser()
+    emitted = parser.feed('{"a": "dice \\"hola\\", adiós"}')
+
+    assert emitted == [("a", 'dice "hola", adiós')]
+
+
+def test_validate_field_rejects_mandatory_prefix():
+    """El validador de fórmula obligatoria se aplica por campo."""
+    with pytest.raises(FieldViolation) as exc:
+        validate_field(FichaData, "plazo_presentacion", "Hasta el 31/12/2025")
+
+    assert exc.value.field == "plazo_presentacion"
+    assert validate_field(FichaData, "portales", ["Salud", "Mayores"]) == ["Mayores", "Salud"]
+
+
+def test_stream_aborts_and_reprompts(processor, ficha, ficha_json):
+    """Una violación aborta el streaming y se vuelve a pedir la ficha."""
+    bad_json = json.dumps(dict(ficha, plazo_presentacion="Hasta el 31/12/2025"), ensure_ascii=False)
+    processor.llm = FakeListChatModel(responses=[bad_json, ficha_json])
+    fields = []
+
+    result = processor.generate_ficha(
+        "BOP Madrid núm. 45, 15/01/2025. " * 10,
+        use_rag=False,
+        on_field=lambda name, value: fields.append(name),
+    )
+
+    aborts = result["metadata"]["stream_aborts"]
+    assert len(aborts) == 1
+    assert aborts[0]["campo"] == "plazo_presentacion"
+    assert aborts[0]["chars_generados"] < len(bad_json)
+    assert result["ficha"].plazo_presentacion == ficha["plazo_presentacion"]
+    assert "otros_datos" in fields
+
+
+def test_astream_gives_up_after_max_reprompts(monkeypatch, processor, ficha):
+    """Si la violación persiste se propaga tras los reintentos."""
+    monkeypatch.setattr(settings, "ENABLE_STREAMING", True)
+    monkeypatch.setattr(settings, "LLM_STREAM_MAX_REPROMPTS", 1)
+    bad_json = json.dumps(dict(ficha, requisitos_acceso="Requisitos: ninguno"), ensure_ascii=False)
+    processor.llm = FakeListChatModel(responses=[bad_json])
+
+    with pytest.raises(FieldViolation):
+        asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
@@ -0,0 +1,143 @@
+"""
+Tests para el procesador LLM (sin llamadas reales a proveedores).
+"""
+
+import asyncio
+from langchain_core.messages import AIMessage
+
+from app.config import settings
+from app.core.llm_processor import LLMProcessor
+from app.core.http_clients import get_async_http_client, use_shared_anthropic_client
+from app.models.ficha_schema import FichaData
+
+
+def test_static_prefix_compiled_once(processor):
+    """El prefijo estático se reutiliza entre instancias."""
+    first = processor._get_static_prefix()
+    other = LLMProcessor(provider="anthropic")
+
+    assert other._get_static_prefix() is first
+    assert "SCHEMA DE SALIDA" in first
+
+
+def test_anthropic_messages_use_cache_control(processor):
+    """El bloque de sistema se marca como cacheable en Anthropic."""
+    messages = processor._build_messages("documento")
+
+    block = messages[0].content[0]
+    assert block["cache_control"] == {"type": "ephemeral"}
+    assert block["text"] == processor._get_static_prefix()
+    assert messages[1].content == "documento"
+
+
+def test_caching_disabled_sends_plain_system(processor, monkeypatch):
+    """Sin caché el sistema va como texto plano."""
+    monkeypatch.setattr(settings, "ENABLE_PROMPT_CACHING", False)
+    messages = processor._build_messages("documento")
+
+    assert isinstance(messages[0].content, str)
+
+
+def test_extract_usage_with_cache():
+    """Se leen los tokens de caché del usage_metadata."""
+    message = AIMessage(
+        content="{}",
+        usage_metadata={
+            "input_tokens": 1200,
+            "output_tokens": 300,
+            "total_tokens": 1500,
+            "input_token_details": {"cache_read": 1000, "cache_creation": 0},
+        },
+    )
+
+    usage = LLMProcessor._extract_usage(message)
+
+    assert usage == {
+        "input_tokens": 1200,
+        "output_tokens": 300,
+        "cache_read_tokens": 1000,
+        "cache_creation_tokens": 0,
+    }
+
+
+def test_generate_ficha_with_fake_llm(processor):
+    """Generación completa con un LLM simulado."""
+    result = processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)
+
+    assert isinstance(result["ficha"], FichaData)
+    assert result["metadata"]["instructions_version"] == processor.instructions_version
+    assert "cache_read_tokens" in result["metadata"]
+
+
+def test_agenerate_ficha_with_fake_llm(processor):
+    """La ruta asíncrona produce el mismo resultado."""
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+
+    assert isinstance(result["ficha"], FichaData)
+    assert result["metadata"]["provider"] == "anthropic"
+
+
+class FakeRAG:
+    """RAG con una ficha de ejemplo larga y secciones por campo."""
+
+    def retrieve_similar(self, query, k=3):
+        return [{"text": "USUARIO: EJEMPLO\n" + "Cabecera de la ficha. " * 100}]
+
+    def retrieve_field_examples(self, query, fields):
+        return {field: {"text": f"Texto de {field}. " + "detalle " * 400} for field in fields}
+
+
+def test_field_examples_replace_truncated_fichas(processor, monkeypatch):
+    """Con ejemplos por campo cada ficha aporta solo su inicio y los fragmentos respetan el presupuesto."""
+    monkeypatch.setattr(settings, "RAG_FIELD_EXAMPLE_FIELDS", "cuantia,documentos_presentar")
+    monkeypatch.setattr(settings, "RAG_FIELD_EXAMPLE_TOKENS", 200)
+    processor.rag_system = FakeRAG()
+
+    prepared = processor._prepare_generation("documento")
+    prompt = prepared["user_prompt"]
+    examples = prompt.split("# EJEMPLOS POR CAMPO")[1].split("# INSTRUCCIONES")[0]
+    assert "## cuantia\n\nTexto de cuantia." in examples
+    assert "## documentos_presentar\n" in examples
+    assert len(examples) < 200 * 4 + 200
+    assert prompt.count("Cabecera de la ficha.") < 20
+
+    monkeypatch.setattr(settings, "RAG_FIELD_EXAMPLES", False)
+    plain = processor._prepare_generation("documento")["user_prompt"]
+    assert "# EJEMPLOS POR CAMPO" not in plain
+    assert plain.count("Cabecera de la ficha.") > 60
+
+
+def test_anthropic_uses_shared_http_client(api_key):
+    """El cliente asíncrono de Anthropic usa el pool HTTP compartido."""
+    llm = LLMProcessor(provider="anthropic").llm
+    assert llm._async_client._client is get_async_http_client("anthropic")
+
+
+def test_shared_client_injection_supported(api_key):
+    """La versión instalada de langchain-anthropic admite la inyección; si una actualización la rompe, falla aquí."""
+    assert use_shared_anthropic_client(LLMProcessor(provider="anthropic").llm) is True
+
+
+def test_shared_client_injection_guard(monkeypatch, api_key):
+    """En una versión no comprobada no se toca el cliente de LangChain."""
+    monkeypatch.setattr("app.core.http_clients.ANTHROPIC_INJECTION_VERSIONS", ("9.9.",))
+    llm = LLMProcessor(provider="anthropic").llm
+    llm.__dict__.pop("_async_client", None)
+
+    assert use_shared_anthropic_client(llm) is False
+    assert llm._async_client._client is not get_async_http_client("anthropic")
+
+
+def test_shared_http_client_works_across_event_loops():
+    """El cliente compartido sirve a varios bucles de eventos (p. ej. asyncio.run sucesivos)."""
+    from scripts.mock_llm_server import create_app, run_in_thread
+
+    server, port = run_in_thread(create_app(latency=0))
+    client = get_async_http_client("openai")
+    try:
+        statuses = [asyncio.run(client.get(f"http://127.0.0.1:{port}/v1/batches")).status_code for _ in range(3)]
+    finally:
+        server.should_exit = True
+
+    assert statuses == [200, 200, 200]
+    assert get_async_http_client("openai") is client
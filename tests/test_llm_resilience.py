@@ -0,0 +1,354 @@
+"""
+Tests para las políticas de resiliencia de llamadas LLM.
+"""
+
+import json
+import time
+import asyncio
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.config import settings
+from app.core.json_stream import FieldViolation
+from app.core.llm_processor import LLMProcessor
+from app.core.llm_resilience import LatencyTracker, hedged, is_retryable, retry_async, retry_sync
+from scripts.mock_llm_server import create_app, run_in_thread
+
+
+class FakeStatusError(Exception):
+    """Error de proveedor con código HTTP."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    """LLM simulado con latencia asíncrona configurable."""
+
+    delay: float = 0.0
+
+    async def ainvoke(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return await super().ainvoke(*args, **kwargs)
+
+
+class LateStartFakeChatModel(FakeListChatModel):
+    """LLM simulado que tarda en emitir el primer token y luego transmite sin pausa."""
+
+    delay: float = 0.0
+
+    async def _astream(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+class FailingFakeChatModel(FakeListChatModel):
+    """LLM simulado siempre sobrecargado."""
+
+    def invoke(self, *args, **kwargs):
+        raise FakeStatusError(529)
+
+
+def test_is_retryable():
+    """Se reintentan 429/5xx y timeouts, no los errores de cliente."""
+    assert is_retryable(FakeStatusError(429))
+    assert is_retryable(FakeStatusError(529))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(FakeStatusError(400))
+    assert not is_retryable(ValueError("schema"))
+
+
+def test_retry_sync_recovers_from_transient_error():
+    """Un 429 transitorio se reintenta hasta obtener respuesta."""
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeStatusError(429)
+        return "ok"
+
+    result, attempts = retry_sync(call, max_retries=3, base_delay=0.001, max_delay=0.01)
+
+    assert result == "ok"
+    assert attempts == 3
+
+
+def test_retry_sync_does_not_retry_client_errors():
+    """Los errores no transitorios se propagan sin reintentar."""
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise FakeStatusError(400)
+
+    with pytest.raises(FakeStatusError):
+        retry_sync(call, max_retries=3, base_delay=0.001, max_delay=0.01)
+    assert len(calls) == 1
+
+
+def test_retry_async_respects_deadline():
+    """Una llamada bloqueada se corta al agotar el plazo."""
+
+    async def stalled():
+        await asyncio.sleep(10)
+
+    start = time.monotonic()
+    with pytest.raises((TimeoutError, asyncio.TimeoutError)):
+        asyncio.run(
+            retry_async(stalled, max_retries=2, base_delay=0.5, max_delay=1.0, deadline=time.monotonic() + 0.2)
+        )
+    assert time.monotonic() - start < 1.0
+
+
+def test_hedged_secondary_wins_when_primary_stalls():
+    """Si el primario se retrasa, responde el secundario."""
+
+    async def slow():
+        await asyncio.sleep(5)
+        return "primario"
+
+    async def fast():
+        return "secundario"
+
+    start = time.monotonic()
+    result, winner = asyncio.run(hedged(slow, fast, hedge_delay=0.05))
+
+    assert (result, winner) == ("secundario", "secondary")
+    assert time.monotonic() - start < 1.0
+
+
+def test_hedged_primary_without_hedge():
+    """Si el primario responde a tiempo no se lanza el secundario."""
+    launched = []
+
+    async def fast():
+        return "primario"
+
+    async def secondary():
+        launched.append(1)
+        return "secundario"
+
+    result, winner = asyncio.run(hedged(fast, secondary, hedge_delay=1.0))
+
+    assert winner == "primary"
+    assert not launched
+
+
+def test_hedged_skips_hedge_once_primary_streams():
+    """Un primario que ya ha emitido su primer token no se cubre aunque tarde en terminar."""
+    launched = []
+
+    async def secondary():
+        launched.append(1)
+        return "secundario"
+
+    async def run():
+        started = asyncio.Event()
+
+        async def streaming():
+            started.set()
+            await asyncio.sleep(0.2)
+            return "primario"
+
+        return await hedged(streaming, secondary, hedge_delay=0.05, primary_started=started)
+
+    result, winner = asyncio.run(run())
+
+    assert (result, winner) == ("primario", "primary")
+    assert not launched
+
+
+def test_hedged_propagates_fatal_errors():
+    """Un error fatal del primario se propaga sin lanzar el secundario."""
+    launched = []
+
+    async def violating():
+        raise FieldViolation("plazo_presentacion", "no empieza por la fórmula obligatoria")
+
+    async def secondary():
+        launched.append(1)
+        return "secundario"
+
+    with pytest.raises(FieldViolation):
+        asyncio.run(hedged(violating, secondary, hedge_delay=1.0, fatal=(FieldViolation,)))
+    assert not launched
+
+
+def test_hedged_fails_over_when_started_primary_drops():
+    """Si el primario ya emitía y luego falla, se lanza el secundario como failover."""
+
+    async def run():
+        started = asyncio.Event()
+
+        async def dropping():
+            started.set()
+            await asyncio.sleep(0.1)
+            raise FakeStatusError(529)
+
+        async def secondary():
+            return "secundario"
+
+        return await hedged(dropping, secondary, hedge_delay=0.05, primary_started=started)
+
+    assert asyncio.run(run()) == ("secundario", "secondary")
+
+
+def test_latency_tracker_percentile():
+    """El percentil solo se estima con muestras suficientes."""
+    tracker = LatencyTracker(min_samples=5)
+    for value in [0.1, 0.2, 0.3, 0.4]:
+        tracker.record(value)
+    assert tracker.percentile(0.9) is None
+
+    tracker.record(5.0)
+    assert tracker.percentile(0.9) == 5.0
+
+
+def test_processor_hedges_to_fallback(monkeypatch, api_key, ficha_json):
+    """Con hedging activo, un primario lento se cubre con el secundario."""
+    monkeypatch.setattr(settings, "ENABLE_LLM_HEDGING", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+
+    processor = LLMProcessor(provider="anthropic", model_name="modelo-hedge-test")
+    processor.llm = SlowFakeChatModel(responses=[ficha_json], delay=5.0)
+    processor.fallback = ("openai", "secundario", FakeListChatModel(responses=[ficha_json]))
+
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+
+    assert result["metadata"]["provider"] == "openai"
+    assert result["metadata"]["hedged"] is True
+    # La rama cancelada también cuenta, con el tiempo que llevaba esperando
+    assert min(LLMProcessor._latency_tracker("anthropic", "modelo-hedge-test").samples) >= 0.05
+
+
+def test_streaming_hedge_waits_on_ttft(monkeypatch, api_key, ficha_json):
+    """En streaming el retraso de cobertura se mide hasta el primer token, no hasta el final."""
+    monkeypatch.setattr(settings, "ENABLE_LLM_HEDGING", True)
+    monkeypatch.setattr(settings, "ENABLE_STREAMING", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+
+    processor = LLMProcessor(provider="anthropic", model_name="modelo-hedge-ttft")
+    processor.llm = FakeListChatModel(responses=[ficha_json], sleep=0.2 / len(ficha_json))
+    secondary = FakeListChatModel(responses=[ficha_json])
+    processor.fallback = ("openai", "secundario", secondary)
+
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+
+    assert result["metadata"]["provider"] == "anthropic"
+    assert result["metadata"]["hedged"] is False
+    assert result["metadata"]["llm_latency"] > 0.05
+    assert secondary.i == 0
+    assert LLMProcessor._latency_tracker("anthropic", "modelo-hedge-ttft", "ttft").samples
+
+
+def test_streaming_violation_reprompts_instead_of_hedging(monkeypatch, api_key, ficha, ficha_json):
+    """Una violación del schema del primario se corrige reprompteando, sin lanzar el secundario."""
+    monkeypatch.setattr(settings, "ENABLE_LLM_HEDGING", True)
+    monkeypatch.setattr(settings, "ENABLE_STREAMING", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 5.0)
+    bad = dict(ficha, plazo_presentacion="Hasta el 31/12/2025")
+
+    processor = LLMProcessor(provider="anthropic", model_name="modelo-hedge-reprompt")
+    processor.llm = FakeListChatModel(responses=[json.dumps(bad, ensure_ascii=False), ficha_json])
+    secondary = FakeListChatModel(responses=[ficha_json])
+    processor.fallback = ("openai", "secundario", secondary)
+
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+
+    assert result["metadata"]["provider"] == "anthropic"
+    assert [abort["campo"] for abort in result["metadata"]["stream_aborts"]] == ["plazo_presentacion"]
+    assert secondary.i == 0
+
+
+def test_processor_fails_over_on_error(monkeypatch, processor, ficha_json):
+    """Si el principal agota los reintentos se usa el secundario."""
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.001)
+    processor.llm = FailingFakeChatModel(responses=[ficha_json])
+    processor.fallback = ("openai", "secundario", FakeListChatModel(responses=[ficha_json]))
+
+    response, invocation = processor._invoke_llm("documento")
+
+    assert response.content == ficha_json
+    assert invocation["provider"] == "openai"
+
+
+def test_streaming_hedge_delivers_only_winner_fields(monkeypatch, api_key, ficha, ficha_json):
+    """Con las dos ramas en curso on_field recibe solo los campos de la ganadora, una vez cada uno."""
+    monkeypatch.setattr(settings, "ENABLE_LLM_HEDGING", True)
+    monkeypatch.setattr(settings, "ENABLE_STREAMING", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    other_json = json.dumps(dict(ficha, nombre_ayuda="OTRA AYUDA DISTINTA"), ensure_ascii=False)
+
+    processor = LLMProcessor(provider="anthropic", model_name="modelo-hedge-campos")
+    processor.llm = LateStartFakeChatModel(responses=[ficha_json], delay=0.2)
+    processor.fallback = ("openai", "secundario", FakeListChatModel(responses=[other_json], sleep=0.5 / len(other_json)))
+    fields = []
+
+    result = asyncio.run(processor.agenerate_ficha(
+        "BOP Madrid núm. 45, 15/01/2025. " * 10,
+        use_rag=False,
+        on_field=lambda name, value: fields.append((name, value)),
+    ))
+
+    assert result["metadata"]["provider"] == "anthropic"
+    assert [name for name, _ in fields] == list(ficha)
+    assert dict(fields)["nombre_ayuda"] == ficha["nombre_ayuda"]
+
+
+@pytest.fixture
+def stub_providers(monkeypatch):
+    """Arranca servidores simulados como proveedor principal (Anthropic) y secundario (OpenAI)."""
+    servers = []
+
+    def start(primary_app, secondary_app):
+        primary, primary_port = run_in_thread(primary_app)
+        secondary, secondary_port = run_in_thread(secondary_app)
+        servers.extend([primary, secondary])
+        monkeypatch.setattr(settings, "ANTHROPIC_API_KEY", "test-key")
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr(settings, "ANTHROPIC_BASE_URL", f"http://127.0.0.1:{primary_port}")
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", f"http://127.0.0.1:{secondary_port}/v1")
+        monkeypatch.setattr(settings, "LLM_FALLBACK_PROVIDER", "openai")
+        monkeypatch.setattr(settings, "LLM_REPLAY_MODE", "off")
+
+    yield start
+    for server in servers:
+        server.should_exit = True
+
+
+def test_hedge_covers_stalled_provider(monkeypatch, stub_providers):
+    """Un proveedor bloqueado se cubre con el secundario sin esperar al bloqueo."""
+    monkeypatch.setattr(settings, "ENABLE_LLM_HEDGING", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 0.1)
+    primary_app = create_app(latency=0, stall_rate=1.0, stall_seconds=5.0)
+    stub_providers(primary_app, create_app(latency=0))
+
+    processor = LLMProcessor(provider="anthropic", model_name="stub-bloqueado")
+    start = time.monotonic()
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+
+    assert result["metadata"]["provider"] == "openai"
+    assert result["metadata"]["hedged"] is True
+    assert primary_app.state.requests == 1
+    assert time.monotonic() - start < 3.0
+
+
+def test_failover_on_overloaded_provider(monkeypatch, stub_providers):
+    """Un 529/429 persistente agota los reintentos y la llamada pasa al secundario sin esperar al hedge."""
+    monkeypatch.setattr(settings, "ENABLE_LLM_HEDGING", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 5.0)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 1)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.001)
+    primary_app = create_app(latency=0, error_rate=1.0)
+    stub_providers(primary_app, create_app(latency=0))
+
+    processor = LLMProcessor(provider="anthropic", model_name="stub-sobrecargado")
+    start = time.monotonic()
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+
+    assert result["metadata"]["provider"] == "openai"
+    assert primary_app.state.requests == 2
+    assert time.monotonic() - start < 3.0
@@ -0,0 +1,97 @@
+"""
+Tests para la generación map-reduce de documentos largos.
+"""
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from app.config import settings
+from app.core.map_reduce import ChunkCache, build_reduce_document, chunk_key, split_document
+from app.models.ficha_schema import FichaData
+
+
+def make_document(n: int = 400) -> str:
+    """Documento largo con párrafos distintos."""
+    return "\n".join(f"Artículo {i}. Disposición número {i} de las bases reguladoras." for i in range(n))
+
+
+class CountingMapModel(FakeListChatModel):
+    """Modelo de extracción simulado que cuenta las llamadas."""
+
+    calls: int = 0
+
+    def invoke(self, messages, *args, **kwargs):
+        self.calls += 1
+        return AIMessage(content='{"cuantia": ["600,00 €"], "resolucion": null}')
+
+
+@pytest.fixture
+def processor(processor, monkeypatch, tmp_path):
+    """Procesador con umbral bajo y caché temporal."""
+    monkeypatch.setattr(settings, "MAP_REDUCE_THRESHOLD_CHARS", 5000)
+    monkeypatch.setattr(settings, "MAP_REDUCE_CHUNK_CHARS", 2000)
+    processor.chunk_cache = ChunkCache(str(tmp_path))
+    processor.map_llm = CountingMapModel(responses=["{}"])
+    return processor
+
+
+def test_split_document_respects_size():
+    """Los fragmentos no superan el tamaño y cubren todo el texto."""
+    text = make_document()
+    chunks = split_document(text, chunk_chars=2000)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+    assert "\n".join(chunks) == text
+
+
+def test_split_document_resynchronizes_after_edit():
+    """Una edición solo altera los fragmentos cercanos."""
+    text = make_document()
+    edited = text.replace("Disposición número 10 ", "Disposición modificada número 10 ")
+
+    before = set(split_document(text, chunk_chars=2000))
+    after = split_document(edited, chunk_chars=2000)
+
+    unchanged = sum(1 for chunk in after if chunk in before)
+    assert unchanged >= len(after) - 2
+
+
+def test_chunk_cache_roundtrip(tmp_path):
+    """La caché devuelve los candidatos guardados por clave."""
+    cache = ChunkCache(str(tmp_path))
+    key = chunk_key("fragmento", "modelo")
+
+    assert cache.get(key) is None
+    cache.put(key, {"cuantia": ["600,00 €"]})
+    assert cache.get(key) == {"cuantia": ["600,00 €"]}
+    assert chunk_key("fragmento", "otro-modelo") != key
+
+
+def test_reduce_document_lists_candidates():
+    """El documento reducido contiene los candidatos y el inicio."""
+    document = build_reduce_document(["Inicio del texto", "Resto"], [{"cuantia": ["600,00 €"]}, {}])
+
+    assert "### Fragmento 1" in document
+    assert "### Fragmento 2" not in document
+    assert "Inicio del texto" in document
+
+
+def test_map_reduce_reuses_cached_chunks(processor):
+    """Reprocesar un documento modificado solo extrae los fragmentos nuevos."""
+    text = make_document()
+
+    first = processor.generate_ficha(text, use_rag=False)
+    first_calls = processor.map_llm.calls
+    stats = first["metadata"]["map_reduce"]
+
+    assert isinstance(first["ficha"], FichaData)
+    assert stats["chunks"] == first_calls
+    assert stats["cached_chunks"] == 0
+
+    edited = text.replace("Disposición número 390 ", "Disposición corregida número 390 ")
+    second = processor.generate_ficha(edited, use_rag=False)
+
+    assert second["metadata"]["map_reduce"]["cached_chunks"] >= stats["chunks"] - 2
+    assert processor.map_llm.calls - first_calls <= 2
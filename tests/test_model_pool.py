@@ -0,0 +1,140 @@
+"""
+Tests para el pool de modelos y la cascada por coste.
+"""
+
+import json
+import asyncio
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app.config import settings
+from app.core.model_pool import EscalationStats, ModelPool, document_type
+from app.models.ficha_schema import FichaData
+
+
+TEXTO = "EXTRACTO de la convocatoria de ayudas de emergencia social. BOP Madrid núm. 45, 15/01/2025. " * 5
+
+
+@pytest.fixture
+def pool(monkeypatch, api_key):
+    """Pool con solo Anthropic configurado."""
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", None)
+    monkeypatch.setattr(settings, "LLM_REPAIR_MAX_ROUNDS", 0)
+    return ModelPool()
+
+
+def test_document_type():
+    """El tipo se deduce de la cabecera del documento."""
+    assert document_type(TEXTO) == "extracto"
+    assert document_type("Bases reguladoras de las ayudas") == "bases"
+    assert document_type("Corrección de errores del extracto") == "correccion"
+    assert document_type("Texto sin cabecera reconocible") == "otro"
+
+
+def test_escalation_stats():
+    """La tasa de escalado se calcula por tipo de documento."""
+    stats = EscalationStats()
+    stats.record("extracto", escalated=False)
+    stats.record("extracto", escalated=True)
+
+    assert stats.snapshot()["extracto"]["escalation_rate"] == 0.5
+
+
+def test_pool_only_builds_configured_providers(pool):
+    """Solo hay procesadores para proveedores con API key."""
+    assert "claude-3.5-haiku" in pool.available()
+    assert pool.get("claude-3.5-sonnet") is pool.default
+    assert pool.get("claude-3.5-haiku").model_name == "claude-3-5-haiku-20241022"
+
+    with pytest.raises(ValueError):
+        pool.get("gpt-4o")
+
+
+def test_cascade_keeps_cheap_result(pool, ficha_json):
+    """Si el modelo económico supera la validación no se escala."""
+    pool.get("claude-3.5-haiku").llm = FakeListChatModel(responses=[ficha_json])
+
+    result = asyncio.run(pool.agenerate_cascade(TEXTO, use_rag=False))
+
+    assert result["metadata"]["cascade"]["escalated"] is False
+    assert result["metadata"]["model"] == "claude-3-5-haiku-20241022"
+
+
+def test_cascade_escalates_on_validation_failure(pool, ficha, ficha_json):
+    """Una ficha inválida del modelo económico escala al premium."""
+    bad = dict(ficha, beneficiarios="Personas empadronadas")
+    pool.get("claude-3.5-haiku").llm = FakeListChatModel(responses=[json.dumps(bad, ensure_ascii=False)])
+    pool.get("claude-3.5-sonnet").llm = FakeListChatModel(responses=[ficha_json])
+
+    result = asyncio.run(pool.agenerate_cascade(TEXTO, use_rag=False))
+
+    cascade = result["metadata"]["cascade"]
+    assert cascade["escalated"] is True
+    assert cascade["tiers_tried"] == ["claude-3.5-haiku", "claude-3.5-sonnet"]
+    assert pool.stats.snapshot()["extracto"]["escalation_rate"] == 1.0
+
+
+def test_cascade_escalates_on_quality_failure(pool, ficha, ficha_json):
+    """Una ficha válida para el schema que no supera el control de calidad también escala."""
+    # Cumple la fórmula del plazo pero con otra fecha de fin, e incluye un importe en la descripción
+    poor = dict(
+        ficha,
+        plazo_presentacion="El plazo permanecerá abierto hasta 30/11/2025",
+        descripcion="Ayudas económicas de hasta 600,00 € para situaciones de emergencia social.",
+    )
+    FichaData(**poor)  # El schema la acepta: el escalado no viene de la validación
+    pool.get("claude-3.5-haiku").llm = FakeListChatModel(responses=[json.dumps(poor, ensure_ascii=False)])
+    pool.get("claude-3.5-sonnet").llm = FakeListChatModel(responses=[ficha_json])
+
+    result = asyncio.run(pool.agenerate_cascade(TEXTO, use_rag=False))
+
+    cascade = result["metadata"]["cascade"]
+    assert cascade["escalated"] is True
+    [discarded] = cascade["discarded"]
+    assert discarded["tier"] == "claude-3.5-haiku"
+    assert discarded["reason"] == "quality"
+    assert discarded["quality"]["passed"] is False
+    assert {"plazo", "importe_en_descripcion"} <= {issue["rule"] for issue in discarded["quality"]["issues"]}
+    assert result["metadata"]["model"] == "claude-3-5-sonnet-20241022"
+    assert result["metadata"]["quality"]["score"] > discarded["quality"]["score"]
+
+
+def test_cascade_reports_discarded_usage(pool, ficha, ficha_json):
+    """El gasto de los niveles descartados queda en la metadata de la cascada."""
+    bad = dict(ficha, beneficiarios="Personas empadronadas")
+    usage = {"input_tokens": 1000, "output_tokens": 200, "total_tokens": 1200}
+    pool.get("claude-3.5-haiku").llm = GenericFakeChatModel(
+        messages=iter([AIMessage(content=json.dumps(bad, ensure_ascii=False), usage_metadata=usage)])
+    )
+    pool.get("claude-3.5-sonnet").llm = FakeListChatModel(responses=[ficha_json])
+
+    result = asyncio.run(pool.agenerate_cascade(TEXTO, use_rag=False))
+
+    cascade = result["metadata"]["cascade"]
+    [discarded] = cascade["discarded"]
+    assert discarded["reason"] == "validation"
+    assert discarded["usage"]["model"] == "claude-3-5-haiku-20241022"
+    assert cascade["discarded_usage"]["input_tokens"] == 1000
+    assert cascade["discarded_usage"]["output_tokens"] == 200
+    assert cascade["discarded_usage"]["cost_usd"] > 0
+
+
+class FailingChatModel(FakeListChatModel):
+    """Modelo que falla como lo haría un proveedor caído."""
+
+    async def _agenerate(self, *args, **kwargs):
+        raise RuntimeError("proveedor no disponible")
+
+
+def test_cascade_does_not_escalate_on_provider_error(pool, ficha_json):
+    """Un error que no es de validación se propaga sin gastar el nivel premium."""
+    pool.get("claude-3.5-haiku").llm = FailingChatModel(responses=["{}"])
+    premium = FakeListChatModel(responses=[ficha_json])
+    pool.get("claude-3.5-sonnet").llm = premium
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.agenerate_cascade(TEXTO, use_rag=False))
+
+    assert premium.i == 0
+    assert pool.stats.snapshot()["extracto"]["failed"] == 1
@@ -0,0 +1,88 @@
+"""
+Tests para la detección de documentos casi duplicados.
+"""
+
+import asyncio
+import pytest
+from datetime import date
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.core.near_duplicates import DuplicateIndex, restamp_ficha, text_diff, touched_fields
+from app.models.ficha_schema import FichaData
+
+
+EXAMPLE = FichaData.model_config["json_schema_extra"]["example"]
+
+
+def make_extracto(fecha: str) -> str:
+    """Extracto de convocatoria con una fecha de publicación variable."""
+    lines = [f"Butlletí Oficial de la Província de Barcelona. Data {fecha}"]
+    lines += [f"Artículo {i}. Las ayudas de urgencia social se concederán según la base {i}." for i in range(60)]
+    lines.append("Cuantía: el importe máximo por unidad familiar será de 1.200,00 €.")
+    return "\n".join(lines)
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Índice con un extracto ya procesado."""
+    index = DuplicateIndex(str(tmp_path))
+    index.add("anterior", make_extracto("13-6-2025"), FichaData(**EXAMPLE), {"model": "m", "provider": "anthropic"})
+    return index
+
+
+def test_finds_republished_document(index):
+    """Una republicación con otra fecha se detecta como casi duplicado."""
+    match = index.find(make_extracto("19-6-2025"), threshold=0.9)
+
+    assert match["doc_id"] == "anterior"
+    assert match["similarity"] >= 0.9
+    assert match["ficha"]["cuantia"] == EXAMPLE["cuantia"]
+
+
+def test_ignores_different_document(index):
+    """Un documento distinto no supera el umbral."""
+    other = "\n".join(f"Ordenanza general de subvenciones, título {i}, capítulo {i * 7}." for i in range(80))
+
+    assert index.find(other, threshold=0.9) is None
+
+
+def test_index_persists(index, tmp_path):
+    """Las firmas se recargan desde disco."""
+    reloaded = DuplicateIndex(str(tmp_path))
+
+    assert len(reloaded) == 1
+    assert reloaded.find(make_extracto("19-6-2025"))["doc_id"] == "anterior"
+
+
+def test_diff_touches_only_related_fields():
+    """Un cambio de importe afecta a la cuantía y no a los requisitos."""
+    old = make_extracto("13-6-2025")
+    diff = text_diff(old, old.replace("1.200,00 €", "1.500,00 €"))
+    fields = touched_fields(diff, EXAMPLE)
+
+    assert "cuantia" in fields and "importe_maximo" in fields
+    assert "requisitos_acceso" not in fields
+
+
+def test_update_regenerates_only_touched_fields(processor):
+    """La actualización conserva los campos no afectados de la ficha anterior."""
+    processor.llm = FakeListChatModel(responses=['{"cuantia": ["La cuantía de la ayuda será: 1.500,00 €"]}'])
+    previous = FichaData(**EXAMPLE).model_dump(mode="json")
+
+    result = asyncio.run(processor.aupdate_ficha(make_extracto("19-6-2025"), previous, ["cuantia"], ["-1.200,00 €"]))
+
+    assert result["ficha"].cuantia == ["La cuantía de la ayuda será: 1.500,00 €"]
+    assert result["ficha"].requisitos_acceso == EXAMPLE["requisitos_acceso"]
+    assert result["metadata"]["updated_fields"] == ["cuantia"]
+
+
+def test_restamp_uses_current_request(index):
+    """La ficha reutilizada lleva el usuario y la fecha de la petición, no los de la anterior."""
+    previous = FichaData(**index.find(make_extracto("19-6-2025"))["ficha"])
+
+    ficha = restamp_ficha(previous, "OTRO_PROYECTO", today=date(2025, 6, 20))
+
+    assert (ficha.otros_datos.USUARIO, ficha.otros_datos.FECHA) == ("OTRO_PROYECTO", "20/06/2025")
+    assert ficha.otros_datos.DOCUMENTOS_ADJUNTOS == previous.otros_datos.DOCUMENTOS_ADJUNTOS
+    assert previous.otros_datos.USUARIO == EXAMPLE["otros_datos"]["USUARIO"]
+    assert ficha.cuantia == previous.cuantia
@@ -61,6 +61,42 @@ def test_extract_tables(pdf_extractor, sample_pdf_path):
     # Puede o no tener tablas
 
 
+def test_extract_pages(pdf_extractor, tmp_path):
+    """Test de extracción por páginas con estadísticas."""
+    import pymupdf
+
+    pdf_path = tmp_path / "paginas.pdf"
+    doc = pymupdf.open()
+    doc.new_page().insert_text((72, 72), "Bases reguladoras de ayudas")
+    doc.new_page()
+    doc.save(pdf_path)
+    doc.close()
+
+    pages = pdf_extractor.extract_pages(pdf_path)
+
+    assert [p["page"] for p in pages] == [1, 2]
+    assert pages[0]["has_text"] and pages[0]["words"] == 4
+    assert not pages[1]["has_text"]
+
+
+def test_is_boletin_oficial_matches_scanner(pdf_extractor, tmp_path):
+    """La cabecera del boletín se detecta igual en el extractor y en el escáner de entidades."""
+    import pymupdf
+    from app.core.entity_scanner import EntityScanner
+
+    pdf_path = tmp_path / "boletin.pdf"
+    doc = pymupdf.open()
+    doc.new_page().insert_text((72, 72), "BOLETÍN OFICIAL\nDE LA PROVINCIA DE BADAJOZ\nNúm. 12, 20/01/2025")
+    doc.save(pdf_path)
+    doc.close()
+
+    detected = pdf_extractor.is_boletin_oficial(pdf_path)
+    boletines = [e for e in EntityScanner().scan(pdf_extractor.extract_text(pdf_path)) if e["tipo"] == "boletin"]
+
+    assert detected["es_boletin"] and detected["tipo_boletin"] == "BOP"
+    assert boletines[0]["valor"]["tipo"] == detected["tipo_boletin"]
+
+
 def test_clean_text(pdf_extractor):
     """Test de limpieza de texto."""
     raw_text = "Test   con    espacios\n\n\n\nmúltiples\t\ttabs"
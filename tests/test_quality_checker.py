@@ -0,0 +1,108 @@
+"""
+Tests para el control de calidad determinista de fichas.
+"""
+
+from datetime import date
+
+from app.config import settings
+from app.core.quality_checker import QualityChecker
+from app.models.ficha_schema import FichaData
+
+
+EXAMPLE = FichaData.model_config["json_schema_extra"]["example"]
+
+
+def make_ficha(**updates) -> FichaData:
+    """Ficha de ejemplo con campos sustituidos (sin volver a validar)."""
+    return FichaData(**EXAMPLE).model_copy(update=updates)
+
+
+def rules(report: dict) -> set:
+    return {issue["rule"] for issue in report["issues"]}
+
+
+def test_example_ficha_passes():
+    """La ficha de ejemplo solo incumple la frase publicitaria (ámbito municipal)."""
+    report = QualityChecker().check(make_ficha())
+
+    assert report["passed"]
+    assert rules(report) == {"frase_publicitar"}
+    assert report["score"] == 95
+
+
+def test_dates_and_plazo_rules():
+    """Plazo relativo, plazo distinto de la fecha de fin y fechas fuera de formato."""
+    ficha = make_ficha(
+        fecha_fin=date(2025, 11, 30),
+        plazo_presentacion="El plazo será de 15 días desde el 2025-01-01",
+    )
+    report = QualityChecker().check(ficha)
+
+    messages = [i["message"] for i in report["issues"] if i["rule"] in ("plazo", "formato_fecha")]
+    assert any("relativos" in m for m in messages)
+    assert any("30/11/2025" in m for m in messages)
+    assert any("2025-01-01" in m for m in messages)
+    assert not report["passed"]
+
+
+def test_amount_and_reference_value_rules():
+    """Importes fuera de formato, en descripción y valores IPREM incorrectos."""
+    ficha = make_ficha(
+        descripcion="Ayuda de 600,00 € para emergencias.",
+        cuantia=["La cuantía de la ayuda será: hasta 600 euros por solicitud"],
+        beneficiarios="Podrán ser beneficiarias:\n- Ingresos inferiores al IPREM (580,00 € mensuales).",
+        requisitos_acceso=(
+            "Los requisitos para optar a las ayudas son los siguientes:\n"
+            "- Ingresos inferiores a 1,5 veces el IPREM (900,00 €)."
+        ),
+    )
+    report = QualityChecker().check(ficha)
+
+    assert {"importe_en_descripcion", "formato_importe", "valor_referencia"} <= rules(report)
+    # Con multiplicador (veces, %) el importe no tiene por qué ser el de referencia
+    assert [i["field"] for i in report["issues"] if i["rule"] == "valor_referencia"] == ["beneficiarios"]
+
+
+def test_boletin_and_portal_rules():
+    """Boletín sin formato, portales que duplican la categoría y tipo incoherente."""
+    ficha = make_ficha(
+        normativa_reguladora=["Bases reguladoras publicadas en el BOP de Madrid de 15 de enero"],
+        tipo_ayuda="Violencia de Género",
+        portales=["Salud"],
+        categoria=["Salud"],
+        requisitos_acceso="Requisitos: estar empadronado.",
+    )
+    report = QualityChecker().check(ficha)
+
+    assert {"formato_boletin", "punto_final", "portales_categoria", "coherencia_portales", "frase_inicio"} <= rules(
+        report
+    )
+    assert not report["passed"]
+
+
+def test_rules_compiled_from_instructions():
+    """Las frases de inicio y el límite de palabras salen del JSON de instrucciones."""
+    instructions = {
+        "campos": {
+            "beneficiarios": {"reglas": ["Se inicia el texto con la frase: 'Destinatarios:'."]},
+            "otros_datos": {"reglas": ["FRASE PARA PUBLICITAR: solo si la ayuda es estatal, máx. 5 palabras."]},
+        }
+    }
+    ficha = make_ficha(ambito_territorial="Estatal", administracion="Ministerio de Igualdad")
+    report = QualityChecker(instructions).check(ficha)
+
+    assert [i["field"] for i in report["issues"] if i["rule"] == "frase_inicio"] == ["beneficiarios"]
+    assert any("Máximo 5 palabras" in i["message"] for i in report["issues"])
+
+    reports, summary = QualityChecker(instructions).check_many([ficha, make_ficha()])
+    assert summary["fichas"] == 2 and len(reports) == 2
+
+
+def test_processor_adds_quality_metadata(monkeypatch, processor):
+    """La ficha generada incluye el informe de calidad en la metadata."""
+    result = processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)
+
+    assert result["metadata"]["quality"]["score"] == 95
+
+    monkeypatch.setattr(settings, "ENABLE_QUALITY_CHECK", False)
+    assert "quality" not in processor.generate_ficha("BOP Madrid núm. 45. " * 10, use_rag=False)["metadata"]
@@ -0,0 +1,326 @@
+"""
+Tests para el índice persistente del sistema RAG y su sincronización incremental.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.core import rag_system
+from app.core.rag_system import RAGSystem, split_query_chunks
+
+
+class FakeEmbedder:
+    """
+    Modelo de embeddings determinista que cuenta los textos codificados y,
+    como el real, solo ve las primeras palabras de cada texto.
+    """
+
+    encoded = 0
+    calls = 0
+    max_words = 200
+    vocabulary = ["agua", "luz", "boletín"]
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        FakeEmbedder.encoded += len(texts)
+        FakeEmbedder.calls += 1
+        vectors = []
+        for text in texts:
+            words = text.split()[: self.max_words]
+            vector = np.array([words.count(w) for w in self.vocabulary] + [len(text) % 7, 1.0], dtype=float)
+            vectors.append(vector / np.linalg.norm(vector))
+        vectors = np.array(vectors)
+        return vectors[0] if single else vectors
+
+
+@pytest.fixture(params=["chroma", "numpy"])
+def make_rag(request, monkeypatch, tmp_path):
+    """Crea sistemas RAG sobre el mismo directorio con embeddings falsos, en cada backend."""
+    monkeypatch.setattr(rag_system, "create_embedding_model", FakeEmbedder)
+    monkeypatch.setattr(settings, "VECTOR_STORE_BACKEND", request.param)
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_DIR", str(tmp_path / "embeddings"))
+    FakeEmbedder.encoded = 0
+
+    def factory(model: str = "fake-model") -> RAGSystem:
+        return RAGSystem(persist_directory=str(tmp_path / "db"), collection_name="test", embedding_model=model)
+
+    return factory
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Carpeta con tres fichas de texto."""
+    folder = tmp_path / "dataset"
+    folder.mkdir()
+    for name in ("uno", "dos", "tres"):
+        (folder / f"{name}.txt").write_text(f"Ficha {name}: " + "ayuda social " * 20, encoding="utf-8")
+    return folder
+
+
+def files_of(folder):
+    return {path.stem: path for path in folder.glob("*.txt")}
+
+
+def load(ficha_id, path):
+    text = path.read_text(encoding="utf-8")
+    return {"text": text, "metadata": {"filename": path.name}} if "descartar" not in text else None
+
+
+def test_index_persists_across_instances(make_rag, dataset, tmp_path):
+    """Las fichas indexadas siguen ahí al volver a abrir el directorio."""
+    make_rag().sync_files(files_of(dataset), load)
+
+    rag = make_rag()
+
+    assert rag.count() == 3
+    assert (tmp_path / "db" / "test.manifest.json").exists()
+    assert rag.retrieve_similar("Ficha uno: ayuda social", k=1)[0]["id"] in {"uno", "dos", "tres"}
+
+
+def test_sync_is_noop_when_nothing_changed(make_rag, dataset):
+    """Sin cambios no se lee ningún fichero ni se generan embeddings."""
+    make_rag().sync_files(files_of(dataset), load)
+    encoded = FakeEmbedder.encoded
+
+    stats = make_rag().sync_files(files_of(dataset), lambda *_: pytest.fail("no debe leer fichas"))
+
+    assert stats == {"added": 0, "updated": 0, "deleted": 0, "skipped": 0, "errors": 0, "unchanged": 3}
+    assert FakeEmbedder.encoded == encoded
+
+
+def test_sync_applies_only_changes(make_rag, dataset):
+    """Solo se reindexan las fichas modificadas o nuevas y se borran las eliminadas."""
+    make_rag().sync_files(files_of(dataset), load)
+    encoded = FakeEmbedder.encoded
+
+    (dataset / "uno.txt").write_text("Ficha uno modificada: " + "cuantía " * 30, encoding="utf-8")
+    (dataset / "dos.txt").unlink()
+    (dataset / "cuatro.txt").write_text("Ficha cuatro: " + "empadronamiento " * 20, encoding="utf-8")
+    (dataset / "cinco.txt").write_text("descartar", encoding="utf-8")
+
+    rag = make_rag()
+    stats = rag.sync_files(files_of(dataset), load)
+
+    assert stats == {"added": 1, "updated": 1, "deleted": 1, "skipped": 1, "errors": 0, "unchanged": 1}
+    assert FakeEmbedder.encoded == encoded + 2
+    assert sorted(rag.store.get()["ids"]) == ["cuatro", "tres", "uno"]
+    assert "modificada" in rag.store.get(ids=["uno"])["documents"][0]
+    # La ficha descartada queda registrada y no se vuelve a leer
+    assert rag.sync_files(files_of(dataset), load)["skipped"] == 0
+
+
+def test_embedding_model_change_reindexes(make_rag, dataset):
+    """Un manifiesto de otro modelo de embeddings obliga a reindexar."""
+    make_rag().sync_files(files_of(dataset), load)
+    (dataset / "dos.txt").unlink()
+
+    rag = make_rag("other-model")
+    stats = rag.sync_files(files_of(dataset), load)
+
+    assert stats["added"] == 2
+    assert sorted(rag.store.get()["ids"]) == ["tres", "uno"]
+
+
+def test_split_query_chunks_covers_whole_document():
+    """Con más ventanas que el máximo se reparten por todo el texto."""
+    words = [str(i) for i in range(2000)]
+
+    chunks = split_query_chunks(" ".join(words), chunk_words=160, overlap=20, max_chunks=4)
+
+    assert len(chunks) == 4
+    assert chunks[0].split()[0] == "0"
+    assert chunks[-1].split()[-1] == "1999"
+    assert all(len(chunk.split()) <= 160 for chunk in chunks)
+    assert split_query_chunks("texto corto", 160, 20, 4) == ["texto corto"]
+    assert split_query_chunks("   ", 160) == []
+
+
+def test_maxsim_finds_content_beyond_truncation(make_rag, monkeypatch):
+    """El contenido tras la cabecera del boletín solo se ve con ventanas."""
+    monkeypatch.setattr(settings, "RAG_QUERY_MAX_CHUNKS", 8)
+    rag = make_rag()
+    rag.upsert_multiple([
+        {"id": "agua", "text": "agua " * 50, "metadata": {"folder": "agua"}},
+        {"id": "luz", "text": "luz " * 50, "metadata": {"folder": "luz"}},
+    ])
+    query = "boletín " * 400 + "agua " * 5 + "luz " * 100
+
+    calls = FakeEmbedder.calls
+    assert len(rag.encode_query(query, "maxsim")) > 1
+    assert FakeEmbedder.calls == calls + 1  # Todas las ventanas en un solo lote
+
+    assert rag.retrieve_similar(query, k=1, pooling="maxsim")[0]["id"] == "luz"
+    assert rag.retrieve_similar(query, k=1, pooling="mean")[0]["id"] == "luz"
+    results = rag.retrieve_similar(query, k=2, pooling="maxsim")
+    assert [r["id"] for r in results] == ["luz", "agua"]
+    assert results[0]["distance"] <= results[1]["distance"]
+
+
+HYBRID_FICHAS = [
+    {"id": "tele", "text": "boletín " * 30 + "Servicio de teleasistencia domiciliaria",
+     "metadata": {"tipo": "dependencia", "provincia": "Badajoz"}},
+    {"id": "agua", "text": "agua " * 30 + "Ayuda para el recibo del agua",
+     "metadata": {"tipo": "suministros", "provincia": "Cáceres"}},
+    {"id": "luz", "text": "luz " * 40 + "Ayuda para el recibo de la luz",
+     "metadata": {"tipo": "suministros", "provincia": "Badajoz"}},
+]
+
+
+def test_hybrid_retrieval_recovers_lexical_match(make_rag, monkeypatch):
+    """La ficha que solo encuentra BM25 entra en el top k y se lee del almacén."""
+    monkeypatch.setattr(settings, "RAG_HYBRID_CANDIDATES", 1)
+    rag = make_rag()
+    rag.upsert_multiple(HYBRID_FICHAS)
+    query = "luz " * 10 + "teleasistencia domiciliaria"
+
+    dense = rag.retrieve_similar(query, k=1, hybrid=False)
+    assert [r["id"] for r in dense] == ["luz"]
+
+    results = rag.retrieve_similar(query, k=2)
+    assert "tele" in [r["id"] for r in results]
+    tele = next(r for r in results if r["id"] == "tele")
+    assert tele["bm25_score"] > 0 and tele["text"].endswith("domiciliaria")
+
+    filtered = rag.retrieve_similar(query, k=2, filter_metadata={"tipo": "dependencia"})
+    assert [r["id"] for r in filtered] == ["tele"]
+
+
+def test_bm25_rebuilt_from_existing_collection(make_rag, monkeypatch):
+    """Una colección indexada sin BM25 lo reconstruye al abrirse."""
+    monkeypatch.setattr(settings, "RAG_HYBRID", False)
+    rag = make_rag()
+    rag.upsert_multiple(HYBRID_FICHAS)
+    assert rag.bm25 is None
+
+    monkeypatch.setattr(settings, "RAG_HYBRID", True)
+    reopened = make_rag()
+    assert len(reopened.bm25) == 3
+    assert reopened.get_collection_info()["bm25_documents"] == 3
+
+    reopened.delete_all()
+    assert len(reopened.bm25) == 0
+
+
+def test_field_examples_pick_closest_section(make_rag):
+    """Cada campo se busca en su propio índice y las secciones se reemplazan al reindexar."""
+    rag = make_rag()
+    rag.upsert_multiple([
+        {"id": "agua", "text": "agua " * 20, "metadata": {"tipo": "agua"},
+         "sections": {"cuantia": "agua " * 10 + "hasta 300 euros", "importe_maximo": "300 euros"}},
+        {"id": "luz", "text": "luz " * 20, "metadata": {"tipo": "luz"},
+         "sections": {"cuantia": "luz " * 10 + "hasta 500 euros"}},
+    ])
+    assert rag.get_collection_info()["field_sections"] == 3
+
+    examples = rag.retrieve_field_examples("luz " * 30, ["cuantia", "importe_maximo", "beneficiarios"])
+    assert examples["cuantia"]["ficha_id"] == "luz"
+    assert examples["importe_maximo"]["text"] == "300 euros"
+    assert "beneficiarios" not in examples
+    filtered = rag.retrieve_field_examples("luz " * 30, ["cuantia"], filter_metadata={"tipo": "agua"})
+    assert filtered["cuantia"]["ficha_id"] == "agua"
+
+    rag.upsert_multiple([{"id": "luz", "text": "luz " * 20, "metadata": {"tipo": "luz"}, "sections": {}}])
+    assert rag.retrieve_field_examples("luz " * 30, ["cuantia"])["cuantia"]["ficha_id"] == "agua"
+
+
+def test_missing_field_index_triggers_reindex(make_rag, dataset):
+    """Un índice anterior a las secciones se vuelve a leer en la siguiente sincronización."""
+    def load_with_sections(ficha_id, path):
+        return dict(load(ficha_id, path), sections={"cuantia": path.read_text(encoding="utf-8")})
+
+    rag = make_rag()
+    rag.sync_files(files_of(dataset), load_with_sections)
+    assert rag.sections.count() == 3
+
+    # Simula un manifiesto previo al índice por campos
+    for entry in rag.manifest.files.values():
+        entry.pop("sections")
+    rag.manifest.save()
+    rag.sections.reset()
+
+    reopened = make_rag()
+    stats = reopened.sync_files(files_of(dataset), load_with_sections)
+    assert stats["added"] == 3 and reopened.sections.count() == 3
+    assert reopened.sync_files(files_of(dataset), load_with_sections)["unchanged"] == 3
+
+
+def test_sync_resumes_after_last_committed_batch(make_rag, tmp_path):
+    """Si el proceso falla a mitad, la siguiente sincronización solo lee lo que faltaba."""
+    folder = tmp_path / "archivo"
+    folder.mkdir()
+    for i in range(5):
+        (folder / f"ficha{i}.txt").write_text(f"Ficha {i}: " + "ayuda " * 20, encoding="utf-8")
+
+    rag = make_rag()
+    upsert, calls = rag.store.upsert, []
+
+    def failing_upsert(**kwargs):
+        calls.append(kwargs["ids"])
+        if len(calls) == 2:
+            raise RuntimeError("disco lleno")
+        upsert(**kwargs)
+
+    rag.store.upsert = failing_upsert
+    with pytest.raises(RuntimeError):
+        rag.sync_files(files_of(folder), load, batch_size=2)
+    assert rag.count() == 2
+
+    read = []
+    stats = make_rag().sync_files(files_of(folder), lambda i, p: read.append(i) or load(i, p), batch_size=2)
+    assert stats["added"] == 3 and stats["unchanged"] == 2
+    assert sorted(read) == sorted(set(files_of(folder)) - set(calls[0]))
+
+
+def test_sync_writes_bm25_once_per_batch(make_rag, tmp_path):
+    """El índice BM25 se escribe al confirmar cada lote, no en cada upsert."""
+    folder = tmp_path / "archivo"
+    folder.mkdir()
+    for i in range(5):
+        (folder / f"ficha{i}.txt").write_text(f"Ficha {i}: " + "ayuda " * 20, encoding="utf-8")
+
+    rag = make_rag()
+    flush, writes = rag.bm25.flush, []
+    rag.bm25.flush = lambda: (writes.append(rag.bm25.dirty), flush())
+    upsert = rag.bm25.upsert
+    rag.bm25.upsert = lambda *args: (upsert(*args), writes.append("upsert"))
+
+    rag.sync_files(files_of(folder), load, batch_size=2)
+
+    # Tras las eliminaciones (ninguna) no hay nada que escribir; luego una escritura por lote
+    assert writes == [False] + ["upsert", True] * 3
+    assert len(make_rag().bm25) == 5
+
+
+def test_sync_parallel_loading_counts_errors(make_rag, dataset):
+    """Los ficheros que fallan al leerse no se registran y se reintentan."""
+    def flaky_load(ficha_id, path):
+        if ficha_id == "dos":
+            raise ValueError("docx corrupto")
+        return load(ficha_id, path)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        stats = make_rag().sync_files(files_of(dataset), flaky_load, executor=executor, batch_size=1)
+    assert stats["added"] == 2 and stats["errors"] == 1
+
+    rag = make_rag()
+    stats = rag.sync_files(files_of(dataset), load)
+    assert stats["added"] == 1 and stats["unchanged"] == 2
+    assert rag.count() == 3
+
+
+def test_index_multiple_streams_batches(make_rag):
+    """index_multiple consume un generador lote a lote."""
+    rag = make_rag()
+    calls = FakeEmbedder.calls
+    fichas = ({"id": f"f{i}", "text": f"ficha {i} agua", "metadata": {"n": i}} for i in range(7))
+
+    assert rag.index_multiple(fichas, batch_size=3) == 7
+    assert FakeEmbedder.calls == calls + 3
+    assert rag.count() == 7
@@ -0,0 +1,93 @@
+"""
+Tests para el planificador de llamadas RPM/TPM.
+"""
+
+import time
+import threading
+import pytest
+from langchain_core.messages import HumanMessage
+
+from app.core.rate_scheduler import (
+    BULK,
+    INTERACTIVE,
+    RateScheduler,
+    TokenBucket,
+    estimate_tokens,
+    get_scheduler,
+    llm_priority,
+)
+from app.core.replay_llm import SimulatedAPIError
+
+
+def test_token_bucket_refills_per_minute():
+    """Un cubo de 60/min se recarga a una unidad por segundo."""
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+
+    assert bucket.wait_time(1, now=bucket.updated) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=bucket.updated + 1.0) == 0.0
+    assert TokenBucket(0).wait_time(10**9) == 0.0
+
+
+def test_tpm_budget_throttles_calls():
+    """Una llamada espera hasta que el TPM tiene sitio para sus tokens."""
+    scheduler = RateScheduler("test", tpm=60000)
+    scheduler.run_sync(lambda: None, 60000)
+
+    start = time.monotonic()
+    scheduler.run_sync(lambda: None, 200)
+
+    assert time.monotonic() - start >= 0.15
+    assert scheduler.stats()["throttle_time"] >= 0.15
+
+
+def test_aimd_halves_on_rate_limit_and_grows_on_success():
+    """Un 429 reduce la concurrencia a la mitad; los éxitos la recuperan."""
+    scheduler = RateScheduler("test", max_concurrency=8)
+
+    def rate_limited():
+        raise SimulatedAPIError(429, "rate limit simulado")
+
+    with pytest.raises(SimulatedAPIError):
+        scheduler.run_sync(rate_limited, 100)
+    assert scheduler.stats()["concurrency_limit"] == 4
+    assert scheduler.stats()["rate_limited"] == 1
+
+    for _ in range(20):
+        scheduler.run_sync(lambda: None, 100)
+    assert scheduler.stats()["concurrency_limit"] > 4
+
+
+def test_interactive_requests_jump_bulk_queue():
+    """Con la concurrencia agotada, una interactiva pasa antes que una masiva anterior."""
+    scheduler = RateScheduler("test", max_concurrency=1, poll_interval=0.005)
+    scheduler.acquire_sync(1)
+    order = []
+
+    def call(level: str):
+        with llm_priority(level):
+            scheduler.run_sync(lambda: order.append(level), 1)
+
+    threads = [threading.Thread(target=call, args=(BULK,)), threading.Thread(target=call, args=(INTERACTIVE,))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    assert scheduler.stats()["queue_depth_by_priority"] == {INTERACTIVE: 1, BULK: 1}
+
+    scheduler.release(1, latency=0.01)
+    for thread in threads:
+        thread.join()
+
+    assert order == [INTERACTIVE, BULK]
+
+
+def test_processor_calls_go_through_scheduler(processor):
+    """Cada llamada del procesador se admite en el planificador de su modelo."""
+    scheduler = get_scheduler("anthropic", processor.model_name)
+    admitted = scheduler.stats()["admitted"]
+
+    processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)
+
+    assert scheduler.stats()["admitted"] == admitted + 1
+    assert scheduler.stats()["in_flight"] == 0
+    assert estimate_tokens([HumanMessage(content="x" * 400)], output_tokens=0) == 100
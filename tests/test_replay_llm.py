@@ -0,0 +1,88 @@
+"""
+Tests para el LLM de grabación/reproducción.
+"""
+
+import json
+import time
+import asyncio
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from app.config import settings
+from app.core.llm_processor import LLMProcessor
+from app.core.llm_resilience import is_retryable
+from app.core.replay_llm import RecordingChatModel, ReplayChatModel, ReplayMissError, SimulatedAPIError
+from app.models.ficha_schema import FichaData
+
+
+FICHA_JSON = json.dumps(FichaData.model_config["json_schema_extra"]["example"], ensure_ascii=False)
+MESSAGES = [HumanMessage(content="Genera la ficha")]
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    """Directorio con una respuesta grabada para MESSAGES."""
+    recorder = RecordingChatModel(
+        inner=FakeListChatModel(responses=[FICHA_JSON]),
+        model_name="modelo",
+        cassette_dir=str(tmp_path),
+    )
+    recorder.invoke(MESSAGES)
+    return str(tmp_path)
+
+
+def test_replay_returns_recorded_response(cassette):
+    """La reproducción devuelve la respuesta grabada."""
+    replay = ReplayChatModel(model_name="modelo", cassette_dir=cassette, latency=0)
+
+    assert replay.invoke(MESSAGES).content == FICHA_JSON
+
+
+def test_replay_miss(cassette):
+    """Una petición no grabada falla de forma explícita."""
+    replay = ReplayChatModel(model_name="modelo", cassette_dir=cassette, latency=0)
+
+    with pytest.raises(ReplayMissError):
+        replay.invoke([HumanMessage(content="Otra petición")])
+
+
+def test_replay_streams_tokens_with_latency(cassette):
+    """El streaming trocea la respuesta y respeta latencia y ritmo."""
+    replay = ReplayChatModel(model_name="modelo", cassette_dir=cassette, latency=0.1, tokens_per_second=2000)
+
+    start = time.monotonic()
+    chunks = list(replay.stream(MESSAGES))
+    elapsed = time.monotonic() - start
+
+    assert "".join(chunk.content for chunk in chunks) == FICHA_JSON
+    assert len(chunks) > 10
+    assert elapsed >= 0.1 + len(chunks) / 2000 * 0.8
+
+
+def test_replay_injects_rate_limits(cassette):
+    """Los 429 simulados son reintentables por la capa de resiliencia."""
+    replay = ReplayChatModel(model_name="modelo", cassette_dir=cassette, latency=0, rate_limit_rate=1.0)
+
+    with pytest.raises(SimulatedAPIError) as excinfo:
+        asyncio.run(replay.ainvoke(MESSAGES))
+
+    assert excinfo.value.status_code == 429
+    assert is_retryable(excinfo.value)
+
+
+def test_processor_record_then_replay_offline(monkeypatch, tmp_path, api_key):
+    """Lo grabado con el procesador se reproduce sin API key."""
+    text = "BOP Madrid núm. 45, 15/01/2025. " * 10
+    monkeypatch.setattr(settings, "LLM_REPLAY_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LLM_REPLAY_LATENCY", 0.0)
+    monkeypatch.setattr(settings, "LLM_REPLAY_MODE", "record")
+    recorder = LLMProcessor(provider="anthropic")
+    recorder.llm.inner = FakeListChatModel(responses=[FICHA_JSON])
+    recorded = recorder.generate_ficha(text, use_rag=False)
+
+    monkeypatch.setattr(settings, "ANTHROPIC_API_KEY", None)
+    monkeypatch.setattr(settings, "LLM_REPLAY_MODE", "replay")
+    replayed = asyncio.run(LLMProcessor(provider="anthropic").agenerate_ficha(text, use_rag=False))
+
+    assert replayed["ficha"] == recorded["ficha"]
@@ -0,0 +1,74 @@
+"""
+Tests para la salida estructurada nativa (LLM_OUTPUT_MODE=native).
+"""
+
+import asyncio
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from app.config import settings
+from app.core.structured_output import TOOL_NAME, strict_json_schema, structured_message
+from app.models.ficha_schema import FichaData
+
+
+EXAMPLE = FichaData.model_config["json_schema_extra"]["example"]
+
+
+class ToolCallFakeChatModel(FakeListChatModel):
+    """LLM simulado que responde con tool use y registra los kwargs recibidos."""
+
+    calls: list = []
+
+    def invoke(self, messages, *args, **kwargs):
+        self.calls.append(kwargs)
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": TOOL_NAME, "args": EXAMPLE, "id": "toolu_1"}],
+            usage_metadata={"input_tokens": 100, "output_tokens": 50, "total_tokens": 150},
+        )
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        return self.invoke(messages, *args, **kwargs)
+
+
+@pytest.fixture
+def processor(processor, monkeypatch):
+    """Procesador Anthropic en modo nativo."""
+    monkeypatch.setattr(settings, "LLM_OUTPUT_MODE", "native")
+    processor.llm = ToolCallFakeChatModel(responses=["{}"], calls=[])
+    return processor
+
+
+def test_strict_schema():
+    """El schema strict cierra los objetos y exige todas las propiedades."""
+    schema = strict_json_schema(FichaData)
+
+    assert schema["additionalProperties"] is False
+    assert set(schema["required"]) == set(schema["properties"])
+    assert all("default" not in prop for prop in schema["properties"].values())
+
+
+def test_structured_message_from_tool_call():
+    """Los argumentos de la herramienta se convierten en el contenido JSON."""
+    message = AIMessage(content="", tool_calls=[{"name": TOOL_NAME, "args": {"cuantia": "1.000 €"}, "id": "t"}])
+
+    assert structured_message(message).content == '{"cuantia": "1.000 €"}'
+
+
+def test_native_prefix_omits_schema(processor, monkeypatch):
+    """En modo nativo el schema no se repite en el prompt."""
+    native = processor._get_static_prefix()
+    monkeypatch.setattr(settings, "LLM_OUTPUT_MODE", "prompt")
+
+    assert "SCHEMA DE SALIDA" not in native
+    assert "SCHEMA DE SALIDA" in processor._get_static_prefix()
+
+
+def test_generate_with_tool_use(processor):
+    """La ficha se obtiene de los argumentos de la herramienta forzada."""
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+
+    assert result["ficha"].cuantia == EXAMPLE["cuantia"]
+    assert result["metadata"]["output_mode"] == "native"
+    assert processor.llm.calls[0]["tool_choice"] == {"type": "tool", "name": TOOL_NAME}
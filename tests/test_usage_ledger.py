@@ -0,0 +1,217 @@
+"""
+Tests para la contabilidad de tokens, coste y latencia.
+"""
+
+import asyncio
+import json
+import pytest
+from datetime import date
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from app.config import settings
+from app.core.llm_processor import LLMProcessor
+from app.core.usage_ledger import UsageLedger, estimate_cost, to_csv, usage_entries
+from app.models.ficha_schema import FichaData
+
+
+FICHA_JSON = json.dumps(FichaData.model_config["json_schema_extra"]["example"], ensure_ascii=False)
+
+
+class UsageFakeChatModel(FakeListChatModel):
+    """LLM simulado que informa del uso de tokens."""
+
+    def invoke(self, messages, *args, **kwargs):
+        return AIMessage(
+            content=FICHA_JSON,
+            usage_metadata={
+                "input_tokens": 12000,
+                "output_tokens": 1500,
+                "total_tokens": 13500,
+                "input_token_details": {"cache_read": 10000},
+            },
+        )
+
+
+def test_estimate_cost_uses_price_table():
+    """1M tokens de entrada y de salida de Sonnet: 3 $ + 15 $."""
+    assert estimate_cost("claude-3-5-sonnet-20241022", 1_000_000, 1_000_000) == pytest.approx(18.0)
+
+
+def test_estimate_cost_discounts_cache_reads(monkeypatch):
+    """Los tokens leídos de caché se cobran a su precio, no al de entrada."""
+    full = estimate_cost("claude-3-5-sonnet-20241022", 100_000, 0)
+    cached = estimate_cost("claude-3-5-sonnet-20241022", 100_000, 0, cache_read_tokens=90_000)
+
+    assert cached == pytest.approx(full * 0.19)
+    monkeypatch.setattr(settings, "LLM_PRICE_OVERRIDES", {"modelo-propio": {"input": 1.0, "output": 2.0}})
+    assert estimate_cost("modelo-propio", 1_000_000, 0) == pytest.approx(1.0)
+    assert estimate_cost("modelo-desconocido", 1_000_000, 0) == 0.0
+
+
+def test_ledger_summary_and_export(tmp_path):
+    """El uso se agrega por modelo y usuario y se exporta a CSV."""
+    ledger = UsageLedger(str(tmp_path))
+    for model, usuario, cost in [("gpt-4o", "ana", 0.02), ("gpt-4o", "ana", 0.03), ("gpt-4o-mini", "luis", 0.001)]:
+        ledger.record({"model": model, "usuario": usuario, "cost_usd": cost, "input_tokens": 1000, "ttft": 0.5})
+
+    rows = ledger.summary(group_by=["model", "usuario"])
+
+    assert rows[0] == {
+        **rows[0],
+        "model": "gpt-4o",
+        "usuario": "ana",
+        "requests": 2,
+        "input_tokens": 2000,
+        "cost_usd": pytest.approx(0.05),
+        "avg_ttft": 0.5,
+    }
+    assert to_csv(rows).splitlines()[0].startswith("model,usuario,requests")
+    assert ledger.summary(group_by=["day"], until=date(2000, 1, 1)) == []
+    with pytest.raises(ValueError):
+        ledger.summary(group_by=["tokens"])
+
+
+def test_generation_reports_cost_and_latency(api_key):
+    """La metadata de la generación incluye coste, TTFT y tiempo de LLM."""
+    processor = LLMProcessor(provider="anthropic", model_name="claude-3-5-sonnet-20241022")
+    processor.llm = UsageFakeChatModel(responses=["{}"])
+
+    metadata = processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)["metadata"]
+
+    assert metadata["cost_usd"] == pytest.approx(estimate_cost("claude-3-5-sonnet-20241022", 12000, 1500, 10000))
+    assert metadata["ttft"] == metadata["llm_latency"]
+    assert metadata["llm_time"] >= metadata["llm_latency"]
+
+
+def test_streaming_measures_ttft(monkeypatch, processor, ficha_json):
+    """En streaming el TTFT es menor que la latencia total."""
+    monkeypatch.setattr(settings, "ENABLE_STREAMING", True)
+    processor.llm = FakeListChatModel(responses=[ficha_json], sleep=0.0005)
+
+    metadata = processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)["metadata"]
+
+    assert metadata["ttft"] < metadata["llm_latency"]
+
+
+def test_usage_entries_include_discarded_and_failed_generations():
+    """Se registran los niveles descartados de la cascada y lo gastado en generaciones fallidas."""
+    haiku = {"provider": "anthropic", "model": "claude-3-5-haiku-20241022", "input_tokens": 900, "cost_usd": 0.001}
+    metadata = {
+        "provider": "anthropic",
+        "model": "claude-3-5-sonnet-20241022",
+        "input_tokens": 1000,
+        "cost_usd": 0.01,
+        "ttft": 0.4,
+        "cascade": {"discarded": [{"tier": "claude-3.5-haiku", "reason": "quality", "usage": haiku}]},
+    }
+
+    entries = usage_entries("f1", "ana", metadata)
+    assert [(e["model"], e["status"]) for e in entries] == [
+        ("claude-3-5-haiku-20241022", "discarded"),
+        ("claude-3-5-sonnet-20241022", "success"),
+    ]
+    assert entries[0]["input_tokens"] == 900 and entries[0]["ttft"] == 0
+    assert entries[1]["ficha_id"] == "f1" and entries[1]["usuario"] == "ana"
+
+    error = ValueError("ficha inválida")
+    error.llm_usage = {"provider": "anthropic", "model": "claude-3-5-sonnet-20241022", "output_tokens": 1500}
+    error.cascade_discarded = metadata["cascade"]["discarded"]
+    failed = usage_entries("f2", "ana", error=error)
+    assert [e["status"] for e in failed] == ["discarded", "error"]
+    assert failed[1]["output_tokens"] == 1500
+    assert usage_entries("f3", "ana", error=RuntimeError("sin respuesta")) == []
+
+
+class InvalidUsageFakeChatModel(FakeListChatModel):
+    """LLM simulado que devuelve una ficha vacía e informa del uso."""
+
+    def invoke(self, messages, *args, **kwargs):
+        return AIMessage(content="{}", usage_metadata={"input_tokens": 800, "output_tokens": 10, "total_tokens": 810})
+
+
+def test_failed_generation_carries_spent_usage(monkeypatch, api_key):
+    """Una ficha que no supera la validación adjunta a la excepción los tokens ya gastados."""
+    monkeypatch.setattr(settings, "LLM_REPAIR_MAX_ROUNDS", 0)
+    processor = LLMProcessor(provider="anthropic", model_name="claude-3-5-sonnet-20241022")
+    processor.llm = InvalidUsageFakeChatModel(responses=["{}"])
+
+    with pytest.raises(Exception) as raised:
+        processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)
+
+    assert raised.value.llm_usage["input_tokens"] == 800
+    assert raised.value.llm_usage["cost_usd"] == pytest.approx(estimate_cost("claude-3-5-sonnet-20241022", 800, 10))
+
+
+class RepairFailoverFakeChatModel(FakeListChatModel):
+    """Primario que devuelve una ficha vacía y falla en las reparaciones."""
+
+    def invoke(self, messages, *args, **kwargs):
+        self.i += 1
+        if self.i > 1:
+            raise ValueError("proveedor caído")
+        return AIMessage(content="{}", usage_metadata={"input_tokens": 800, "output_tokens": 10, "total_tokens": 810})
+
+
+class RepairFakeChatModel(FakeListChatModel):
+    """Secundario que devuelve la ficha corregida e informa del uso."""
+
+    def invoke(self, messages, *args, **kwargs):
+        return AIMessage(
+            content=FICHA_JSON, usage_metadata={"input_tokens": 500, "output_tokens": 700, "total_tokens": 1200}
+        )
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    """LLM simulado con latencia asíncrona."""
+
+    async def ainvoke(self, *args, **kwargs):
+        await asyncio.sleep(5.0)
+        return await super().ainvoke(*args, **kwargs)
+
+
+def test_repair_priced_with_its_own_model(api_key):
+    """Una reparación que hace failover al secundario se valora con el precio del secundario."""
+    processor = LLMProcessor(provider="anthropic", model_name="claude-3-5-sonnet-20241022")
+    processor.llm = RepairFailoverFakeChatModel(responses=["{}"])
+    processor.fallback = ("openai", "gpt-4o", RepairFakeChatModel(responses=[FICHA_JSON]))
+
+    metadata = processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)["metadata"]
+
+    assert metadata["repair_rounds"] == 1
+    assert metadata["cost_usd"] == pytest.approx(
+        estimate_cost("claude-3-5-sonnet-20241022", 800, 10) + estimate_cost("gpt-4o", 500, 700), abs=1e-6
+    )
+
+
+def test_aborted_stream_usage_is_counted(monkeypatch, processor, ficha, ficha_json):
+    """Los tokens del stream abortado por una violación se suman al uso de la generación."""
+    monkeypatch.setattr(settings, "ENABLE_STREAMING", True)
+    bad_json = json.dumps(dict(ficha, plazo_presentacion="Hasta el 31/12/2025"), ensure_ascii=False)
+    processor.llm = FakeListChatModel(responses=[bad_json, ficha_json])
+
+    metadata = processor.generate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False)["metadata"]
+
+    # El simulador no informa de uso: solo cuenta el estimado del intento abortado
+    assert metadata["stream_aborts"][0]["chars_generados"] // 4 <= metadata["output_tokens"] < len(bad_json) // 4
+    assert metadata["input_tokens"] > 0
+    assert metadata["repair_rounds"] == 0
+
+
+def test_cancelled_hedge_leg_usage_is_counted(monkeypatch, api_key, ficha_json):
+    """La rama cancelada de una petición cubierta se factura con el modelo del primario."""
+    monkeypatch.setattr(settings, "ENABLE_LLM_HEDGING", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    processor = LLMProcessor(provider="anthropic", model_name="claude-3-5-sonnet-20241022")
+    processor.llm = SlowFakeChatModel(responses=[ficha_json])
+    processor.fallback = ("openai", "gpt-4o", FakeListChatModel(responses=[ficha_json]))
+
+    result = asyncio.run(processor.agenerate_ficha("BOP Madrid núm. 45, 15/01/2025. " * 10, use_rag=False))
+    metadata = result["metadata"]
+
+    assert metadata["provider"] == "openai" and metadata["hedged"] is True
+    assert metadata["input_tokens"] > 0
+    assert metadata["cost_usd"] == pytest.approx(
+        estimate_cost("claude-3-5-sonnet-20241022", metadata["input_tokens"], 0), abs=1e-6
+    )
+    assert metadata["llm_time"] == metadata["llm_latency"]
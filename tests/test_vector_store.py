@@ -0,0 +1,65 @@
+"""
+Tests para los almacenes vectoriales.
+"""
+
+import numpy as np
+import pytest
+
+from app.core.vector_store import ChromaVectorStore, NumpyVectorStore, match_where
+
+
+def sample(n: int = 50, dim: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    metadatas = [{"tipo": ["emergencia", "vivienda"][i % 2], "anio": 2020 + i % 5} for i in range(n)]
+    return [f"f{i}" for i in range(n)], vectors, [f"doc {i}" for i in range(n)], metadatas
+
+
+def test_match_where_operators():
+    """Los filtros siguen la sintaxis de ChromaDB."""
+    metadata = {"tipo": "emergencia", "anio": 2024}
+
+    assert match_where(metadata, {"tipo": "emergencia"})
+    assert match_where(metadata, {"anio": {"$gte": 2024}, "tipo": {"$in": ["emergencia", "vivienda"]}})
+    assert match_where(metadata, {"$or": [{"tipo": "vivienda"}, {"anio": {"$lt": 2025}}]})
+    assert not match_where(metadata, {"$and": [{"tipo": "emergencia"}, {"anio": {"$ne": 2024}}]})
+    with pytest.raises(ValueError):
+        match_where(metadata, {"anio": {"$regex": "20"}})
+
+
+@pytest.mark.parametrize("where", [None, {"tipo": "vivienda"}, {"$and": [{"tipo": "emergencia"}, {"anio": {"$gt": 2021}}]}])
+def test_numpy_matches_chroma(tmp_path, where):
+    """Mismos resultados y distancias que Chroma, con y sin filtros."""
+    ids, vectors, documents, metadatas = sample()
+    stores = [ChromaVectorStore(str(tmp_path / "chroma"), "test"), NumpyVectorStore(str(tmp_path / "np"), "test")]
+    for store in stores:
+        store.upsert(ids=ids, embeddings=vectors.tolist(), documents=documents, metadatas=metadatas)
+
+    queries = sample(n=3, seed=1)[1].tolist()
+    chroma, numpy_ = (store.query(query_embeddings=queries, n_results=5, where=where) for store in stores)
+
+    assert numpy_["ids"] == chroma["ids"]
+    np.testing.assert_allclose(numpy_["distances"], chroma["distances"], atol=1e-4)
+    assert numpy_["metadatas"] == chroma["metadatas"]
+
+
+def test_numpy_store_persists_upserts_and_deletes(tmp_path):
+    """Las escrituras se guardan en .npy + sidecar y se releen con memory-map."""
+    ids, vectors, documents, metadatas = sample(n=5)
+    store = NumpyVectorStore(str(tmp_path), "test")
+    store.upsert(ids=ids, embeddings=vectors.tolist(), documents=documents, metadatas=metadatas)
+    store.upsert(ids=["f1", "nuevo"], embeddings=vectors[:2].tolist(), documents=["otro", "nuevo"],
+                 metadatas=[{"tipo": "x"}, {"tipo": "y"}])
+    store.delete(["f3", "no-existe"])
+
+    reopened = NumpyVectorStore(str(tmp_path), "test")
+
+    assert isinstance(reopened.matrix, np.memmap)
+    assert reopened.count() == 5
+    assert reopened.get(ids=["f1"])["documents"] == ["otro"]
+    assert reopened.query(query_embeddings=[vectors[0].tolist()], n_results=2)["ids"][0][0] in {"f0", "f1"}
+    assert reopened.query(query_embeddings=[vectors[0].tolist()], n_results=3, where={"tipo": "y"})["ids"] == [["nuevo"]]
+
+    reopened.reset()
+    assert NumpyVectorStore(str(tmp_path), "test").count() == 0